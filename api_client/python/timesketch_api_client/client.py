@@ -14,9 +14,14 @@
 """Timesketch API client."""
 from __future__ import unicode_literals
 
+import hashlib
 import json
+import os
+import time
 import uuid
 
+from multiprocessing.pool import ThreadPool
+
 # pylint: disable=wrong-import-order
 import bs4
 import requests
@@ -30,6 +35,18 @@ import numpy
 from .definitions import HTTP_STATUS_CODE_20X
 
 
+# Files larger than this are uploaded in chunks.
+CHUNKED_UPLOAD_THRESHOLD = 32 * 1024 * 1024
+
+# Number of chunks that are uploaded at the same time.
+DEFAULT_UPLOAD_WORKERS = 4
+
+# Number of times a chunk is sent before giving up on it in a round, and the
+# number of rounds of sending the chunks the server is missing.
+UPLOAD_CHUNK_RETRIES = 3
+UPLOAD_MAX_ROUNDS = 3
+
+
 class TimesketchApi(object):
     """Timesketch API object
 
@@ -446,21 +463,121 @@ class Sketch(BaseResource):
             timelines.append(timeline_obj)
         return timelines
 
-    def upload(self, timeline_name, file_path):
+    def _upload_chunk(self, upload_url, file_path, chunk_index, chunk_size):
+        """Send a chunk of a file, with retries.
+
+        Args:
+            upload_url: URL of the chunked upload.
+            file_path: Path to the file that is uploaded.
+            chunk_index: Index of the chunk, starting at 0.
+            chunk_size: Size of a chunk in bytes.
+
+        Returns:
+            Boolean indicating if the server accepted the chunk.
+        """
+        with open(file_path, 'rb') as fh:
+            fh.seek(chunk_index * chunk_size)
+            data = fh.read(chunk_size)
+        headers = {'X-Chunk-SHA256': hashlib.sha256(data).hexdigest()}
+        chunk_url = '{0:s}{1:d}/'.format(upload_url, chunk_index)
+
+        for attempt in range(UPLOAD_CHUNK_RETRIES):
+            if attempt:
+                time.sleep(2 ** attempt)
+            try:
+                response = self.api.session.put(
+                    chunk_url, data=data, headers=headers)
+            except requests.exceptions.RequestException:
+                continue
+            if response.status_code in HTTP_STATUS_CODE_20X:
+                return True
+        return False
+
+    def _upload_chunked(self, timeline_name, file_path, workers):
+        """Upload a file in chunks that are sent concurrently.
+
+        Chunks that fail are sent again after the other chunks, until the
+        server has all of them.
+
+        Args:
+            timeline_name: Name of the resulting timeline.
+            file_path: Path to the file to be uploaded.
+            workers: Number of chunks to send at the same time.
+
+        Returns:
+            Dictionary with the response data of the finished upload.
+
+        Raises:
+            RuntimeError if the upload can't be started or finished.
+        """
+        resource_url = '{0:s}/upload/chunked/'.format(self.api.api_root)
+        data = {
+            'filename': os.path.basename(file_path),
+            'file_size': os.path.getsize(file_path),
+            'name': timeline_name,
+            'sketch_id': self.id
+        }
+        response = self.api.session.post(resource_url, json=data)
+        if response.status_code not in HTTP_STATUS_CODE_20X:
+            raise RuntimeError('Unable to start upload: {0!s}'.format(
+                response.json()))
+        upload = response.json()['meta']
+        upload_url = '{0:s}{1:s}/'.format(resource_url, upload['upload_id'])
+
+        for _ in range(UPLOAD_MAX_ROUNDS):
+            if not upload['missing_chunks']:
+                break
+            pool = ThreadPool(workers)
+            try:
+                pool.map(
+                    lambda chunk_index: self._upload_chunk(
+                        upload_url, file_path, chunk_index,
+                        upload['chunk_size']),
+                    upload['missing_chunks'])
+            finally:
+                pool.close()
+                pool.join()
+            # Ask the server which chunks it still needs.
+            upload = self.api.session.get(upload_url).json()['meta']
+
+        if upload['missing_chunks']:
+            raise RuntimeError('Unable to upload {0:d} chunk(s)'.format(
+                len(upload['missing_chunks'])))
+
+        response = self.api.session.post(upload_url)
+        if response.status_code not in HTTP_STATUS_CODE_20X:
+            raise RuntimeError('Unable to finish upload: {0!s}'.format(
+                response.json()))
+        return response.json()
+
+    def upload(self, timeline_name, file_path, chunked=None,
+               workers=DEFAULT_UPLOAD_WORKERS):
         """Upload a CSV, JSONL, or Plaso file to the server for indexing.
 
         Args:
             timeline_name: Name of the resulting timeline.
             file_path: Path to the file to be uploaded.
+            chunked: Boolean indicating if the file should be uploaded in
+                chunks. Defaults to True for files larger than
+                CHUNKED_UPLOAD_THRESHOLD bytes.
+            workers: Number of chunks to send at the same time.
 
         Returns:
             Timeline object instance.
         """
-        resource_url = '{0:s}/upload/'.format(self.api.api_root)
-        files = {'file': open(file_path, 'rb')}
-        data = {'name': timeline_name, 'sketch_id': self.id}
-        response = self.api.session.post(resource_url, files=files, data=data)
-        response_dict = response.json()
+        if chunked is None:
+            chunked = os.path.getsize(file_path) > CHUNKED_UPLOAD_THRESHOLD
+
+        if chunked:
+            response_dict = self._upload_chunked(
+                timeline_name, file_path, workers)
+        else:
+            resource_url = '{0:s}/upload/'.format(self.api.api_root)
+            files = {'file': open(file_path, 'rb')}
+            data = {'name': timeline_name, 'sketch_id': self.id}
+            response = self.api.session.post(
+                resource_url, files=files, data=data)
+            response_dict = response.json()
         timeline = response_dict['objects'][0]
         timeline_obj = Timeline(
             timeline_id=timeline['id'],
@@ -566,6 +683,9 @@ class Sketch(BaseResource):
             'filter': query_filter,
             'dsl': query_dsl,
             'fields': return_fields,
+            'enable_cursor': True,
+            # Servers without cursor support page with a scroll instead,
+            # servers with cursor support ignore this.
             'enable_scroll': True,
         }
 
@@ -577,21 +697,37 @@ class Sketch(BaseResource):
 
         response_json = response.json()
 
-        scroll_id = response_json.get('meta', {}).get('scroll_id', '')
-        form_data['scroll_id'] = scroll_id
+        # Page through the results with the continuation cursor, this keeps
+        # no state on the server so abandoned queries cost nothing. Servers
+        # without cursor support return no cursor but a scroll ID.
+        meta = response_json.get('meta', {})
+        use_cursor = 'cursor' in meta
+        if use_cursor:
+            next_page = meta.get('cursor', '')
+        else:
+            next_page = meta.get('scroll_id', '')
 
         count = len(response_json.get('objects', []))
         total_count = count
-        while count > 0:
+        while next_page and count > 0:
             if max_entries and total_count >= max_entries:
                 break
+            if use_cursor:
+                form_data['cursor'] = next_page
+            else:
+                form_data['scroll_id'] = next_page
             more_response = self.api.session.post(resource_url, json=form_data)
             if more_response.status_code != 200:
                 raise ValueError((
                     'Unable to query results, with error: '
-                    '[{0:d}] {1:s}').format(
-                        response.status_code, response.reason))
+                    '[{0:d}] {1!s}').format(
+                        more_response.status_code, more_response.reason))
             more_response_json = more_response.json()
+            more_meta = more_response_json.get('meta', {})
+            if use_cursor:
+                next_page = more_meta.get('cursor', '')
+            else:
+                next_page = more_meta.get('scroll_id', next_page)
             count = len(more_response_json.get('objects', []))
             total_count += count
             response_json['objects'].extend(
@@ -13,7 +13,11 @@
 # limitations under the License.
 """Tests for the Timesketch API client"""
 
+import hashlib
+import os
+import tempfile
 import unittest
+
 import mock
 
 from . import client
@@ -173,7 +177,54 @@ class SketchTest(unittest.TestCase):
                                                u'test')
         self.sketch = self.api_client.get_sketch(1)
 
-    # TODO: Add test for upload()
+    def test_upload_chunked(self):
+        """Test to upload a file in chunks and to retry failed chunks."""
+        data = b'0123456789'
+        fd, file_path = tempfile.mkstemp(suffix=u'.csv')
+        os.write(fd, data)
+        os.close(fd)
+        self.addCleanup(os.remove, file_path)
+
+        chunks = {}
+        failures = set([1])
+
+        def put(url, data=None, headers=None):
+            """Mock PUT request handler that fails a chunk once."""
+            chunk_index = int(url.rstrip(u'/').split(u'/')[-1])
+            if chunk_index in failures:
+                failures.discard(chunk_index)
+                return mock.Mock(status_code=500)
+            self.assertEqual(
+                headers[u'X-Chunk-SHA256'], hashlib.sha256(data).hexdigest())
+            chunks[chunk_index] = data
+            return mock.Mock(status_code=200)
+
+        def upload_state():
+            """Mock upload state response."""
+            missing = [i for i in range(3) if i not in chunks]
+            return mock.Mock(status_code=200, json=lambda: {u'meta': {
+                u'upload_id': u'abc', u'chunk_size': 4,
+                u'missing_chunks': missing}})
+
+        timeline = {u'objects': [{
+            u'id': 1, u'name': u'test', u'searchindex': {
+                u'index_name': u'test'}}]}
+        session = mock.Mock()
+        session.put.side_effect = put
+        session.get.side_effect = lambda url: upload_state()
+        session.post.side_effect = [
+            upload_state(), mock.Mock(status_code=201, json=lambda: timeline)]
+        self.api_client.session = session
+
+        with mock.patch(u'time.sleep'):
+            result = self.sketch.upload(
+                u'test', file_path, chunked=True, workers=2)
+        self.assertIsInstance(result, client.Timeline)
+        self.assertEqual(
+            b''.join(chunks[i] for i in sorted(chunks)), data)
+        self.assertEqual(session.put.call_count, 4)
+        session.post.assert_called_with(
+            u'http://127.0.0.1/api/v1/upload/chunked/abc/')
 
     def test_get_views(self):
         """Test to get a view."""
@@ -195,6 +246,43 @@ class SketchTest(unittest.TestCase):
         self.assertEqual(len(results['objects']), 1)
         self.assertIsInstance(results['objects'], list)
 
+    def _explore_pages(self, pages):
+        """Explore with a session that returns pages of results.
+
+        Args:
+            pages: List of tuples with a list of events and the meta data.
+
+        Returns:
+            Tuple with the explore results and the mock session.
+        """
+        session = mock.Mock()
+        session.post.side_effect = [
+            mock.Mock(status_code=200, json=lambda objects=objects, meta=meta: {
+                u'objects': list(objects), u'meta': dict(meta)})
+            for objects, meta in pages]
+        self.api_client.session = session
+        return self.sketch.explore(query_string=u'test'), session
+
+    def test_explore_cursor(self):
+        """Test paging through the results with a cursor."""
+        results, session = self._explore_pages([
+            ([1, 2], {u'cursor': u'a', u'es_time': 1}),
+            ([3], {u'cursor': u'', u'es_time': 1})])
+        self.assertEqual(results[u'objects'], [1, 2, 3])
+        self.assertEqual(
+            session.post.call_args[1][u'json'][u'cursor'], u'a')
+
+    def test_explore_scroll(self):
+        """Test paging with a scroll on servers without cursor support."""
+        results, session = self._explore_pages([
+            ([1, 2], {u'scroll_id': u's', u'es_time': 1}),
+            ([3], {u'scroll_id': u's', u'es_time': 1}),
+            ([], {u'scroll_id': u's', u'es_time': 1})])
+        self.assertEqual(results[u'objects'], [1, 2, 3])
+        self.assertEqual(session.post.call_count, 3)
+        self.assertEqual(
+            session.post.call_args[1][u'json'][u'scroll_id'], u's')
+
 
 class ViewTest(unittest.TestCase):
     """Test View object."""
@@ -28,7 +28,11 @@ from flask_restful import Api
 from flask_wtf import CSRFProtect
 
 from timesketch.api.v1.routes import API_ROUTES as V1_API_ROUTES
+from timesketch.lib.datastores.cache import configure_cache
+from timesketch.lib.datastores.pool import configure_pool
 from timesketch.lib.errors import ApiHTTPError
+from timesketch.lib.queues import WORKER_QUEUE_ENVIRONMENT_VARIABLE
+from timesketch.lib.queues import get_celery_settings
 from timesketch.models import configure_engine
 from timesketch.models import init_db
 from timesketch.models.sketch import Sketch
@@ -101,6 +105,10 @@ def create_app(config=None):
     configure_engine(app.config['SQLALCHEMY_DATABASE_URI'])
     db = init_db()
 
+    # Setup the shared datastore clients.
+    configure_pool(app.config)
+    configure_cache(app.config)
+
     # Alembic migration support:
     # http://alembic.zzzcomputing.com/en/latest/
     migrate = Migrate()
@@ -165,6 +173,8 @@ def create_celery_app():
     app = create_app()
     celery = Celery(app.import_name, broker=app.config['CELERY_BROKER_URL'])
     celery.conf.update(app.config)
+    celery.conf.update(get_celery_settings(
+        app.config, os.environ.get(WORKER_QUEUE_ENVIRONMENT_VARIABLE)))
     TaskBase = celery.Task
 
     # pylint: disable=no-init
@@ -39,7 +39,6 @@ import uuid
 
 import six
 
-from dateutil import parser
 from flask import abort
 from flask import current_app
 from flask import jsonify
@@ -47,11 +46,13 @@ from flask import request
 from flask_login import current_user
 from flask_login import login_required
 from flask_restful import fields
+from flask_restful import inputs
 from flask_restful import marshal
 from flask_restful import reqparse
 from flask_restful import Resource
 from sqlalchemy import desc
 from sqlalchemy import not_
+from sqlalchemy.orm import joinedload
 
 from timesketch.lib.aggregators import manager as aggregator_manager
 from timesketch.lib.aggregators_old import heatmap
@@ -66,10 +67,15 @@ from timesketch.lib.datastores.elastic import ElasticsearchDataStore
 from timesketch.lib.datastores.neo4j import Neo4jDataStore
 from timesketch.lib.datastores.neo4j import SCHEMA as neo4j_schema
 from timesketch.lib.errors import ApiHTTPError
+from timesketch.lib.timestamps import normalize_datetime
+from timesketch.lib.uploads import ChunkedUpload
+from timesketch.lib.uploads import DEFAULT_UPLOAD_CHUNK_SIZE
+from timesketch.lib.uploads import DEFAULT_UPLOAD_MAX_FILE_SIZE
 from timesketch.lib.emojis import get_emojis_as_dict
 from timesketch.lib.forms import AddTimelineSimpleForm
 from timesketch.lib.forms import AggregationExploreForm
 from timesketch.lib.forms import AggregationLegacyForm
+from timesketch.lib.forms import ChunkedUploadForm
 from timesketch.lib.forms import CreateTimelineForm
 from timesketch.lib.forms import SaveAggregationForm
 from timesketch.lib.forms import SaveViewForm
@@ -82,12 +88,16 @@ from timesketch.lib.forms import StoryForm
 from timesketch.lib.forms import GraphExploreForm
 from timesketch.lib.forms import SearchIndexForm
 from timesketch.lib.forms import TimelineForm
+from timesketch.lib.utils import decode_search_cursor
+from timesketch.lib.utils import encode_search_cursor
 from timesketch.lib.utils import get_validated_indices
+from timesketch.lib.utils import split_file_extension
 from timesketch.lib.experimental.utils import GRAPH_VIEWS
 from timesketch.lib.experimental.utils import get_graph_views
 from timesketch.lib.experimental.utils import get_graph_view
 from timesketch.models import db_session
 from timesketch.models.sketch import Aggregation
+from timesketch.models.sketch import Analysis
 from timesketch.models.sketch import Event
 from timesketch.models.sketch import SearchIndex
 from timesketch.models.sketch import Sketch
@@ -135,6 +145,21 @@ class ResourceMixin(object):
         'updated_at': fields.DateTime
     }
 
+    import_progress_fields = {
+        'bytes_total': fields.Integer,
+        'bytes_read': fields.Integer,
+        'events_parsed': fields.Integer,
+        'events_indexed': fields.Integer,
+        'events_failed': fields.Integer,
+        'events_duplicate': fields.Integer,
+        'events_per_second': fields.Float,
+        'bytes_per_second': fields.Float,
+        'eta_seconds': fields.Float,
+        'started_at': fields.DateTime,
+        'reported_at': fields.DateTime,
+        'finished_at': fields.DateTime
+    }
+
     searchindex_fields = {
         'id': fields.Integer,
         'name': fields.String,
@@ -142,6 +167,8 @@ class ResourceMixin(object):
         'description': fields.String,
         'index_name': fields.String,
         'status': fields.Nested(status_fields),
+        'import_progress': fields.Nested(
+            import_progress_fields, allow_null=True),
         'deleted': fields.Boolean,
         'created_at': fields.DateTime,
         'updated_at': fields.DateTime
@@ -193,6 +220,27 @@ class ResourceMixin(object):
         'updated_at': fields.DateTime
     }
 
+    analysis_fields = {
+        'id': fields.Integer,
+        'name': fields.String,
+        'description': fields.String,
+        'analyzer_name': fields.String,
+        'parameters': fields.String,
+        'result': fields.String,
+        'status': fields.Nested(status_fields),
+        'timeline_id': fields.Integer,
+        'analysissession_id': fields.Integer,
+        'wall_time': fields.Float,
+        'search_time': fields.Float,
+        'run_time': fields.Float,
+        'write_time': fields.Float,
+        'events_read': fields.Integer,
+        'events_written': fields.Integer,
+        'peak_memory': fields.Integer,
+        'created_at': fields.DateTime,
+        'updated_at': fields.DateTime
+    }
+
     sketch_fields = {
         'id': fields.Integer,
         'name': fields.String,
@@ -229,6 +277,7 @@ class ResourceMixin(object):
         'user': user_fields,
         'sketch': sketch_fields,
         'story': story_fields,
+        'analysis': analysis_fields,
         'event_comment': comment_fields,
         'event_label': label_fields
     }
@@ -679,6 +728,8 @@ class ExploreResource(ResourceMixin, Resource):
         return_fields = form.fields.data
         enable_scroll = form.enable_scroll.data
         scroll_id = form.scroll_id.data
+        enable_cursor = form.enable_cursor.data
+        cursor = form.cursor.data
 
         if not return_fields:
             return_fields = DEFAULT_SOURCE_FIELDS
@@ -705,7 +756,20 @@ class ExploreResource(ResourceMixin, Resource):
                 query_filter.get('events'), query_dsl):
             abort(HTTP_STATUS_CODE_BAD_REQUEST)
 
-        if scroll_id:
+        # Cursor based pagination uses search_after and keeps no scroll
+        # context open on the cluster between requests.
+        search_after = None
+        if enable_cursor or cursor:
+            enable_cursor = True
+            enable_scroll = False
+            search_after = []
+            if cursor:
+                try:
+                    search_after = decode_search_cursor(cursor)
+                except ValueError:
+                    return bad_request('Invalid cursor')
+
+        if scroll_id and not enable_cursor:
             # pylint: disable=unexpected-keyword-arg
             result = self.datastore.client.scroll(
                 scroll_id=scroll_id, scroll='1m')
@@ -718,7 +782,8 @@ class ExploreResource(ResourceMixin, Resource):
                 indices,
                 aggregations=None,
                 return_fields=return_fields,
-                enable_scroll=enable_scroll)
+                enable_scroll=enable_scroll,
+                search_after=search_after)
 
         # Get labels for each event that matches the sketch.
         # Remove all other labels.
@@ -760,6 +825,15 @@ class ExploreResource(ResourceMixin, Resource):
             'timeline_names': tl_names,
             'scroll_id': result.get('_scroll_id', ''),
         }
+
+        # The cursor is the sort values of the last event on this page. An
+        # empty cursor means there are no more events.
+        if enable_cursor:
+            meta['cursor'] = ''
+            hits = result['hits']['hits']
+            if hits and hits[-1].get('sort'):
+                meta['cursor'] = encode_search_cursor(hits[-1]['sort'])
+
         schema = {'meta': meta, 'objects': result['hits']['hits']}
         return jsonify(schema)
 
@@ -1076,13 +1150,14 @@ class EventCreateResource(ResourceMixin, Resource):
             event_type = 'user_created_event'
 
             # derive datetime from timestamp:
-            parsed_datetime = parser.parse(form.timestamp.data)
-            timestamp = int(
-                time.mktime(parsed_datetime.utctimetuple())) * 1000000
-            timestamp += parsed_datetime.microsecond
+            try:
+                event_datetime, timestamp = normalize_datetime(
+                    form.timestamp.data)
+            except ValueError as e:
+                return bad_request(str(e))
 
             event = {
-                "datetime": form.timestamp.data,
+                "datetime": event_datetime,
                 "timestamp": timestamp,
                 "timestamp_desc": form.timestamp_desc.data,
                 "message": form.message.data,
@@ -1119,11 +1194,11 @@ class EventCreateResource(ResourceMixin, Resource):
 
                 timeline = None
                 if sketch and sketch.has_permission(current_user, 'write'):
-                    self.datastore.import_event(
-                        index_name,
-                        event_type,
-                        event,
-                        flush_interval=1)
+                    datastore = self.datastore
+                    datastore.import_event(index_name, event_type, event)
+                    summary = datastore.flush_queued_events()
+                    if summary.get(index_name, {}).get('failed'):
+                        raise RuntimeError('Unable to index the event.')
 
                     timeline = Timeline.get_or_create(
                         name=searchindex.name,
@@ -1232,10 +1307,63 @@ class EventResource(ResourceMixin, Resource):
 class EventAnnotationResource(ResourceMixin, Resource):
     """Resource to create an annotation for an event."""
 
+    # Maximum number of values in one SQL IN clause.
+    MAX_SQL_IN_VALUES = 500
+
+    def _get_events(self, sketch, searchindices, events):
+        """Get or create the database events to attach annotations to.
+
+        Existing events are fetched with one query per index and chunk of
+        document IDs, new events are added to the session but not committed.
+
+        Args:
+            sketch: A sketch (instance of timesketch.models.sketch.Sketch)
+            searchindices: Dictionary with index name as key and a
+                searchindex (instance of SearchIndex) as value.
+            events: List of event dictionaries with _index and _id.
+
+        Returns:
+            Dictionary with (index name, document ID) as key and an event
+            (instance of timesketch.models.sketch.Event) as value.
+        """
+        document_ids = {}
+        for _event in events:
+            document_ids.setdefault(_event['_index'], set()).add(_event['_id'])
+
+        db_events = {}
+        for index_name, index_document_ids in document_ids.items():
+            searchindex = searchindices[index_name]
+            index_document_ids = sorted(index_document_ids)
+            for i in range(
+                    0, len(index_document_ids), self.MAX_SQL_IN_VALUES):
+                chunk = index_document_ids[i:i + self.MAX_SQL_IN_VALUES]
+                query = Event.query.options(
+                    joinedload(Event.labels)).filter(
+                        Event.sketch_id == sketch.id,
+                        Event.searchindex_id == searchindex.id,
+                        Event.document_id.in_(chunk))
+                for event in query:
+                    db_events[(index_name, event.document_id)] = event
+
+            for document_id in index_document_ids:
+                if (index_name, document_id) not in db_events:
+                    event = Event(
+                        sketch=sketch,
+                        searchindex=searchindex,
+                        document_id=document_id)
+                    db_session.add(event)
+                    db_events[(index_name, document_id)] = event
+
+        return db_events
+
     @login_required
     def post(self, sketch_id):
         """Handles POST request to the resource.
 
+        All events are annotated in one database transaction and the labels
+        are set in the datastore with bulk requests. The status of the
+        datastore update for every event is returned in the meta data.
+
         Args:
             sketch_id: Integer primary key for a sketch database model
 
@@ -1243,70 +1371,127 @@ class EventAnnotationResource(ResourceMixin, Resource):
             An annotation in JSON (instance of flask.wrappers.Response)
         """
         form = EventAnnotationForm.build(request)
-        if form.validate_on_submit():
-            annotations = []
-            sketch = Sketch.query.get_with_acl(sketch_id)
-            indices = [t.searchindex.index_name for t in sketch.timelines]
-            annotation_type = form.annotation_type.data
-            events = form.events.raw_data
-
-            for _event in events:
-                searchindex_id = _event['_index']
-                searchindex = SearchIndex.query.filter_by(
-                    index_name=searchindex_id).first()
-                event_id = _event['_id']
-                event_type = _event['_type']
-
-                if searchindex_id not in indices:
-                    abort(HTTP_STATUS_CODE_BAD_REQUEST)
-
-                # Get or create an event in the SQL database to have something
-                # to attach the annotation to.
-                event = Event.get_or_create(
-                    sketch=sketch,
-                    searchindex=searchindex,
-                    document_id=event_id)
-
-                # Add the annotation to the event object.
-                if 'comment' in annotation_type:
-                    annotation = Event.Comment(
-                        comment=form.annotation.data, user=current_user)
-                    event.comments.append(annotation)
-                    self.datastore.set_label(
-                        searchindex_id,
-                        event_id,
-                        event_type,
-                        sketch.id,
-                        current_user.id,
-                        '__ts_comment',
-                        toggle=False)
-
-                elif 'label' in annotation_type:
-                    annotation = Event.Label.get_or_create(
-                        label=form.annotation.data, user=current_user)
-                    if annotation not in event.labels:
-                        event.labels.append(annotation)
-                    toggle = False
-                    if '__ts_star' or '__ts_hidden' in form.annotation.data:
-                        toggle = True
-                    self.datastore.set_label(
-                        searchindex_id,
-                        event_id,
-                        event_type,
-                        sketch.id,
-                        current_user.id,
-                        form.annotation.data,
-                        toggle=toggle)
-                else:
-                    abort(HTTP_STATUS_CODE_BAD_REQUEST)
+        if not form.validate_on_submit():
+            return abort(HTTP_STATUS_CODE_BAD_REQUEST)
 
-                annotations.append(annotation)
-                # Save the event to the database
-                db_session.add(event)
-                db_session.commit()
-            return self.to_json(
-                annotations, status_code=HTTP_STATUS_CODE_CREATED)
-        return abort(HTTP_STATUS_CODE_BAD_REQUEST)
+        sketch = Sketch.query.get_with_acl(sketch_id)
+        indices = [t.searchindex.index_name for t in sketch.timelines]
+        annotation_type = form.annotation_type.data
+        events = form.events.raw_data
+
+        if 'comment' in annotation_type:
+            label = '__ts_comment'
+            toggle = False
+        elif 'label' in annotation_type:
+            label = form.annotation.data
+            toggle = False
+            if label in ('__ts_star', '__ts_hidden'):
+                toggle = True
+        else:
+            abort(HTTP_STATUS_CODE_BAD_REQUEST)
+
+        # Validate all events before anything is written.
+        for _event in events:
+            if _event['_index'] not in indices:
+                abort(HTTP_STATUS_CODE_BAD_REQUEST)
+
+        searchindices = {
+            searchindex.index_name: searchindex
+            for searchindex in SearchIndex.query.filter(
+                SearchIndex.index_name.in_(
+                    {_event['_index'] for _event in events}))
+        }
+        db_events = self._get_events(sketch, searchindices, events)
+
+        annotations = []
+        for _event in events:
+            event = db_events[(_event['_index'], _event['_id'])]
+
+            # Add the annotation to the event object.
+            if 'comment' in annotation_type:
+                annotation = Event.Comment(
+                    comment=form.annotation.data, user=current_user)
+                event.comments.append(annotation)
+            else:
+                annotation = None
+                for event_label in event.labels:
+                    if (event_label.label == label and
+                            event_label.user == current_user):
+                        annotation = event_label
+                        break
+                if not annotation:
+                    annotation = Event.Label(label=label, user=current_user)
+                    event.labels.append(annotation)
+            annotations.append(annotation)
+
+        results = self.datastore.set_labels(
+            events, sketch.id, current_user.id, label, toggle=toggle)
+
+        # Save all events to the database
+        db_session.commit()
+
+        meta = {'events': results}
+        return self.to_json(
+            annotations, meta=meta, status_code=HTTP_STATUS_CODE_CREATED)
+
+
+def index_uploaded_file(file_path, file_extension, timeline_name,
+                        sketch_id=None):
+    """Create a timeline for an uploaded file and start indexing it.
+
+    Args:
+        file_path: Path to the uploaded file.
+        file_extension: Type of the file, e.g. csv.
+        timeline_name: Name of the timeline.
+        sketch_id: Optional ID of the sketch to add the timeline to.
+
+    Returns:
+        The timeline, or the search index if no timeline was added to a
+        sketch.
+    """
+    sketch = None
+    if sketch_id:
+        sketch = Sketch.query.get_with_acl(sketch_id)
+
+    index_name = uuid.uuid4().hex
+    if not isinstance(index_name, six.text_type):
+        index_name = codecs.decode(index_name, 'utf-8')
+
+    # Create the search index in the Timesketch database
+    searchindex = SearchIndex.get_or_create(
+        name=timeline_name,
+        description=timeline_name,
+        user=current_user,
+        index_name=index_name)
+    searchindex.grant_permission(permission='read', user=current_user)
+    searchindex.grant_permission(permission='write', user=current_user)
+    searchindex.grant_permission(permission='delete', user=current_user)
+    searchindex.set_status('processing')
+    db_session.add(searchindex)
+    db_session.commit()
+
+    timeline = None
+    if sketch and sketch.has_permission(current_user, 'write'):
+        timeline = Timeline(
+            name=searchindex.name,
+            description=searchindex.description,
+            sketch=sketch,
+            user=current_user,
+            searchindex=searchindex)
+        timeline.set_status('processing')
+        sketch.timelines.append(timeline)
+        db_session.add(timeline)
+        db_session.commit()
+
+    # Start Celery pipeline for indexing and analysis.
+    # Import here to avoid circular imports.
+    from timesketch.lib import tasks
+    pipeline = tasks.build_index_pipeline(
+        file_path, timeline_name, index_name, file_extension, sketch_id)
+    pipeline.apply_async()
+
+    # Return Timeline if it was created.
+    return timeline or searchindex
 
 
 class UploadFileResource(ResourceMixin, Resource):
@@ -1329,13 +1514,13 @@ class UploadFileResource(ResourceMixin, Resource):
         if form.validate_on_submit() and upload_enabled:
             sketch_id = form.sketch_id.data or None
             file_storage = form.file.data
-            _filename, _extension = os.path.splitext(file_storage.filename)
-            file_extension = _extension.lstrip('.')
+            _filename, file_extension, _ = split_file_extension(
+                file_storage.filename)
             timeline_name = form.name.data or _filename.rstrip('.')
 
-            sketch = None
+            # Check access to the sketch before the file is saved.
             if sketch_id:
-                sketch = Sketch.query.get_with_acl(sketch_id)
+                Sketch.query.get_with_acl(sketch_id)
 
             # We do not need a human readable filename or
             # datastore index name, so we use UUIDs here.
@@ -1343,61 +1528,144 @@ class UploadFileResource(ResourceMixin, Resource):
             if not isinstance(filename, six.text_type):
                 filename = codecs.decode(filename, 'utf-8')
 
-            index_name = uuid.uuid4().hex
-            if not isinstance(index_name, six.text_type):
-                index_name = codecs.decode(index_name, 'utf-8')
-
             file_path = os.path.join(upload_folder, filename)
             file_storage.save(file_path)
 
-            # Create the search index in the Timesketch database
-            searchindex = SearchIndex.get_or_create(
-                name=timeline_name,
-                description=timeline_name,
-                user=current_user,
-                index_name=index_name)
-            searchindex.grant_permission(permission='read', user=current_user)
-            searchindex.grant_permission(permission='write', user=current_user)
-            searchindex.grant_permission(
-                permission='delete', user=current_user)
-            searchindex.set_status('processing')
-            db_session.add(searchindex)
-            db_session.commit()
-
-            timeline = None
-            if sketch and sketch.has_permission(current_user, 'write'):
-                timeline = Timeline(
-                    name=searchindex.name,
-                    description=searchindex.description,
-                    sketch=sketch,
-                    user=current_user,
-                    searchindex=searchindex)
-                timeline.set_status('processing')
-                sketch.timelines.append(timeline)
-                db_session.add(timeline)
-                db_session.commit()
-
-            # Start Celery pipeline for indexing and analysis.
-            # Import here to avoid circular imports.
-            from timesketch.lib import tasks
-            pipeline = tasks.build_index_pipeline(
-                file_path, timeline_name, index_name, file_extension, sketch_id)
-            pipeline.apply_async()
-
-            # Return Timeline if it was created.
-            # pylint: disable=no-else-return
-            if timeline:
-                return self.to_json(
-                    timeline, status_code=HTTP_STATUS_CODE_CREATED)
-
             return self.to_json(
-                searchindex, status_code=HTTP_STATUS_CODE_CREATED)
+                index_uploaded_file(
+                    file_path, file_extension, timeline_name, sketch_id),
+                status_code=HTTP_STATUS_CODE_CREATED)
 
         raise ApiHTTPError(
             message=form.errors['file'][0],
             status_code=HTTP_STATUS_CODE_BAD_REQUEST)
 
 
+def get_chunked_upload(upload_id):
+    """Get a chunked upload of the current user.
+
+    Args:
+        upload_id: ID of the upload.
+
+    Returns:
+        Instance of timesketch.lib.uploads.ChunkedUpload.
+    """
+    try:
+        upload = ChunkedUpload.load(
+            current_app.config['UPLOAD_FOLDER'], upload_id)
+    except KeyError:
+        abort(HTTP_STATUS_CODE_NOT_FOUND)
+    if upload.user_id != current_user.id:
+        abort(HTTP_STATUS_CODE_FORBIDDEN)
+    return upload
+
+
+class ChunkedUploadListResource(ResourceMixin, Resource):
+    """Resource to start chunked file uploads."""
+
+    @login_required
+    def post(self):
+        """Handles POST request to the resource.
+
+        Starts an upload. The metadata of the response has the upload ID,
+        the chunk size and the chunks the client needs to send.
+
+        Returns:
+            Upload state in JSON (instance of flask.wrappers.Response)
+        """
+        if not current_app.config['UPLOAD_ENABLED']:
+            abort(HTTP_STATUS_CODE_FORBIDDEN)
+
+        form = ChunkedUploadForm.build(request)
+        if not form.validate_on_submit():
+            return bad_request(
+                'Unable to start upload: {0!s}'.format(form.errors))
+
+        sketch_id = form.sketch_id.data or None
+        if sketch_id:
+            Sketch.query.get_with_acl(sketch_id)
+
+        try:
+            upload = ChunkedUpload.create(
+                current_app.config['UPLOAD_FOLDER'],
+                filename=form.filename.data,
+                file_size=form.file_size.data,
+                chunk_size=current_app.config.get(
+                    'UPLOAD_CHUNK_SIZE', DEFAULT_UPLOAD_CHUNK_SIZE),
+                user_id=current_user.id,
+                sketch_id=sketch_id,
+                timeline_name=form.name.data or None,
+                max_file_size=current_app.config.get(
+                    'UPLOAD_MAX_FILE_SIZE', DEFAULT_UPLOAD_MAX_FILE_SIZE))
+        except ValueError as e:
+            return bad_request('Unable to start upload: {0!s}'.format(e))
+        return self.to_json(
+            [], meta=upload.to_dict(), status_code=HTTP_STATUS_CODE_CREATED)
+
+
+class ChunkedUploadResource(ResourceMixin, Resource):
+    """Resource to get the state of and finish chunked file uploads."""
+
+    @login_required
+    def get(self, upload_id):
+        """Handles GET request to the resource.
+
+        Returns:
+            Upload state with the missing chunks in JSON (instance of
+            flask.wrappers.Response)
+        """
+        upload = get_chunked_upload(upload_id)
+        return self.to_json([], meta=upload.to_dict())
+
+    @login_required
+    def post(self, upload_id):
+        """Handles POST request to the resource.
+
+        Finishes the upload when all chunks have been received and starts
+        indexing the file.
+
+        Returns:
+            A timeline or search index in JSON (instance of
+            flask.wrappers.Response)
+        """
+        upload = get_chunked_upload(upload_id)
+        try:
+            file_path = upload.finish()
+        except ValueError as e:
+            return bad_request(str(e))
+
+        _filename, file_extension, _ = split_file_extension(upload.filename)
+        timeline_name = upload.timeline_name or _filename.rstrip('.')
+        return self.to_json(
+            index_uploaded_file(
+                file_path, file_extension, timeline_name, upload.sketch_id),
+            status_code=HTTP_STATUS_CODE_CREATED)
+
+
+class ChunkedUploadChunkResource(ResourceMixin, Resource):
+    """Resource to receive the chunks of chunked file uploads."""
+
+    @login_required
+    def put(self, upload_id, chunk_index):
+        """Handles PUT request to the resource.
+
+        The request body is the chunk, the X-Chunk-SHA256 header must have
+        the hex encoded SHA-256 digest of it.
+
+        Returns:
+            Upload state with the missing chunks in JSON (instance of
+            flask.wrappers.Response)
+        """
+        upload = get_chunked_upload(upload_id)
+        try:
+            upload.write_chunk(
+                chunk_index, request.get_data(),
+                request.headers.get('X-Chunk-SHA256'))
+        except ValueError as e:
+            return bad_request(str(e))
+        return self.to_json([], meta=upload.to_dict())
+
+
 class TaskResource(ResourceMixin, Resource):
     """Resource to get information on celery task."""
 
@@ -1422,11 +1690,17 @@ class TaskResource(ResourceMixin, Resource):
         for search_index in indices:
             # pylint: disable=too-many-function-args
             celery_task = self.celery.AsyncResult(search_index.index_name)
+            progress = None
+            if search_index.import_progress:
+                progress = marshal(
+                    search_index.import_progress,
+                    self.import_progress_fields)
             task = dict(
                 task_id=celery_task.task_id,
                 state=celery_task.state,
                 successful=celery_task.successful(),
                 name=search_index.name,
+                progress=progress,
                 result=False)
             if celery_task.state == 'SUCCESS':
                 task['result'] = celery_task.result
@@ -1540,6 +1814,27 @@ class StoryResource(ResourceMixin, Resource):
         return abort(HTTP_STATUS_CODE_BAD_REQUEST)
 
 
+class AnalysisListResource(ResourceMixin, Resource):
+    """Resource to get all analyses for a sketch."""
+
+    @login_required
+    def get(self, sketch_id):
+        """Handles GET request to the resource.
+
+        The analyses include the execution profile of the analyzer runs.
+
+        Args:
+            sketch_id: Integer primary key for a sketch database model
+
+        Returns:
+            Analyses in JSON (instance of flask.wrappers.Response)
+        """
+        sketch = Sketch.query.get_with_acl(sketch_id)
+        analyses = Analysis.query.filter_by(
+            sketch=sketch).order_by(desc(Analysis.created_at)).all()
+        return self.to_json(analyses)
+
+
 class QueryResource(ResourceMixin, Resource):
     """Resource to get a query."""
 
@@ -1979,3 +2274,40 @@ class SearchIndexResource(ResourceMixin, Resource):
         """
         searchindex = SearchIndex.query.get_with_acl(searchindex_id)
         return self.to_json(searchindex)
+
+
+class SearchIndexResumeResource(ResourceMixin, Resource):
+    """Resource to resume a failed or interrupted import."""
+
+    def __init__(self):
+        super(SearchIndexResumeResource, self).__init__()
+        self.parser = reqparse.RequestParser()
+        self.parser.add_argument(
+            'force', type=inputs.boolean, required=False, default=False)
+
+    @login_required
+    def post(self, searchindex_id):
+        """Handles POST request to the resource.
+
+        Returns:
+            Search index in JSON (instance of flask.wrappers.Response)
+
+        Raises:
+            ApiHTTPError
+        """
+        searchindex = SearchIndex.query.get_with_acl(searchindex_id)
+        if not searchindex.has_permission(current_user, 'write'):
+            abort(HTTP_STATUS_CODE_FORBIDDEN)
+
+        # Import here to avoid circular imports.
+        from timesketch.lib import tasks
+        args = self.parser.parse_args()
+        try:
+            pipeline = tasks.build_resume_pipeline(
+                searchindex.index_name, force=args.get('force'))
+        except ValueError as e:
+            raise ApiHTTPError(
+                message=str(e), status_code=HTTP_STATUS_CODE_BAD_REQUEST)
+        pipeline.apply_async()
+
+        return self.to_json(searchindex, status_code=HTTP_STATUS_CODE_CREATED)
@@ -15,14 +15,24 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import hashlib
 import json
+import os
+import shutil
+import tempfile
+
 import mock
 
 from timesketch.lib.definitions import HTTP_STATUS_CODE_CREATED
 from timesketch.lib.definitions import HTTP_STATUS_CODE_OK
 from timesketch.lib.definitions import HTTP_STATUS_CODE_BAD_REQUEST
+from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 from timesketch.lib.testlib import BaseTest
 from timesketch.lib.testlib import MockDataStore
+from timesketch.lib.utils import decode_search_cursor
+from timesketch.models.sketch import Analysis
+from timesketch.models.sketch import Event
+from timesketch.models.sketch import Sketch
 
 from timesketch.api.v1.resources import ResourceMixin
 
@@ -213,6 +223,34 @@ class ExploreResourceTest(BaseTest):
         self.assertDictEqual(response.json, self.expected_response)
         self.assert200(response)
 
+    @mock.patch('timesketch.api.v1.resources.ElasticsearchDataStore',
+                MockDataStore)
+    def test_search_cursor(self):
+        """Authenticated request to query the datastore with a cursor."""
+        self.login()
+        data = dict(query='test', filter={}, enable_cursor=True)
+        response = self.client.post(
+            self.resource_url,
+            data=json.dumps(data, ensure_ascii=False),
+            content_type='application/json')
+        self.assert200(response)
+        cursor = response.json['meta']['cursor']
+        self.assertEqual(decode_search_cursor(cursor), [1410593223000])
+
+        data = dict(query='test', filter={}, cursor=cursor)
+        response = self.client.post(
+            self.resource_url,
+            data=json.dumps(data, ensure_ascii=False),
+            content_type='application/json')
+        self.assert200(response)
+
+        data = dict(query='test', filter={}, cursor='invalid')
+        response = self.client.post(
+            self.resource_url,
+            data=json.dumps(data, ensure_ascii=False),
+            content_type='application/json')
+        self.assert400(response)
+
 
 class AggregationLegacyResourceTest(BaseTest):
     """Test AggregationLegacyResource."""
@@ -314,6 +352,52 @@ class EventAnnotationResourceTest(BaseTest):
                 content_type='application/json')
             self.assertIsInstance(response.json, dict)
             self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+            self.assertEqual(response.json['meta']['events'], [
+                {'_index': 'test', '_id': 'test', 'status': 200}])
+
+    @mock.patch('timesketch.api.v1.resources.ElasticsearchDataStore',
+                MockDataStore)
+    def test_post_annotate_many_events(self):
+        """Authenticated request to label several events at once."""
+        self.login()
+        events = [
+            {'_type': 'test_event', '_index': 'test', '_id': 'test1'},
+            {'_type': 'test_event', '_index': 'test', '_id': 'test2'},
+        ]
+        data = dict(annotation='foo', annotation_type='label', events=events)
+        for _ in range(2):
+            response = self.client.post(
+                self.resource_url,
+                data=json.dumps(data),
+                content_type='application/json')
+            self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+            self.assertEqual(len(response.json['meta']['events']), 2)
+
+        db_events = Event.query.filter(
+            Event.document_id.in_(['test1', 'test2'])).all()
+        self.assertEqual(len(db_events), 2)
+        for event in db_events:
+            self.assertEqual([l.label for l in event.labels], ['foo'])
+
+    @mock.patch('timesketch.api.v1.resources.ElasticsearchDataStore',
+                MockDataStore)
+    def test_post_annotate_toggle(self):
+        """Authenticated request to star an event and to label it."""
+        self.login()
+        events = [{'_type': 'test_event', '_index': 'test', '_id': 'test'}]
+        for label, toggle in (('__ts_star', True), ('foo', False)):
+            data = dict(
+                annotation=label, annotation_type='label', events=events)
+            with mock.patch.object(
+                    MockDataStore, 'set_labels',
+                    return_value=[]) as mock_set_labels:
+                response = self.client.post(
+                    self.resource_url,
+                    data=json.dumps(data),
+                    content_type='application/json')
+            self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+            self.assertEqual(
+                mock_set_labels.call_args[1], {'toggle': toggle})
 
     def test_post_annotate_invalid_index_resource(self):
         """
@@ -351,6 +435,143 @@ class SearchIndexResourceTest(BaseTest):
         self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
 
 
+class SearchIndexResumeResourceTest(BaseTest):
+    """Test SearchIndexResumeResource."""
+    resource_url = '/api/v1/searchindices/1/resume/'
+
+    def test_post_resume(self):
+        """Authenticated request to resume an import."""
+        self.login()
+        mock_tasks = mock.Mock()
+        with mock.patch('timesketch.lib.tasks', mock_tasks, create=True):
+            response = self.client.post(self.resource_url)
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        mock_tasks.build_resume_pipeline.assert_called_once_with(
+            'test', force=False)
+        pipeline = mock_tasks.build_resume_pipeline.return_value
+        pipeline.apply_async.assert_called_once_with()
+
+    def test_post_resume_force(self):
+        """Authenticated request to resume an import that is processing."""
+        self.login()
+        mock_tasks = mock.Mock()
+        with mock.patch('timesketch.lib.tasks', mock_tasks, create=True):
+            response = self.client.post(
+                self.resource_url, data=json.dumps({'force': True}),
+                content_type='application/json')
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        mock_tasks.build_resume_pipeline.assert_called_once_with(
+            'test', force=True)
+
+    def test_post_resume_without_checkpoint(self):
+        """Authenticated request to resume an import that can't resume."""
+        self.login()
+        mock_tasks = mock.Mock()
+        mock_tasks.build_resume_pipeline.side_effect = ValueError(
+            'No import to resume for index: test')
+        with mock.patch('timesketch.lib.tasks', mock_tasks, create=True):
+            response = self.client.post(self.resource_url)
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_BAD_REQUEST)
+
+
+class ChunkedUploadResourceTest(BaseTest):
+    """Test the chunked upload resources."""
+    resource_url = '/api/v1/upload/chunked/'
+
+    def setUp(self):
+        """Enable uploads to a temporary folder."""
+        super(ChunkedUploadResourceTest, self).setUp()
+        upload_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_folder)
+        self.app.config['UPLOAD_ENABLED'] = True
+        self.app.config['UPLOAD_FOLDER'] = upload_folder
+        self.app.config['UPLOAD_CHUNK_SIZE'] = 4
+
+    def _put_chunk(self, upload_id, index, data, checksum=None):
+        """Send a chunk.
+
+        Args:
+            upload_id: ID of the upload.
+            index: Index of the chunk.
+            data: Bytes of the chunk.
+            checksum: Optional checksum, defaults to the one of data.
+
+        Returns:
+            Response of the request.
+        """
+        return self.client.put(
+            '{0:s}{1:s}/{2:d}/'.format(self.resource_url, upload_id, index),
+            data=data, headers={
+                'X-Chunk-SHA256':
+                    checksum or hashlib.sha256(data).hexdigest()})
+
+    def test_chunked_upload(self):
+        """Authenticated request to upload a file in chunks."""
+        self.login()
+        response = self.client.post(
+            self.resource_url, data=json.dumps(dict(
+                filename='timeline.jsonl.gz', file_size=10, sketch_id=1)),
+            content_type='application/json')
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        upload = response.json['meta']
+        self.assertEqual(upload['chunk_count'], 3)
+        upload_id = upload['upload_id']
+
+        response = self._put_chunk(upload_id, 1, b'4567', checksum='00')
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_BAD_REQUEST)
+        response = self._put_chunk(upload_id, 2, b'89')
+        self.assertEqual(response.json['meta']['missing_chunks'], [0, 1])
+        self._put_chunk(upload_id, 0, b'0123')
+
+        # The upload can't be finished before all chunks are received.
+        response = self.client.post(
+            '{0:s}{1:s}/'.format(self.resource_url, upload_id))
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_BAD_REQUEST)
+
+        self._put_chunk(upload_id, 1, b'4567')
+        response = self.client.get(
+            '{0:s}{1:s}/'.format(self.resource_url, upload_id))
+        self.assertEqual(response.json['meta']['missing_chunks'], [])
+
+        mock_tasks = mock.Mock()
+        with mock.patch('timesketch.lib.tasks', mock_tasks, create=True):
+            response = self.client.post(
+                '{0:s}{1:s}/'.format(self.resource_url, upload_id))
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+        self.assertEqual(response.json['objects'][0]['name'], 'timeline')
+        file_path, timeline_name, _, file_extension, sketch_id = (
+            mock_tasks.build_index_pipeline.call_args[0])
+        self.assertEqual(
+            (timeline_name, file_extension, sketch_id),
+            ('timeline', 'jsonl', 1))
+        with open(file_path, 'rb') as fh:
+            self.assertEqual(fh.read(), b'0123456789')
+
+        response = self.client.get(
+            '{0:s}{1:s}/'.format(self.resource_url, upload_id))
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_NOT_FOUND)
+
+    def test_chunked_upload_invalid_file_type(self):
+        """Authenticated request to upload an unsupported file type."""
+        self.login()
+        response = self.client.post(
+            self.resource_url, data=json.dumps(dict(
+                filename='timeline.plaso.gz', file_size=10)),
+            content_type='application/json')
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_BAD_REQUEST)
+
+    def test_chunked_upload_too_large(self):
+        """Authenticated request to upload a file above the maximum size."""
+        self.login()
+        self.app.config['UPLOAD_MAX_FILE_SIZE'] = 10
+        response = self.client.post(
+            self.resource_url, data=json.dumps(dict(
+                filename='timeline.jsonl', file_size=11)),
+            content_type='application/json')
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_BAD_REQUEST)
+        self.assertEqual(os.listdir(self.app.config['UPLOAD_FOLDER']), [])
+
+
 class TimelineListResourceTest(BaseTest):
     """Test TimelineList resource."""
     resource_url = '/api/v1/sketches/1/timelines/'
@@ -374,3 +595,27 @@ class TimelineListResourceTest(BaseTest):
             data=json.dumps(data, ensure_ascii=False),
             content_type='application/json')
         self.assertEqual(response.status_code, HTTP_STATUS_CODE_CREATED)
+
+
+class AnalysisListResourceTest(BaseTest):
+    """Test AnalysisListResource."""
+    resource_url = '/api/v1/sketches/1/analysis/'
+
+    def test_analysis_list_resource(self):
+        """Authenticated request to get the analyses of a sketch."""
+        self.login()
+        analysis = Analysis(
+            name='test', description='test', analyzer_name='domain',
+            parameters='{}', user=None, sketch=Sketch.query.get(1))
+        analysis.wall_time = 2.5
+        analysis.events_read = 100
+        self._commit_to_database(analysis)
+
+        response = self.client.get(self.resource_url)
+        self.assertEqual(response.status_code, HTTP_STATUS_CODE_OK)
+        analyses = response.json['objects'][0]
+        self.assertEqual(len(analyses), 1)
+        self.assertEqual(analyses[0]['analyzer_name'], 'domain')
+        self.assertEqual(analyses[0]['wall_time'], 2.5)
+        self.assertEqual(analyses[0]['events_read'], 100)
+        self.assertIsNone(analyses[0]['write_time'])
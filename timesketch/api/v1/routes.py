@@ -19,6 +19,7 @@ from .resources import AggregationListResource
 from .resources import AggregationLegacyResource
 from .resources import AggregationExploreResource
 from .resources import AggregationResource
+from .resources import AnalysisListResource
 from .resources import ExploreResource
 from .resources import EventResource
 from .resources import EventAnnotationResource
@@ -33,6 +34,9 @@ from .resources import ViewListResource
 from .resources import SearchTemplateResource
 from .resources import SearchTemplateListResource
 from .resources import UploadFileResource
+from .resources import ChunkedUploadListResource
+from .resources import ChunkedUploadResource
+from .resources import ChunkedUploadChunkResource
 from .resources import TaskResource
 from .resources import StoryListResource
 from .resources import StoryResource
@@ -42,6 +46,7 @@ from .resources import TimelineResource
 from .resources import TimelineListResource
 from .resources import SearchIndexListResource
 from .resources import SearchIndexResource
+from .resources import SearchIndexResumeResource
 
 
 # Disable error for long line. Readability is more important than line
@@ -63,15 +68,20 @@ API_ROUTES = [
     (SearchTemplateListResource, '/searchtemplate/'),
     (SearchTemplateResource, '/searchtemplate/<int:searchtemplate_id>/'),
     (UploadFileResource, '/upload/'),
+    (ChunkedUploadListResource, '/upload/chunked/'),
+    (ChunkedUploadResource, '/upload/chunked/<upload_id>/'),
+    (ChunkedUploadChunkResource, '/upload/chunked/<upload_id>/<int:chunk_index>/'),
     (TaskResource, '/tasks/'),
     (StoryListResource, '/sketches/<int:sketch_id>/stories/'),
     (StoryResource, '/sketches/<int:sketch_id>/stories/<int:story_id>/'),
+    (AnalysisListResource, '/sketches/<int:sketch_id>/analysis/'),
     (QueryResource, '/sketches/<int:sketch_id>/explore/query/'),
     (CountEventsResource, '/sketches/<int:sketch_id>/count/'),
     (TimelineListResource, '/sketches/<int:sketch_id>/timelines/'),
     (TimelineResource, '/sketches/<int:sketch_id>/timelines/<int:timeline_id>/'),
     (SearchIndexListResource, '/searchindices/'),
     (SearchIndexResource, '/searchindices/<int:searchindex_id>/'),
+    (SearchIndexResumeResource, '/searchindices/<int:searchindex_id>/resume/'),
     (GraphResource, '/sketches/<int:sketch_id>/explore/graph/'),
     (GraphViewListResource, '/sketches/<int:sketch_id>/explore/graph/views/'),
     (GraphViewResource, '/sketches/<int:sketch_id>/explore/graph/views/<int:view_id>/'),
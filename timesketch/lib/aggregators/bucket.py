@@ -78,7 +78,7 @@ class TermsAggregation(interface.BaseAggregator):
             'aggs': {
                 'aggregation': {
                     'terms': {
-                        'field': '{0:s}.keyword'.format(field),
+                        'field': self.get_terms_field(field),
                         'size': limit
                     }
                 }
@@ -15,12 +15,14 @@
 
 from __future__ import unicode_literals
 
-from elasticsearch import Elasticsearch
 from flask import current_app
 
 import pandas
 
 from timesketch.lib.charts import manager as chart_manager
+from timesketch.lib.datastores.cache import get_cache
+from timesketch.lib.datastores.pool import get_client
+from timesketch.lib.datastores.schema import get_terms_field
 from timesketch.models.sketch import Sketch as SQLSketch
 
 
@@ -119,9 +121,9 @@ class BaseAggregator(object):
 
         self.sketch = SQLSketch.query.get(sketch_id)
         self.index = index
-        self.elastic = Elasticsearch(
-            host=current_app.config['ELASTIC_HOST'],
-            port=current_app.config['ELASTIC_PORT'])
+        self.elastic = get_client(
+            current_app.config['ELASTIC_HOST'],
+            current_app.config['ELASTIC_PORT'])
 
         if not self.index:
             active_timelines = self.sketch.active_timelines
@@ -136,11 +138,34 @@ class BaseAggregator(object):
         Returns:
             Elasticsearch aggregation result.
         """
+        cache = get_cache()
+        cache_key = None
+        if cache.enabled:
+            cache_key = cache.build_key(
+                'aggregation', aggregation_spec, self.index)
+            aggregation = cache.get(cache_key)
+            if aggregation is not None:
+                return aggregation
+
         # pylint: disable=unexpected-keyword-arg
         aggregation = self.elastic.search(
             index=self.index, body=aggregation_spec, size=0)
+
+        if cache_key:
+            cache.set(cache_key, aggregation)
         return aggregation
 
+    def get_terms_field(self, field):
+        """Get the field to run a terms aggregation on.
+
+        Args:
+            field: Name of the event attribute.
+
+        Returns:
+            Name of the field with keyword values.
+        """
+        return get_terms_field(self.elastic, self.index, field)
+
     def run(self, *args, **kwargs):
         """Entry point for the aggregator."""
         raise NotImplementedError
@@ -19,7 +19,7 @@ from timesketch.lib.aggregators import manager
 from timesketch.lib.aggregators import interface
 
 
-def get_spec(field, query='', query_dsl=''):
+def get_spec(field, query='', query_dsl='', terms_field=None):
     """Returns aggregation specs for a term of filtered events.
 
     The aggregation spec will summarize values of an attribute
@@ -33,6 +33,8 @@ def get_spec(field, query='', query_dsl=''):
         query_dsl (str): the query DSL field to run on all documents prior
             to aggregating the results (optional). Either a query string
             or a query DSL has to be present.
+        terms_field (str): the field with keyword values to aggregate on,
+            defaults to the keyword sub field of the attribute (optional).
 
     Raises:
         ValueError: if neither query_string or query_dsl is provided.
@@ -64,7 +66,8 @@ def get_spec(field, query='', query_dsl=''):
                 'aggregations': {
                     'term_count': {
                         'terms': {
-                            'field': '{0:s}.keyword'.format(field)
+                            'field': terms_field or '{0:s}.keyword'.format(
+                                field)
                         }
                     }
                 }
@@ -131,7 +134,8 @@ class FilteredTermsAggregation(interface.BaseAggregator):
             raise ValueError('Both query_string and query_dsl are missing')
 
         aggregation_spec = get_spec(
-            field=field, query=query_string, query_dsl=query_dsl)
+            field=field, query=query_string, query_dsl=query_dsl,
+            terms_field=self.get_terms_field(field))
 
         # Encoding information for Vega-Lite.
         encoding = {
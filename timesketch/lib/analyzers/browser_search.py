@@ -58,6 +58,7 @@ class BrowserSearchSketchPlugin(interface.BaseSketchAnalyzer):
         """
         self.index_name = index_name
         super(BrowserSearchSketchPlugin, self).__init__(index_name, sketch_id)
+        self._search_counter = 0
 
     def _decode_url(self, url):
         """Decodes the URL, replaces %XX to their corresponding characters.
@@ -160,57 +161,65 @@ class BrowserSearchSketchPlugin(interface.BaseSketchAnalyzer):
 
         return self._decode_url(parameter)
 
-    def run(self):
-        """Entry point for the browser search analyzer.
+    def get_scan_query(self):
+        """Get the query for the events the analyzer looks at one by one.
 
         Returns:
-            String with summary of the analyzer result
+            Tuple with a query string, a JSON string with an Elasticsearch
+            DSL query and a list of fields to return.
         """
         query = 'source_short:"WEBHIST"'
         return_fields = ['url']
-        search_emoji = emojis.get_emoji('MAGNIFYING_GLASS')
+        return query, None, return_fields
 
-        # Generator of events based on your query.
-        events = self.event_stream(
-            query_string=query, return_fields=return_fields)
+    def analyze_event(self, event):
+        """Extract the search query from the URL of an event.
 
-        simple_counter = 0
-        for event in events:
-            url = event.source.get('url')
+        Args:
+            event: Instance of Event.
+        """
+        url = event.source.get('url')
 
-            if url is None:
+        if url is None:
+            return
+
+        for engine, expression, method_name, parameter in self._URL_FILTERS:
+            callback_method = getattr(self, method_name, None)
+            if not callback_method:
                 continue
 
-            for engine, expression, method_name, parameter in self._URL_FILTERS:
-                callback_method = getattr(self, method_name, None)
-                if not callback_method:
-                    continue
+            match = expression.search(url)
+            if not match:
+                continue
 
-                match = expression.search(url)
-                if not match:
-                    continue
+            if parameter:
+                search_query = callback_method(url, parameter)
+            else:
+                search_query = callback_method(url)
 
-                if parameter:
-                    search_query = callback_method(url, parameter)
-                else:
-                    search_query = callback_method(url)
+            if not search_query:
+                continue
 
-                if not search_query:
-                    continue
+            self._search_counter += 1
+            event.add_attributes({'search_string': search_query})
 
-                simple_counter += 1
-                event.add_attributes({'search_string': search_query})
+            event.add_human_readable('{0:s} search query: {1:s}'.format(
+                engine, search_query), self.NAME)
+            event.add_emojis([emojis.get_emoji('MAGNIFYING_GLASS')])
+            event.add_tags(['browser_search'])
+            # We break at the first hit of a successful search engine.
+            break
 
-                event.add_human_readable('{0:s} search query: {1:s}'.format(
-                    engine, search_query), self.NAME)
-                event.add_emojis([search_emoji])
-                event.add_tags(['browser_search'])
-                # We break at the first hit of a successful search engine.
-                break
+        # Commit the event to the datastore.
+        event.commit()
 
-            # Commit the event to the datastore.
-            event.commit()
+    def finalize(self):
+        """Add a view for the extracted search queries.
 
+        Returns:
+            String with summary of the analyzer result
+        """
+        simple_counter = self._search_counter
         if simple_counter > 0:
             self.sketch.add_view(
                 view_name='Browser Search', analyzer_name=self.NAME,
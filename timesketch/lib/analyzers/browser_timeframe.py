@@ -155,6 +155,8 @@ class BrowserTimeframeSketchPlugin(interface.BaseSketchAnalyzer):
 
     NAME = 'browser_timeframe'
     DEPENDENCIES = frozenset()
+    # Activity hours are calculated from all browser events.
+    FULL_RESCAN = True
 
     def __init__(self, index_name, sketch_id):
         """Initialize The Sketch Analyzer.
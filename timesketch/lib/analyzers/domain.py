@@ -18,6 +18,9 @@ class DomainSketchPlugin(interface.BaseSketchAnalyzer):
 
     DEPENDENCIES = frozenset()
 
+    # Domains are tagged by how common they are in the whole timeline.
+    FULL_RESCAN = True
+
     def __init__(self, index_name, sketch_id):
         """Initialize The Sketch Analyzer.
 
@@ -27,12 +30,16 @@ class DomainSketchPlugin(interface.BaseSketchAnalyzer):
         """
         self.index_name = index_name
         super(DomainSketchPlugin, self).__init__(index_name, sketch_id)
+        self._domains = {}
+        self._domain_counter = collections.Counter()
+        self._tld_counter = collections.Counter()
 
-    def run(self):
-        """Entry point for the analyzer.
+    def get_scan_query(self):
+        """Get the query for the events the analyzer looks at one by one.
 
         Returns:
-            String with summary of the analyzer result
+            Tuple with a query string, a JSON string with an Elasticsearch
+            DSL query and a list of fields to return.
         """
         query = (
             '{"query": { "bool": { "should": [ '
@@ -40,33 +47,42 @@ class DomainSketchPlugin(interface.BaseSketchAnalyzer):
             '{ "exists" : { "field" : "domain" }} ] } } }')
 
         return_fields = ['domain', 'url']
+        return '', query, return_fields
 
-        events = self.event_stream(
-            '', query_dsl=query, return_fields=return_fields)
+    def analyze_event(self, event):
+        """Count the domain of an event.
 
-        domains = {}
-        domain_counter = collections.Counter()
-        tld_counter = collections.Counter()
-        cdn_counter = collections.Counter()
+        Args:
+            event: Instance of Event.
+        """
+        domain = event.source.get('domain')
 
-        for event in events:
-            domain = event.source.get('domain')
+        if not domain:
+            url = event.source.get('url')
+            if not url:
+                return
+            domain = utils.get_domain_from_url(url)
 
-            if not domain:
-                url = event.source.get('url')
-                if not url:
-                    continue
-                domain = utils.get_domain_from_url(url)
+        if not domain:
+            return
 
-            if not domain:
-                continue
+        self._domain_counter[domain] += 1
+        self._domains.setdefault(domain, [])
+        self._domains[domain].append(event)
 
-            domain_counter[domain] += 1
-            domains.setdefault(domain, [])
-            domains[domain].append(event)
+        tld = '.'.join(domain.split('.')[-2:])
+        self._tld_counter[tld] += 1
 
-            tld = '.'.join(domain.split('.')[-2:])
-            tld_counter[tld] += 1
+    def finalize(self):
+        """Tag the events with the frequency of their domain.
+
+        Returns:
+            String with summary of the analyzer result
+        """
+        domains = self._domains
+        domain_counter = self._domain_counter
+        tld_counter = self._tld_counter
+        cdn_counter = collections.Counter()
 
         # Exit early if there are no domains in the data set to analyze.
         if not domain_counter:
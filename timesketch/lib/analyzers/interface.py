@@ -15,15 +15,22 @@
 
 from __future__ import unicode_literals
 
+import collections
+import json
 import logging
 import os
+import time
+import traceback
 import yaml
 
 import pandas
 
 from flask import current_app
 from timesketch.lib import definitions
+from timesketch.lib.analyzers.profiling import AnalyzerProfile
 from timesketch.lib.datastores.elastic import ElasticsearchDataStore
+from timesketch.lib.datastores.elastic import INGEST_TIME_FIELD
+from timesketch.lib.datastores.elastic import UPDATE_EVENT_SCRIPT
 from timesketch.models import db_session
 from timesketch.models.sketch import Event as SQLEvent
 from timesketch.models.sketch import Sketch as SQLSketch
@@ -31,14 +38,301 @@ from timesketch.models.sketch import SearchIndex
 from timesketch.models.sketch import View
 from timesketch.models.sketch import Analysis
 
+# Number of documents with pending updates an analyzer keeps before they are
+# queued in the datastore, see ANALYZER_UPDATE_BUFFER_SIZE.
+DEFAULT_UPDATE_BUFFER_SIZE = 10000
 
-def _flush_datastore_decorator(func):
-    """Decorator that flushes the bulk insert queue in the datastore."""
-    def wrapper(self, *args, **kwargs):
-        func_return = func(self, *args, **kwargs)
-        self.datastore.flush_queued_events()
-        return func_return
-    return wrapper
+
+# Events are still being indexed a while after they got their ingest time,
+# so the watermark of a run is set this many microseconds before it started.
+WATERMARK_OVERLAP = 5 * 60 * 1000000
+
+# Fields that event_stream() always returns.
+DEFAULT_STREAM_FIELDS = ['tag', 'human_readable', '__ts_emojis']
+
+
+def _flush_datastore(runner):
+    """Write the pending event updates of an analyzer run to the datastore.
+
+    Args:
+        runner: Analyzer or SharedScan instance.
+    """
+    runner.event_buffer.flush()
+    with runner.profile.time_write():
+        summary = runner.datastore.flush_queued_events()
+    indexed = sum(counts.get('indexed', 0) for counts in summary.values())
+    updated = sum(counts.get('updated', 0) for counts in summary.values())
+    failed = sum(counts.get('failed', 0) for counts in summary.values())
+    runner.profile.events_written += indexed
+    logging.info(
+        '[{0:s}] {1:d} event commits merged into {2:d} updates, {3:d} '
+        'commits without changes skipped, {4:d} documents written, '
+        '{5:d} failed'.format(
+            runner.name, runner.event_buffer.commits,
+            runner.event_buffer.updates, runner.event_buffer.skipped,
+            updated, failed))
+
+
+def _get_profile_path(analyzer_names, analysis_id):
+    """Get the path to write the function statistics of a run to.
+
+    Args:
+        analyzer_names: List of names of the analyzers in the run.
+        analysis_id: ID of the (first) analysis of the run, or the index
+            name for index analyzers.
+
+    Returns:
+        Path to a file in ANALYZER_PROFILE_DIR, or None if none of the
+        analyzers is in ANALYZER_PROFILE.
+    """
+    profile_dir = current_app.config.get('ANALYZER_PROFILE_DIR')
+    profile_analyzers = current_app.config.get('ANALYZER_PROFILE') or []
+    if not profile_dir:
+        return None
+    if not any(name in profile_analyzers for name in analyzer_names):
+        return None
+    return os.path.join(profile_dir, '{0:s}_{1!s}.pstats'.format(
+        '+'.join(analyzer_names), analysis_id))
+
+
+def set_analysis_error(analysis, error, error_traceback):
+    """Record that an analyzer failed on its analysis.
+
+    Args:
+        analysis: Instance of timesketch.models.sketch.Analysis.
+        error: The exception raised by the analyzer.
+        error_traceback: String with the traceback of the exception.
+
+    Returns:
+        String with the result of the analysis.
+    """
+    result = 'Error: {0!s}'.format(error)
+    analysis.result = result
+    analysis.log = error_traceback
+    analysis.set_status('ERROR')
+    db_session.add(analysis)
+    return result
+
+
+def _get_new_watermark():
+    """Get the watermark for an analysis that starts now.
+
+    Returns:
+        Ingest time in microseconds since epoch.
+    """
+    return int(time.time() * 1000000) - WATERMARK_OVERLAP
+
+
+def _get_last_watermark(analysis):
+    """Get the watermark of the last completed run of the same analysis.
+
+    Args:
+        analysis: Instance of timesketch.models.sketch.Analysis.
+
+    Returns:
+        Ingest time in microseconds since epoch, or None if the analyzer has
+        not analyzed the timeline with the same parameters before.
+    """
+    last_analysis = Analysis.query.filter(
+        Analysis.id < analysis.id,
+        Analysis.analyzer_name == analysis.analyzer_name,
+        Analysis.sketch_id == analysis.sketch_id,
+        Analysis.timeline_id == analysis.timeline_id,
+        Analysis.parameters == analysis.parameters,
+        Analysis.watermark.isnot(None)).order_by(
+            Analysis.id.desc()).first()
+    if not last_analysis:
+        return None
+    return last_analysis.watermark
+
+
+def _get_ingest_filter(watermark):
+    """Build a filter for the events ingested since a watermark.
+
+    Events without an ingest time, e.g. from Plaso or from before ingest
+    times were recorded, always match.
+
+    Args:
+        watermark: Ingest time in microseconds since epoch.
+
+    Returns:
+        Dictionary with an Elasticsearch DSL filter.
+    """
+    return {
+        'bool': {
+            'should': [
+                {'range': {INGEST_TIME_FIELD: {'gte': watermark}}},
+                {'bool': {
+                    'must_not': {'exists': {'field': INGEST_TIME_FIELD}}}}
+            ]
+        }
+    }
+
+
+def _is_unchanged(old_value, new_value):
+    """Check if an update sets an attribute to the value it has already.
+
+    Args:
+        old_value: Value of the attribute in the event.
+        new_value: Value in the update.
+
+    Returns:
+        True if the update does not change the attribute.
+    """
+    if old_value == new_value:
+        return True
+    if isinstance(old_value, dict) and isinstance(new_value, dict):
+        # Dictionaries are merged with the existing value.
+        return all(
+            key in old_value and _is_unchanged(old_value[key], value)
+            for key, value in new_value.items())
+    if isinstance(old_value, list) and isinstance(new_value, list):
+        # Tags and emojis are merged through sets, the order is arbitrary.
+        try:
+            return (len(old_value) == len(new_value) and
+                    set(old_value) == set(new_value))
+        except TypeError:
+            return False
+    return False
+
+
+def _merge_attributes(target, attributes):
+    """Merge attributes into pending attributes, like a partial update.
+
+    Dictionaries are merged recursively, so that e.g. two sessionizers that
+    set a different key of session_id both keep their session. Other values
+    replace the pending value.
+
+    Args:
+        target: Dictionary with pending attributes, changed in place.
+        attributes: Dictionary with new or updated attributes.
+    """
+    for key, value in attributes.items():
+        if isinstance(value, dict):
+            if not isinstance(target.get(key), dict):
+                target[key] = {}
+            _merge_attributes(target[key], value)
+        else:
+            target[key] = value
+
+
+def _build_update(attributes, labels):
+    """Build the partial update of an event for the datastore.
+
+    Args:
+        attributes: Dictionary with new or updated attributes.
+        labels: List of dictionaries with a timesketch_label and a toggle
+            flag, in the order they were added.
+
+    Returns:
+        Dictionary with the attributes or a script that sets the attributes
+        and labels, as accepted by import_event().
+    """
+    if not labels:
+        return dict(attributes)
+    return dict(
+        source=UPDATE_EVENT_SCRIPT, lang='painless',
+        params={'doc': dict(attributes), 'labels': list(labels)})
+
+
+class EventUpdateBuffer(object):
+    """Pending updates of events, merged per document.
+
+    Analyzers often change an event more than once, e.g. a label and a
+    few attributes. All changes to a document are kept until the buffer is
+    flushed and then sent to the datastore as a single update. The bulk
+    indexer of the datastore sends the updates in parallel bulk requests
+    limited by size in bytes.
+
+    Attributes:
+        datastore: Instance of ElasticsearchDatastore.
+        max_documents: Number of documents with pending updates before the
+            buffer is flushed.
+        commits: Number of commits added to the buffer.
+        skipped: Number of commits that did not change the event.
+        updates: Number of document updates sent to the datastore.
+        profile: Instance of AnalyzerProfile that records the time spent in
+            flushes, or None.
+    """
+
+    def __init__(
+            self, datastore, max_documents=DEFAULT_UPDATE_BUFFER_SIZE,
+            profile=None):
+        """Initialize the buffer.
+
+        Args:
+            datastore: Instance of ElasticsearchDatastore.
+            max_documents: Number of documents with pending updates before
+                the buffer is flushed.
+            profile: Optional instance of AnalyzerProfile that records the
+                time spent in flushes, bulk requests included.
+        """
+        super(EventUpdateBuffer, self).__init__()
+        self.datastore = datastore
+        self.max_documents = max(1, max_documents)
+        self.profile = profile
+        self.commits = 0
+        self.skipped = 0
+        self.updates = 0
+        # (index name, event ID) to event type, attributes and labels.
+        self._pending = collections.OrderedDict()
+
+    def __len__(self):
+        """Number of documents with pending updates."""
+        return len(self._pending)
+
+    def add(self, index_name, event_type, event_id, attributes, labels):
+        """Add the changes of a commit to the buffer.
+
+        Args:
+            index_name: Name of the index of the event.
+            event_type: Document type of the event.
+            event_id: ID of the event.
+            attributes: Dictionary with new or updated attributes.
+            labels: List of dictionaries with a timesketch_label and a
+                toggle flag.
+        """
+        self.commits += 1
+        if not (attributes or labels):
+            self.skipped += 1
+            return
+
+        key = (index_name, event_id)
+        _, pending_attributes, pending_labels = self._pending.setdefault(
+            key, (event_type, {}, []))
+        _merge_attributes(pending_attributes, attributes)
+        pending_labels.extend(labels)
+
+        if len(self._pending) >= self.max_documents:
+            self.flush()
+
+    def flush(self):
+        """Queue the pending updates in the datastore.
+
+        Returns:
+            Number of document updates queued.
+        """
+        if self.profile is None:
+            return self._flush()
+        with self.profile.time_write():
+            return self._flush()
+
+    def _flush(self):
+        """Queue the pending updates in the datastore.
+
+        Returns:
+            Number of document updates queued.
+        """
+        queued = 0
+        while self._pending:
+            (index_name, event_id), (event_type, attributes, labels) = (
+                self._pending.popitem(last=False))
+            self.datastore.import_event(
+                index_name, event_type, event_id=event_id,
+                event=_build_update(attributes, labels))
+            queued += 1
+        self.updates += queued
+        return queued
 
 
 def get_yaml_config(file_name):
@@ -77,26 +371,32 @@ class Event(object):
     Attributes:
         datastore: Instance of ElasticsearchDatastore.
         sketch: Sketch ID or None if not provided.
+        update_buffer: Instance of EventUpdateBuffer or None if commits are
+            sent to the datastore directly.
         event_id: ID of the Event.
         event_type: Document type in Elasticsearch.
         index_name: The name of the Elasticsearch index.
         source: Source document from Elasticsearch.
     """
-    def __init__(self, event, datastore, sketch=None):
+    def __init__(self, event, datastore, sketch=None, update_buffer=None):
         """Initialize Event object.
 
         Args:
             event: Dictionary of event from Elasticsearch.
             datastore: Instance of ElasticsearchDatastore.
             sketch: Optional instance of a Sketch object.
+            update_buffer: Optional instance of EventUpdateBuffer that
+                merges the commits of all events of an analyzer.
 
         Raises:
             KeyError if event dictionary is missing mandatory fields.
         """
         self.datastore = datastore
         self.sketch = sketch
+        self.update_buffer = update_buffer
 
         self.updated_event = {}
+        self._updated_labels = []
 
         try:
             self.event_id = event['_id']
@@ -112,27 +412,42 @@ class Event(object):
         Args:
             event: Dictionary with new or updated values.
         """
-        self.updated_event.update(event)
+        _merge_attributes(self.updated_event, event)
 
     def commit(self, event_dict=None):
         """Commit an event to Elasticsearch.
 
+        Attributes that already have the updated value are left out, and
+        nothing is sent if the event did not change. With an update buffer
+        the changes are merged with other commits of the same event.
+
         Args:
             event_dict: (optional) Dictionary with updated event attributes.
             Defaults to self.updated_event.
         """
         if event_dict:
-            event_to_commit = event_dict
-        else:
-            event_to_commit = self.updated_event
+            self._update(event_dict)
 
-        if not event_to_commit:
-            return
-
-        self.datastore.import_event(
-            self.index_name, self.event_type, event_id=self.event_id,
-            event=event_to_commit)
+        source = self.source if isinstance(self.source, dict) else {}
+        attributes = dict(
+            (key, value) for key, value in self.updated_event.items()
+            if key not in source or not _is_unchanged(source[key], value))
+        labels = self._updated_labels
         self.updated_event = {}
+        self._updated_labels = []
+
+        if self.update_buffer is not None:
+            self.update_buffer.add(
+                self.index_name, self.event_type, self.event_id, attributes,
+                labels)
+        elif attributes or labels:
+            self.datastore.import_event(
+                self.index_name, self.event_type, event_id=self.event_id,
+                event=_build_update(attributes, labels))
+
+        # Later changes are compared to the committed values.
+        if isinstance(self.source, dict):
+            _merge_attributes(self.source, attributes)
 
     def add_attributes(self, attributes):
         """Add key/values to an Event.
@@ -143,7 +458,7 @@ class Event(object):
         self._update(attributes)
 
     def add_label(self, label, toggle=False):
-        """Add label to the Event.
+        """Add label to the Event and commit it with the pending changes.
 
         Args:
             label: Label name.
@@ -155,10 +470,15 @@ class Event(object):
             raise RuntimeError('No sketch provided.')
 
         user_id = 0
-        updated_event = self.datastore.set_label(
-            self.index_name, self.event_id, self.event_type, self.sketch.id,
-            user_id, label, toggle=toggle, single_update=False)
-        self.commit(updated_event)
+        # Same label as ElasticsearchDataStore.set_label() adds.
+        self._updated_labels.append({
+            'timesketch_label': {
+                'name': str(label),
+                'user_id': user_id,
+                'sketch_id': self.sketch.id
+            },
+            'toggle': toggle})
+        self.commit()
 
     def add_tags(self, tags):
         """Add tags to the Event.
@@ -169,7 +489,8 @@ class Event(object):
         if not tags:
             return
 
-        existing_tags = self.source.get('tag', [])
+        existing_tags = self.updated_event.get(
+            'tag', self.source.get('tag', []))
         new_tags = list(set().union(existing_tags, tags))
         updated_event_attribute = {'tag': new_tags}
         self._update(updated_event_attribute)
@@ -183,7 +504,8 @@ class Event(object):
         if not emojis:
             return
 
-        existing_emoji_list = self.source.get('__ts_emojis', [])
+        existing_emoji_list = self.updated_event.get(
+            '__ts_emojis', self.source.get('__ts_emojis', []))
         if not isinstance(existing_emoji_list, (list, tuple)):
             existing_emoji_list = []
         new_emoji_list = list(set().union(existing_emoji_list, emojis))
@@ -229,13 +551,16 @@ class Event(object):
                 been defined. Defaults to True, and does nothing if
                 human_readable is not defined.
         """
-        existing_human_readable = self.source.get('human_readable', [])
+        existing_human_readable = self.updated_event.get(
+            'human_readable', self.source.get('human_readable', []))
 
         human_readable = '[{0:s}] {1:s}'.format(analyzer_name, human_readable)
 
         if human_readable in existing_human_readable:
             return
 
+        # The list is copied so that the source keeps the committed value.
+        existing_human_readable = list(existing_human_readable)
         if append:
             existing_human_readable.append(human_readable)
         else:
@@ -315,6 +640,14 @@ class BaseIndexAnalyzer(object):
         name: Analyzer name.
         index_name: Name if Elasticsearch index.
         datastore: Elasticsearch datastore client.
+        event_buffer: Instance of EventUpdateBuffer with the pending commits
+            of the events from event_stream().
+        incremental: Boolean indicating if the analyzer only analyzes the
+            events added since its last run.
+        watermark: Ingest time in microseconds since epoch of the oldest
+            events event_stream() returns, or None for all events.
+        profile: Instance of AnalyzerProfile with the execution profile of
+            the run.
         sketch: Instance of Sketch object.
     """
 
@@ -326,6 +659,11 @@ class BaseIndexAnalyzer(object):
     # the indexer names.
     DEPENDENCIES = frozenset()
 
+    # Analyzers that keep state across all events, e.g. counts or sessions,
+    # set this to analyze all events on every run instead of only the events
+    # added since the last run.
+    FULL_RESCAN = False
+
     def __init__(self, index_name):
         """Initialize the analyzer object.
 
@@ -337,6 +675,15 @@ class BaseIndexAnalyzer(object):
         self.datastore = ElasticsearchDataStore(
             host=current_app.config['ELASTIC_HOST'],
             port=current_app.config['ELASTIC_PORT'])
+        self.profile = AnalyzerProfile()
+        self.event_buffer = EventUpdateBuffer(
+            self.datastore, max_documents=current_app.config.get(
+                'ANALYZER_UPDATE_BUFFER_SIZE', DEFAULT_UPDATE_BUFFER_SIZE),
+            profile=self.profile)
+        self.incremental = bool(
+            current_app.config.get('ANALYZER_INCREMENTAL', False) and
+            not self.FULL_RESCAN)
+        self.watermark = None
 
         if not hasattr(self, 'sketch'):
             self.sketch = None
@@ -346,6 +693,10 @@ class BaseIndexAnalyzer(object):
             indices=None, return_fields=None):
         """Search ElasticSearch.
 
+        Commits of the events are merged in the event buffer of the analyzer,
+        which is flushed when the stream is exhausted or closed. If the
+        analyzer has a watermark only the events ingested since are returned.
+
         Args:
             query_string: Query string.
             query_filter: Dictionary containing filters to apply.
@@ -371,53 +722,158 @@ class BaseIndexAnalyzer(object):
             return_fields = ['message']
 
         # Make sure we always return tag, human_readable and emoji attributes.
-        return_fields.extend(['tag', 'human_readable', '__ts_emojis'])
+        return_fields.extend(DEFAULT_STREAM_FIELDS)
         return_fields = list(set(return_fields))
 
         if not indices:
             indices = [self.index_name]
 
+        if self.watermark:
+            if query_dsl:
+                query_dsl = json.loads(query_dsl)
+            else:
+                query_dsl = {
+                    'query': {'query_string': {'query': query_string}}}
+            query_dsl['query'] = {
+                'bool': {
+                    'must': [query_dsl.get('query', {'match_all': {}})],
+                    'filter': [_get_ingest_filter(self.watermark)]
+                }
+            }
+            query_dsl = json.dumps(query_dsl)
+
         # Refresh the index to make sure it is searchable.
         for index in indices:
             self.datastore.client.indices.refresh(index=index)
 
-        event_generator = self.datastore.search_stream(
+        event_generator = self.profile.time_search(self.datastore.search_stream(
             query_string=query_string,
             query_filter=query_filter,
             query_dsl=query_dsl,
             indices=indices,
             return_fields=return_fields
-        )
-        for event in event_generator:
-            yield Event(event, self.datastore, sketch=self.sketch)
-
-    @_flush_datastore_decorator
-    def run_wrapper(self, analysis_id):
+        ))
+        try:
+            for event in event_generator:
+                yield Event(
+                    event, self.datastore, sketch=self.sketch,
+                    update_buffer=self.event_buffer)
+        finally:
+            self.event_buffer.flush()
+
+    def run_wrapper(self, analysis_id=None):
         """A wrapper method to run the analyzer.
 
-        This method is decorated to flush the bulk insert operation on the
-        datastore. This makes sure that all events are indexed at exit.
+        The event buffer and the bulk insert queue of the datastore are
+        flushed before the analysis is done. This makes sure that all events
+        are indexed at exit. The execution profile of the run is stored on
+        the analysis.
+
+        Args:
+            analysis_id: ID of the analysis, or None for index analyzers,
+                which don't have one. The result and the profile of the run
+                are then only logged.
 
         Returns:
-            Return value of the run method.
+            Return value of the run method, or a string with the error if the
+            analyzer failed.
         """
-        analysis = Analysis.query.get(analysis_id)
-        analysis.set_status('STARTED')
-
-        # Run the analyzer
-        result = self.run()
+        analysis = None
+        if analysis_id is not None:
+            analysis = Analysis.query.get(analysis_id)
+            analysis.set_status('STARTED')
+
+        watermark = _get_new_watermark()
+        if self.incremental and analysis:
+            self.watermark = _get_last_watermark(analysis)
+
+        self.profile.start(_get_profile_path(
+            [self.name], analysis_id or self.index_name))
+        # Run the analyzer. Errors are recorded on the analysis instead of
+        # raised, so that analyzers that run in parallel in the same Celery
+        # group and the analyzers after it are not cancelled.
+        error = None
+        try:
+            result = self.run()
+        except Exception as e:  # pylint: disable=broad-except
+            logging.exception('[{0:s}] Analyzer failed'.format(self.name))
+            error = (e, traceback.format_exc())
+        _flush_datastore(self)
+        self.profile.stop()
+        self.profile.log(self.name)
+
+        if not analysis:
+            if error:
+                return 'Error: {0!s}'.format(error[0])
+            return result
+
+        self.profile.save(analysis)
+        if error:
+            result = set_analysis_error(analysis, *error)
+            db_session.commit()
+            return result
 
         # Update database analysis object with result and status
         analysis.result = '{0:s}'.format(result)
+        analysis.watermark = watermark
         analysis.set_status('DONE')
         db_session.add(analysis)
         db_session.commit()
 
         return result
 
+    def get_scan_query(self):
+        """Get the query for the events the analyzer looks at one by one.
+
+        Analyzers that return a query implement analyze_event() and
+        finalize() instead of run(), and can share a scan of the index with
+        other analyzers.
+
+        Returns:
+            Tuple with a query string, a JSON string with an Elasticsearch
+            DSL query and a list of fields to return, or None if the
+            analyzer implements run().
+        """
+        return None
+
+    def analyze_event(self, event):  # pylint: disable=unused-argument
+        """Analyze an event matching the scan query.
+
+        Only called for analyzers that return a scan query, the default
+        leaves the event as it is.
+
+        Args:
+            event: Instance of Event.
+        """
+        return
+
+    def finalize(self):
+        """Finish the analysis after all events of the scan were analyzed.
+
+        Only called for analyzers that return a scan query.
+
+        Returns:
+            String with summary of the analyzer result, empty by default.
+        """
+        return ''
+
     def run(self):
-        """Entry point for the analyzer."""
-        raise NotImplementedError
+        """Entry point for the analyzer.
+
+        Returns:
+            String with summary of the analyzer result.
+        """
+        scan_query = self.get_scan_query()
+        if not scan_query:
+            raise NotImplementedError
+
+        query_string, query_dsl, return_fields = scan_query
+        events = self.event_stream(
+            query_string=query_string, query_dsl=query_dsl,
+            return_fields=list(return_fields))
+        for event in events:
+            self.analyze_event(event)
+        return self.finalize()
 
 
 class BaseSketchAnalyzer(BaseIndexAnalyzer):
@@ -478,14 +934,14 @@ class BaseSketchAnalyzer(BaseIndexAnalyzer):
             return_fields = list(set(return_fields))
             return_fields = ','.join(return_fields)
 
-        results = self.datastore.search_stream(
+        results = self.profile.time_search(self.datastore.search_stream(
             sketch_id=self.sketch.id,
             query_string=query_string,
             query_filter=query_filter,
             query_dsl=query_dsl,
             indices=indices,
             return_fields=return_fields,
-        )
+        ))
 
         events = []
         for event in results:
@@ -497,6 +953,255 @@ class BaseSketchAnalyzer(BaseIndexAnalyzer):
 
         return pandas.DataFrame(events)
 
+
+class SharedScan(object):
+    """A single scan of an index for several analyzers.
+
+    The queries of the analyzers that implement get_scan_query() are
+    combined into one query with a named clause per analyzer. Every event
+    is read once and handed to the analyze_event() method of each analyzer
+    with a matching clause, then finalize() is called on every analyzer.
+    Other analyzers are run after the scan. All analyzers share one event
+    buffer, so that changes to an event by different analyzers are merged
+    into a single update.
+
+    Attributes:
+        name: Name used in log messages.
+        analyzers: List of analyzers, all for the same index.
+        index_name: Name of the Elasticsearch index.
+        datastore: Elasticsearch datastore client.
+        event_buffer: Instance of EventUpdateBuffer shared by the analyzers.
+        profile: Instance of AnalyzerProfile with the execution profile of
+            the whole run.
+        scanned: Set with the names of the analyzers in the scan.
+        errors: Dictionary with the exception and traceback of each failed
+            analyzer, by analyzer name.
+    """
+
+    def __init__(self, analyzers):
+        """Initialize the scan.
+
+        Args:
+            analyzers: List of analyzer instances for the same index.
+
+        Raises:
+            ValueError: if there are no analyzers or they are for different
+                indices.
+        """
+        if not analyzers:
+            raise ValueError('No analyzers to run.')
+        if len(set(analyzer.index_name for analyzer in analyzers)) > 1:
+            raise ValueError('Analyzers in a shared scan need the same index.')
+
+        self.analyzers = analyzers
+        self.name = '+'.join(analyzer.name for analyzer in analyzers)
+        self.index_name = analyzers[0].index_name
+        self.datastore = analyzers[0].datastore
+        self.event_buffer = analyzers[0].event_buffer
+        self.profile = AnalyzerProfile()
+        self.event_buffer.profile = self.profile
+        self.scanned = set()
+        # Analyzer name to exception and traceback of failed analyzers.
+        self.errors = {}
+        for analyzer in analyzers:
+            analyzer.event_buffer = self.event_buffer
+
+    def _call(self, analyzer, method, *args):
+        """Call a method of an analyzer and record the error if it fails.
+
+        A failing analyzer is left out of the rest of the scan, the other
+        analyzers carry on. The time of the call and of the flushes of the
+        event buffer during the call are added to the profile of the
+        analyzer.
+
+        Args:
+            analyzer: Analyzer instance.
+            method: Bound method of the analyzer.
+            args: Arguments to the method.
+
+        Returns:
+            Return value of the method, or None if it failed.
+        """
+        started = time.time()
+        self.event_buffer.profile = analyzer.profile
+        try:
+            return method(*args)
+        except Exception as e:  # pylint: disable=broad-except
+            logging.exception('[{0:s}] Analyzer failed'.format(analyzer.name))
+            self.errors[analyzer.name] = (e, traceback.format_exc())
+            return None
+        finally:
+            self.event_buffer.profile = self.profile
+            analyzer.profile.wall_time += time.time() - started
+
+    @staticmethod
+    def _get_query_clause(analyzer, query_string, query_dsl):
+        """Build the named clause for the query of an analyzer.
+
+        Args:
+            analyzer: Analyzer instance.
+            query_string: Query string.
+            query_dsl: JSON string with an Elasticsearch DSL query.
+
+        Returns:
+            Dictionary with an Elasticsearch DSL query clause.
+        """
+        if query_dsl:
+            query = json.loads(query_dsl).get('query', {'match_all': {}})
+        elif analyzer.watermark:
+            query = {'query_string': {'query': query_string}}
+        else:
+            return {'query_string': {
+                'query': query_string, '_name': analyzer.name}}
+
+        clause = {'bool': {'must': [query], '_name': analyzer.name}}
+        if analyzer.watermark:
+            clause['bool']['filter'] = [_get_ingest_filter(analyzer.watermark)]
+        return clause
+
+    def _scan(self, scan_queries):
+        """Read the events once and hand them to the analyzers.
+
+        Args:
+            scan_queries: List of tuples with an analyzer and its scan query.
+        """
+        analyzers = {}
+        clauses = []
+        return_fields = set(DEFAULT_STREAM_FIELDS)
+        for analyzer, (query_string, query_dsl, fields) in scan_queries:
+            analyzers[analyzer.name] = analyzer
+            clauses.append(self._get_query_clause(
+                analyzer, query_string, query_dsl))
+            return_fields.update(fields)
+
+        query_dsl = {
+            'query': {
+                'bool': {
+                    'should': clauses,
+                    'minimum_should_match': 1
+                }
+            }
+        }
+
+        # Refresh the index to make sure it is searchable.
+        self.datastore.client.indices.refresh(index=self.index_name)
+
+        event_generator = self.profile.time_search(self.datastore.search_stream(
+            query_string='',
+            query_filter={'indices': self.index_name},
+            query_dsl=json.dumps(query_dsl),
+            indices=[self.index_name],
+            return_fields=sorted(return_fields)
+        ))
+        try:
+            for event in event_generator:
+                for name in event.get('matched_queries', []):
+                    analyzer = analyzers.get(name)
+                    if not analyzer or name in self.errors:
+                        continue
+                    analyzer.profile.events_read += 1
+                    self._call(analyzer, analyzer.analyze_event, Event(
+                        event, analyzer.datastore, sketch=analyzer.sketch,
+                        update_buffer=self.event_buffer))
+        finally:
+            self.event_buffer.flush()
+
     def run(self):
-        """Entry point for the analyzer."""
-        raise NotImplementedError
+        """Run the analyzers.
+
+        Returns:
+            List with the result of each analyzer, in the same order as the
+            analyzers, None for the analyzers that failed.
+        """
+        scan_queries = []
+        for analyzer in self.analyzers:
+            scan_query = analyzer.get_scan_query()
+            if scan_query:
+                scan_queries.append((analyzer, scan_query))
+
+        results = {}
+        if len(scan_queries) > 1:
+            self._scan(scan_queries)
+            for analyzer, _ in scan_queries:
+                self.scanned.add(analyzer.name)
+                if analyzer.name not in self.errors:
+                    results[analyzer.name] = self._call(
+                        analyzer, analyzer.finalize)
+            self.event_buffer.flush()
+
+        for analyzer in self.analyzers:
+            if analyzer.name not in self.scanned:
+                results[analyzer.name] = self._call(analyzer, analyzer.run)
+
+        return [results.get(analyzer.name) for analyzer in self.analyzers]
+
+    def _get_analyzer_profile(self, analyzer):
+        """Get the execution profile of an analyzer in the run.
+
+        The profile of an analyzer only has the time spent in its own
+        methods, its own searches and writes. The time of the scan, of the
+        final writes and the number of documents written are shared by all
+        analyzers and added from the profile of the run.
+
+        Args:
+            analyzer: Analyzer instance.
+
+        Returns:
+            Instance of AnalyzerProfile.
+        """
+        profile = analyzer.profile
+        profile.run_time = max(
+            0.0, profile.wall_time - profile.search_time - profile.write_time)
+        if analyzer.name in self.scanned:
+            profile.search_time += self.profile.search_time
+        profile.write_time += self.profile.write_time
+        profile.wall_time = self.profile.wall_time
+        profile.events_written = self.profile.events_written
+        profile.peak_memory = self.profile.peak_memory
+        return profile
+
+    def run_wrapper(self, analysis_ids):
+        """A wrapper method to run the analyzers.
+
+        The event buffer and the bulk insert queue of the datastore are
+        flushed before the analyses are done. The execution profile of each
+        analyzer is stored on its analysis.
+
+        Args:
+            analysis_ids: List of analysis IDs, one per analyzer.
+
+        Returns:
+            List with the result of each analyzer.
+        """
+        analyses = [
+            Analysis.query.get(analysis_id) for analysis_id in analysis_ids]
+        watermark = _get_new_watermark()
+        for analyzer, analysis in zip(self.analyzers, analyses):
+            analysis.set_status('STARTED')
+            if analyzer.incremental:
+                analyzer.watermark = _get_last_watermark(analysis)
+
+        self.profile.start(_get_profile_path(
+            [analyzer.name for analyzer in self.analyzers], analysis_ids[0]))
+        results = self.run()
+        _flush_datastore(self)
+        self.profile.stop()
+        self.profile.log(self.name)
+
+        for index, analysis in enumerate(analyses):
+            analyzer_name = self.analyzers[index].name
+            profile = self._get_analyzer_profile(self.analyzers[index])
+            profile.save(analysis)
+            profile.log(analyzer_name)
+            if analyzer_name in self.errors:
+                error, error_traceback = self.errors[analyzer_name]
+                results[index] = set_analysis_error(
+                    analysis, error, error_traceback)
+                continue
+            analysis.result = '{0:s}'.format(results[index])
+            analysis.watermark = watermark
+            analysis.set_status('DONE')
+            db_session.add(analysis)
+        db_session.commit()
+
+        return results
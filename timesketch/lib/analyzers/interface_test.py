@@ -15,9 +15,16 @@
 
 from __future__ import unicode_literals
 
+import json
+
+import mock
+
+from timesketch.lib.datastores.elastic import UPDATE_EVENT_SCRIPT
 from timesketch.lib.testlib import BaseTest
 from timesketch.lib.testlib import MockDataStore
 from timesketch.lib.analyzers import interface
+from timesketch.models import db_session
+from timesketch.models.sketch import Analysis
 from timesketch.models.sketch import Sketch
 from timesketch.models.sketch import View
 
@@ -41,6 +48,114 @@ class TestAnalysisEvent(BaseTest):
         self.assertIsInstance(sketch_event.sketch, interface.Sketch)
         self.assertRaises(KeyError, interface.Event, invalid_event, datastore)
 
+    def test_commit(self):
+        """Test that commits only send changed attributes."""
+        datastore = mock.Mock()
+        event = interface.Event(dict(
+            _id='1', _type='test', _index='test',
+            _source={'tag': ['a', 'b'], 'message': 'test'}), datastore)
+        event.add_tags(['b', 'a'])
+        event.commit()
+        datastore.import_event.assert_not_called()
+
+        event.add_tags(['c'])
+        event.add_human_readable('readable', 'test')
+        event.add_attributes({'message': 'test', 'new': 1})
+        event.commit()
+        update = datastore.import_event.call_args[1]['event']
+        self.assertEqual(
+            sorted(update), ['human_readable', 'new', 'tag'])
+        self.assertEqual(sorted(update['tag']), ['a', 'b', 'c'])
+        self.assertEqual(event.source['new'], 1)
+
+    def test_update_buffer(self):
+        """Test that the commits of an event are merged into one update."""
+        sketch = interface.Sketch(sketch_id=self.SKETCH_ID)
+        datastore = mock.Mock()
+        update_buffer = interface.EventUpdateBuffer(datastore)
+        event = interface.Event(dict(
+            _id='1', _type='test', _index='test', _source={}), datastore,
+                                sketch=sketch, update_buffer=update_buffer)
+        event.add_attributes({'first': 1})
+        event.add_star()
+        event.add_attributes({'second': 2})
+        event.commit()
+        event.commit()
+        other_event = interface.Event(dict(
+            _id='2', _type='test', _index='test', _source={}), datastore,
+                                      update_buffer=update_buffer)
+        other_event.add_attributes({'first': 1})
+        other_event.commit()
+        datastore.import_event.assert_not_called()
+
+        self.assertEqual(update_buffer.flush(), 2)
+        self.assertEqual(update_buffer.commits, 4)
+        self.assertEqual(update_buffer.skipped, 1)
+        self.assertEqual(update_buffer.updates, 2)
+        first_call, second_call = datastore.import_event.call_args_list
+        update = first_call[1]['event']
+        self.assertEqual(update['source'], UPDATE_EVENT_SCRIPT)
+        self.assertEqual(update['params']['doc'], {'first': 1, 'second': 2})
+        self.assertEqual(update['params']['labels'], [{
+            'timesketch_label': {
+                'name': '__ts_star', 'user_id': 0,
+                'sketch_id': self.SKETCH_ID},
+            'toggle': False}])
+        self.assertEqual(second_call[1]['event_id'], '2')
+        self.assertEqual(second_call[1]['event'], {'first': 1})
+
+    def test_update_buffer_merge(self):
+        """Test that attributes with dictionaries are merged recursively."""
+        sketch = interface.Sketch(sketch_id=self.SKETCH_ID)
+        datastore = mock.Mock()
+        update_buffer = interface.EventUpdateBuffer(datastore)
+        source = {'session_id': {'all_events': 1}}
+
+        # Two sessionizers that write their session to the same event.
+        for session_type, session_num in (('ssh', 2), ('web', 3)):
+            event = interface.Event(dict(
+                _id='1', _type='test', _index='test', _source=source),
+                                    datastore, update_buffer=update_buffer)
+            event.add_attributes({'session_id': {session_type: session_num}})
+            event.commit()
+        update_buffer.flush()
+        update = datastore.import_event.call_args[1]['event']
+        self.assertEqual(update, {'session_id': {'ssh': 2, 'web': 3}})
+
+        # Same with a label, which makes the update a script.
+        source = {'session_id': {'all_events': 1}}
+        event = interface.Event(dict(
+            _id='1', _type='test', _index='test', _source=source),
+                                datastore, sketch=sketch,
+                                update_buffer=update_buffer)
+        event.add_attributes({'session_id': {'ssh': 2}})
+        event.add_attributes({'session_id': {'web': 3}})
+        event.add_star()
+        update_buffer.flush()
+        update = datastore.import_event.call_args[1]['event']
+        self.assertEqual(update['source'], UPDATE_EVENT_SCRIPT)
+        self.assertEqual(
+            update['params']['doc'], {'session_id': {'ssh': 2, 'web': 3}})
+
+        # Sessions that the event has already are not sent again.
+        self.assertEqual(
+            source, {'session_id': {'all_events': 1, 'ssh': 2, 'web': 3}})
+        event.add_attributes({'session_id': {'all_events': 1, 'ssh': 2}})
+        event.commit()
+        self.assertEqual(update_buffer.skipped, 1)
+
+    def test_update_buffer_max_documents(self):
+        """Test that the buffer is flushed when it is full."""
+        datastore = mock.Mock()
+        update_buffer = interface.EventUpdateBuffer(
+            datastore, max_documents=2)
+        update_buffer.add('test', 'test', '1', {'a': 1}, [])
+        update_buffer.add('test', 'test', '1', {'b': 1}, [])
+        self.assertEqual(len(update_buffer), 1)
+        update_buffer.add('test', 'test', '2', {'a': 1}, [])
+        self.assertEqual(len(update_buffer), 0)
+        self.assertEqual(datastore.import_event.call_count, 2)
+
 
 class TestAnalysisSketch(BaseTest):
     """Tests for the functionality of the Sketch class."""
@@ -67,3 +182,300 @@ class TestAnalysisSketch(BaseTest):
         self.assertIsInstance(indices, list)
         self.assertEqual(len(indices), 1)
         self.assertEqual(indices[0], 'test')
+
+
+class TestIncrementalAnalysis(BaseTest):
+    """Tests for analyzing the events added since the last run."""
+
+    SKETCH_ID = 1
+
+    def test_get_last_watermark(self):
+        """Test getting the watermark of the last run of an analysis."""
+        sketch = Sketch.query.get(self.SKETCH_ID)
+        analyses = []
+        for parameters, watermark in [
+                ('{}', 100), ('{}', 200), ('{"a": 1}', 300), ('{}', None)]:
+            analysis = Analysis(
+                name='test', description='test', analyzer_name='test',
+                parameters=parameters, user=None, sketch=sketch)
+            analysis.watermark = watermark
+            db_session.add(analysis)
+            analyses.append(analysis)
+        db_session.commit()
+
+        # pylint: disable=protected-access
+        self.assertEqual(interface._get_last_watermark(analyses[-1]), 200)
+        self.assertIsNone(interface._get_last_watermark(analyses[0]))
+
+    @mock.patch('timesketch.lib.analyzers.interface.ElasticsearchDataStore',
+                mock.Mock)
+    def test_event_stream(self):
+        """Test that only events ingested since the watermark are read."""
+        analyzer = MockScanAnalyzer('test', self.SKETCH_ID)
+        analyzer.datastore.search_stream.return_value = iter([])
+        analyzer.watermark = 1000
+        list(analyzer.event_stream(query_string='data_type:"a"'))
+
+        query_dsl = json.loads(
+            analyzer.datastore.search_stream.call_args[1]['query_dsl'])
+        self.assertEqual(query_dsl['query']['bool']['must'], [
+            {'query_string': {'query': 'data_type:"a"'}}])
+        ingest_filter = query_dsl['query']['bool']['filter'][0]
+        self.assertEqual(
+            ingest_filter['bool']['should'][0],
+            {'range': {'__ts_ingest_time': {'gte': 1000}}})
+
+
+class TestAnalyzerProfile(BaseTest):
+    """Tests for the execution profile of analyzer runs."""
+
+    SKETCH_ID = 1
+
+    def _create_analysis(self):
+        """Create an analysis for a test run.
+
+        Returns:
+            Instance of timesketch.models.sketch.Analysis.
+        """
+        analysis = Analysis(
+            name='test', description='test', analyzer_name='mock_scan',
+            parameters='{}', user=None,
+            sketch=Sketch.query.get(self.SKETCH_ID))
+        db_session.add(analysis)
+        db_session.commit()
+        return analysis
+
+    @mock.patch('timesketch.lib.analyzers.interface.ElasticsearchDataStore',
+                mock.Mock)
+    def test_run_wrapper(self):
+        """Test that the profile of a run is stored on the analysis."""
+        analysis = self._create_analysis()
+        analyzer = MockScanAnalyzer('test', self.SKETCH_ID)
+        datastore = analyzer.datastore
+        datastore.search_stream.return_value = iter([
+            dict(_id='1', _type='test', _index='test', _source={}),
+            dict(_id='2', _type='test', _index='test', _source={})])
+        datastore.flush_queued_events.return_value = {
+            'test': {'indexed': 2, 'updated': 2, 'failed': 0}}
+
+        self.assertEqual(analyzer.run_wrapper(analysis.id), '2 events')
+
+        analysis = Analysis.query.get(analysis.id)
+        self.assertEqual(analysis.get_status.status, 'DONE')
+        self.assertEqual(analysis.events_read, 2)
+        self.assertEqual(analysis.events_written, 2)
+        self.assertGreaterEqual(analysis.peak_memory, 0)
+        self.assertGreaterEqual(analysis.wall_time, analysis.run_time)
+        self.assertAlmostEqual(
+            analysis.wall_time,
+            analysis.search_time + analysis.run_time + analysis.write_time)
+
+    @mock.patch('timesketch.lib.analyzers.interface.ElasticsearchDataStore',
+                mock.Mock)
+    def test_run_wrapper_without_analysis(self):
+        """Test a run of an index analyzer, which has no analysis."""
+        for analyzer_class, result in [
+                (MockScanAnalyzer, '2 events'),
+                (MockFailingScanAnalyzer, 'Error: Unable to analyze event.')]:
+            analyzer = analyzer_class('test', self.SKETCH_ID)
+            analyzer.datastore.search_stream.return_value = iter([
+                dict(_id='1', _type='test', _index='test', _source={}),
+                dict(_id='2', _type='test', _index='test', _source={})])
+            analyzer.datastore.flush_queued_events.return_value = {}
+
+            self.assertEqual(analyzer.run_wrapper(), result)
+        self.assertEqual(Analysis.query.count(), 0)
+
+    @mock.patch('timesketch.lib.analyzers.interface.ElasticsearchDataStore',
+                mock.Mock)
+    def test_shared_scan_run_wrapper(self):
+        """Test that each analysis of a shared scan gets a profile."""
+        analyses = [self._create_analysis(), self._create_analysis()]
+        analyzers = [
+            MockScanAnalyzer('test', self.SKETCH_ID),
+            MockDslScanAnalyzer('test', self.SKETCH_ID)]
+        datastore = analyzers[0].datastore
+        datastore.search_stream.return_value = iter([
+            dict(_id='1', _type='test', _index='test', _source={},
+                 matched_queries=['mock_scan']),
+            dict(_id='2', _type='test', _index='test', _source={},
+                 matched_queries=['mock_scan', 'mock_dsl_scan'])])
+        datastore.flush_queued_events.return_value = {
+            'test': {'indexed': 2, 'updated': 2, 'failed': 0}}
+
+        shared_scan = interface.SharedScan(analyzers)
+        shared_scan.run_wrapper([analysis.id for analysis in analyses])
+
+        self.assertEqual(shared_scan.profile.events_read, 2)
+        analyses = [Analysis.query.get(analysis.id) for analysis in analyses]
+        self.assertEqual(
+            [analysis.events_read for analysis in analyses], [2, 1])
+        self.assertEqual(
+            [analysis.events_written for analysis in analyses], [2, 2])
+        for analysis in analyses:
+            self.assertEqual(
+                analysis.wall_time, shared_scan.profile.wall_time)
+            self.assertEqual(
+                analysis.search_time, shared_scan.profile.search_time)
+
+    def test_get_profile_path(self):
+        """Test that only the configured analyzers are profiled."""
+        self.app.config['ANALYZER_PROFILE_DIR'] = '/tmp/profiles'
+        self.app.config['ANALYZER_PROFILE'] = ['mock_scan']
+        # pylint: disable=protected-access
+        self.assertEqual(
+            interface._get_profile_path(['mock_scan', 'domain'], 3),
+            '/tmp/profiles/mock_scan+domain_3.pstats')
+        self.assertIsNone(interface._get_profile_path(['domain'], 3))
+
+        self.app.config['ANALYZER_PROFILE_DIR'] = ''
+        self.assertIsNone(interface._get_profile_path(['mock_scan'], 3))
+
+
+class MockScanAnalyzer(interface.BaseSketchAnalyzer):
+    """Analyzer that tags the events matching its query."""
+
+    NAME = 'mock_scan'
+    QUERY = 'data_type:"a"'
+
+    def __init__(self, index_name, sketch_id):
+        """Initialize the analyzer."""
+        super(MockScanAnalyzer, self).__init__(index_name, sketch_id)
+        self.event_ids = []
+
+    def get_scan_query(self):
+        """Get the query for the events the analyzer looks at one by one."""
+        return self.QUERY, None, ['data_type']
+
+    def analyze_event(self, event):
+        """Tag an event."""
+        self.event_ids.append(event.event_id)
+        event.add_tags([self.NAME])
+        event.commit()
+
+    def finalize(self):
+        """Count the tagged events."""
+        return '{0:d} events'.format(len(self.event_ids))
+
+
+class MockDslScanAnalyzer(MockScanAnalyzer):
+    """Analyzer with a DSL query."""
+
+    NAME = 'mock_dsl_scan'
+
+    def get_scan_query(self):
+        """Get the query for the events the analyzer looks at one by one."""
+        query = {'query': {'exists': {'field': 'url'}}}
+        return '', json.dumps(query), ['url']
+
+
+class MockFailingScanAnalyzer(MockScanAnalyzer):
+    """Analyzer that fails on every event."""
+
+    NAME = 'mock_failing_scan'
+
+    def analyze_event(self, event):
+        """Fail on an event."""
+        raise ValueError('Unable to analyze event.')
+
+
+class MockSessionScanAnalyzer(MockScanAnalyzer):
+    """Analyzer that adds the events matching its query to a session."""
+
+    NAME = 'mock_session_scan'
+
+    def analyze_event(self, event):
+        """Add an event to a session."""
+        self.event_ids.append(event.event_id)
+        event.add_attributes({'session_id': {self.NAME: 1}})
+        event.commit()
+
+
+class MockOtherSessionScanAnalyzer(MockSessionScanAnalyzer):
+    """Analyzer that adds the events to another type of session."""
+
+    NAME = 'mock_other_session_scan'
+
+
+class TestSharedScan(BaseTest):
+    """Tests for the SharedScan class."""
+
+    SKETCH_ID = 1
+
+    @mock.patch('timesketch.lib.analyzers.interface.ElasticsearchDataStore',
+                mock.Mock)
+    def test_run(self):
+        """Test that each analyzer gets the events matching its query."""
+        analyzers = [
+            MockScanAnalyzer('test', self.SKETCH_ID),
+            MockDslScanAnalyzer('test', self.SKETCH_ID)]
+        datastore = analyzers[0].datastore
+        datastore.search_stream.return_value = iter([
+            dict(_id='1', _type='test', _index='test', _source={},
+                 matched_queries=['mock_scan']),
+            dict(_id='2', _type='test', _index='test', _source={},
+                 matched_queries=['mock_scan', 'mock_dsl_scan'])])
+
+        results = interface.SharedScan(analyzers).run()
+
+        self.assertEqual(results, ['2 events', '1 events'])
+        self.assertEqual(analyzers[0].event_ids, ['1', '2'])
+        self.assertEqual(analyzers[1].event_ids, ['2'])
+        datastore.search_stream.assert_called_once()
+        search_kwargs = datastore.search_stream.call_args[1]
+        self.assertEqual(
+            search_kwargs['return_fields'],
+            ['__ts_emojis', 'data_type', 'human_readable', 'tag', 'url'])
+        clauses = json.loads(
+            search_kwargs['query_dsl'])['query']['bool']['should']
+        self.assertEqual(clauses, [
+            {'query_string': {
+                'query': 'data_type:"a"', '_name': 'mock_scan'}},
+            {'bool': {
+                'must': [{'exists': {'field': 'url'}}],
+                '_name': 'mock_dsl_scan'}}])
+
+        # The tags of both analyzers are merged into one update.
+        self.assertEqual(datastore.import_event.call_count, 2)
+        update = datastore.import_event.call_args[1]['event']
+        self.assertEqual(
+            sorted(update['tag']), ['mock_dsl_scan', 'mock_scan'])
+
+    @mock.patch('timesketch.lib.analyzers.interface.ElasticsearchDataStore',
+                mock.Mock)
+    def test_run_same_attribute(self):
+        """Test that analyzers that write the same attribute both keep it."""
+        analyzers = [
+            MockSessionScanAnalyzer('test', self.SKETCH_ID),
+            MockOtherSessionScanAnalyzer('test', self.SKETCH_ID)]
+        datastore = analyzers[0].datastore
+        datastore.search_stream.return_value = iter([
+            dict(_id='1', _type='test', _index='test', _source={},
+                 matched_queries=[
+                     'mock_session_scan', 'mock_other_session_scan'])])
+
+        interface.SharedScan(analyzers).run()
+
+        datastore.import_event.assert_called_once()
+        update = datastore.import_event.call_args[1]['event']
+        self.assertEqual(update, {'session_id': {
+            'mock_session_scan': 1, 'mock_other_session_scan': 1}})
+
+    @mock.patch('timesketch.lib.analyzers.interface.ElasticsearchDataStore',
+                mock.Mock)
+    def test_run_failing_analyzer(self):
+        """Test that a failing analyzer doesn't stop the other analyzers."""
+        analyzers = [
+            MockFailingScanAnalyzer('test', self.SKETCH_ID),
+            MockScanAnalyzer('test', self.SKETCH_ID)]
+        analyzers[0].datastore.search_stream.return_value = iter([
+            dict(_id='1', _type='test', _index='test', _source={},
+                 matched_queries=['mock_failing_scan', 'mock_scan'])])
+
+        shared_scan = interface.SharedScan(analyzers)
+        results = shared_scan.run()
+
+        self.assertEqual(results, [None, '1 events'])
+        self.assertEqual(list(shared_scan.errors), ['mock_failing_scan'])
+        self.assertIsInstance(
+            shared_scan.errors['mock_failing_scan'][0], ValueError)
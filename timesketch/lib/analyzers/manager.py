@@ -89,14 +89,35 @@ class AnalysisManager(object):
                 str: the uniquely identifying name of the analyzer
                 type: the analyzer class.
         """
+        for cluster in cls.get_analyzer_clusters(analyzer_names):
+            for analyzer_name, analyzer_class in cluster:
+                yield analyzer_name, analyzer_class
+
+    @classmethod
+    def get_analyzer_clusters(cls, analyzer_names=None):
+        """Retrieves the registered analyzers grouped by dependencies.
+
+        The analyzers in a cluster only depend on analyzers in earlier
+        clusters, so they can run at the same time.
+
+        Args:
+            analyzer_names (list): List of analyzer names.
+
+        Returns:
+            list: one list per cluster of tuples containing:
+                str: the uniquely identifying name of the analyzer
+                type: the analyzer class.
+        """
         # Get all analyzers if no specific ones have been requested.
         if not analyzer_names:
             analyzer_names = cls._class_registry.keys()
 
+        clusters = []
         for cluster in cls._build_dependencies(analyzer_names):
-            for analyzer_name in cluster:
-                analyzer_class = cls.get_analyzer(analyzer_name)
-                yield analyzer_name, analyzer_class
+            clusters.append([
+                (analyzer_name, cls.get_analyzer(analyzer_name))
+                for analyzer_name in sorted(cluster)])
+        return clusters
 
     @classmethod
     def get_analyzer(cls, analyzer_name):
@@ -112,6 +112,13 @@ class TestAnalysisManager(BaseTest):
         self.assertIn('mockanalyzer2', dependency_tree[1])
         self.assertIn('mockanalyzer4', dependency_tree[2])
 
+        clusters = manager.AnalysisManager.get_analyzer_clusters(
+            analyzers_to_run)
+        self.assertEqual(
+            [[name for name, _ in cluster] for cluster in clusters],
+            [['mockanalyzer', 'mockanalyzer3'], ['mockanalyzer2'],
+             ['mockanalyzer4']])
+
         manager.AnalysisManager.clear_registration()
         manager.AnalysisManager.register_analyzer(MockAnalyzerFail1)
         manager.AnalysisManager.register_analyzer(MockAnalyzerFail2)
@@ -21,6 +21,9 @@ class PhishyDomainsSketchPlugin(interface.BaseSketchAnalyzer):
 
     DEPENDENCIES = frozenset(['domain'])
 
+    # The watch list is built from the most common domains in the timeline.
+    FULL_RESCAN = True
+
     # This list contains entries from Alexa top 10 list (as of 2018-12-27).
     # They are used to create the base of a domain watch list. For custom
     # entries use DOMAIN_ANALYZER_WATCHED_DOMAINS in timesketch.conf.
@@ -43,6 +46,9 @@ class PhishyDomainsSketchPlugin(interface.BaseSketchAnalyzer):
             'DOMAIN_ANALYZER_WATCHED_DOMAINS_SCORE_THRESHOLD', 0.75)
         self.domain_scoring_whitelist = current_app.config.get(
             'DOMAIN_ANALYZER_WHITELISTED_DOMAINS', [])
+        self._domains = {}
+        self._domain_counter = collections.Counter()
+        self._tld_counter = collections.Counter()
 
     @staticmethod
     def _get_minhash_from_domain(domain):
@@ -155,11 +161,12 @@ class PhishyDomainsSketchPlugin(interface.BaseSketchAnalyzer):
 
         return similar
 
-    def run(self):
-        """Entry point for the analyzer.
+    def get_scan_query(self):
+        """Get the query for the events the analyzer looks at one by one.
 
         Returns:
-            String with summary of the analyzer result
+            Tuple with a query string, a JSON string with an Elasticsearch
+            DSL query and a list of fields to return.
         """
         query = (
             '{"query": { "bool": { "should": [ '
@@ -167,26 +174,35 @@ class PhishyDomainsSketchPlugin(interface.BaseSketchAnalyzer):
             '{ "exists" : { "field" : "domain" }} ] } } }')
 
         return_fields = ['domain', 'url', 'message', 'human_readable']
+        return '', query, return_fields
 
-        events = self.event_stream(
-            '', query_dsl=query, return_fields=return_fields)
+    def analyze_event(self, event):
+        """Count the domain of an event.
 
-        domains = {}
-        domain_counter = collections.Counter()
-        tld_counter = collections.Counter()
+        Args:
+            event: Instance of Event.
+        """
+        domain = event.source.get('domain')
 
-        for event in events:
-            domain = event.source.get('domain')
+        if not domain:
+            return
 
-            if not domain:
-                continue
+        self._domain_counter[domain] += 1
+        self._domains.setdefault(domain, [])
+        self._domains[domain].append(event)
 
-            domain_counter[domain] += 1
-            domains.setdefault(domain, [])
-            domains[domain].append(event)
+        tld = utils.get_tld_from_domain(domain)
+        self._tld_counter[tld] += 1
 
-            tld = utils.get_tld_from_domain(domain)
-            tld_counter[tld] += 1
+    def finalize(self):
+        """Tag the events with domains similar to the watched domains.
+
+        Returns:
+            String with summary of the analyzer result
+        """
+        domains = self._domains
+        domain_counter = self._domain_counter
+        tld_counter = self._tld_counter
 
         if not domain_counter:
             return 'No domains discovered, so no phishy domains.'
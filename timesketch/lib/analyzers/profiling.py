@@ -0,0 +1,172 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Execution profile of analyzer runs.
+
+The time of a run is split into the time spent waiting on search results,
+the time spent writing events to the datastore and the time spent in the
+analyzer itself. The profile is stored on the analysis, so that slow
+analyzers can be found when the analysis queue backs up.
+"""
+
+from __future__ import unicode_literals
+
+import contextlib
+import cProfile
+import json
+import logging
+import resource
+import sys
+import time
+
+# Fields of the profile, same as the columns of the Analysis model.
+PROFILE_FIELDS = [
+    'wall_time', 'search_time', 'run_time', 'write_time', 'events_read',
+    'events_written', 'peak_memory']
+
+
+def get_peak_memory():
+    """Get the peak resident memory of the process since it started.
+
+    Returns:
+        Number of bytes.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+class AnalyzerProfile(object):
+    """Where an analyzer run spent its time.
+
+    Attributes:
+        wall_time: Seconds from the start to the end of the run.
+        search_time: Seconds spent waiting on search results.
+        run_time: Seconds spent in the analyzer itself.
+        write_time: Seconds spent writing events to the datastore.
+        events_read: Number of events read from the datastore.
+        events_written: Number of documents written to the datastore.
+        peak_memory: Bytes the peak resident memory of the worker process
+            grew by during the run. Celery workers run many tasks, the peak
+            of the process itself is the peak of the largest task so far.
+    """
+
+    def __init__(self):
+        """Initialize the profile."""
+        super(AnalyzerProfile, self).__init__()
+        self.wall_time = 0.0
+        self.search_time = 0.0
+        self.run_time = 0.0
+        self.write_time = 0.0
+        self.events_read = 0
+        self.events_written = 0
+        self.peak_memory = 0
+        self._started = None
+        self._started_peak_memory = 0
+        self._profiler = None
+        self._profile_path = None
+
+    def start(self, profile_path=None):
+        """Start the run.
+
+        Args:
+            profile_path: Optional path to write the function statistics of
+                the run to, as read by the pstats module. The statistics are
+                collected with cProfile, which slows the run down.
+        """
+        self._started = time.time()
+        self._started_peak_memory = get_peak_memory()
+        if profile_path:
+            self._profile_path = profile_path
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def stop(self):
+        """Stop the run and compute the time spent in the analyzer."""
+        if self._profiler:
+            self._profiler.disable()
+            try:
+                self._profiler.dump_stats(self._profile_path)
+                logging.info('Analyzer profile written to: {0:s}'.format(
+                    self._profile_path))
+            except (IOError, OSError) as e:
+                logging.warning(
+                    'Unable to write analyzer profile: {0!s}'.format(e))
+            self._profiler = None
+
+        if self._started is not None:
+            self.wall_time = time.time() - self._started
+        self.run_time = max(
+            0.0, self.wall_time - self.search_time - self.write_time)
+        self.peak_memory = max(
+            0, get_peak_memory() - self._started_peak_memory)
+
+    def time_search(self, results):
+        """Time the wait on search results.
+
+        Args:
+            results: Iterable with search results.
+
+        Yields:
+            The search results.
+        """
+        iterator = iter(results)
+        while True:
+            started = time.time()
+            try:
+                result = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.search_time += time.time() - started
+            self.events_read += 1
+            yield result
+
+    @contextlib.contextmanager
+    def time_write(self):
+        """Context manager that times writes to the datastore."""
+        started = time.time()
+        try:
+            yield
+        finally:
+            self.write_time += time.time() - started
+
+    def to_dict(self):
+        """Get the profile as a dictionary.
+
+        Returns:
+            Dictionary with the profile fields.
+        """
+        return dict((field, getattr(self, field)) for field in PROFILE_FIELDS)
+
+    def save(self, analysis):
+        """Store the profile on an analysis.
+
+        Args:
+            analysis: Instance of timesketch.models.sketch.Analysis.
+        """
+        for field, value in self.to_dict().items():
+            setattr(analysis, field, value)
+
+    def log(self, name):
+        """Log the profile as JSON, for log based metrics.
+
+        Args:
+            name: Name of the analyzer.
+        """
+        profile = self.to_dict()
+        profile['analyzer'] = name
+        logging.info('[{0:s}] Analyzer profile: {1:s}'.format(
+            name, json.dumps(profile, sort_keys=True)))
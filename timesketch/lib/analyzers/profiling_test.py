@@ -0,0 +1,68 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the execution profile of analyzer runs."""
+
+from __future__ import unicode_literals
+
+import os
+import pstats
+import shutil
+import tempfile
+
+import mock
+
+from timesketch.lib.analyzers.profiling import AnalyzerProfile
+from timesketch.lib.analyzers.profiling import PROFILE_FIELDS
+from timesketch.lib.testlib import BaseTest
+
+
+class AnalyzerProfileTest(BaseTest):
+    """Tests for the AnalyzerProfile class."""
+
+    @mock.patch('timesketch.lib.analyzers.profiling.get_peak_memory')
+    @mock.patch('timesketch.lib.analyzers.profiling.time.time')
+    def test_profile(self, mock_time, mock_get_peak_memory):
+        """Test that the wall time is split into search, run and write."""
+        # The peak memory of the worker before the run doesn't count.
+        mock_get_peak_memory.side_effect = [1000, 1500]
+        mock_time.side_effect = [0.0, 1.0, 3.0, 3.0, 3.0, 3.5, 4.5, 10.0]
+        profile = AnalyzerProfile()
+        profile.start()
+
+        # Two seconds waiting on the first result, none on the end.
+        self.assertEqual(list(profile.time_search(['a'])), ['a'])
+        with profile.time_write():
+            pass
+        profile.stop()
+
+        self.assertEqual(profile.events_read, 1)
+        self.assertEqual(profile.search_time, 2.0)
+        self.assertEqual(profile.write_time, 1.0)
+        self.assertEqual(profile.wall_time, 10.0)
+        self.assertEqual(profile.run_time, 7.0)
+        self.assertEqual(profile.peak_memory, 500)
+        self.assertEqual(sorted(profile.to_dict()), sorted(PROFILE_FIELDS))
+
+    def test_profile_dump(self):
+        """Test that the function statistics are written on request."""
+        profile_dir = tempfile.mkdtemp()
+        try:
+            profile_path = os.path.join(profile_dir, 'test.pstats')
+            profile = AnalyzerProfile()
+            profile.start(profile_path)
+            sorted(range(100))
+            profile.stop()
+            self.assertTrue(pstats.Stats(profile_path).total_calls > 0)
+        finally:
+            shutil.rmtree(profile_dir)
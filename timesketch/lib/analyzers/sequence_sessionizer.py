@@ -26,6 +26,14 @@ class SequenceSessionizerSketchPlugin(sessionizer.SessionizerSketchPlugin):
     session_num = 0
     session_type = None
 
+    def get_scan_query(self):
+        """The analyzer runs its own scan.
+
+        Returns:
+            None, the events are not analyzed one by one.
+        """
+        return None
+
     def run(self):
         """Entry point for the analyzer.
 
@@ -22,45 +22,60 @@ class SessionizerSketchPlugin(interface.BaseSketchAnalyzer):
     """
 
     NAME = 'sessionizer'
+    # Sessions are numbered from the first event in the timeline.
+    FULL_RESCAN = True
     # TODO max_time_diff_micros should be configurable
     max_time_diff_micros = 300000000
     query = '*'
     session_type = 'all_events'
 
-    def run(self):
-        """Entry point for the analyzer. Allocates each event a session_id
-        attribute.
+    def __init__(self, index_name, sketch_id):
+        """Initialize the analyzer.
+
+        Args:
+            index_name: Elasticsearch index name
+            sketch_id: Sketch ID
+        """
+        super(SessionizerSketchPlugin, self).__init__(index_name, sketch_id)
+        self._session_num = 0
+        self._last_timestamp = None
+
+    def get_scan_query(self):
+        """Get the query for the events the analyzer looks at one by one.
+
         Returns:
-            String containing the number of sessions created.
+            Tuple with a query string, a JSON string with an Elasticsearch
+            DSL query and a list of fields to return.
+        """
+        return self.query, None, ['timestamp']
+
+    def analyze_event(self, event):
+        """Allocate a session_id attribute to an event. Events are streamed
+        ordered by time, therefore no further sorting is needed.
+
+        Args:
+            event: Instance of Event.
         """
-        return_fields = ['timestamp']
-
-        # event_stream returns an ordered generator of events (by time)
-        # therefore no further sorting is needed.
-        events = self.event_stream(query_string=self.query,
-                                   return_fields=return_fields)
-        session_num = 0
-
-        try:
-            first_event = next(events)
-            last_timestamp = first_event.source.get('timestamp')
-            session_num = 1
-            self.annotateEvent(first_event, session_num)
-
-            for event in events:
-                curr_timestamp = event.source.get('timestamp')
-                if curr_timestamp - last_timestamp > self.max_time_diff_micros:
-                    session_num += 1
-                self.annotateEvent(event, session_num)
-                last_timestamp = curr_timestamp
+        curr_timestamp = event.source.get('timestamp')
+        if not self._session_num:
+            self._session_num = 1
+        elif curr_timestamp - self._last_timestamp > self.max_time_diff_micros:
+            self._session_num += 1
+        self.annotateEvent(event, self._session_num)
+        self._last_timestamp = curr_timestamp
+
+    def finalize(self):
+        """Add a view for the sessions.
 
+        Returns:
+            String containing the number of sessions created.
+        """
+        if self._session_num:
             self.sketch.add_view('Session view',
                                  self.NAME, query_string=self.query)
-        except StopIteration:
-            pass
 
         return ('Sessionizing completed, number of session created:'
-                ' {0:d}'.format(session_num))
+                ' {0:d}'.format(self._session_num))
 
     def annotateEvent(self, event, session_num):
         event.add_attributes({'session_id': {self.session_type: session_num}})
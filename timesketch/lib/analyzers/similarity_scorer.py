@@ -86,6 +86,9 @@ class SimilarityScorer(interface.BaseSketchAnalyzer):
 
     DEPENDENCIES = frozenset()
 
+    # Events are scored by their similarity to all other events.
+    FULL_RESCAN = True
+
     def __init__(self, index_name, sketch_id, data_type):
         """Initializes a similarity scorer.
 
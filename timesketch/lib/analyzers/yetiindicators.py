@@ -28,6 +28,8 @@ class YetiIndicators(interface.BaseSketchAnalyzer):
 
     NAME = 'yetiindicators'
     DEPENDENCIES = frozenset(['domain'])
+    # New indicators in Yeti also match events from earlier runs.
+    FULL_RESCAN = True
 
     def __init__(self, index_name, sketch_id):
         """Initialize the Index Analyzer.
@@ -0,0 +1,108 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark the row by row and the chunked CSV readers.
+
+Usage:
+    python -m timesketch.lib.benchmarks.csv_reader --rows 1000000
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import csv
+import datetime
+import io
+import os
+import tempfile
+import time
+
+from timesketch.lib.utils import read_and_validate_csv
+from timesketch.lib.utils import read_and_validate_csv_chunked
+
+
+def write_csv(path, rows):
+    """Write a synthetic CSV timeline.
+
+    Every 1000th row has a datetime that can't be parsed.
+
+    Args:
+        path: Path to the file to write.
+        rows: Number of rows.
+    """
+    start = datetime.datetime(2019, 1, 1)
+    with io.open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(
+            ['message', 'datetime', 'timestamp_desc', 'data_type'])
+        for i in range(rows):
+            event_time = start + datetime.timedelta(seconds=i, microseconds=i)
+            event_datetime = event_time.isoformat() + '+00:00'
+            if i % 1000 == 999:
+                event_datetime = 'invalid'
+            writer.writerow([
+                'Event number {0:d}'.format(i), event_datetime,
+                'Event time', 'benchmark:event'])
+
+
+def run(reader, path):
+    """Read all rows of a file.
+
+    Args:
+        reader: Reader function.
+        path: Path to the CSV file.
+
+    Returns:
+        Tuple with number of rows and seconds spent.
+    """
+    start = time.time()
+    count = 0
+    for _ in reader(path):
+        count += 1
+    return count, time.time() - start
+
+
+def main():
+    """Run the benchmark."""
+    argument_parser = argparse.ArgumentParser(description=__doc__)
+    argument_parser.add_argument(
+        '--rows', type=int, default=100000, help='Number of rows.')
+    args = argument_parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    os.close(fd)
+    try:
+        write_csv(path, args.rows)
+        size = os.path.getsize(path) / (1024.0 * 1024.0)
+        print('{0:d} rows, {1:.1f} MB'.format(args.rows, size))
+
+        results = {}
+        for name, reader in (
+                ('read_and_validate_csv', read_and_validate_csv),
+                ('read_and_validate_csv_chunked',
+                 read_and_validate_csv_chunked)):
+            count, seconds = run(reader, path)
+            results[name] = seconds
+            print('{0:s}: {1:d} rows in {2:.2f}s, {3:.0f} rows/s'.format(
+                name, count, seconds, count / max(seconds, 1e-9)))
+
+        print('Speedup: {0:.1f}x'.format(
+            results['read_and_validate_csv'] /
+            max(results['read_and_validate_csv_chunked'], 1e-9)))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
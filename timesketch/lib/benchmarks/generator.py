@@ -0,0 +1,204 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Generator for synthetic CSV, JSONL, Redline and Parquet timelines."""
+
+from __future__ import unicode_literals
+
+import csv
+import datetime
+import io
+import json
+
+import six
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+START_TIME = datetime.datetime(2019, 1, 1)
+
+# Datetime formats seen in real timelines. All of them can be parsed by
+# the readers in timesketch.lib.utils.
+DATETIME_FORMATS = {
+    'iso8601': lambda dt: dt.isoformat() + '+00:00',
+    'iso8601_z': lambda dt: dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+    'offset': lambda dt: dt.isoformat() + '+02:00',
+    'space': lambda dt: dt.strftime('%Y-%m-%d %H:%M:%S'),
+    'us': lambda dt: dt.strftime('%m/%d/%Y %I:%M:%S %p'),
+    'rfc2822': lambda dt: dt.strftime('%a, %d %b %Y %H:%M:%S +0000'),
+}
+
+# Cycles through all formats, row by row.
+MIXED_DATETIME_FORMAT = 'mixed'
+
+TIMELINE_FORMATS = ['csv', 'jsonl', 'redline', 'parquet']
+
+
+def format_datetime(index, datetime_format):
+    """Get the datetime of a synthetic event.
+
+    Args:
+        index: Number of the event.
+        datetime_format: Name of a format in DATETIME_FORMATS or 'mixed'.
+
+    Returns:
+        Datetime string.
+
+    Raises:
+        KeyError if the format is unknown.
+    """
+    if datetime_format == MIXED_DATETIME_FORMAT:
+        names = sorted(DATETIME_FORMATS)
+        datetime_format = names[index % len(names)]
+    event_time = START_TIME + datetime.timedelta(
+        seconds=index, microseconds=index % 1000000)
+    return DATETIME_FORMATS[datetime_format](event_time)
+
+
+def generate_events(rows, fields=0, datetime_format='iso8601'):
+    """Generator for synthetic events.
+
+    Args:
+        rows: Number of events.
+        fields: Number of fields in addition to the mandatory ones.
+        datetime_format: Name of a format in DATETIME_FORMATS or 'mixed'.
+
+    Yields:
+        Dictionary with the event.
+    """
+    for index in six.moves.range(rows):
+        event = {
+            'message': 'Synthetic event number {0:d}'.format(index),
+            'datetime': format_datetime(index, datetime_format),
+            'timestamp_desc': 'Event Recorded',
+            'data_type': 'benchmark:event',
+        }
+        for field in six.moves.range(fields):
+            event['field_{0:d}'.format(field)] = 'value {0:d}'.format(
+                (index * 31 + field) % 10000)
+        yield event
+
+
+def write_csv(path, rows, fields=0, datetime_format='iso8601'):
+    """Write a synthetic CSV timeline.
+
+    Args:
+        path: Path to the file to write.
+        rows: Number of rows.
+        fields: Number of columns in addition to the mandatory ones.
+        datetime_format: Name of a format in DATETIME_FORMATS or 'mixed'.
+    """
+    header = ['message', 'datetime', 'timestamp_desc', 'data_type'] + [
+        'field_{0:d}'.format(field) for field in six.moves.range(fields)]
+    with io.open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(header)
+        for event in generate_events(rows, fields, datetime_format):
+            writer.writerow([event[column] for column in header])
+
+
+def write_jsonl(path, rows, fields=0, datetime_format='iso8601'):
+    """Write a synthetic JSONL timeline.
+
+    Args:
+        path: Path to the file to write.
+        rows: Number of lines.
+        fields: Number of fields in addition to the mandatory ones.
+        datetime_format: Name of a format in DATETIME_FORMATS or 'mixed'.
+    """
+    with io.open(path, 'w', encoding='utf-8') as fh:
+        for event in generate_events(rows, fields, datetime_format):
+            fh.write(six.text_type(json.dumps(event, sort_keys=True)))
+            fh.write('\n')
+
+
+def write_redline(path, rows, fields=0, datetime_format='iso8601'):
+    """Write a synthetic Redline CSV timeline.
+
+    Redline timelines have a fixed set of columns, additional fields are
+    appended to the summary.
+
+    Args:
+        path: Path to the file to write.
+        rows: Number of rows.
+        fields: Number of fields to append to the summary.
+        datetime_format: Name of a format in DATETIME_FORMATS or 'mixed'.
+    """
+    with io.open(path, 'w', encoding='utf-8', newline='') as fh:
+        writer = csv.writer(fh, quoting=csv.QUOTE_ALL)
+        writer.writerow(['Alert', 'Tag', 'Timestamp', 'Field', 'Summary'])
+        for event in generate_events(rows, fields, datetime_format):
+            summary = ' '.join(
+                [event['message']] + [
+                    '{0:s}={1:s}'.format(key, value)
+                    for key, value in sorted(event.items())
+                    if key.startswith('field_')])
+            writer.writerow([
+                '', 'benchmark', event['datetime'], event['timestamp_desc'],
+                summary])
+
+
+def write_parquet(path, rows, fields=0, datetime_format='iso8601'):
+    """Write a synthetic Parquet timeline.
+
+    Args:
+        path: Path to the file to write.
+        rows: Number of rows.
+        fields: Number of columns in addition to the mandatory ones.
+        datetime_format: Name of a format in DATETIME_FORMATS or 'mixed'.
+
+    Raises:
+        RuntimeError if pyarrow is not installed.
+    """
+    if not pyarrow:
+        raise RuntimeError(
+            'Unable to write Parquet files, the pyarrow module is missing.')
+    header = ['message', 'datetime', 'timestamp_desc', 'data_type'] + [
+        'field_{0:d}'.format(field) for field in six.moves.range(fields)]
+    columns = dict((column, []) for column in header)
+    for event in generate_events(rows, fields, datetime_format):
+        for column in header:
+            columns[column].append(event[column])
+    table = pyarrow.Table.from_arrays(
+        [pyarrow.array(columns[column]) for column in header], header)
+    pyarrow.parquet.write_table(table, path)
+
+
+def write_timeline(path, timeline_format, rows, fields=0,
+                   datetime_format='iso8601'):
+    """Write a synthetic timeline.
+
+    Args:
+        path: Path to the file to write.
+        timeline_format: One of TIMELINE_FORMATS.
+        rows: Number of events.
+        fields: Number of fields in addition to the mandatory ones.
+        datetime_format: Name of a format in DATETIME_FORMATS or 'mixed'.
+
+    Raises:
+        ValueError if the timeline format is unknown.
+    """
+    writers = {
+        'csv': write_csv,
+        'jsonl': write_jsonl,
+        'redline': write_redline,
+        'parquet': write_parquet,
+    }
+    writer = writers.get(timeline_format)
+    if not writer:
+        raise ValueError('Unknown timeline format: {0:s}'.format(
+            timeline_format))
+    writer(path, rows, fields=fields, datetime_format=datetime_format)
@@ -0,0 +1,68 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the synthetic timeline generator."""
+
+from __future__ import unicode_literals
+
+import os
+import shutil
+import tempfile
+
+from timesketch.lib.benchmarks import generator
+from timesketch.lib.testlib import BaseTest
+from timesketch.lib import utils
+from timesketch.lib.utils import read_and_validate_csv_chunked
+from timesketch.lib.utils import read_and_validate_jsonl
+from timesketch.lib.utils import read_and_validate_parquet
+from timesketch.lib.utils import read_and_validate_redline
+
+
+class TestGenerator(BaseTest):
+    """Tests for the synthetic timeline generator."""
+
+    def setUp(self):
+        """Create a folder for the timelines."""
+        super(TestGenerator, self).setUp()
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def test_timelines(self):
+        """Test that the readers accept all generated timelines."""
+        readers = {
+            'csv': read_and_validate_csv_chunked,
+            'jsonl': read_and_validate_jsonl,
+            'redline': read_and_validate_redline,
+        }
+        if utils.pyarrow:
+            readers['parquet'] = read_and_validate_parquet
+        for timeline_format, reader in readers.items():
+            path = os.path.join(self.folder, 'timeline.' + timeline_format)
+            generator.write_timeline(
+                path, timeline_format, 12, fields=3,
+                datetime_format=generator.MIXED_DATETIME_FORMAT)
+            events = list(reader(path))
+            self.assertEqual(len(events), 12, timeline_format)
+            self.assertIn('Synthetic event number 11', events[-1]['message'])
+
+        self.assertRaises(
+            ValueError, generator.write_timeline, path, 'plaso', 1)
+
+    def test_datetime_formats(self):
+        """Test that all datetime formats describe the same time."""
+        self.assertEqual(
+            generator.format_datetime(1, 'iso8601'),
+            '2019-01-01T00:00:01.000001+00:00')
+        self.assertEqual(
+            generator.format_datetime(1, 'us'), '01/01/2019 12:00:01 AM')
+        self.assertRaises(KeyError, generator.format_datetime, 1, 'unknown')
@@ -0,0 +1,301 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Benchmark the timeline readers and bulk indexing of events.
+
+Synthetic timelines are generated in a temporary folder and every benchmark
+runs in its own process, so that the peak memory use can be measured. Events
+are indexed into a local stand-in for the Elasticsearch bulk API, which
+acknowledges all documents without storing them.
+
+The results are written as JSON, to compare runs before and after a change.
+
+Usage:
+    python -m timesketch.lib.benchmarks.ingest --rows 1000000 \\
+        --fields 10 --datetime_format mixed --output results.json
+"""
+
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from six.moves import BaseHTTPServer
+from six.moves import socketserver
+
+from timesketch.lib.benchmarks import generator
+from timesketch.lib.datastores.elastic import ElasticsearchDataStore
+from timesketch.lib import utils
+
+# Benchmark name and the timeline format it reads.
+BENCHMARKS = [
+    ('read_and_validate_csv', 'csv'),
+    ('read_and_validate_csv_chunked', 'csv'),
+    ('read_and_validate_jsonl', 'jsonl'),
+    ('read_and_validate_jsonl_parallel', 'jsonl'),
+    ('read_and_validate_redline', 'redline'),
+    ('read_and_validate_parquet', 'parquet'),
+    ('import_event', 'jsonl'),
+]
+
+
+class BulkRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Stand-in for the Elasticsearch bulk API."""
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Acknowledge all actions of a bulk request."""
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        self.server.bytes_received += length
+
+        # Every action has a header line and a document line.
+        actions = body.count(b'\n') // 2
+        response = json.dumps({
+            'took': 0,
+            'errors': False,
+            'items': [{'index': {'status': 201}}] * actions,
+        }).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *unused_args):  # pylint: disable=arguments-differ
+        """Don't log requests."""
+        return
+
+
+class BulkServer(socketserver.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """Threaded HTTP server for the bulk API stand-in."""
+    daemon_threads = True
+
+    def __init__(self):
+        """Listen on a free port on localhost."""
+        BaseHTTPServer.HTTPServer.__init__(
+            self, ('127.0.0.1', 0), BulkRequestHandler)
+        self.bytes_received = 0
+
+
+def peak_rss():
+    """Get the peak resident memory of the current process.
+
+    Returns:
+        Number of bytes.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    if sys.platform == 'darwin':
+        return max_rss
+    return max_rss * 1024
+
+
+def read_events(name, path):
+    """Read all events of a timeline with one of the readers.
+
+    Args:
+        name: Name of the reader function in timesketch.lib.utils.
+        path: Path to the timeline.
+
+    Returns:
+        Tuple with number of events and number of bytes read.
+    """
+    count = 0
+    for _ in getattr(utils, name)(path):
+        count += 1
+    return count, os.path.getsize(path)
+
+
+def import_events(path):
+    """Index the events of a JSONL timeline into the bulk API stand-in.
+
+    The events are read before the timer starts, so that only the bulk
+    indexing is measured.
+
+    Args:
+        path: Path to the JSONL timeline.
+
+    Returns:
+        Tuple with number of events, number of bytes sent and the start
+        time.
+    """
+    events = list(utils.read_and_validate_jsonl(path))
+
+    server = BulkServer()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        datastore = ElasticsearchDataStore(
+            host=server.server_address[0], port=server.server_address[1])
+        start = time.time()
+        for event in events:
+            datastore.import_event('benchmark', 'generic_event', event)
+        summary = datastore.flush_queued_events().get('benchmark', {})
+        if summary.get('failed'):
+            raise RuntimeError('{0:d} events failed'.format(
+                summary['failed']))
+        return summary.get('indexed', 0), server.bytes_received, start
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def run_benchmark(name, path):
+    """Run one benchmark.
+
+    Args:
+        name: Name of the benchmark.
+        path: Path to the timeline.
+
+    Returns:
+        Dictionary with the results.
+    """
+    start = time.time()
+    if name == 'import_event':
+        rows, size, start = import_events(path)
+    else:
+        rows, size = read_events(name, path)
+    seconds = max(time.time() - start, 1e-9)
+
+    return {
+        'name': name,
+        'rows': rows,
+        'bytes': size,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds,
+        'mb_per_second': size / seconds / (1024.0 * 1024.0),
+        'peak_rss_bytes': peak_rss(),
+    }
+
+
+def _benchmark_process(queue, name, path):
+    """Run one benchmark and put the result in a queue.
+
+    Args:
+        queue: Instance of multiprocessing.Queue.
+        name: Name of the benchmark.
+        path: Path to the timeline.
+    """
+    # Errors are part of the results, a reader that fails is a regression.
+    try:
+        result = run_benchmark(name, path)
+    except Exception as e:  # pylint: disable=broad-except
+        result = {'name': name, 'error': '{0!s}'.format(e)}
+    queue.put(result)
+
+
+def run(rows, fields, datetime_format, names=None):
+    """Generate timelines and run the benchmarks.
+
+    Args:
+        rows: Number of events per timeline.
+        fields: Number of fields in addition to the mandatory ones.
+        datetime_format: Name of a datetime format, see
+            timesketch.lib.benchmarks.generator.
+        names: Optional list of benchmark names to run, defaults to all.
+
+    Returns:
+        Dictionary with the parameters and a list of results.
+    """
+    benchmarks = [
+        (name, timeline_format) for name, timeline_format in BENCHMARKS
+        if not names or name in names]
+
+    folder = tempfile.mkdtemp()
+    try:
+        paths = {}
+        for _, timeline_format in benchmarks:
+            if timeline_format in paths:
+                continue
+            path = os.path.join(folder, 'timeline.' + timeline_format)
+            generator.write_timeline(
+                path, timeline_format, rows, fields=fields,
+                datetime_format=datetime_format)
+            paths[timeline_format] = path
+
+        results = []
+        for name, timeline_format in benchmarks:
+            # A new process for every benchmark, so that peak memory of one
+            # doesn't hide the peak memory of the next. It's not a pool
+            # worker, those can't start the processes of the parallel
+            # readers.
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(
+                target=_benchmark_process,
+                args=(queue, name, paths[timeline_format]))
+            process.start()
+            result = queue.get()
+            process.join()
+            result['format'] = timeline_format
+            results.append(result)
+    finally:
+        shutil.rmtree(folder)
+
+    return {
+        'parameters': {
+            'rows': rows,
+            'fields': fields,
+            'datetime_format': datetime_format,
+        },
+        'python': platform.python_version(),
+        'results': results,
+    }
+
+
+def main():
+    """Run the benchmarks."""
+    argument_parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    argument_parser.add_argument(
+        '--rows', type=int, default=100000, help='Number of events.')
+    argument_parser.add_argument(
+        '--fields', type=int, default=0,
+        help='Number of fields in addition to the mandatory ones.')
+    argument_parser.add_argument(
+        '--datetime_format', default='iso8601',
+        choices=sorted(generator.DATETIME_FORMATS) + [
+            generator.MIXED_DATETIME_FORMAT],
+        help='Format of the datetime field.')
+    argument_parser.add_argument(
+        '--benchmark', action='append', dest='benchmarks',
+        choices=[name for name, _ in BENCHMARKS],
+        help='Benchmark to run, can be repeated. Defaults to all.')
+    argument_parser.add_argument(
+        '--output', help='Write the results to this file instead of stdout.')
+    args = argument_parser.parse_args()
+
+    results = run(
+        args.rows, args.fields, args.datetime_format, names=args.benchmarks)
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
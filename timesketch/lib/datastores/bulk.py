@@ -0,0 +1,289 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Parallel bulk indexing for the Elasticsearch datastore."""
+
+from __future__ import unicode_literals
+
+from collections import Counter
+from collections import defaultdict
+import logging
+import threading
+import time
+
+from multiprocessing.pool import ThreadPool
+
+# pylint: disable=redefined-builtin
+from elasticsearch.exceptions import ConnectionError
+from elasticsearch.exceptions import TransportError
+from elasticsearch.serializer import JSONSerializer
+
+
+class BulkIndexer(object):
+    """Queue bulk actions and send them to Elasticsearch in parallel.
+
+    Actions are serialized as they are added and grouped into bulk requests
+    that are bounded both by payload size in bytes and by number of actions.
+    Up to thread_count bulk requests are in flight at the same time, when
+    all of them are busy adding more actions blocks until one finishes.
+
+    Items rejected by Elasticsearch because the cluster is overloaded (HTTP
+    429) are retried with exponential backoff, as are requests that fail
+    because the cluster can't be reached or times out. All other errors,
+    and errors that remain after the last retry, are counted as failed.
+    Callers must treat failed documents as a failed import.
+
+    Attributes:
+        client: Instance of elasticsearch.Elasticsearch.
+        thread_count: Maximum number of concurrent bulk requests.
+        max_bytes: Maximum size of one bulk request payload in bytes.
+        max_actions: Maximum number of actions in one bulk request.
+        max_retries: Number of times a rejected item is retried.
+        initial_backoff: Seconds to wait before the first retry.
+        max_backoff: Maximum number of seconds to wait between retries.
+        stats: Dictionary with a Counter of indexed, updated, failed and
+            retried documents per index name. Updated documents are indexed
+            documents that replaced a document with the same ID.
+    """
+
+    DEFAULT_THREAD_COUNT = 4
+    DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+    DEFAULT_MAX_ACTIONS = 1000
+    DEFAULT_MAX_RETRIES = 3
+    DEFAULT_INITIAL_BACKOFF = 2
+    DEFAULT_MAX_BACKOFF = 60
+
+    # Bulk item status codes that are worth retrying.
+    RETRY_STATUS_CODES = frozenset([429])
+
+    # Bulk request status codes that are worth retrying, connection errors
+    # and timeouts have no status code and are always retried.
+    RETRY_REQUEST_STATUS_CODES = frozenset([429, 502, 503, 504])
+
+    # Maximum number of error messages to keep per index.
+    MAX_ERRORS = 10
+
+    def __init__(self, client, thread_count=DEFAULT_THREAD_COUNT,
+                 max_bytes=DEFAULT_MAX_BYTES, max_actions=DEFAULT_MAX_ACTIONS,
+                 max_retries=DEFAULT_MAX_RETRIES,
+                 initial_backoff=DEFAULT_INITIAL_BACKOFF,
+                 max_backoff=DEFAULT_MAX_BACKOFF):
+        """Initialize the bulk indexer.
+
+        Args:
+            client: Instance of elasticsearch.Elasticsearch.
+            thread_count: Maximum number of concurrent bulk requests.
+            max_bytes: Maximum size of one bulk request payload in bytes.
+            max_actions: Maximum number of actions in one bulk request.
+            max_retries: Number of times a rejected item is retried.
+            initial_backoff: Seconds to wait before the first retry.
+            max_backoff: Maximum number of seconds to wait between retries.
+        """
+        super(BulkIndexer, self).__init__()
+        self.client = client
+        self.thread_count = max(1, int(thread_count))
+        self.max_bytes = int(max_bytes)
+        self.max_actions = max(1, int(max_actions))
+        self.max_retries = int(max_retries)
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stats = defaultdict(Counter)
+        self.errors = defaultdict(list)
+
+        self._serializer = JSONSerializer()
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._pool = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.thread_count)
+
+    @property
+    def queued_actions(self):
+        """Number of actions waiting to be sent."""
+        return len(self._buffer)
+
+    def add(self, header, body, max_actions=None):
+        """Queue one bulk action.
+
+        Args:
+            header: Dictionary with the bulk action header, e.g.
+                {'index': {'_index': 'foo', '_type': 'bar'}}.
+            body: Dictionary with the document or partial update.
+            max_actions: Optional number of queued actions to send the
+                queue at, instead of the max_actions of the indexer.
+        """
+        action = list(header.values())[0]
+        header_line = self._serializer.dumps(header)
+        body_line = self._serializer.dumps(body)
+        size = len(header_line.encode('utf-8')) + len(
+            body_line.encode('utf-8')) + 2
+
+        if self._buffer and self._buffer_bytes + size > self.max_bytes:
+            self._submit()
+
+        self._buffer.append((action.get('_index'), header_line, body_line))
+        self._buffer_bytes += size
+
+        if len(self._buffer) >= (max_actions or self.max_actions):
+            self._submit()
+
+    def flush(self):
+        """Send all queued actions and wait for in flight requests.
+
+        Returns:
+            Dictionary with a summary of indexed, failed and retried documents
+            per index name.
+        """
+        if self._buffer:
+            self._submit()
+
+        for result in self._pending:
+            result.wait()
+        self._pending = []
+
+        if self._pool:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        return self.summary()
+
+    def summary(self):
+        """Get a summary of the bulk operations so far.
+
+        Returns:
+            Dictionary with index name as key and a dictionary with the number
+            of indexed, updated, failed and retried documents as value.
+        """
+        with self._lock:
+            return {
+                index_name: {
+                    'indexed': counter['indexed'],
+                    'updated': counter['updated'],
+                    'failed': counter['failed'],
+                    'retried': counter['retried'],
+                }
+                for index_name, counter in self.stats.items()
+            }
+
+    def _submit(self):
+        """Hand the queued actions over to a worker thread."""
+        chunk = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+
+        # Block until there is a free slot, this bounds the number of
+        # requests in flight and the memory used by queued chunks.
+        self._slots.acquire()
+        if not self._pool:
+            self._pool = ThreadPool(self.thread_count)
+        self._pending = [
+            result for result in self._pending if not result.ready()]
+        self._pending.append(
+            self._pool.apply_async(self._send_chunk, (chunk,)))
+
+    def _count(self, chunk, key):
+        """Update the statistics for all actions in a chunk.
+
+        Args:
+            chunk: List of (index name, header, body) tuples.
+            key: Name of the counter to increment.
+        """
+        with self._lock:
+            for index_name, _, _ in chunk:
+                self.stats[index_name][key] += 1
+
+    def _add_error(self, index_name, error):
+        """Keep a bounded number of error messages for an index.
+
+        Args:
+            index_name: Name of the index.
+            error: Error message or error dictionary from Elasticsearch.
+        """
+        with self._lock:
+            errors = self.errors[index_name]
+            if len(errors) < self.MAX_ERRORS:
+                errors.append(error)
+
+    def _backoff(self, attempt):
+        """Sleep before retrying.
+
+        Args:
+            attempt: Zero based number of the retry.
+        """
+        time.sleep(min(self.max_backoff, self.initial_backoff * 2**attempt))
+
+    def _send_chunk(self, chunk):
+        """Send a chunk of actions, retrying rejected items.
+
+        Args:
+            chunk: List of (index name, header, body) tuples.
+        """
+        try:
+            attempt = 0
+            while chunk:
+                lines = []
+                for _, header_line, body_line in chunk:
+                    lines.append(header_line)
+                    lines.append(body_line)
+                body = '\n'.join(lines) + '\n'
+
+                try:
+                    response = self.client.bulk(body=body)
+                except TransportError as e:
+                    retry = (
+                        isinstance(e, ConnectionError) or
+                        e.status_code in self.RETRY_REQUEST_STATUS_CODES)
+                    if retry and attempt < self.max_retries:
+                        logging.warning(
+                            'Bulk request failed, retrying: {0!s}'.format(e))
+                        self._count(chunk, 'retried')
+                        self._backoff(attempt)
+                        attempt += 1
+                        continue
+                    raise
+
+                retry_chunk = []
+                for action, item in zip(chunk, response.get('items', [])):
+                    result = list(item.values())[0]
+                    status = result.get('status', 500)
+                    if 200 <= status < 300:
+                        self._count([action], 'indexed')
+                        if (result.get('result') == 'updated' or
+                                result.get('created') is False):
+                            self._count([action], 'updated')
+                    elif (status in self.RETRY_STATUS_CODES and
+                          attempt < self.max_retries):
+                        retry_chunk.append(action)
+                    else:
+                        self._count([action], 'failed')
+                        self._add_error(action[0], result.get('error'))
+
+                if not retry_chunk:
+                    break
+
+                self._count(retry_chunk, 'retried')
+                self._backoff(attempt)
+                attempt += 1
+                chunk = retry_chunk
+
+        # We want to account for all errors so that the summary is complete
+        # and the worker thread survives.
+        except Exception as e:  # pylint: disable=broad-except
+            logging.error('Bulk request failed: {0!s}'.format(e))
+            self._count(chunk, 'failed')
+            if chunk:
+                self._add_error(chunk[0][0], str(e))
+        finally:
+            self._slots.release()
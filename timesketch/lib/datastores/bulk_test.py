@@ -0,0 +1,149 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the bulk indexer."""
+
+from __future__ import unicode_literals
+
+import json
+import threading
+
+# pylint: disable=redefined-builtin
+from elasticsearch.exceptions import ConnectionError
+
+from timesketch.lib.datastores.bulk import BulkIndexer
+from timesketch.lib.testlib import BaseTest
+
+
+class MockBulkClient(object):
+    """Mock Elasticsearch client that records bulk requests."""
+
+    def __init__(self, rejected_messages=None, connection_errors=0):
+        """Initialize the client.
+
+        Args:
+            rejected_messages: Set of event messages to reject once with
+                status 429.
+            connection_errors: Number of bulk requests that fail with a
+                connection error before requests succeed.
+        """
+        self.requests = []
+        self.rejected_messages = set(rejected_messages or [])
+        self.connection_errors = connection_errors
+        self._lock = threading.Lock()
+
+    def bulk(self, body):
+        """Mock a bulk request."""
+        lines = body.strip().split('\n')
+        items = []
+        with self._lock:
+            if self.connection_errors:
+                self.connection_errors -= 1
+                raise ConnectionError('N/A', 'Connection timed out', None)
+            self.requests.append(lines)
+            for line in lines[1::2]:
+                message = json.loads(line).get('message')
+                if message in self.rejected_messages:
+                    self.rejected_messages.discard(message)
+                    items.append({'index': {'status': 429}})
+                elif message == 'bad':
+                    items.append({'index': {
+                        'status': 400, 'error': 'mapper_parsing_exception'}})
+                elif message == 'duplicate':
+                    items.append({'index': {
+                        'status': 200, 'result': 'updated'}})
+                else:
+                    items.append({'index': {
+                        'status': 201, 'result': 'created'}})
+        return {'errors': False, 'items': items}
+
+
+class TestBulkIndexer(BaseTest):
+    """Tests for the bulk indexer."""
+
+    @staticmethod
+    def _header(index_name='test'):
+        """Build a bulk index header."""
+        return {'index': {'_index': index_name, '_type': 'generic_event'}}
+
+    def test_flush_by_actions(self):
+        """Test that requests are split on number of actions."""
+        client = MockBulkClient()
+        indexer = BulkIndexer(client, thread_count=2, max_actions=10)
+        for i in range(25):
+            indexer.add(self._header(), {'message': str(i)})
+        indexer.add(self._header(), {'message': 'duplicate'})
+        summary = indexer.flush()
+
+        self.assertEqual(len(client.requests), 3)
+        self.assertEqual(summary['test']['indexed'], 26)
+        self.assertEqual(summary['test']['updated'], 1)
+        self.assertEqual(summary['test']['failed'], 0)
+
+    def test_flush_by_actions_per_call(self):
+        """Test that max_actions of a call doesn't change the indexer."""
+        client = MockBulkClient()
+        indexer = BulkIndexer(client, max_actions=10)
+        indexer.add(self._header(), {'message': '1'}, max_actions=1)
+        indexer.add(self._header(), {'message': '2'})
+        indexer.flush()
+
+        self.assertEqual(indexer.max_actions, 10)
+        self.assertEqual(len(client.requests), 2)
+
+    def test_flush_by_bytes(self):
+        """Test that requests are split on payload size."""
+        client = MockBulkClient()
+        indexer = BulkIndexer(client, max_bytes=200)
+        for _ in range(10):
+            indexer.add(self._header(), {'message': 'x' * 50})
+        indexer.flush()
+
+        self.assertGreater(len(client.requests), 1)
+        for lines in client.requests:
+            self.assertLessEqual(len('\n'.join(lines)), 200)
+
+    def test_retry_and_failures(self):
+        """Test that rejected items are retried and errors are counted."""
+        client = MockBulkClient(rejected_messages=['1', '2'])
+        indexer = BulkIndexer(client, initial_backoff=0)
+        indexer.add(self._header(), {'message': '1'})
+        indexer.add(self._header(), {'message': '2'})
+        indexer.add(self._header(), {'message': '3'})
+        indexer.add(self._header('other'), {'message': 'bad'})
+        summary = indexer.flush()
+
+        self.assertEqual(summary['test'], {
+            'indexed': 3, 'updated': 0, 'failed': 0, 'retried': 2})
+        self.assertEqual(summary['other'], {
+            'indexed': 0, 'updated': 0, 'failed': 1, 'retried': 0})
+        self.assertEqual(
+            indexer.errors['other'], ['mapper_parsing_exception'])
+
+    def test_retry_connection_errors(self):
+        """Test that requests are retried when the cluster can't be reached."""
+        client = MockBulkClient(connection_errors=2)
+        indexer = BulkIndexer(client, initial_backoff=0)
+        indexer.add(self._header(), {'message': '1'})
+        summary = indexer.flush()
+
+        self.assertEqual(summary['test'], {
+            'indexed': 1, 'updated': 0, 'failed': 0, 'retried': 2})
+
+        client = MockBulkClient(connection_errors=5)
+        indexer = BulkIndexer(client, max_retries=2, initial_backoff=0)
+        indexer.add(self._header(), {'message': '1'})
+        summary = indexer.flush()
+
+        self.assertEqual(summary['test'], {
+            'indexed': 0, 'updated': 0, 'failed': 1, 'retried': 2})
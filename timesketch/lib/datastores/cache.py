@@ -0,0 +1,292 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Process wide cache for Elasticsearch query results."""
+
+from __future__ import unicode_literals
+
+import collections
+import json
+import logging
+import threading
+import time
+
+from flask import current_app
+from flask import has_app_context
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+class LocalGenerations(object):
+    """Generation numbers of indices in the memory of the process."""
+
+    def __init__(self):
+        """Initialize the generations."""
+        super(LocalGenerations, self).__init__()
+        self._generations = collections.defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, indices):
+        """Get the generations of indices.
+
+        Args:
+            indices: List of index names.
+
+        Returns:
+            List with the generation of every index.
+        """
+        with self._lock:
+            return [self._generations.get(index, 0) for index in indices]
+
+    def increment(self, indices):
+        """Increment the generations of indices.
+
+        Args:
+            indices: List of index names.
+        """
+        with self._lock:
+            for index in indices:
+                self._generations[index] += 1
+
+
+class RedisGenerations(object):
+    """Generation numbers of indices in Redis, shared by all processes."""
+
+    KEY_PREFIX = 'timesketch:cache:generation:'
+
+    def __init__(self, client):
+        """Initialize the generations.
+
+        Args:
+            client: Instance of redis.StrictRedis.
+        """
+        super(RedisGenerations, self).__init__()
+        self._client = client
+
+    def get(self, indices):
+        """Get the generations of indices.
+
+        Args:
+            indices: List of index names.
+
+        Returns:
+            List with the generation of every index.
+        """
+        values = self._client.mget(
+            [self.KEY_PREFIX + index for index in indices])
+        return [int(value or 0) for value in values]
+
+    def increment(self, indices):
+        """Increment the generations of indices.
+
+        Args:
+            indices: List of index names.
+        """
+        pipeline = self._client.pipeline(transaction=False)
+        for index in indices:
+            pipeline.incr(self.KEY_PREFIX + index)
+        pipeline.execute()
+
+
+class QueryCache(object):
+    """LRU cache of query results bounded by size in bytes.
+
+    Results are stored as serialized JSON, so every hit returns a fresh copy
+    that the caller is free to modify. Every index has a generation number
+    that is part of the cache key. Writing to an index bumps its generation,
+    which makes all cached results for that index unreachable; they are then
+    evicted as the least recently used entries.
+
+    With generations in Redis, writes from other processes, e.g. Celery
+    workers, invalidate the results right away. Results are also expired
+    after ttl seconds.
+
+    Attributes:
+        max_bytes: Maximum size of all cached results in bytes, 0 disables
+            the cache.
+        ttl: Number of seconds a result is kept.
+        size: Current size of all cached results in bytes.
+    """
+
+    DEFAULT_MAX_BYTES = 0
+    DEFAULT_TTL = 60
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL,
+                 generations=None):
+        """Initialize the cache.
+
+        Args:
+            max_bytes: Maximum size of all cached results in bytes.
+            ttl: Number of seconds a result is kept.
+            generations: Optional store of index generations, e.g. an
+                instance of RedisGenerations. Defaults to generations in
+                the memory of the process.
+        """
+        super(QueryCache, self).__init__()
+        self.max_bytes = int(max_bytes)
+        self.ttl = ttl
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._generations = generations or LocalGenerations()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """Boolean indicating if results are cached."""
+        return self.max_bytes > 0
+
+    def build_key(self, kind, query, indices):
+        """Build a cache key.
+
+        Args:
+            kind: String with the type of request, e.g. search.
+            query: JSON serializable query, e.g. the output of build_query.
+            indices: List of index names the query is run against.
+
+        Returns:
+            Tuple to use as cache key, or None if the generations of the
+            indices are not available and the result can't be cached.
+        """
+        indices = sorted(set(indices))
+        try:
+            generations = tuple(
+                zip(indices, self._generations.get(indices)))
+        except Exception as e:  # pylint: disable=broad-except
+            logging.warning(
+                'Unable to get index generations: {0!s}'.format(e))
+            return None
+        query = json.dumps(query, sort_keys=True, separators=(',', ':'))
+        return kind, query, generations
+
+    def get(self, key):
+        """Get a cached result.
+
+        Args:
+            key: Cache key from build_key().
+
+        Returns:
+            Copy of the cached result or None if there is no valid result.
+        """
+        if not self.enabled or key is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                self._remove(key)
+                return None
+            # Mark as most recently used.
+            del self._entries[key]
+            self._entries[key] = entry
+        return json.loads(value.decode('utf-8'))
+
+    def set(self, key, result):
+        """Cache a result.
+
+        Args:
+            key: Cache key from build_key().
+            result: JSON serializable result.
+        """
+        if not self.enabled or key is None:
+            return
+
+        value = json.dumps(result, separators=(',', ':')).encode('utf-8')
+        size = len(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.time() + self.ttl, value)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, indices):
+        """Invalidate all cached results for the given indices.
+
+        Args:
+            indices: List of index names that were written to.
+        """
+        if not self.enabled:
+            return
+        try:
+            self._generations.increment(sorted(set(indices)))
+        except Exception as e:  # pylint: disable=broad-except
+            # Other processes drop the results after the TTL.
+            logging.warning(
+                'Unable to invalidate cached results: {0!s}'.format(e))
+            self.clear()
+
+    def clear(self):
+        """Remove all cached results."""
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        """Remove an entry, the caller must hold the lock.
+
+        Args:
+            key: Cache key of the entry.
+        """
+        _, value = self._entries.pop(key)
+        self.size -= len(value)
+
+
+# This needs to be global to be shared by all datastore objects in the
+# process.
+# pylint: disable=invalid-name
+_cache = None
+
+
+def configure_cache(config):
+    """Configure the query cache for this process.
+
+    The generations of the indices are kept in the Redis database of the
+    Celery broker, if there is one, so that writes in one process
+    invalidate the results cached by all processes.
+
+    Args:
+        config: Dictionary like object with the Timesketch configuration.
+    """
+    # pylint: disable=global-statement
+    global _cache
+    max_bytes = config.get(
+        'ELASTIC_CACHE_MAX_BYTES', QueryCache.DEFAULT_MAX_BYTES)
+    broker_url = config.get('CELERY_BROKER_URL') or ''
+    generations = None
+    if max_bytes and redis and broker_url.startswith(('redis:', 'rediss:')):
+        generations = RedisGenerations(redis.StrictRedis.from_url(broker_url))
+    _cache = QueryCache(
+        max_bytes=max_bytes,
+        ttl=config.get('ELASTIC_CACHE_TTL', QueryCache.DEFAULT_TTL),
+        generations=generations)
+
+
+def get_cache():
+    """Get the query cache for this process.
+
+    Returns:
+        Instance of QueryCache.
+    """
+    if _cache is None:
+        configure_cache(current_app.config if has_app_context() else {})
+    return _cache
@@ -0,0 +1,158 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the query result cache."""
+
+from __future__ import unicode_literals
+
+import mock
+
+from timesketch.lib.datastores.cache import QueryCache
+from timesketch.lib.datastores.cache import RedisGenerations
+from timesketch.lib.datastores.cache import configure_cache
+from timesketch.lib.datastores.cache import get_cache
+from timesketch.lib.testlib import BaseTest
+
+
+class MockRedis(object):
+    """Mock Redis client that keeps counters in memory."""
+
+    def __init__(self):
+        self.values = {}
+
+    def mget(self, keys):
+        """Get the values of keys."""
+        return [self.values.get(key) for key in keys]
+
+    def incr(self, key):
+        """Increment the value of a key."""
+        self.values[key] = self.values.get(key, 0) + 1
+
+    def pipeline(self, transaction=True):
+        """Return a pipeline that executes commands right away."""
+        _ = transaction
+        pipeline = mock.Mock()
+        pipeline.incr.side_effect = self.incr
+        return pipeline
+
+
+class TestQueryCache(BaseTest):
+    """Tests for the query result cache."""
+
+    def test_get_and_set(self):
+        """Test that results are cached as copies."""
+        cache = QueryCache(max_bytes=1024)
+        key = cache.build_key('search', {'query': 'foo', 'size': 1}, ['b', 'a'])
+        self.assertIsNone(cache.get(key))
+
+        cache.set(key, {'hits': ['foo']})
+        result = cache.get(key)
+        self.assertEqual(result, {'hits': ['foo']})
+        result['hits'].append('bar')
+        self.assertEqual(cache.get(key), {'hits': ['foo']})
+
+        # Key order in the query and index order don't matter.
+        self.assertEqual(key, cache.build_key(
+            'search', {'size': 1, 'query': 'foo'}, ['a', 'b']))
+
+    def test_disabled(self):
+        """Test that nothing is cached when the cache is disabled."""
+        cache = QueryCache(max_bytes=0)
+        key = cache.build_key('search', {}, ['a'])
+        cache.set(key, {'hits': []})
+        self.assertIsNone(cache.get(key))
+
+    def test_invalidate(self):
+        """Test that writing to an index invalidates its results."""
+        cache = QueryCache(max_bytes=1024)
+        key_a = cache.build_key('search', {}, ['a'])
+        key_b = cache.build_key('search', {}, ['b'])
+        cache.set(key_a, 1)
+        cache.set(key_b, 2)
+        cache.invalidate(['a'])
+        self.assertIsNone(cache.get(cache.build_key('search', {}, ['a'])))
+        self.assertEqual(cache.get(cache.build_key('search', {}, ['b'])), 2)
+
+    def test_eviction(self):
+        """Test that least recently used results are evicted by size."""
+        cache = QueryCache(max_bytes=30)
+        keys = [cache.build_key('search', {'n': i}, ['a']) for i in range(3)]
+        cache.set(keys[0], 'x' * 10)
+        cache.set(keys[1], 'x' * 10)
+        cache.get(keys[0])
+        cache.set(keys[2], 'x' * 10)
+        self.assertLessEqual(cache.size, 30)
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNotNone(cache.get(keys[2]))
+
+    def test_ttl(self):
+        """Test that results expire."""
+        cache = QueryCache(max_bytes=1024, ttl=10)
+        key = cache.build_key('search', {}, ['a'])
+        with mock.patch('time.time', return_value=100):
+            cache.set(key, 1)
+        with mock.patch('time.time', return_value=105):
+            self.assertEqual(cache.get(key), 1)
+        with mock.patch('time.time', return_value=111):
+            self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.size, 0)
+
+    def test_shared_generations(self):
+        """Test that writes in one process invalidate all processes."""
+        client = MockRedis()
+        cache = QueryCache(
+            max_bytes=1024, generations=RedisGenerations(client))
+        other_cache = QueryCache(
+            max_bytes=1024, generations=RedisGenerations(client))
+        key = cache.build_key('search', {}, ['a'])
+        cache.set(key, 1)
+        self.assertEqual(cache.get(cache.build_key('search', {}, ['a'])), 1)
+
+        other_cache.invalidate(['a'])
+        self.assertEqual(
+            client.values, {RedisGenerations.KEY_PREFIX + 'a': 1})
+        self.assertIsNone(cache.get(cache.build_key('search', {}, ['a'])))
+
+    def test_generations_unavailable(self):
+        """Test that results are not cached without generations."""
+        client = mock.Mock()
+        client.mget.side_effect = IOError('Connection refused')
+        client.pipeline.return_value.execute.side_effect = IOError(
+            'Connection refused')
+        cache = QueryCache(
+            max_bytes=1024, generations=RedisGenerations(client))
+        key = cache.build_key('search', {}, ['a'])
+        self.assertIsNone(key)
+        cache.set(key, 1)
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(cache.size, 0)
+
+        cache.invalidate(['a'])
+
+    @mock.patch('timesketch.lib.datastores.cache.redis')
+    def test_configure_cache(self, mock_redis):
+        """Test that generations are kept in the Redis broker."""
+        # pylint: disable=protected-access
+        configure_cache({
+            'ELASTIC_CACHE_MAX_BYTES': 1024,
+            'CELERY_BROKER_URL': 'redis://127.0.0.1:6379'})
+        mock_redis.StrictRedis.from_url.assert_called_once_with(
+            'redis://127.0.0.1:6379')
+        self.assertIsInstance(get_cache()._generations, RedisGenerations)
+
+        mock_redis.reset_mock()
+        configure_cache({'CELERY_BROKER_URL': 'redis://127.0.0.1:6379'})
+        mock_redis.StrictRedis.from_url.assert_not_called()
+        self.assertFalse(get_cache().enabled)
+        configure_cache({})
@@ -17,19 +17,33 @@ from __future__ import unicode_literals
 
 from collections import Counter
 import codecs
+import functools
+import heapq
 import json
 import logging
+import threading
+import time
 
 from uuid import uuid4
 
 import six
+from six.moves import queue
 
-from elasticsearch import Elasticsearch
 from elasticsearch.exceptions import NotFoundError
+from elasticsearch.exceptions import TransportError
 # pylint: disable=redefined-builtin
 from elasticsearch.exceptions import ConnectionError
 from flask import abort
-
+from flask import current_app
+from flask import has_app_context
+
+from timesketch.lib.datastores.bulk import BulkIndexer
+from timesketch.lib.datastores.cache import get_cache
+from timesketch.lib.datastores.pool import get_client
+from timesketch.lib.datastores.schema import DEFAULT_FIELD_LIMIT
+from timesketch.lib.datastores.schema import OVERFLOW_FIELD
+from timesketch.lib.datastores.schema import OverflowRouter
+from timesketch.lib.datastores.schema import TEXT_MAPPING
 from timesketch.lib.definitions import HTTP_STATUS_CODE_NOT_FOUND
 
 # Setup logging
@@ -62,6 +76,121 @@ if(ctx._source.timesketch_label.contains(params.timesketch_label)) {
 }
 """
 
+# Sets the attributes in params.doc and then adds or toggles the labels in
+# params.labels in order, so that all changes to an event are one update.
+# Objects are merged recursively, like a partial document update does.
+UPDATE_EVENT_SCRIPT = """
+void merge(Map target, Map source) {
+    for (entry in source.entrySet()) {
+        def key = entry.getKey();
+        def value = entry.getValue();
+        if (value instanceof Map && target.get(key) instanceof Map) {
+            merge(target.get(key), value);
+        } else {
+            target.put(key, value);
+        }
+    }
+}
+merge(ctx._source, params.doc);
+if (params.labels.size() > 0 && ctx._source.timesketch_label == null) {
+    ctx._source.timesketch_label = new ArrayList();
+}
+for (item in params.labels) {
+    def label = item.timesketch_label;
+    if (!ctx._source.timesketch_label.contains(label)) {
+        ctx._source.timesketch_label.add(label);
+    } else if (item.toggle) {
+        ctx._source.timesketch_label.removeIf(existing -> existing == label);
+    }
+}
+"""
+
+# Time in microseconds since epoch at which an event was added to the index.
+# Incremental analyzers only look at events added after their last run.
+INGEST_TIME_FIELD = '__ts_ingest_time'
+
+# Explicit mappings for the fields every event has, used for new indices in
+# ingest mode or with an inferred schema.
+CORE_FIELD_MAPPINGS = {
+    'datetime': {
+        'type': 'date'
+    },
+    'timestamp': {
+        'type': 'long'
+    },
+    'timestamp_desc': TEXT_MAPPING,
+    'message': TEXT_MAPPING,
+    'data_type': TEXT_MAPPING,
+    'tag': TEXT_MAPPING,
+    INGEST_TIME_FIELD: {
+        'type': 'long'
+    }
+}
+
+# Item types used when handing events over from scroll slice readers.
+_STREAM_EVENT = 'event'
+_STREAM_DONE = 'done'
+_STREAM_ERROR = 'error'
+
+
+def _get_sort_orders(sort):
+    """Get the direction of every clause of a sort.
+
+    Args:
+        sort: Sort of an Elasticsearch DSL query.
+
+    Returns:
+        List of booleans, True for a descending clause, or None if the
+        direction of a clause can't be determined.
+    """
+    if isinstance(sort, dict):
+        clauses = [{field: order} for field, order in sort.items()]
+    elif isinstance(sort, list):
+        clauses = sort
+    else:
+        clauses = [sort]
+
+    orders = []
+    for clause in clauses:
+        # The score sorts descending by default, everything else ascending.
+        if isinstance(clause, six.string_types):
+            orders.append(clause == '_score')
+            continue
+        if not isinstance(clause, dict) or len(clause) != 1:
+            return None
+        field, order = list(clause.items())[0]
+        if isinstance(order, dict):
+            order = order.get('order', 'desc' if field == '_score' else 'asc')
+        if order not in ('asc', 'desc'):
+            return None
+        orders.append(order == 'desc')
+    return orders
+
+
+def _compare_sort_values(orders, left, right):
+    """Compare the sort values of two events.
+
+    Args:
+        orders: List of booleans, True for a descending clause.
+        left: List of sort values of the first event.
+        right: List of sort values of the second event.
+
+    Returns:
+        Negative if the first event sorts first, positive if the second
+        event sorts first and zero if they are equal.
+    """
+    for descending, left_value, right_value in zip(orders, left, right):
+        if left_value == right_value:
+            continue
+        # Missing values sort last in both directions.
+        if left_value is None:
+            return 1
+        if right_value is None:
+            return -1
+        result = -1 if left_value < right_value else 1
+        return -result if descending else result
+    return 0
+
 
 class ElasticsearchDataStore(object):
     """Implements the datastore."""
@@ -72,13 +201,59 @@ class ElasticsearchDataStore(object):
     DEFAULT_LIMIT = DEFAULT_SIZE  # Max events to return
     DEFAULT_FROM = 0
     DEFAULT_STREAM_LIMIT = 5000 # Max events to return when streaming results
+    DEFAULT_STREAM_SLICES = 1  # Number of scroll slices to read in parallel
+    DEFAULT_STREAM_QUEUE_SIZE = 10000  # Max events buffered per slice
+    DEFAULT_STREAM_SCROLL_TIMEOUT = '5m'
+
+    # Index settings restored after ingest.
+    DEFAULT_REFRESH_INTERVAL = '1s'
+    DEFAULT_REPLICAS = 1
+    FORCE_MERGE_TIMEOUT = 3600
+
+    # Unique per event field used to break ties when paginating with a
+    # cursor.
+    CURSOR_TIEBREAKER_FIELD = '_uid'
 
     def __init__(self, host='127.0.0.1', port=9200):
-        """Create a Elasticsearch client."""
+        """Create a Elasticsearch client.
+
+        The client is shared with all other datastore objects for the same
+        host and port in this process, see timesketch.lib.datastores.pool.
+        """
         super(ElasticsearchDataStore, self).__init__()
-        self.client = Elasticsearch([{'host': host, 'port': port}])
+        self.client = get_client(host, port)
         self.import_counter = Counter()
-        self.import_events = []
+        self._bulk_indexer = None
+        self._written_indices = set()
+        self._ingest_indices = set()
+        # Index name to the overflow router of its inferred schema.
+        self._overflow_routers = {}
+
+    @property
+    def bulk_indexer(self):
+        """Get the bulk indexer used for importing events.
+
+        The indexer is configured from the ELASTIC_BULK_* settings when running
+        inside an application context.
+
+        Returns:
+            Instance of timesketch.lib.datastores.bulk.BulkIndexer
+        """
+        if self._bulk_indexer:
+            return self._bulk_indexer
+
+        config = current_app.config if has_app_context() else {}
+        self._bulk_indexer = BulkIndexer(
+            self.client,
+            thread_count=config.get(
+                'ELASTIC_BULK_THREADS', BulkIndexer.DEFAULT_THREAD_COUNT),
+            max_bytes=config.get(
+                'ELASTIC_BULK_MAX_BYTES', BulkIndexer.DEFAULT_MAX_BYTES),
+            max_actions=config.get(
+                'ELASTIC_BULK_MAX_ACTIONS', self.DEFAULT_FLUSH_INTERVAL),
+            max_retries=config.get(
+                'ELASTIC_BULK_MAX_RETRIES', BulkIndexer.DEFAULT_MAX_RETRIES))
+        return self._bulk_indexer
 
     @staticmethod
     def _build_label_query(sketch_id, label_name):
@@ -247,7 +422,8 @@ class ElasticsearchDataStore(object):
                count=False,
                aggregations=None,
                return_fields=None,
-               enable_scroll=False):
+               enable_scroll=False,
+               search_after=None):
         """Search ElasticSearch. This will take a query string from the UI
         together with a filter definition. Based on this it will execute the
         search request on ElasticSearch and get result back.
@@ -262,6 +438,10 @@ class ElasticsearchDataStore(object):
             aggregations: Dict of Elasticsearch aggregations
             return_fields: List of fields to return
             enable_scroll: If Elasticsearch scroll API should be used
+            search_after: List of sort values from the last event of the
+                previous page, or an empty list for the first page, to use
+                cursor based pagination. This adds a tiebreaker to the sort
+                and cannot be combined with scroll.
 
         Returns:
             Set of event documents in JSON format
@@ -286,43 +466,106 @@ class ElasticsearchDataStore(object):
         query_dsl = self.build_query(sketch_id, query_string, query_filter,
                                      query_dsl, aggregations)
 
+        if search_after is not None and not count:
+            scroll_timeout = None
+            query_dsl = self._build_cursor_query(query_dsl, search_after)
+
         # Default search type for elasticsearch is query_then_fetch.
         search_type = 'query_then_fetch'
 
+        # Results of scroll searches depend on server side state and can't be
+        # cached.
+        cache = get_cache()
+        cache_key = None
+        if cache.enabled and not scroll_timeout:
+            cache_key = cache.build_key(
+                'count' if count else 'search',
+                {'query': query_dsl, 'fields': return_fields}, indices)
+            result = cache.get(cache_key)
+            if result is not None:
+                return result
+
         # Only return how many documents matches the query.
         if count:
             del query_dsl['sort']
             count_result = self.client.count(
                 body=query_dsl, index=list(indices))
-            return count_result.get('count', 0)
-
-        if not return_fields:
+            result = count_result.get('count', 0)
+        elif not return_fields:
             # Suppress the lint error because elasticsearch-py adds parameters
             # to the function with a decorator and this makes pylint sad.
             # pylint: disable=unexpected-keyword-arg
-            return self.client.search(
+            result = self.client.search(
                 body=query_dsl,
                 index=list(indices),
                 search_type=search_type,
                 scroll=scroll_timeout)
+        else:
+            # Suppress the lint error because elasticsearch-py adds parameters
+            # to the function with a decorator and this makes pylint sad.
+            # pylint: disable=unexpected-keyword-arg
+            result = self.client.search(
+                body=query_dsl,
+                index=list(indices),
+                search_type=search_type,
+                _source_include=return_fields,
+                scroll=scroll_timeout)
 
-        # Suppress the lint error because elasticsearch-py adds parameters
-        # to the function with a decorator and this makes pylint sad.
-        # pylint: disable=unexpected-keyword-arg
-        return self.client.search(
-            body=query_dsl,
-            index=list(indices),
-            search_type=search_type,
-            _source_include=return_fields,
-            scroll=scroll_timeout)
+        if cache_key:
+            cache.set(cache_key, result)
+        return result
+
+    def _build_cursor_query(self, query_dsl, search_after):
+        """Prepare a query for cursor based pagination.
+
+        Pagination with search_after needs a total order of the events, so
+        a tiebreaker is added to the sort. It keeps no state in the cluster
+        and replaces the from parameter.
+
+        Args:
+            query_dsl: Dictionary containing Elasticsearch DSL query
+            search_after: List of sort values to continue after.
+
+        Returns:
+            Elasticsearch DSL query as a dictionary
+        """
+        sort = query_dsl.get('sort', [])
+        if isinstance(sort, dict):
+            sort = [{field: order} for field, order in sorted(sort.items())]
+        elif not isinstance(sort, list):
+            sort = [sort]
+
+        sort_fields = set()
+        for sort_spec in sort:
+            if isinstance(sort_spec, dict):
+                sort_fields.update(sort_spec.keys())
+            else:
+                sort_fields.add(sort_spec)
+
+        if self.CURSOR_TIEBREAKER_FIELD not in sort_fields:
+            sort = sort + [{self.CURSOR_TIEBREAKER_FIELD: 'asc'}]
+
+        query_dsl['sort'] = sort
+        query_dsl.pop('from', None)
+        if search_after:
+            query_dsl['search_after'] = search_after
+        return query_dsl
 
     def search_stream(
             self, sketch_id=None, query_string=None, query_filter=None,
-            query_dsl=None, indices=None, return_fields=None):
+            query_dsl=None, indices=None, return_fields=None, slices=None,
+            keep_order=True):
         """Search ElasticSearch. This will take a query string from the UI
         together with a filter definition. Based on this it will execute the
         search request on ElasticSearch and get result back.
 
+        The query can be split into several scroll slices that are read in
+        parallel. Events from the slices are merged so that the stream is
+        still ordered on the sort key, unless keep_order is False in which
+        case events are yielded as soon as any slice returns them. The scroll
+        contexts are always released when the stream is exhausted, fails or
+        is closed by the caller.
+
         Args :
             sketch_id: Integer of sketch primary key
             query_string: Query string
@@ -330,10 +573,16 @@ class ElasticsearchDataStore(object):
             query_dsl: Dictionary containing Elasticsearch DSL query
             indices: List of indices to query
             return_fields: List of fields to return
+            slices: Number of scroll slices to read in parallel. Defaults to
+                the ELASTIC_STREAM_SLICES setting.
+            keep_order: Boolean indicating if events should be yielded in
+                sort order when reading more than one slice.
 
         Returns:
             Generator of event documents in JSON format
         """
+        if not query_filter:
+            query_filter = {}
 
         if not query_filter.get('size'):
             query_filter['size'] = self.DEFAULT_STREAM_LIMIT
@@ -341,28 +590,206 @@ class ElasticsearchDataStore(object):
         if not query_filter.get('terminate_after'):
             query_filter['terminate_after'] = self.DEFAULT_STREAM_LIMIT
 
-        result = self.search(
-            sketch_id=sketch_id,
-            query_string=query_string,
-            query_dsl=query_dsl,
-            query_filter=query_filter,
-            indices=indices,
-            return_fields=return_fields,
-            enable_scroll=True)
+        # Exit early if we have no indices to query
+        if not indices:
+            return
+
+        # Check if we have specific events to fetch and get indices.
+        if query_filter.get('events', None):
+            indices = {
+                event['index']
+                for event in query_filter['events']
+                if event['index'] in indices
+            }
+
+        query_dsl = self.build_query(
+            sketch_id, query_string, query_filter, query_dsl)
+
+        if slices is None:
+            config = current_app.config if has_app_context() else {}
+            slices = config.get(
+                'ELASTIC_STREAM_SLICES', self.DEFAULT_STREAM_SLICES)
+        slices = int(slices)
 
-        scroll_id = result['_scroll_id']
-        scroll_size = result['hits']['total']
+        # Slices can only be merged in order if the direction of every sort
+        # clause is known.
+        if keep_order and _get_sort_orders(query_dsl.get('sort')) is None:
+            slices = 1
 
-        for event in result['hits']['hits']:
+        if slices < 2:
+            for event in self._scroll(query_dsl, indices, return_fields):
+                yield event
+            return
+
+        for event in self._scroll_slices(
+                query_dsl, indices, return_fields, slices, keep_order):
             yield event
 
-        while scroll_size > 0:
-            # pylint: disable=unexpected-keyword-arg
-            result = self.client.scroll(scroll_id=scroll_id, scroll='5m')
-            scroll_id = result['_scroll_id']
-            scroll_size = len(result['hits']['hits'])
-            for event in result['hits']['hits']:
+    def _scroll(self, query_dsl, indices, return_fields, slice_id=None,
+                max_slices=None):
+        """Read all pages of a scroll search.
+
+        Args:
+            query_dsl: Dictionary containing Elasticsearch DSL query
+            indices: List of indices to query
+            return_fields: List of fields to return
+            slice_id: Optional integer with the ID of the scroll slice.
+            max_slices: Optional integer with the total number of slices.
+
+        Yields:
+            Event documents in JSON format
+        """
+        if max_slices:
+            query_dsl = dict(query_dsl)
+            query_dsl['slice'] = {'id': slice_id, 'max': max_slices}
+
+        search_kwargs = {
+            'body': query_dsl,
+            'index': list(indices),
+            'scroll': self.DEFAULT_STREAM_SCROLL_TIMEOUT
+        }
+        if return_fields:
+            search_kwargs['_source_include'] = return_fields
+
+        # pylint: disable=unexpected-keyword-arg
+        result = self.client.search(**search_kwargs)
+        scroll_id = result.get('_scroll_id')
+        try:
+            while result['hits']['hits']:
+                for event in result['hits']['hits']:
+                    yield event
+                # pylint: disable=unexpected-keyword-arg
+                result = self.client.scroll(
+                    scroll_id=scroll_id,
+                    scroll=self.DEFAULT_STREAM_SCROLL_TIMEOUT)
+                scroll_id = result.get('_scroll_id', scroll_id)
+        finally:
+            self._clear_scroll(scroll_id)
+
+    def _clear_scroll(self, scroll_id):
+        """Release a scroll context in Elasticsearch.
+
+        Args:
+            scroll_id: The scroll ID to release.
+        """
+        if not scroll_id:
+            return
+        try:
+            self.client.clear_scroll(scroll_id=scroll_id)
+        except (NotFoundError, TransportError) as e:
+            logging.warning('Unable to clear scroll: {0!s}'.format(e))
+
+    def _scroll_slices(self, query_dsl, indices, return_fields, slices,
+                       keep_order):
+        """Read a scroll search split into slices on a pool of threads.
+
+        Every slice is read by its own thread into a bounded queue. This
+        keeps the memory use bounded and makes the readers wait when the
+        consumer is slower than Elasticsearch.
+
+        Args:
+            query_dsl: Dictionary containing Elasticsearch DSL query
+            indices: List of indices to query
+            return_fields: List of fields to return
+            slices: Number of scroll slices.
+            keep_order: Boolean indicating if events should be merged in
+                sort order.
+
+        Yields:
+            Event documents in JSON format
+
+        Raises:
+            Any exception raised while reading one of the slices.
+        """
+        stop = threading.Event()
+        queue_size = self.DEFAULT_STREAM_QUEUE_SIZE
+        if keep_order:
+            queues = [queue.Queue(queue_size) for _ in range(slices)]
+        else:
+            queues = [queue.Queue(queue_size)] * slices
+
+        def _put(slice_queue, item):
+            """Put an item on a queue, giving up if the stream is stopped."""
+            while not stop.is_set():
+                try:
+                    slice_queue.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def _read_slice(slice_id):
+            """Read one slice and hand the events over to the consumer."""
+            slice_queue = queues[slice_id]
+            events = self._scroll(
+                query_dsl, indices, return_fields, slice_id=slice_id,
+                max_slices=slices)
+            try:
+                for event in events:
+                    if not _put(slice_queue, (_STREAM_EVENT, event)):
+                        break
+                _put(slice_queue, (_STREAM_DONE, None))
+            # Errors are handed over to the consumer and raised there.
+            except Exception as e:  # pylint: disable=broad-except
+                _put(slice_queue, (_STREAM_ERROR, e))
+            finally:
+                events.close()
+
+        threads = []
+        for slice_id in range(slices):
+            thread = threading.Thread(target=_read_slice, args=(slice_id,))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        def _get(slice_queue):
+            """Get the next event from a queue, None if the slice is done."""
+            item_type, item = slice_queue.get()
+            if item_type == _STREAM_ERROR:
+                raise item
+            if item_type == _STREAM_DONE:
+                return None
+            return item
+
+        try:
+            if not keep_order:
+                done = 0
+                while done < slices:
+                    event = _get(queues[0])
+                    if event is None:
+                        done += 1
+                        continue
+                    yield event
+                return
+
+            sort_key = functools.cmp_to_key(functools.partial(
+                _compare_sort_values, _get_sort_orders(query_dsl.get('sort'))))
+
+            def _sort_key(event):
+                """Sort key of an event for merging the slices."""
+                return sort_key(event.get('sort', []))
+
+            heap = []
+            sequence = 0
+            for slice_id, slice_queue in enumerate(queues):
+                event = _get(slice_queue)
+                if event is not None:
+                    heapq.heappush(
+                        heap, (_sort_key(event), sequence, slice_id, event))
+                    sequence += 1
+
+            while heap:
+                _, _, slice_id, event = heapq.heappop(heap)
                 yield event
+                event = _get(queues[slice_id])
+                if event is not None:
+                    heapq.heappush(
+                        heap, (_sort_key(event), sequence, slice_id, event))
+                    sequence += 1
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
 
     def get_event(self, searchindex_id, event_id):
         """Get one event from the datastore.
@@ -443,6 +870,7 @@ class ElasticsearchDataStore(object):
                 params=script['params']
             )
 
+        get_cache().invalidate([searchindex_id])
         doc = self.client.get(
             index=searchindex_id, id=event_id, doc_type='_all')
         try:
@@ -463,12 +891,102 @@ class ElasticsearchDataStore(object):
 
         return None
 
-    def create_index(self, index_name=uuid4().hex, doc_type='generic_event'):
+    def set_labels(self, events, sketch_id, user_id, label, toggle=False):
+        """Set a label on many events with bulk requests.
+
+        The label scripts create the timesketch_label list when it is
+        missing, so unlike set_label() no document needs to be fetched
+        first.
+
+        Args:
+            events: List of dictionaries with _index, _id and _type of the
+                events to label.
+            sketch_id: Integer of sketch primary key
+            user_id: Integer of user primary key
+            label: String with the name of the label
+            toggle: Optional boolean value if the label should be toggled
+
+        Returns:
+            List with a dictionary per event, in the same order as events,
+            with _index, _id, the HTTP status of the update and an error
+            message if it failed.
+        """
+        script = {
+            'lang': 'painless',
+            'source': TOGGLE_LABEL_SCRIPT if toggle else ADD_LABEL_SCRIPT,
+            'params': {
+                'timesketch_label': {
+                    'name': str(label),
+                    'user_id': user_id,
+                    'sketch_id': sketch_id
+                }
+            }
+        }
+
+        get_cache().invalidate({event['_index'] for event in events})
+
+        results = []
+        for i in range(0, len(events), self.DEFAULT_FLUSH_INTERVAL):
+            chunk = events[i:i + self.DEFAULT_FLUSH_INTERVAL]
+            body = []
+            for event in chunk:
+                body.append({
+                    'update': {
+                        '_index': event['_index'],
+                        '_type': event['_type'],
+                        '_id': event['_id'],
+                        'retry_on_conflict': 3
+                    }
+                })
+                body.append({'script': script})
+
+            # A failed request fails all events in the chunk, but the other
+            # chunks are still sent.
+            try:
+                items = self.client.bulk(body=body).get('items', [])
+            except TransportError as e:
+                status = e.status_code
+                if not isinstance(status, int):
+                    status = 500
+                items = [{'update': {'status': status, 'error': str(e)}}]
+                items = items * len(chunk)
+
+            for event, item in zip(chunk, items):
+                item = list(item.values())[0]
+                result = {
+                    '_index': event['_index'],
+                    '_id': event['_id'],
+                    'status': item.get('status', 500)
+                }
+                if item.get('error'):
+                    result['error'] = item['error']
+                results.append(result)
+
+        return results
+
+    def create_index(
+            self, index_name=uuid4().hex, doc_type='generic_event',
+            ingest=False, schema=None):
         """Create index with Timesketch settings.
 
+        In ingest mode a new index is created with refresh disabled, without
+        replicas and with explicit mappings for the core event fields. Call
+        finish_ingest() when all events are imported to restore the normal
+        settings.
+
+        With a schema the index gets explicit mappings for the sampled
+        fields. Events imported with import_event() have their other fields
+        mapped dynamically until the field limit of the schema is reached,
+        after that they are moved to the overflow field. When the index
+        already exists the schema it was created with is used instead.
+
         Args:
             index_name: Name of the index. Default is a generated UUID.
             doc_type: Name of the document type. Default id generic_event.
+            ingest: Boolean indicating if the index should be optimized for
+                bulk indexing.
+            schema: Optional instance of
+                timesketch.lib.datastores.schema.FieldSchema.
 
         Returns:
             Index name in string format.
@@ -483,13 +1001,36 @@ class ElasticsearchDataStore(object):
                 }
             }
         }
+        body = {'mappings': _document_mapping}
+        properties = _document_mapping[doc_type]['properties']
+
+        if schema:
+            properties.update(schema.properties())
+        if ingest or schema:
+            properties.update(CORE_FIELD_MAPPINGS)
+        if ingest:
+            body['settings'] = {
+                'index': {
+                    'refresh_interval': '-1',
+                    'number_of_replicas': 0
+                }
+            }
 
-        if not self.client.indices.exists(index_name):
-            try:
-                self.client.indices.create(
-                    index=index_name, body={'mappings': _document_mapping})
-            except ConnectionError:
-                raise RuntimeError('Unable to connect to Timesketch backend.')
+        try:
+            index_exists = self.client.indices.exists(index_name)
+            if not index_exists:
+                self.client.indices.create(index=index_name, body=body)
+        except ConnectionError:
+            raise RuntimeError('Unable to connect to Timesketch backend.')
+
+        if not index_exists:
+            if ingest:
+                self._ingest_indices.add(index_name)
+            if schema:
+                self._overflow_routers[index_name] = OverflowRouter(
+                    properties, schema.field_limit)
+        elif schema:
+            self.load_index_schema(index_name)
         # We want to return unicode here to keep SQLalchemy happy.
         if six.PY2:
             if not isinstance(index_name, six.text_type):
@@ -500,12 +1041,83 @@ class ElasticsearchDataStore(object):
 
         return index_name, doc_type
 
+    def load_index_schema(self, index_name):
+        """Use the inferred schema of an existing index for imports.
+
+        Args:
+            index_name: Name of the index.
+
+        Returns:
+            Boolean indicating if the index has an inferred schema.
+        """
+        self._overflow_routers.pop(index_name, None)
+        try:
+            response = self.client.indices.get_mapping(index=index_name)
+        except NotFoundError:
+            return False
+        except ConnectionError:
+            raise RuntimeError('Unable to connect to Timesketch backend.')
+
+        for index_mapping in response.values():
+            for type_mapping in index_mapping.get('mappings', {}).values():
+                properties = type_mapping.get('properties', {})
+                if OVERFLOW_FIELD in properties:
+                    config = current_app.config if has_app_context() else {}
+                    self._overflow_routers[index_name] = OverflowRouter(
+                        properties, config.get(
+                            'ELASTIC_MAPPING_FIELD_LIMIT',
+                            DEFAULT_FIELD_LIMIT))
+                    return True
+        return False
+
+    def finish_ingest(self, index_name, force_merge=None, force=False):
+        """Restore the normal settings of an index created in ingest mode.
+
+        Indices that were not created by create_index() in ingest mode on
+        this datastore object are left untouched, unless force is set.
+
+        Args:
+            index_name: Name of the index.
+            force_merge: Boolean indicating if the index should be force
+                merged. Defaults to the ELASTIC_INGEST_FORCE_MERGE setting.
+            force: Boolean indicating that the index was created in ingest
+                mode by another datastore object, e.g. in another task.
+        """
+        if index_name not in self._ingest_indices and not force:
+            return
+        self._ingest_indices.discard(index_name)
+
+        config = current_app.config if has_app_context() else {}
+        if force_merge is None:
+            force_merge = config.get('ELASTIC_INGEST_FORCE_MERGE', False)
+
+        try:
+            self.client.indices.put_settings(index=index_name, body={
+                'index': {
+                    'refresh_interval': config.get(
+                        'ELASTIC_INDEX_REFRESH_INTERVAL',
+                        self.DEFAULT_REFRESH_INTERVAL),
+                    'number_of_replicas': config.get(
+                        'ELASTIC_INDEX_REPLICAS', self.DEFAULT_REPLICAS)
+                }
+            })
+            self.client.indices.refresh(index=index_name)
+            if force_merge:
+                # pylint: disable=unexpected-keyword-arg
+                self.client.indices.forcemerge(
+                    index=index_name, max_num_segments=1,
+                    request_timeout=self.FORCE_MERGE_TIMEOUT)
+        except ConnectionError:
+            raise RuntimeError('Unable to connect to Timesketch backend.')
+        get_cache().invalidate([index_name])
+
     def delete_index(self, index_name):
         """Delete Elasticsearch index.
 
         Args:
             index_name: Name of the index to delete.
         """
+        get_cache().invalidate([index_name])
         if self.client.indices.exists(index_name):
             try:
                 self.client.indices.delete(index=index_name)
@@ -516,67 +1128,122 @@ class ElasticsearchDataStore(object):
 
     def import_event(
             self, index_name, event_type, event=None,
-            event_id=None, flush_interval=DEFAULT_FLUSH_INTERVAL):
+            event_id=None, flush_interval=None, document_id=None):
         """Add event to Elasticsearch.
 
+        Events are queued in the bulk indexer and sent in the background
+        when the queue reaches flush_interval events or the configured size
+        in bytes. Call flush_queued_events() to make sure that all events
+        have been indexed. New events get the time they were added in the
+        INGEST_TIME_FIELD field.
+
         Args:
-            flush_interval: Number of events to queue up before indexing
+            flush_interval: Number of events to queue up before indexing,
+                for this event only. Defaults to ELASTIC_BULK_MAX_ACTIONS.
             index_name: Name of the index in Elasticsearch
             event_type: Type of event (e.g. plaso_event)
             event: Event dictionary
             event_id: Event Elasticsearch ID
+            document_id: ID for a new document. Indexing the same event with
+                the same ID again overwrites it, which makes imports that
+                are resumed idempotent.
+
+        Returns:
+            Number of events queued so far.
         """
-        if event:
-            for k, v in event.items():
-                if not isinstance(k, six.text_type):
-                    k = codecs.decode(k, 'utf8')
+        if not event:
+            # Import the remaining events in the queue.
+            self.flush_queued_events()
+            return self.import_counter['events']
 
-                # Make sure we have decoded strings in the event dict.
-                if isinstance(v, six.binary_type):
-                    v = codecs.decode(v, 'utf8')
+        for k, v in event.items():
+            if not isinstance(k, six.text_type):
+                k = codecs.decode(k, 'utf8')
 
-                event[k] = v
+            # Make sure we have decoded strings in the event dict.
+            if isinstance(v, six.binary_type):
+                v = codecs.decode(v, 'utf8')
 
-            # Header needed by Elasticsearch when bulk inserting.
-            header = {
-                'index': {
-                    '_index': index_name,
-                    '_type': event_type
-                }
+            event[k] = v
+
+        if not event_id:
+            event.setdefault(INGEST_TIME_FIELD, int(time.time() * 1000000))
+
+        overflow_router = self._overflow_routers.get(index_name)
+        if overflow_router and not event_id:
+            overflow_router.route(event)
+
+        # Header needed by Elasticsearch when bulk inserting.
+        header = {
+            'index': {
+                '_index': index_name,
+                '_type': event_type
             }
-            update_header = {
-                'update': {
-                    '_index': index_name,
-                    '_type': event_type,
-                    '_id': event_id
-                }
+        }
+        if document_id:
+            header['index']['_id'] = document_id
+        update_header = {
+            'update': {
+                '_index': index_name,
+                '_type': event_type,
+                '_id': event_id
             }
+        }
 
-            if event_id:
-                # Event has "lang" defined if there is a script used for import.
-                if event.get('lang'):
-                    event = {'script': event}
-                else:
-                    event = {'doc': event}
-                header = update_header
-
-            self.import_events.append(header)
-            self.import_events.append(event)
-            self.import_counter['events'] += 1
-
-            if self.import_counter['events'] % int(flush_interval) == 0:
-                self.client.bulk(body=self.import_events)
-                self.import_events = []
-        else:
-            # Import the remaining events in the queue.
-            if self.import_events:
-                self.client.bulk(body=self.import_events)
+        if event_id:
+            # Event has "lang" defined if there is a script used for import.
+            if event.get('lang'):
+                event = {'script': event}
+            else:
+                event = {'doc': event}
+            header = update_header
+
+        max_actions = None
+        if flush_interval:
+            max_actions = max(1, int(flush_interval))
+        self.bulk_indexer.add(header, event, max_actions=max_actions)
+        self.import_counter['events'] += 1
+        if index_name not in self._written_indices:
+            get_cache().invalidate([index_name])
+            self._written_indices.add(index_name)
 
         return self.import_counter['events']
 
+    def import_summary(self):
+        """Get a summary of the events indexed so far, without waiting.
+
+        Returns:
+            Dictionary with index name as key and a dictionary with the number
+            of indexed, updated, failed and retried documents as value.
+        """
+        if not self._bulk_indexer:
+            return {}
+        return self._bulk_indexer.summary()
+
     def flush_queued_events(self):
-        if self.import_events:
-            self.client.bulk(body=self.import_events)
+        """Index all queued events and wait for the bulk requests to finish.
+
+        Returns:
+            Dictionary with index name as key and a dictionary with the number
+            of indexed, updated, failed and retried documents as value.
+        """
+        if not self._bulk_indexer:
+            return {}
+
+        summary = self._bulk_indexer.flush()
+
+        # Cached results for the indices might be stale now. This is done
+        # after the flush so that no result from before the flush is kept.
+        get_cache().invalidate(self._written_indices)
+        self._written_indices.clear()
+
+        for index_name, errors in self._bulk_indexer.errors.items():
+            for error in errors:
+                logging.warning(
+                    'Unable to index event in [{0:s}]: {1!s}'.format(
+                        index_name, error))
+        self._bulk_indexer.errors.clear()
+        return summary
 
     @property
     def version(self):
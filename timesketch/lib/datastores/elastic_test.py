@@ -0,0 +1,324 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the Elasticsearch datastore."""
+
+from __future__ import unicode_literals
+
+import json
+import threading
+
+import mock
+
+from timesketch.lib.datastores.cache import QueryCache
+from timesketch.lib.datastores.elastic import ElasticsearchDataStore
+from timesketch.lib.datastores.elastic import INGEST_TIME_FIELD
+from timesketch.lib.datastores.schema import FieldSchema
+from timesketch.lib.datastores.schema import OVERFLOW_FIELD
+from timesketch.lib.testlib import BaseTest
+
+
+class MockScrollClient(object):
+    """Mock Elasticsearch client that serves sliced scroll searches."""
+
+    def __init__(self, timestamps, page_size=2, sort_values=None):
+        """Initialize the client.
+
+        Args:
+            timestamps: List of timestamps, one event per timestamp.
+            page_size: Number of events per scroll page.
+            sort_values: Optional function that returns the sorted list of
+                sort values of the events of a slice, by timestamp.
+        """
+        self.timestamps = timestamps
+        self.page_size = page_size
+        self.sort_values = sort_values
+        self.cleared = []
+        self.scrolls = {}
+        self.searches = 0
+        self._lock = threading.Lock()
+
+    def _page(self, scroll_id):
+        """Get the next page for a scroll."""
+        events = self.scrolls[scroll_id]
+        page, self.scrolls[scroll_id] = (
+            events[:self.page_size], events[self.page_size:])
+        return {'_scroll_id': scroll_id, 'hits': {'hits': page}}
+
+    # pylint: disable=unused-argument
+    def search(self, body, index, scroll, **kwargs):
+        """Mock a scroll search, slicing on the timestamp."""
+        self.searches += 1
+        slice_spec = body.get('slice', {'id': 0, 'max': 1})
+        timestamps = [
+            ts for ts in sorted(self.timestamps)
+            if ts % slice_spec['max'] == slice_spec['id']]
+        if self.sort_values:
+            sort_values = self.sort_values(timestamps)
+        else:
+            sort_values = [[ts] for ts in timestamps]
+        events = [
+            {'_id': str(values[-1]), 'sort': values,
+             '_source': {'timestamp': values[-1]}}
+            for values in sort_values]
+        with self._lock:
+            scroll_id = 'scroll{0:d}'.format(slice_spec['id'])
+            self.scrolls[scroll_id] = events
+            return self._page(scroll_id)
+
+    def scroll(self, scroll_id, scroll):
+        """Mock getting the next scroll page."""
+        with self._lock:
+            return self._page(scroll_id)
+
+    def clear_scroll(self, scroll_id):
+        """Mock releasing a scroll context."""
+        with self._lock:
+            self.cleared.append(scroll_id)
+
+
+class ElasticsearchDataStoreTest(BaseTest):
+    """Tests for the Elasticsearch datastore."""
+
+    def _get_datastore(self, timestamps):
+        """Get a datastore with a mock client."""
+        datastore = ElasticsearchDataStore()
+        datastore.client = MockScrollClient(timestamps)
+        return datastore
+
+    def test_search_stream(self):
+        """Test reading events with a single scroll."""
+        datastore = self._get_datastore([3, 1, 2, 5, 4])
+        events = datastore.search_stream(
+            query_string='*', query_filter={}, indices=['test'], slices=1)
+        self.assertEqual(
+            [event['sort'][0] for event in events], [1, 2, 3, 4, 5])
+        self.assertEqual(datastore.client.cleared, ['scroll0'])
+
+    def test_search_stream_slices(self):
+        """Test reading events from several slices in sort order."""
+        timestamps = list(range(20, 0, -1))
+        datastore = self._get_datastore(timestamps)
+        events = datastore.search_stream(
+            query_string='*', query_filter={}, indices=['test'], slices=3)
+        self.assertEqual(
+            [event['sort'][0] for event in events], list(range(1, 21)))
+        self.assertEqual(
+            sorted(datastore.client.cleared),
+            ['scroll0', 'scroll1', 'scroll2'])
+
+    def test_search_stream_slices_mixed_order(self):
+        """Test merging slices sorted on a descending string key."""
+        def _sort_values(timestamps):
+            """Sort on the name descending, then on the timestamp."""
+            values = [['abc'[ts % 3], ts] for ts in timestamps]
+            return sorted(
+                sorted(values, key=lambda value: value[1]),
+                key=lambda value: value[0], reverse=True)
+
+        datastore = ElasticsearchDataStore()
+        datastore.client = MockScrollClient(
+            list(range(1, 13)), sort_values=_sort_values)
+        query_dsl = {
+            'query': {'match_all': {}},
+            'sort': [{'name': 'desc'}, {'timestamp': {'order': 'asc'}}]}
+        events = datastore.search_stream(
+            query_dsl=json.dumps(query_dsl), query_filter={},
+            indices=['test'], slices=2)
+        self.assertEqual(
+            [event['sort'] for event in events],
+            _sort_values(list(range(1, 13))))
+
+    def test_search_stream_unknown_sort(self):
+        """Test that sorts without a known order are read in one slice."""
+        datastore = self._get_datastore(list(range(1, 11)))
+        query_dsl = {
+            'query': {'match_all': {}},
+            'sort': [{'name': 'desc', 'timestamp': 'asc'}]}
+        events = list(datastore.search_stream(
+            query_dsl=json.dumps(query_dsl), query_filter={},
+            indices=['test'], slices=2))
+        self.assertEqual(len(events), 10)
+        self.assertEqual(datastore.client.searches, 1)
+
+    def test_search_stream_slices_unordered(self):
+        """Test reading events from several slices without ordering."""
+        datastore = self._get_datastore(list(range(1, 11)))
+        events = datastore.search_stream(
+            query_string='*', query_filter={}, indices=['test'], slices=2,
+            keep_order=False)
+        self.assertEqual(
+            sorted(event['sort'][0] for event in events), list(range(1, 11)))
+
+    def test_search_stream_closed(self):
+        """Test that scroll contexts are released when the stream is closed."""
+        datastore = self._get_datastore(list(range(1, 101)))
+        events = datastore.search_stream(
+            query_string='*', query_filter={}, indices=['test'], slices=2)
+        next(events)
+        events.close()
+        self.assertEqual(
+            sorted(datastore.client.cleared), ['scroll0', 'scroll1'])
+
+    # pylint: disable=protected-access
+    def test_build_cursor_query(self):
+        """Test that cursor queries get a tiebreaker and search_after."""
+        datastore = ElasticsearchDataStore()
+        query_dsl = {'from': 40, 'sort': {'datetime': 'desc'}}
+        query_dsl = datastore._build_cursor_query(
+            query_dsl, [1410593223000, 'plaso_event#test'])
+        self.assertEqual(query_dsl, {
+            'sort': [{'datetime': 'desc'}, {'_uid': 'asc'}],
+            'search_after': [1410593223000, 'plaso_event#test']})
+
+        query_dsl = datastore._build_cursor_query(
+            {'sort': ['_uid']}, [])
+        self.assertEqual(query_dsl, {'sort': ['_uid']})
+
+    def test_search_cache(self):
+        """Test that search results are cached until the index is written."""
+        datastore = self._get_datastore([1, 2, 3])
+        cache = QueryCache(max_bytes=1024 * 1024)
+        with mock.patch(
+                'timesketch.lib.datastores.elastic.get_cache',
+                return_value=cache):
+            for _ in range(2):
+                result = datastore.search(
+                    sketch_id=1, query_string='*', query_filter={},
+                    query_dsl=None, indices=['test'])
+                self.assertEqual(len(result['hits']['hits']), 2)
+            self.assertEqual(datastore.client.searches, 1)
+
+            datastore.import_event('test', 'generic_event', {'message': 'x'})
+            datastore.search(
+                sketch_id=1, query_string='*', query_filter={},
+                query_dsl=None, indices=['test'])
+            self.assertEqual(datastore.client.searches, 2)
+
+    def test_set_labels(self):
+        """Test that labels are set with one bulk request per chunk."""
+        datastore = ElasticsearchDataStore()
+        datastore.client = mock.Mock()
+        datastore.client.bulk.return_value = {'items': [
+            {'update': {'status': 200}},
+            {'update': {'status': 404, 'error': 'document_missing'}}]}
+        events = [
+            {'_index': 'test', '_id': '1', '_type': 'generic_event'},
+            {'_index': 'test', '_id': '2', '_type': 'generic_event'}]
+        results = datastore.set_labels(events, 1, 1, '__ts_star', toggle=True)
+
+        self.assertEqual(datastore.client.bulk.call_count, 1)
+        body = datastore.client.bulk.call_args[1]['body']
+        self.assertEqual(len(body), 4)
+        self.assertEqual(body[0]['update']['_id'], '1')
+        self.assertEqual(
+            body[1]['script']['params']['timesketch_label']['name'],
+            '__ts_star')
+        self.assertEqual(results, [
+            {'_index': 'test', '_id': '1', 'status': 200},
+            {'_index': 'test', '_id': '2', 'status': 404,
+             'error': 'document_missing'}])
+
+    def test_ingest_index_lifecycle(self):
+        """Test that ingest settings are set on create and restored."""
+        datastore = ElasticsearchDataStore()
+        datastore.client = mock.Mock()
+        datastore.client.indices.exists.return_value = False
+        datastore.create_index('test', 'generic_event', ingest=True)
+
+        body = datastore.client.indices.create.call_args[1]['body']
+        self.assertEqual(body['settings']['index']['refresh_interval'], '-1')
+        self.assertEqual(body['settings']['index']['number_of_replicas'], 0)
+        properties = body['mappings']['generic_event']['properties']
+        self.assertEqual(properties['datetime'], {'type': 'date'})
+        self.assertEqual(properties['timesketch_label'], {'type': 'nested'})
+
+        datastore.finish_ingest('test', force_merge=True)
+        datastore.client.indices.put_settings.assert_called_once_with(
+            index='test', body={'index': {
+                'refresh_interval': '1s', 'number_of_replicas': 1}})
+        datastore.client.indices.refresh.assert_called_once_with(index='test')
+        self.assertEqual(datastore.client.indices.forcemerge.call_count, 1)
+
+        # Indices are only restored once.
+        datastore.finish_ingest('test')
+        self.assertEqual(datastore.client.indices.put_settings.call_count, 1)
+
+    def test_ingest_existing_index(self):
+        """Test that existing indices are not changed in ingest mode."""
+        datastore = ElasticsearchDataStore()
+        datastore.client = mock.Mock()
+        datastore.client.indices.exists.return_value = True
+        datastore.create_index('test', 'generic_event', ingest=True)
+        datastore.finish_ingest('test')
+        self.assertFalse(datastore.client.indices.create.called)
+        self.assertFalse(datastore.client.indices.put_settings.called)
+
+    def test_create_index_schema(self):
+        """Test that imported events are routed with the index schema."""
+        schema = FieldSchema()
+        schema.add({'message': 'a b', 'user': 'root'})
+        datastore = ElasticsearchDataStore()
+        datastore.client = mock.Mock()
+        datastore.client.indices.exists.return_value = False
+        datastore.create_index('test', 'generic_event', schema=schema)
+
+        body = datastore.client.indices.create.call_args[1]['body']
+        self.assertNotIn('settings', body)
+        properties = body['mappings']['generic_event']['properties']
+        self.assertEqual(properties['user']['type'], 'keyword')
+        self.assertEqual(properties['datetime'], {'type': 'date'})
+
+        # Fields that are not in the sample are mapped dynamically below the
+        # field limit.
+        datastore._bulk_indexer = mock.Mock()
+        event = {'message': 'a b', 'user': 'root', 'new': 'x'}
+        datastore.import_event('test', 'generic_event', event)
+        self.assertIsInstance(event.pop(INGEST_TIME_FIELD), int)
+        self.assertEqual(event, {'message': 'a b', 'user': 'root', 'new': 'x'})
+
+        # The sampled fields reach this field limit, new fields are moved.
+        schema = FieldSchema(field_limit=4)
+        schema.add({'message': 'a b', 'user': 'root'})
+        datastore.create_index('test2', 'generic_event', schema=schema)
+        event = {'message': 'a b', 'user': 'root', 'new': 'x'}
+        datastore.import_event('test2', 'generic_event', event)
+        self.assertIsInstance(event.pop(INGEST_TIME_FIELD), int)
+        self.assertEqual(event, {
+            'message': 'a b', 'user': 'root', OVERFLOW_FIELD: ['new=x']})
+
+        # Updates of existing events are not changed.
+        event = {'new': 'x'}
+        datastore.import_event('test', 'generic_event', event, event_id='1')
+        self.assertEqual(event, {'new': 'x'})
+
+    def test_load_index_schema(self):
+        """Test that the schema of an existing index is used."""
+        datastore = ElasticsearchDataStore()
+        datastore.client = mock.Mock()
+        datastore.client.indices.exists.return_value = True
+        datastore.client.indices.get_mapping.return_value = {
+            'test': {'mappings': {'generic_event': {'properties': {
+                'message': {}, OVERFLOW_FIELD: {}}}}}}
+        datastore.create_index(
+            'test', 'generic_event', schema=FieldSchema())
+        self.assertFalse(datastore.client.indices.create.called)
+        self.assertEqual(
+            datastore._overflow_routers['test'].fields,
+            set(['message', OVERFLOW_FIELD]))
+
+        datastore.client.indices.get_mapping.return_value = {
+            'test': {'mappings': {'generic_event': {'properties': {
+                'message': {}}}}}}
+        self.assertFalse(datastore.load_index_schema('test'))
+        self.assertNotIn('test', datastore._overflow_routers)
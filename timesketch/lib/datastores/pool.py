@@ -0,0 +1,132 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Process wide registry of pooled Elasticsearch clients.
+
+Elasticsearch clients are thread safe and keep a pool of HTTP connections
+per node. Sharing one client per host and port in each process means that
+connections are reused between requests instead of being set up again for
+every datastore object.
+
+Connections must not be shared between processes, so the registry is reset
+whenever it is used from a new process, e.g. after a web or Celery worker is
+forked from a parent that already created clients.
+"""
+
+from __future__ import unicode_literals
+
+import os
+import threading
+
+from elasticsearch import Elasticsearch
+from flask import current_app
+from flask import has_app_context
+
+
+DEFAULT_MAXSIZE = 10
+DEFAULT_TIMEOUT = 10
+DEFAULT_KEEP_ALIVE = True
+DEFAULT_HTTP_COMPRESS = False
+DEFAULT_RETRY_ON_TIMEOUT = False
+DEFAULT_MAX_RETRIES = 3
+
+# These needs to be global to be shared by all datastore objects in the
+# process.
+# pylint: disable=invalid-name
+_clients = {}
+_client_options = None
+_pid = None
+_lock = threading.Lock()
+
+
+def _reset_if_forked():
+    """Drop clients and lock inherited from a parent process."""
+    # pylint: disable=global-statement
+    global _clients, _pid, _lock
+    pid = os.getpid()
+    if _pid != pid:
+        _clients = {}
+        _lock = threading.Lock()
+        _pid = pid
+
+
+def build_client_options(config):
+    """Build Elasticsearch client options from the configuration.
+
+    Args:
+        config: Dictionary like object with the Timesketch configuration.
+
+    Returns:
+        Dictionary with keyword arguments for elasticsearch.Elasticsearch.
+    """
+    headers = {}
+    if not config.get('ELASTIC_KEEP_ALIVE', DEFAULT_KEEP_ALIVE):
+        headers['connection'] = 'close'
+    # The client can't compress request bodies, but it will transparently
+    # decode compressed responses which are the large part of the traffic.
+    if config.get('ELASTIC_HTTP_COMPRESS', DEFAULT_HTTP_COMPRESS):
+        headers['accept-encoding'] = 'gzip,deflate'
+
+    options = {
+        'maxsize': int(config.get('ELASTIC_MAXSIZE', DEFAULT_MAXSIZE)),
+        'timeout': config.get('ELASTIC_TIMEOUT', DEFAULT_TIMEOUT),
+        'retry_on_timeout': config.get(
+            'ELASTIC_RETRY_ON_TIMEOUT', DEFAULT_RETRY_ON_TIMEOUT),
+        'max_retries': int(config.get(
+            'ELASTIC_MAX_RETRIES', DEFAULT_MAX_RETRIES)),
+    }
+    if headers:
+        options['headers'] = headers
+    return options
+
+
+def configure_pool(config):
+    """Configure the client registry for this process.
+
+    This is called when the web app is created and when a Celery worker
+    process starts. Any existing clients are dropped.
+
+    Args:
+        config: Dictionary like object with the Timesketch configuration.
+    """
+    # pylint: disable=global-statement
+    global _clients, _client_options
+    _reset_if_forked()
+    with _lock:
+        _clients = {}
+        _client_options = build_client_options(config)
+
+
+def get_client(host, port):
+    """Get the shared Elasticsearch client for a host and port.
+
+    Args:
+        host: Hostname or IP address of the Elasticsearch node.
+        port: Port of the Elasticsearch node.
+
+    Returns:
+        Instance of elasticsearch.Elasticsearch.
+    """
+    # pylint: disable=global-statement
+    global _client_options
+    _reset_if_forked()
+    with _lock:
+        client = _clients.get((host, port))
+        if client is None:
+            if _client_options is None:
+                config = current_app.config if has_app_context() else {}
+                _client_options = build_client_options(config)
+            client = Elasticsearch(
+                [{'host': host, 'port': port}], **_client_options)
+            _clients[(host, port)] = client
+    return client
@@ -0,0 +1,56 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the Elasticsearch client registry."""
+
+from __future__ import unicode_literals
+
+import mock
+
+from timesketch.lib.datastores import pool
+from timesketch.lib.testlib import BaseTest
+
+
+class TestClientPool(BaseTest):
+    """Tests for the Elasticsearch client registry."""
+
+    def setUp(self):
+        """Start every test with an empty registry."""
+        super(TestClientPool, self).setUp()
+        pool.configure_pool({})
+
+    def test_get_client(self):
+        """Test that clients are shared per host and port."""
+        client = pool.get_client('127.0.0.1', 9200)
+        self.assertIs(client, pool.get_client('127.0.0.1', 9200))
+        self.assertIsNot(client, pool.get_client('127.0.0.1', 9201))
+
+    def test_get_client_after_fork(self):
+        """Test that clients are not shared with a forked process."""
+        client = pool.get_client('127.0.0.1', 9200)
+        with mock.patch('os.getpid', return_value=-1):
+            self.assertIsNot(client, pool.get_client('127.0.0.1', 9200))
+
+    def test_build_client_options(self):
+        """Test that client options are built from the configuration."""
+        options = pool.build_client_options({
+            'ELASTIC_MAXSIZE': 25,
+            'ELASTIC_TIMEOUT': 30,
+            'ELASTIC_KEEP_ALIVE': False,
+            'ELASTIC_HTTP_COMPRESS': True,
+        })
+        self.assertEqual(options['maxsize'], 25)
+        self.assertEqual(options['timeout'], 30)
+        self.assertEqual(options['headers'], {
+            'connection': 'close', 'accept-encoding': 'gzip,deflate'})
+        self.assertNotIn('headers', pool.build_client_options({}))
@@ -0,0 +1,387 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Explicit index mappings inferred from a sample of events.
+
+Dynamic mapping indexes every string as text with a keyword sub field and
+updates the mapping in the cluster state for every new field, which is slow
+for wide timelines. A schema is inferred from the first events of a
+timeline instead and installed when the index is created. Fields that are
+not in the sample are mapped dynamically until the mapping has as many
+fields as the field limit, after that new fields are added to a catch-all
+keyword field as key=value strings.
+"""
+
+from __future__ import unicode_literals
+
+import json
+import re
+
+import six
+
+from elasticsearch.exceptions import NotFoundError
+from elasticsearch.exceptions import TransportError
+
+# Number of events to infer the schema from.
+DEFAULT_SAMPLE_SIZE = 10000
+
+# Maximum number of fields in an inferred mapping, sub fields included.
+DEFAULT_FIELD_LIMIT = 500
+
+# Catch-all field for the fields that are not in the mapping.
+OVERFLOW_FIELD = 'timesketch_overflow'
+
+# Strings up to this length and without whitespace are only indexed as
+# keyword, like hashes, paths and user names.
+KEYWORD_MAX_LENGTH = 256
+
+# Date strings that Elasticsearch parses with its default date format.
+DATE_RE = re.compile(
+    r'^\d{4}-\d{2}-\d{2}'
+    r'(?:T\d{2}:\d{2}(?::\d{2}(?:\.\d{1,9})?)?(?:Z|[+-]\d{2}:\d{2})?)?$')
+
+WHITESPACE_RE = re.compile(r'\s')
+
+# Mapping for text fields, same as the default dynamic mapping so that
+# queries and aggregations on <field>.keyword keep working.
+TEXT_MAPPING = {
+    'type': 'text',
+    'fields': {
+        'keyword': {
+            'type': 'keyword',
+            'ignore_above': 256
+        }
+    }
+}
+
+# Mappings for the inferred field types. Values in the rest of the
+# timeline that don't fit are kept in the source without being indexed.
+FIELD_MAPPINGS = {
+    'boolean': {
+        'type': 'boolean'
+    },
+    'date': {
+        'type': 'date',
+        'ignore_malformed': True
+    },
+    'double': {
+        'type': 'double',
+        'ignore_malformed': True
+    },
+    'keyword': {
+        'type': 'keyword',
+        # Longest value that fits in a Lucene term in UTF-8.
+        'ignore_above': 8191
+    },
+    'long': {
+        'type': 'long',
+        'ignore_malformed': True
+    },
+    'text': TEXT_MAPPING
+}
+
+OVERFLOW_MAPPING = FIELD_MAPPINGS['keyword']
+
+
+def _get_value_type(value):
+    """Get the field type of a value.
+
+    Args:
+        value: Value of an event field, not a list.
+
+    Returns:
+        Name of a field type, 'object' for dictionaries.
+    """
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, six.integer_types):
+        return 'long'
+    if isinstance(value, float):
+        return 'double'
+    if isinstance(value, dict):
+        return 'object'
+    value = six.text_type(value)
+    if DATE_RE.match(value):
+        return 'date'
+    if len(value) <= KEYWORD_MAX_LENGTH and not WHITESPACE_RE.search(value):
+        return 'keyword'
+    return 'text'
+
+
+def _resolve_type(types):
+    """Get the field type for all types seen for a field.
+
+    Args:
+        types: Set of field types.
+
+    Returns:
+        Name of a field type, or None if the values can't share a mapping.
+    """
+    if len(types) == 1:
+        return next(iter(types))
+    if 'object' in types:
+        return None
+    if types <= set(['long', 'double']):
+        return 'double'
+    if 'text' in types:
+        return 'text'
+    return 'keyword'
+
+
+class FieldSchema(object):
+    """Field types inferred from a sample of events.
+
+    Attributes:
+        field_limit: Maximum number of fields in the mapping.
+        sampled: Number of events added to the sample.
+    """
+
+    def __init__(self, field_limit=DEFAULT_FIELD_LIMIT):
+        """Initialize the schema.
+
+        Args:
+            field_limit: Maximum number of fields in the mapping, the fields
+                seen in the fewest events are left out.
+        """
+        super(FieldSchema, self).__init__()
+        self.field_limit = field_limit
+        self.sampled = 0
+        # Field path tuple to number of events and set of types.
+        self._fields = {}
+
+    def _add_value(self, path, value):
+        """Add the value of a field to the sample.
+
+        Args:
+            path: Tuple with the field path.
+            value: Value of the field.
+        """
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            if item is None:
+                continue
+            field_type = _get_value_type(item)
+            _, types = self._fields.setdefault(path, [0, set()])
+            types.add(field_type)
+            if field_type == 'object':
+                for key, child in item.items():
+                    self._add_value(path + (key,), child)
+        if path in self._fields:
+            self._fields[path][0] += 1
+
+    def add(self, event):
+        """Add an event to the sample.
+
+        Args:
+            event: Dictionary with the event.
+        """
+        self.sampled += 1
+        for key, value in event.items():
+            self._add_value((key,), value)
+
+    def _get_leaf_fields(self):
+        """Get the fields with a value type, most common first.
+
+        Returns:
+            List of tuples with the field path and the field type.
+        """
+        leaves = []
+        for path, (count, types) in self._fields.items():
+            field_type = _resolve_type(types)
+            if not field_type or field_type == 'object':
+                continue
+            # Fields of objects that also have other values are not mapped.
+            if any(_resolve_type(self._fields[path[:depth]][1]) != 'object'
+                   for depth in range(1, len(path))):
+                continue
+            leaves.append((-count, path, field_type))
+        return [(path, field_type) for _, path, field_type in sorted(leaves)]
+
+    def properties(self):
+        """Build the mapping properties for the sampled fields.
+
+        Object fields don't map new sub fields dynamically, top level fields
+        that are not in the mapping are added to the overflow field.
+
+        Returns:
+            Dictionary with the mapping properties.
+        """
+        properties = {OVERFLOW_FIELD: dict(OVERFLOW_MAPPING)}
+        remaining = self.field_limit
+        for path, field_type in self._get_leaf_fields():
+            mapping = FIELD_MAPPINGS[field_type]
+            parents = properties
+            new_objects = 0
+            for key in path[:-1]:
+                if key not in parents:
+                    new_objects += 1
+                parents = parents.get(key, {}).get('properties', {})
+            cost = new_objects + (2 if field_type == 'text' else 1)
+            if cost > remaining:
+                continue
+            remaining -= cost
+
+            parents = properties
+            for key in path[:-1]:
+                parents = parents.setdefault(key, {
+                    'type': 'object',
+                    'dynamic': False,
+                    'properties': {}})['properties']
+            parents[path[-1]] = mapping
+        return properties
+
+
+def count_fields(properties):
+    """Count the fields of mapping properties like the field limit does.
+
+    Args:
+        properties: Dictionary with mapping properties.
+
+    Returns:
+        Number of fields, objects and sub fields included.
+    """
+    count = 0
+    for mapping in properties.values():
+        count += 1 + len(mapping.get('fields', {}))
+        count += count_fields(mapping.get('properties', {}))
+    return count
+
+
+def _get_dynamic_cost(value):
+    """Get the number of fields that dynamic mapping adds for a value.
+
+    Args:
+        value: Value of an event field.
+
+    Returns:
+        Number of fields, 0 for values that are not mapped.
+    """
+    if isinstance(value, list):
+        return max([_get_dynamic_cost(item) for item in value] or [0])
+    if value is None:
+        return 0
+    if isinstance(value, dict):
+        return 1 + sum(_get_dynamic_cost(child) for child in value.values())
+    if isinstance(value, (bool, float) + six.integer_types):
+        return 1
+    # Text with a keyword sub field.
+    return 2
+
+
+class OverflowRouter(object):
+    """Routes the fields of an index with an inferred schema.
+
+    Fields that are not in the mapping are left to dynamic mapping while
+    the mapping has fewer fields than the field limit. Once the limit is
+    reached, new fields are moved to the overflow field.
+
+    The fields are counted per router, imports that run in parallel into
+    the same index can each add fields up to the limit.
+
+    Attributes:
+        fields: Set of the top level field names in the mapping.
+        remaining: Number of fields that can still be added to the mapping.
+    """
+
+    def __init__(self, properties, field_limit=DEFAULT_FIELD_LIMIT):
+        """Initialize the router.
+
+        Args:
+            properties: Dictionary with the mapping properties of the index.
+            field_limit: Maximum number of fields in the mapping.
+        """
+        super(OverflowRouter, self).__init__()
+        self.fields = set(properties)
+        self.remaining = field_limit - count_fields(properties)
+
+    def route(self, event):
+        """Map new fields of an event or move them to the overflow field.
+
+        Args:
+            event: Dictionary with the event, changed in place.
+
+        Returns:
+            The event.
+        """
+        for key in sorted(event):
+            if key in self.fields:
+                continue
+            cost = _get_dynamic_cost(event[key])
+            if cost and cost <= self.remaining:
+                self.fields.add(key)
+                self.remaining -= cost
+        return route_overflow(event, self.fields)
+
+
+def route_overflow(event, fields):
+    """Move the fields that are not in a mapping to the overflow field.
+
+    Args:
+        event: Dictionary with the event, changed in place.
+        fields: Set of the top level field names in the mapping.
+
+    Returns:
+        The event.
+    """
+    overflow = []
+    for key in sorted(event):
+        if key in fields:
+            continue
+        value = event.pop(key)
+        values = value if isinstance(value, list) else [value]
+        for item in values:
+            if item is None:
+                continue
+            if isinstance(item, (dict, list)):
+                item = json.dumps(item, sort_keys=True)
+            overflow.append('{0:s}={1!s}'.format(key, item))
+    if overflow:
+        existing = event.get(OVERFLOW_FIELD) or []
+        if not isinstance(existing, list):
+            existing = [existing]
+        event[OVERFLOW_FIELD] = existing + overflow
+    return event
+
+
+def get_terms_field(client, indices, field):
+    """Get the field to run a terms aggregation on.
+
+    String fields are text with a keyword sub field, unless the index was
+    created with an inferred schema that mapped the field as keyword only.
+
+    Args:
+        client: Instance of elasticsearch.Elasticsearch.
+        indices: List of index names.
+        field: Name of the field.
+
+    Returns:
+        Name of the field with keyword values.
+    """
+    try:
+        response = client.indices.get_field_mapping(
+            index=indices, fields=field)
+    except (NotFoundError, TransportError):
+        return '{0:s}.keyword'.format(field)
+
+    leaf_name = field.split('.')[-1]
+    field_types = set()
+    for index_mapping in response.values():
+        for type_mapping in index_mapping.get('mappings', {}).values():
+            field_mapping = type_mapping.get(field, {}).get('mapping', {})
+            field_type = field_mapping.get(leaf_name, {}).get('type')
+            if field_type:
+                field_types.add(field_type)
+
+    if field_types == set(['keyword']):
+        return field
+    return '{0:s}.keyword'.format(field)
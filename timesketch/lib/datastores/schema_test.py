@@ -0,0 +1,146 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the inferred index mappings."""
+
+from __future__ import unicode_literals
+
+import mock
+
+from timesketch.lib.datastores.schema import FieldSchema
+from timesketch.lib.datastores.schema import OVERFLOW_FIELD
+from timesketch.lib.datastores.schema import OverflowRouter
+from timesketch.lib.datastores.schema import count_fields
+from timesketch.lib.datastores.schema import get_terms_field
+from timesketch.lib.datastores.schema import route_overflow
+from timesketch.lib.testlib import BaseTest
+
+
+class FieldSchemaTest(BaseTest):
+    """Tests for the FieldSchema class."""
+
+    def test_properties(self):
+        """Test that field types are inferred from the sampled values."""
+        schema = FieldSchema()
+        schema.add({
+            'count': 1, 'ratio': 1, 'flag': True, 'sha256': 'abc',
+            'created': '2019-01-01T00:00:00Z', 'path': '/tmp/a b',
+            'empty': None, 'mixed': 1, 'tags': ['a', 'b'],
+            'user': {'name': 'root', 'uid': 0}})
+        schema.add({
+            'count': 2, 'ratio': 0.5, 'flag': False, 'sha256': 'def',
+            'created': '2019-01-02', 'path': '/tmp/c', 'mixed': {'a': 1},
+            'user': {'name': 'bob', 'uid': 1000}})
+        properties = schema.properties()
+
+        self.assertEqual(schema.sampled, 2)
+        self.assertEqual(properties['count']['type'], 'long')
+        self.assertEqual(properties['ratio']['type'], 'double')
+        self.assertEqual(properties['flag']['type'], 'boolean')
+        self.assertEqual(properties['sha256']['type'], 'keyword')
+        self.assertEqual(properties['tags']['type'], 'keyword')
+        self.assertEqual(properties['created']['type'], 'date')
+        self.assertEqual(properties['path']['type'], 'text')
+        self.assertIn('keyword', properties['path']['fields'])
+        self.assertEqual(properties['user']['type'], 'object')
+        self.assertFalse(properties['user']['dynamic'])
+        self.assertEqual(
+            properties['user']['properties']['uid']['type'], 'long')
+        self.assertNotIn('empty', properties)
+        self.assertNotIn('mixed', properties)
+        self.assertEqual(properties[OVERFLOW_FIELD]['type'], 'keyword')
+
+    def test_field_limit(self):
+        """Test that the most common fields are mapped up to the limit."""
+        schema = FieldSchema(field_limit=4)
+        for index in range(10):
+            event = {'common': 'a', 'text': 'a b'}
+            if index % 2:
+                event['half'] = 1
+            event['rare_{0:d}'.format(index)] = 'x'
+            schema.add(event)
+        self.assertEqual(
+            sorted(schema.properties()),
+            ['common', 'half', 'text', OVERFLOW_FIELD])
+
+
+class OverflowTest(BaseTest):
+    """Tests for routing fields to the overflow field."""
+
+    def test_route_overflow(self):
+        """Test that unmapped fields are moved to the overflow field."""
+        event = route_overflow({
+            'message': 'test', 'extra': 1, 'list': ['a', None, 'b'],
+            'nested': {'a': 1}, OVERFLOW_FIELD: 'old=1'},
+                               set(['message', OVERFLOW_FIELD]))
+        self.assertEqual(event, {
+            'message': 'test',
+            OVERFLOW_FIELD: [
+                'old=1', 'extra=1', 'list=a', 'list=b', 'nested={"a": 1}']})
+
+        event = {'message': 'test'}
+        self.assertEqual(route_overflow(event, set(['message'])), event)
+
+
+    def test_overflow_router(self):
+        """Test that new fields are only moved once the limit is reached."""
+        properties = FieldSchema().properties()
+        properties['message'] = {
+            'type': 'text', 'fields': {'keyword': {'type': 'keyword'}}}
+        self.assertEqual(count_fields(properties), 3)
+
+        router = OverflowRouter(properties, field_limit=6)
+        event = router.route({'message': 'a', 'text': 'b', 'empty': None})
+        self.assertEqual(event, {'message': 'a', 'text': 'b'})
+        self.assertEqual(router.remaining, 1)
+
+        # The nested field needs two fields, only the number fits.
+        event = router.route({'nested': {'a': 1}, 'number': 1})
+        self.assertEqual(event, {
+            'number': 1, OVERFLOW_FIELD: ['nested={"a": 1}']})
+        self.assertEqual(router.remaining, 0)
+        event = router.route({'number': 2, 'text': 'c', 'late': True})
+        self.assertEqual(event, {
+            'number': 2, 'text': 'c', OVERFLOW_FIELD: ['late=True']})
+
+
+class TermsFieldTest(BaseTest):
+    """Tests for choosing the field of terms aggregations."""
+
+    def _get_client(self, field_types):
+        """Get a mock client with a field mapping per index.
+
+        Args:
+            field_types: List of field types, one index per type.
+
+        Returns:
+            Instance of mock.Mock.
+        """
+        client = mock.Mock()
+        client.indices.get_field_mapping.return_value = dict(
+            ('index{0:d}'.format(index), {'mappings': {'generic_event': {
+                'user.name': {'mapping': {'name': {'type': field_type}}}}}})
+            for index, field_type in enumerate(field_types))
+        return client
+
+    def test_get_terms_field(self):
+        """Test that keyword only fields are aggregated directly."""
+        self.assertEqual(get_terms_field(
+            self._get_client(['keyword']), ['index0'], 'user.name'),
+                         'user.name')
+        self.assertEqual(get_terms_field(
+            self._get_client(['keyword', 'text']), ['index0', 'index1'],
+            'user.name'), 'user.name.keyword')
+        self.assertEqual(get_terms_field(
+            self._get_client([]), ['index0'], 'user.name'),
+                         'user.name.keyword')
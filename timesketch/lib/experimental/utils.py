@@ -75,28 +75,17 @@ def event_stream(sketch_id, query):
         sys.exit('No such sketch')
     indices = {t.searchindex.index_name for t in sketch.timelines}
 
-    result = es.search(
+    events = es.search_stream(
         sketch_id=sketch_id,
         query_string=query,
         query_filter={'size': 10000, 'terminate_after': 1000},
         query_dsl={},
         indices=['_all'],
-        return_fields=['xml_string', 'timestamp'],
-        enable_scroll=True)
+        return_fields=['xml_string', 'timestamp'])
 
-    scroll_id = result['_scroll_id']
-    scroll_size = result['hits']['total']
-
-    for event in result['hits']['hits']:
+    for event in events:
         yield event
 
-    while scroll_size > 0:
-        result = es.client.scroll(scroll_id=scroll_id, scroll='1m')
-        scroll_id = result['_scroll_id']
-        scroll_size = len(result['hits']['hits'])
-        for event in result['hits']['hits']:
-            yield event
-
 
 def parse_xml_event(event_xml):
     xml_root = ElementTree.fromstring(event_xml)
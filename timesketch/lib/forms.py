@@ -30,8 +30,25 @@ from wtforms.fields import SelectMultipleField
 from wtforms.fields import StringField
 from wtforms.validators import DataRequired
 from wtforms.validators import Length
+from wtforms.validators import NumberRange
 from wtforms.validators import Optional
 from wtforms.validators import Regexp
+from wtforms.validators import ValidationError
+
+from timesketch.lib.utils import COMPRESSIBLE_EXTENSIONS
+from timesketch.lib.utils import COMPRESSION_MAGIC
+from timesketch.lib.utils import TIMELINE_EXTENSIONS
+from timesketch.lib.utils import split_file_extension
+
+# File name extensions of timeline files that can be uploaded.
+UPLOAD_EXTENSIONS = TIMELINE_EXTENSIONS + [
+    '{0:s}.{1:s}'.format(extension, compression)
+    for extension in COMPRESSIBLE_EXTENSIONS
+    for compression in COMPRESSION_MAGIC]
+
+UPLOAD_EXTENSIONS_MESSAGE = (
+    'Allowed file extensions: .plaso, .csv, .jsonl, .parquet or .arrow, '
+    '.csv and .jsonl optionally compressed with .gz, .bz2, .xz or .zst')
 
 
 class MultiDict(dict):
@@ -173,6 +190,9 @@ class ExploreForm(BaseForm):
     enable_scroll = BooleanField(
         'Enable scroll', false_values={False, 'false', ''}, default=False)
     scroll_id = StringField('Scroll ID', default='')
+    enable_cursor = BooleanField(
+        'Enable cursor', false_values={False, 'false', ''}, default=False)
+    cursor = StringField('Cursor', default='')
 
 
 class GraphExploreForm(BaseForm):
@@ -243,13 +263,36 @@ class UploadFileForm(BaseForm):
         'file',
         validators=[
             FileRequired(),
-            FileAllowed(['plaso', 'csv', 'jsonl'],
-                        'Allowed file extensions: .plaso, .csv, or .jsonl')
+            FileAllowed(UPLOAD_EXTENSIONS, UPLOAD_EXTENSIONS_MESSAGE)
         ])
     name = StringField('Timeline name', validators=[Optional()])
     sketch_id = IntegerField('Sketch ID', validators=[Optional()])
 
 
+class ChunkedUploadForm(BaseForm):
+    """Form to start a chunked file upload."""
+    filename = StringField('File name', validators=[DataRequired()])
+    file_size = IntegerField(
+        'File size', validators=[DataRequired(), NumberRange(min=1)])
+    name = StringField('Timeline name', validators=[Optional()])
+    sketch_id = IntegerField('Sketch ID', validators=[Optional()])
+
+    def validate_filename(self, field):
+        """Check that the file type can be uploaded.
+
+        Args:
+            field: The file name field.
+
+        Raises:
+            ValidationError if the file type can't be uploaded.
+        """
+        _, extension, compression = split_file_extension(field.data)
+        if compression:
+            extension = '{0:s}.{1:s}'.format(extension, compression)
+        if extension not in UPLOAD_EXTENSIONS:
+            raise ValidationError(UPLOAD_EXTENSIONS_MESSAGE)
+
+
 class StoryForm(BaseForm):
     """Form to handle stories."""
     title = StringField('Title', validators=[])
@@ -0,0 +1,156 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Progress reporting for imports into search indices."""
+
+from __future__ import unicode_literals
+
+import datetime
+import time
+
+from timesketch.models import db_session
+from timesketch.models.sketch import ImportProgress
+from timesketch.models.sketch import SearchIndex
+
+# Seconds between progress updates in the database.
+DEFAULT_PROGRESS_INTERVAL = 10
+
+
+def start_import_progress(index_name, bytes_total=0):
+    """Reset the import progress of a search index.
+
+    Args:
+        index_name: Name of the datastore index.
+        bytes_total: Number of bytes that will be imported.
+
+    Returns:
+        Instance of ImportProgress or None if there is no such search index.
+    """
+    searchindex = SearchIndex.query.filter_by(index_name=index_name).first()
+    if not searchindex:
+        return None
+
+    progress = searchindex.import_progress
+    if progress:
+        progress.reset(bytes_total)
+    else:
+        progress = ImportProgress(
+            searchindex=searchindex, bytes_total=bytes_total)
+    db_session.add(progress)
+    db_session.commit()
+    return progress
+
+
+def finish_import_progress(index_name):
+    """Mark the import into a search index as done.
+
+    Args:
+        index_name: Name of the datastore index.
+    """
+    searchindex = SearchIndex.query.filter_by(index_name=index_name).first()
+    progress = searchindex.import_progress if searchindex else None
+    if not progress:
+        return
+
+    now = datetime.datetime.utcnow()
+    progress.reported_at = now
+    progress.finished_at = now
+    db_session.add(progress)
+    db_session.commit()
+
+
+class ImportProgressReporter(object):
+    """Publishes the progress of an import task.
+
+    Counters are collected in memory and added to the ImportProgress record
+    at most every interval seconds. The record is updated with increments
+    in the database, so that several tasks can report progress for the
+    same index at the same time.
+    """
+
+    def __init__(self, index_name, datastore=None,
+                 interval=DEFAULT_PROGRESS_INTERVAL):
+        """Initialize the reporter.
+
+        Args:
+            index_name: Name of the datastore index.
+            datastore: Optional datastore that the events are imported with,
+                used to report the number of indexed, failed and duplicate
+                events.
+            interval: Seconds between updates in the database.
+        """
+        super(ImportProgressReporter, self).__init__()
+        self.index_name = index_name
+        self.interval = interval
+        self._datastore = datastore
+        self._bytes_read = 0
+        self._events_parsed = 0
+        self._events_indexed = 0
+        self._events_failed = 0
+        self._events_duplicate = 0
+        self._last_report = time.time()
+
+        searchindex = SearchIndex.query.filter_by(
+            index_name=index_name).first()
+        progress = searchindex.import_progress if searchindex else None
+        self._progress_id = progress.id if progress else None
+
+    def add(self, bytes_read=0, events_parsed=0):
+        """Count read bytes and parsed events.
+
+        Args:
+            bytes_read: Number of bytes read since the last call.
+            events_parsed: Number of events parsed since the last call.
+        """
+        self._bytes_read += bytes_read
+        self._events_parsed += events_parsed
+        if time.time() - self._last_report >= self.interval:
+            self.report()
+
+    def report(self):
+        """Add the counters since the last report to the database."""
+        self._last_report = time.time()
+        if not self._progress_id:
+            return
+
+        indexed = self._events_indexed
+        failed = self._events_failed
+        duplicate = self._events_duplicate
+        if self._datastore:
+            summary = self._datastore.import_summary().get(
+                self.index_name, {})
+            indexed = summary.get('indexed', 0)
+            failed = summary.get('failed', 0)
+            duplicate = summary.get('updated', 0)
+
+        ImportProgress.query.filter_by(id=self._progress_id).update({
+            ImportProgress.bytes_read:
+                ImportProgress.bytes_read + self._bytes_read,
+            ImportProgress.events_parsed:
+                ImportProgress.events_parsed + self._events_parsed,
+            ImportProgress.events_indexed:
+                ImportProgress.events_indexed + indexed - self._events_indexed,
+            ImportProgress.events_failed:
+                ImportProgress.events_failed + failed - self._events_failed,
+            ImportProgress.events_duplicate:
+                ImportProgress.events_duplicate + duplicate -
+                self._events_duplicate,
+            ImportProgress.reported_at: datetime.datetime.utcnow(),
+        }, synchronize_session=False)
+        db_session.commit()
+
+        self._bytes_read = 0
+        self._events_parsed = 0
+        self._events_indexed = indexed
+        self._events_failed = failed
+        self._events_duplicate = duplicate
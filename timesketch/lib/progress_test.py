@@ -0,0 +1,76 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for import progress reporting."""
+
+from __future__ import unicode_literals
+
+import datetime
+
+import mock
+
+from timesketch.lib.progress import ImportProgressReporter
+from timesketch.lib.progress import finish_import_progress
+from timesketch.lib.progress import start_import_progress
+from timesketch.lib.testlib import BaseTest
+from timesketch.lib.testlib import MockDataStore
+
+
+class TestImportProgress(BaseTest):
+    """Tests for import progress reporting."""
+
+    def test_report(self):
+        """Test that progress is added up and reported on a schedule."""
+        start_import_progress('test', bytes_total=100)
+        datastore = MockDataStore('127.0.0.1', 4711)
+        datastore.event_store = []
+
+        with mock.patch('time.time') as mock_time:
+            mock_time.return_value = 0
+            progress = ImportProgressReporter(
+                'test', datastore=datastore, interval=10)
+            other_progress = ImportProgressReporter('test', interval=10)
+            for _ in range(3):
+                datastore.import_event('test', 'generic_event', {'a': 1})
+                progress.add(events_parsed=1)
+            self.assertEqual(self.searchindex.import_progress.events_parsed, 0)
+
+            mock_time.return_value = 10
+            progress.add(bytes_read=40)
+            other_progress.add(bytes_read=10, events_parsed=2)
+
+        import_progress = self.searchindex.import_progress
+        self.assertEqual(import_progress.bytes_read, 50)
+        self.assertEqual(import_progress.events_parsed, 5)
+        self.assertEqual(import_progress.events_indexed, 3)
+
+        # Only new events are added on the next report.
+        datastore.import_event('test', 'generic_event', {'a': 1})
+        progress.report()
+        self.assertEqual(self.searchindex.import_progress.events_indexed, 4)
+
+    def test_rate_and_eta(self):
+        """Test the events per second and the estimated time left."""
+        import_progress = start_import_progress('test', bytes_total=100)
+        self.assertIsNone(import_progress.eta_seconds)
+
+        import_progress.reported_at = (
+            import_progress.started_at + datetime.timedelta(seconds=10))
+        import_progress.bytes_read = 25
+        import_progress.events_indexed = 500
+        self.assertEqual(import_progress.events_per_second, 50.0)
+        self.assertEqual(import_progress.eta_seconds, 30.0)
+
+        finish_import_progress('test')
+        self.assertEqual(self.searchindex.import_progress.eta_seconds, 0.0)
+        self.assertIsNone(start_import_progress('no_such_index'))
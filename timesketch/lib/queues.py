@@ -0,0 +1,148 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Routing of Celery tasks to queues by type of task.
+
+Imports are I/O bound and can run for hours, analyzers are CPU and memory
+bound and e-mail notifications take a second. Every type of task goes to its
+own queue, so that workers can be sized per type and short tasks are not
+stuck behind long ones.
+"""
+
+from __future__ import unicode_literals
+
+from kombu import Queue
+
+# Name of the queue for tasks that have no type.
+DEFAULT_QUEUE = 'celery'
+
+# Environment variable with the name of the queue a worker consumes.
+WORKER_QUEUE_ENVIRONMENT_VARIABLE = 'TIMESKETCH_WORKER_QUEUE'
+
+# Highest task priority, tasks with a higher priority run first.
+MAX_PRIORITY = 9
+
+# Task name to type of task.
+TASK_TYPES = {
+    'timesketch.lib.tasks.run_plaso': 'ingest',
+    'timesketch.lib.tasks.run_csv_jsonl': 'ingest',
+    'timesketch.lib.tasks.run_index_prepare': 'ingest',
+    'timesketch.lib.tasks.run_csv_jsonl_chunk': 'ingest',
+    'timesketch.lib.tasks.run_index_chunks_done': 'ingest',
+    'timesketch.lib.tasks.run_sketch_init': 'analysis',
+    'timesketch.lib.tasks.run_index_analyzer': 'analysis',
+    'timesketch.lib.tasks.run_sketch_analyzer': 'analysis',
+    'timesketch.lib.tasks.run_sketch_analyzers_shared_scan': 'analysis',
+    'timesketch.lib.tasks.run_email_result_task': 'notification',
+}
+
+# Queue and priority per type of task, see TASK_ROUTES in timesketch.conf.
+DEFAULT_TASK_ROUTES = {
+    'ingest': {'queue': 'ingest', 'priority': 3},
+    'analysis': {'queue': 'analysis', 'priority': 6},
+    'notification': {'queue': 'notification', 'priority': 9},
+}
+
+# Worker settings per queue, see TASK_QUEUES in timesketch.conf.
+DEFAULT_TASK_QUEUES = {
+    'ingest': {'concurrency': 2, 'prefetch_multiplier': 1},
+    'analysis': {'concurrency': 4, 'prefetch_multiplier': 1},
+    'notification': {'concurrency': 1, 'prefetch_multiplier': 4},
+}
+
+
+def _get_broker_priority(priority, broker_url):
+    """Get the priority of a task as the broker orders messages.
+
+    Args:
+        priority: Priority from 0 to MAX_PRIORITY, highest first.
+        broker_url: URL of the Celery broker.
+
+    Returns:
+        Message priority for the broker.
+    """
+    priority = max(0, min(int(priority), MAX_PRIORITY))
+    # Redis delivers messages with a lower priority number first.
+    if broker_url and broker_url.startswith('redis'):
+        return MAX_PRIORITY - priority
+    return priority
+
+
+def get_celery_settings(config, worker_queue=None):
+    """Get the Celery settings that route tasks to queues.
+
+    Workers consume all queues, unless they are started with -Q or for a
+    single queue with the TIMESKETCH_WORKER_QUEUE environment variable. The
+    latter also sets the concurrency and prefetch multiplier of the queue.
+
+    Args:
+        config: Timesketch configuration.
+        worker_queue: Optional name of the queue the worker consumes.
+
+    Returns:
+        Dictionary with Celery settings.
+
+    Raises:
+        ValueError if the worker queue is unknown.
+    """
+    task_routes = config.get('TASK_ROUTES', DEFAULT_TASK_ROUTES)
+    if not task_routes:
+        return {}
+    broker_url = config.get('CELERY_BROKER_URL')
+
+    # The default queue is kept for tasks that were queued before routing
+    # was enabled, it is declared without priority as it may exist already.
+    queues = {DEFAULT_QUEUE: Queue(DEFAULT_QUEUE, routing_key=DEFAULT_QUEUE)}
+    routes = {}
+    for task_name, task_type in sorted(TASK_TYPES.items()):
+        route = task_routes.get(task_type)
+        if not route:
+            continue
+        queue_name = route.get('queue', task_type)
+        if queue_name not in queues:
+            queues[queue_name] = Queue(
+                queue_name, routing_key=queue_name,
+                queue_arguments={'x-max-priority': MAX_PRIORITY})
+        routes[task_name] = {
+            'queue': queue_name,
+            'priority': _get_broker_priority(
+                route.get('priority', 0), broker_url)}
+
+    settings = {
+        'CELERY_QUEUES': [queues[name] for name in sorted(queues)],
+        'CELERY_ROUTES': routes,
+        'CELERY_DEFAULT_QUEUE': DEFAULT_QUEUE,
+    }
+    if not worker_queue:
+        return settings
+
+    if worker_queue not in queues:
+        raise ValueError('Unknown task queue: {0:s}'.format(worker_queue))
+    queue_settings = config.get('TASK_QUEUES', DEFAULT_TASK_QUEUES).get(
+        worker_queue, {})
+    if queue_settings.get('concurrency'):
+        settings['CELERYD_CONCURRENCY'] = queue_settings['concurrency']
+    if queue_settings.get('prefetch_multiplier'):
+        settings['CELERYD_PREFETCH_MULTIPLIER'] = queue_settings[
+            'prefetch_multiplier']
+    return settings
+
+
+def select_worker_queue(worker, worker_queue):
+    """Make a worker consume a single queue.
+
+    Args:
+        worker: Instance of celery.apps.worker.Worker.
+        worker_queue: Name of the queue.
+    """
+    worker.app.amqp.queues.select([worker_queue])
@@ -0,0 +1,68 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the routing of Celery tasks."""
+
+from __future__ import unicode_literals
+
+from timesketch.lib.queues import get_celery_settings
+from timesketch.lib.testlib import BaseTest
+
+
+class QueuesTest(BaseTest):
+    """Tests for the routing of Celery tasks."""
+
+    def test_get_celery_settings(self):
+        """Test that tasks are routed to a queue per type."""
+        settings = get_celery_settings({
+            'CELERY_BROKER_URL': 'amqp://localhost',
+            'TASK_ROUTES': {
+                'ingest': {'queue': 'ingest', 'priority': 3},
+                'analysis': {'queue': 'short', 'priority': 6},
+                'notification': {'queue': 'short', 'priority': 12},
+            }})
+        self.assertEqual(
+            [queue.name for queue in settings['CELERY_QUEUES']],
+            ['celery', 'ingest', 'short'])
+        routes = settings['CELERY_ROUTES']
+        self.assertEqual(
+            routes['timesketch.lib.tasks.run_plaso'],
+            {'queue': 'ingest', 'priority': 3})
+        self.assertEqual(
+            routes['timesketch.lib.tasks.run_email_result_task'],
+            {'queue': 'short', 'priority': 9})
+        self.assertNotIn('CELERYD_CONCURRENCY', settings)
+
+        self.assertEqual(get_celery_settings({'TASK_ROUTES': {}}), {})
+
+    def test_get_celery_settings_redis(self):
+        """Test that priorities are reversed for Redis."""
+        settings = get_celery_settings(
+            {'CELERY_BROKER_URL': 'redis://127.0.0.1:6379'})
+        self.assertEqual(
+            settings['CELERY_ROUTES'][
+                'timesketch.lib.tasks.run_email_result_task']['priority'], 0)
+
+    def test_get_celery_settings_worker_queue(self):
+        """Test that workers for a queue get the settings of the queue."""
+        config = {
+            'TASK_QUEUES': {
+                'analysis': {'concurrency': 8, 'prefetch_multiplier': 1}}}
+        settings = get_celery_settings(config, worker_queue='analysis')
+        self.assertEqual(settings['CELERYD_CONCURRENCY'], 8)
+        self.assertEqual(settings['CELERYD_PREFETCH_MULTIPLIER'], 1)
+
+        settings = get_celery_settings(config, worker_queue='ingest')
+        self.assertNotIn('CELERYD_CONCURRENCY', settings)
+        with self.assertRaises(ValueError):
+            get_celery_settings(config, worker_queue='unknown')
@@ -15,7 +15,9 @@
 
 from __future__ import unicode_literals
 
+import itertools
 import logging
+import os
 import subprocess
 import traceback
 
@@ -23,17 +25,41 @@ import json
 import six
 
 from celery import chain
+from celery import chord
+from celery import group
 from celery import signals
 from flask import current_app
 from sqlalchemy import create_engine
 
 from timesketch import create_celery_app
 from timesketch.lib.analyzers import manager
+from timesketch.lib.analyzers.interface import SharedScan
+from timesketch.lib.analyzers.interface import set_analysis_error
+from timesketch.lib.datastores.cache import configure_cache
 from timesketch.lib.datastores.elastic import ElasticsearchDataStore
-from timesketch.lib.utils import read_and_validate_csv
+from timesketch.lib.datastores.pool import configure_pool
+from timesketch.lib.datastores.schema import DEFAULT_FIELD_LIMIT
+from timesketch.lib.datastores.schema import DEFAULT_SAMPLE_SIZE
+from timesketch.lib.datastores.schema import FieldSchema
+from timesketch.lib.progress import DEFAULT_PROGRESS_INTERVAL
+from timesketch.lib.progress import ImportProgressReporter
+from timesketch.lib.progress import finish_import_progress
+from timesketch.lib.progress import start_import_progress
+from timesketch.lib.queues import WORKER_QUEUE_ENVIRONMENT_VARIABLE
+from timesketch.lib.queues import select_worker_queue
+from timesketch.lib.utils import COLUMNAR_EXTENSIONS
+from timesketch.lib.utils import count_lines
+from timesketch.lib.utils import detect_compression
+from timesketch.lib.utils import get_event_content_id
+from timesketch.lib.utils import read_and_validate_arrow
+from timesketch.lib.utils import read_and_validate_csv_chunked
 from timesketch.lib.utils import read_and_validate_jsonl
+from timesketch.lib.utils import read_and_validate_jsonl_parallel
+from timesketch.lib.utils import read_and_validate_parquet
 from timesketch.lib.utils import send_email
+from timesketch.lib.utils import split_on_newlines
 from timesketch.models import db_session
+from timesketch.models.sketch import ImportCheckpoint
 from timesketch.models.sketch import SearchIndex
 from timesketch.models.sketch import Sketch
 from timesketch.models.sketch import Timeline
@@ -43,6 +69,9 @@ from timesketch.models.user import User
 
 celery = create_celery_app()
 
+# Number of bytes to import between checkpoints.
+DEFAULT_CHECKPOINT_SIZE = 64 * 1024 * 1024
+
 
 class SqlAlchemyTask(celery.Task):
     """An abstract task that runs on task completion."""
@@ -57,10 +86,20 @@ class SqlAlchemyTask(celery.Task):
 # pylint: disable=unused-argument
 @signals.worker_process_init.connect
 def init_worker(**kwargs):
-    """Create new database engine per worker process."""
+    """Create new database engine and datastore clients per worker process."""
     url = celery.conf.get('SQLALCHEMY_DATABASE_URI')
     engine = create_engine(url)
     db_session.configure(bind=engine)
+    configure_pool(celery.conf)
+    configure_cache(celery.conf)
+
+
+@signals.celeryd_init.connect
+def init_worker_queue(instance=None, **kwargs):
+    """Consume only the queue in TIMESKETCH_WORKER_QUEUE, if set."""
+    worker_queue = os.environ.get(WORKER_QUEUE_ENVIRONMENT_VARIABLE)
+    if worker_queue:
+        select_worker_queue(instance, worker_queue)
 
 
 def _set_timeline_status(index_name, status, error_msg=None):
@@ -104,13 +143,215 @@ def _get_index_task_class(file_extension):
     """
     if file_extension == 'plaso':
         index_class = run_plaso
-    elif file_extension in ['csv', 'jsonl']:
+    elif file_extension in ['csv', 'jsonl'] + COLUMNAR_EXTENSIONS:
         index_class = run_csv_jsonl
     else:
         raise KeyError('No task that supports {0:s}'.format(file_extension))
     return index_class
 
 
+def _split_index_file(file_path, file_extension):
+    """Split a CSV or JSONL file into chunks to index in parallel.
+
+    Args:
+        file_path: Path to the file to index.
+        file_extension: The file extension of the file, csv or jsonl.
+
+    Returns:
+        List of tuples with the start and end offset of the chunks, empty
+        if the file should be indexed by a single task.
+    """
+    split_size = current_app.config.get('INDEX_SPLIT_SIZE', 0)
+    if not split_size or file_extension not in ['csv', 'jsonl']:
+        return []
+
+    try:
+        # Compressed files can only be read from the start.
+        if (os.path.getsize(file_path) <= split_size or
+                detect_compression(file_path)):
+            return []
+        quotechar = '"' if file_extension == 'csv' else None
+        byte_ranges = split_on_newlines(
+            file_path, split_size, quotechar=quotechar)
+    except (IOError, OSError, ValueError) as e:
+        # Leave it to the indexing task to report the error.
+        logging.warning('Unable to split [{0:s}]: {1!s}'.format(file_path, e))
+        return []
+
+    if len(byte_ranges) < 2:
+        return []
+    return byte_ranges
+
+
+def _build_split_index_task(file_path, timeline_name, index_name,
+                            file_extension, resume=False):
+    """Build a task that indexes a CSV or JSONL file in parallel chunks.
+
+    Files larger than INDEX_SPLIT_SIZE bytes are split into byte ranges on
+    line boundaries, outside of quoted fields for CSV files. The index is
+    created once, every range is indexed by its own task into that index
+    and a chord callback sets the timeline status when all of them are done.
+
+    Every chunk gets a checkpoint that its task deletes when the datastore
+    has acknowledged all events of the chunk. A resume only indexes the
+    chunks that still have a checkpoint.
+
+    Args:
+        file_path: Path to the file to index.
+        timeline_name: Name of the timeline to create.
+        index_name: Name of the index to index to.
+        file_extension: The file extension of the file, csv or jsonl.
+        resume: Boolean indicating if the chunks of a failed or interrupted
+            import should be indexed again.
+
+    Returns:
+        Celery chain that returns the index name, or None if the file
+        should be indexed by a single task.
+    """
+    searchindex = SearchIndex.query.filter_by(index_name=index_name).first()
+    if resume:
+        checkpoints = searchindex.import_checkpoints.filter(
+            ImportCheckpoint.end_offset.isnot(None)).order_by(
+                ImportCheckpoint.offset)
+        byte_ranges = [
+            (checkpoint.offset, checkpoint.end_offset)
+            for checkpoint in checkpoints]
+        if not byte_ranges:
+            return None
+    else:
+        byte_ranges = _split_index_file(file_path, file_extension)
+        if not byte_ranges:
+            return None
+        for checkpoint in searchindex.import_checkpoints:
+            db_session.delete(checkpoint)
+        for start, end in byte_ranges:
+            db_session.add(ImportCheckpoint(
+                searchindex=searchindex, source_path=file_path,
+                source_type=file_extension, timeline_name=timeline_name,
+                offset=start, end_offset=end))
+        db_session.commit()
+
+    logging.info('Split [{0:s}] into {1:d} chunks for index [{2:s}]'.format(
+        file_path, len(byte_ranges), index_name))
+
+    chunk_tasks = [
+        run_csv_jsonl_chunk.si(
+            file_path, timeline_name, index_name, file_extension, start, end)
+        for start, end in byte_ranges]
+    return chain(
+        run_index_prepare.si(
+            index_name, 'generic_event',
+            bytes_total=sum(end - start for start, end in byte_ranges),
+            source_file_path=file_path, source_type=file_extension),
+        chord(chunk_tasks, run_index_chunks_done.s(index_name)))
+
+
+def _get_parallel_tasks(analysis_tasks):
+    """Get the tasks to run analysis tasks in parallel.
+
+    The analysis tasks are put in a Celery group, followed by a task that
+    passes the index name on to the next task in the chain. Analysis tasks
+    record errors instead of raising them, so that a failing analyzer does
+    not cancel the rest of the pipeline.
+
+    Args:
+        analysis_tasks: List of analysis tasks as Celery subtask signatures
+            that don't depend on each other.
+
+    Returns:
+        List of Celery subtask signatures to add to a chain.
+    """
+    if len(analysis_tasks) < 2:
+        return analysis_tasks
+    return [group(analysis_tasks), run_sketch_init.s()]
+
+
+def _get_analyzer_tree_task(analyzer_name, signatures, dependents):
+    """Get the task for an analyzer followed by the analyzers after it.
+
+    Args:
+        analyzer_name: Name of the analyzer.
+        signatures: Dictionary with the analysis task of each analyzer.
+        dependents: Dictionary with the names of the analyzers that depend
+            on each analyzer.
+
+    Returns:
+        Celery subtask signature or chain.
+    """
+    children = [
+        _get_analyzer_tree_task(child, signatures, dependents)
+        for child in dependents[analyzer_name]]
+    if not children:
+        return signatures[analyzer_name]
+    return chain(
+        [signatures[analyzer_name]] + _get_parallel_tasks(children))
+
+
+def _get_dependency_tasks(analysis_tasks):
+    """Get the tasks to run analysis tasks in the order of their dependencies.
+
+    The analyzers are split into groups that are connected by dependencies,
+    which run in parallel. Within a group where every analyzer depends on
+    at most one other analyzer, an analyzer starts as soon as the analyzer
+    it depends on is done. In a group with an analyzer that depends on
+    several others, the analyzers run in dependency levels, and the next
+    level starts when all of the previous level are done.
+
+    Args:
+        analysis_tasks: List of tuples with the analyzer name, the analyzer
+            class and the analysis task as Celery subtask signature, in the
+            order of AnalysisManager.get_analyzers().
+
+    Returns:
+        List of Celery subtask signatures to add to a chain.
+    """
+    names = [name for name, _, _ in analysis_tasks]
+    signatures = dict((name, task) for name, _, task in analysis_tasks)
+    dependencies = {}
+    dependents = dict((name, []) for name in names)
+    for name, analyzer_class, _ in analysis_tasks:
+        dependencies[name] = sorted(
+            set(dependency.lower() for dependency in
+                analyzer_class.DEPENDENCIES) & set(names))
+        for dependency in dependencies[name]:
+            dependents[dependency].append(name)
+
+    component_tasks = []
+    done = set()
+    for name in names:
+        if name in done:
+            continue
+        component = set([name])
+        pending = [name]
+        while pending:
+            current = pending.pop()
+            for other in dependencies[current] + dependents[current]:
+                if other not in component:
+                    component.add(other)
+                    pending.append(other)
+        done.update(component)
+        component_names = [other for other in names if other in component]
+
+        if all(len(dependencies[other]) < 2 for other in component_names):
+            component_tasks.append(_get_analyzer_tree_task(
+                component_names[0], signatures, dependents))
+            continue
+
+        levels = {}
+        for other in component_names:
+            levels[other] = 1 + max(
+                [levels[dependency] for dependency in dependencies[other]] or
+                [-1])
+        level_tasks = []
+        for level in range(max(levels.values()) + 1):
+            level_tasks.extend(_get_parallel_tasks([
+                signatures[other] for other in component_names
+                if levels[other] == level]))
+        component_tasks.append(chain(level_tasks))
+
+    return _get_parallel_tasks(component_tasks)
+
+
 def _get_index_analyzers():
     """Get list of index analysis tasks to run.
 
@@ -118,21 +359,19 @@ def _get_index_analyzers():
         Celery chain of index analysis tasks as Celery subtask signatures or
         None if index analyzers are disabled in config.
     """
-    tasks = []
     index_analyzers = current_app.config.get('AUTO_INDEX_ANALYZERS')
 
     if not index_analyzers:
         return None
 
-    for analyzer_name, _ in manager.AnalysisManager.get_analyzers(
-            index_analyzers):
-        tasks.append(run_index_analyzer.s(analyzer_name))
-
-    return chain(tasks)
+    return chain(_get_dependency_tasks([
+        (analyzer_name, analyzer_class, run_index_analyzer.s(analyzer_name))
+        for analyzer_name, analyzer_class in
+        manager.AnalysisManager.get_analyzers(index_analyzers)]))
 
 
 def build_index_pipeline(file_path, timeline_name, index_name, file_extension,
-                         sketch_id=None):
+                         sketch_id=None, resume=False):
     """Build a pipeline for index and analysis.
 
     Args:
@@ -141,6 +380,8 @@ def build_index_pipeline(file_path, timeline_name, index_name, file_extension,
         index_name: Name of the index to index to.
         file_extension: The file extension of the file.
         sketch_id: The ID of the sketch to analyze.
+        resume: Boolean indicating if a CSV or JSONL import should be
+            resumed from its last checkpoint.
 
     Returns:
         Celery chain with indexing task (or single indexing task) and analyzer
@@ -155,8 +396,14 @@ def build_index_pipeline(file_path, timeline_name, index_name, file_extension,
         sketch_analyzer_chain = build_sketch_analysis_pipeline(
             sketch_id, searchindex.id, user_id=None)
 
-    index_task = index_task_class.s(
-        file_path, timeline_name, index_name, file_extension)
+    index_task = _build_split_index_task(
+        file_path, timeline_name, index_name, file_extension, resume=resume)
+    if not index_task and resume and index_task_class is run_csv_jsonl:
+        index_task = index_task_class.s(
+            file_path, timeline_name, index_name, file_extension, resume=True)
+    elif not index_task:
+        index_task = index_task_class.s(
+            file_path, timeline_name, index_name, file_extension)
 
     # If there are no analyzers just run the indexer.
     if not index_analyzer_chain and not sketch_analyzer_chain:
@@ -180,6 +427,53 @@ def build_index_pipeline(file_path, timeline_name, index_name, file_extension,
     return chain(index_task, index_analyzer_chain)
 
 
+def build_resume_pipeline(index_name, force=False):
+    """Build a pipeline that resumes a failed or interrupted import.
+
+    An import that is still processing is only resumed with force, e.g.
+    when the worker that ran it was killed, otherwise two tasks would
+    import into the same index.
+
+    Args:
+        index_name: Name of the index the file was imported to.
+        force: Boolean indicating if an import that is still processing
+            should be resumed.
+
+    Returns:
+        Celery chain with the indexing task and the analyzers.
+
+    Raises:
+        ValueError if the import of the index can't be resumed.
+    """
+    searchindex = SearchIndex.query.filter_by(index_name=index_name).first()
+    if not searchindex:
+        raise ValueError('No such search index: {0:s}'.format(index_name))
+
+    checkpoint = searchindex.import_checkpoints.first()
+    if not checkpoint:
+        raise ValueError(
+            'No import to resume for index: {0:s}'.format(index_name))
+
+    status = searchindex.get_status.status
+    if status == 'ready':
+        raise ValueError(
+            'Import to index {0:s} is already done'.format(index_name))
+    if status == 'processing' and not force:
+        raise ValueError(
+            'Import to index {0:s} is still processing, use force to resume '
+            'it anyway'.format(index_name))
+
+    sketch_id = None
+    timeline = Timeline.query.filter_by(searchindex=searchindex).first()
+    if timeline and timeline.sketch:
+        sketch_id = timeline.sketch.id
+
+    _set_timeline_status(index_name, status='processing')
+    return build_index_pipeline(
+        checkpoint.source_path, checkpoint.timeline_name, index_name,
+        checkpoint.source_type, sketch_id, resume=True)
+
+
 def build_sketch_analysis_pipeline(sketch_id, searchindex_id, user_id,
                                    analyzer_names=None, analyzer_kwargs=None):
     """Build a pipeline for sketch analysis.
@@ -197,8 +491,14 @@ def build_sketch_analysis_pipeline(sketch_id, searchindex_id, user_id,
         analyzer_names (list): List of analyzers to run.
         analyzer_kwargs (dict): Arguments to the analyzers.
 
+    Analyzers run in the order of their dependencies, an analyzer starts
+    when the analyzers it depends on are done. Analyzers that don't depend
+    on each other run in parallel in Celery groups. With a shared scan the
+    analyzers run in dependency levels instead, the analyzers in a level
+    share one scan of the index.
+
     Returns:
-        Celery group with analysis tasks or None if no analyzers are enabled.
+        Celery chain with analysis tasks or None if no analyzers are enabled.
     """
     tasks = []
 
@@ -222,32 +522,53 @@ def build_sketch_analysis_pipeline(sketch_id, searchindex_id, user_id,
 
     sketch = Sketch.query.get(sketch_id)
     analysis_session = AnalysisSession(user, sketch)
-
-    analyzers = manager.AnalysisManager.get_analyzers(analyzer_names)
-    for analyzer_name, analyzer_cls in analyzers:
-        if not analyzer_cls.IS_SKETCH_ANALYZER:
+    shared_scan = current_app.config.get('ANALYZER_SHARED_SCAN', False)
+
+    analysis_tasks = []
+    clusters = manager.AnalysisManager.get_analyzer_clusters(analyzer_names)
+    for cluster in clusters:
+        cluster_analyses = []
+        cluster_tasks = []
+        for analyzer_name, analyzer_cls in cluster:
+            if not analyzer_cls.IS_SKETCH_ANALYZER:
+                continue
+
+            kwargs = analyzer_kwargs.get(analyzer_name, {})
+            searchindex = SearchIndex.query.get(searchindex_id)
+            timeline = Timeline.query.filter_by(
+                sketch=sketch, searchindex=searchindex).first()
+
+            analysis = Analysis(
+                name=analyzer_name,
+                description=analyzer_name,
+                analyzer_name=analyzer_name,
+                parameters=json.dumps(kwargs),
+                user=user,
+                sketch=sketch,
+                timeline=timeline)
+            analysis.set_status('PENDING')
+            analysis_session.analyses.append(analysis)
+            db_session.add(analysis)
+            db_session.commit()
+            cluster_analyses.append((analysis.id, analyzer_name, kwargs))
+            cluster_tasks.append(run_sketch_analyzer.s(
+                sketch_id, analysis.id, analyzer_name, **kwargs))
+            analysis_tasks.append(
+                (analyzer_name, analyzer_cls, cluster_tasks[-1]))
+
+        if not shared_scan:
             continue
 
-        kwargs = analyzer_kwargs.get(analyzer_name, {})
-        searchindex = SearchIndex.query.get(searchindex_id)
-        timeline = Timeline.query.filter_by(
-            sketch=sketch, searchindex=searchindex).first()
-
-        analysis = Analysis(
-            name=analyzer_name,
-            description=analyzer_name,
-            analyzer_name=analyzer_name,
-            parameters=json.dumps(kwargs),
-            user=user,
-            sketch=sketch,
-            timeline=timeline)
-        analysis.set_status('PENDING')
-        analysis_session.analyses.append(analysis)
-        db_session.add(analysis)
-        db_session.commit()
+        # Analyzers in a cluster don't depend on each other, so they can
+        # read the events of the index in a single scan.
+        if len(cluster_analyses) > 1:
+            tasks.append(run_sketch_analyzers_shared_scan.s(
+                sketch_id, cluster_analyses))
+        else:
+            tasks.extend(cluster_tasks)
 
-        tasks.append(run_sketch_analyzer.s(
-            sketch_id, analysis.id, analyzer_name, **kwargs))
+    if not shared_scan:
+        tasks.extend(_get_dependency_tasks(analysis_tasks))
 
     # Commit the analysis session to the database.
     db_session.add(analysis_session)
@@ -354,7 +675,14 @@ def run_index_analyzer(index_name, analyzer_name, **kwargs):
       Name (str) of the index.
     """
     analyzer_class = manager.AnalysisManager.get_analyzer(analyzer_name)
-    analyzer = analyzer_class(index_name=index_name, **kwargs)
+    try:
+        analyzer = analyzer_class(index_name=index_name, **kwargs)
+    except Exception:  # pylint: disable=broad-except
+        # Don't cancel the analyzers that run in parallel or after this one.
+        logging.exception(
+            '[{0:s}] Unable to create analyzer'.format(analyzer_name))
+        return index_name
+
     result = analyzer.run_wrapper()
     if result:
         logging.info('[{0:s}] result: {1:s}'.format(analyzer_name, result))
@@ -378,14 +706,64 @@ def run_sketch_analyzer(index_name, sketch_id, analysis_id, analyzer_name,
       Name (str) of the index.
     """
     analyzer_class = manager.AnalysisManager.get_analyzer(analyzer_name)
-    analyzer = analyzer_class(
-        sketch_id=sketch_id, index_name=index_name, **kwargs)
+    try:
+        analyzer = analyzer_class(
+            sketch_id=sketch_id, index_name=index_name, **kwargs)
+    except Exception as e:  # pylint: disable=broad-except
+        # Record the error on the analysis, like errors of the run, instead
+        # of cancelling the analyzers that run in parallel or after this one.
+        set_analysis_error(
+            Analysis.query.get(analysis_id), e, traceback.format_exc())
+        db_session.commit()
+        logging.exception(
+            '[{0:s}] Unable to create analyzer'.format(analyzer_name))
+        return index_name
 
     result = analyzer.run_wrapper(analysis_id)
     logging.info('[{0:s}] result: {1:s}'.format(analyzer_name, result))
     return index_name
 
 
+@celery.task(track_started=True)
+def run_sketch_analyzers_shared_scan(index_name, sketch_id, analyses):
+    """Create a Celery task for sketch analyzers that share a scan.
+
+    Args:
+        index_name: Name of the datastore index.
+        sketch_id: ID of the sketch to analyze.
+        analyses: List of analysis ID, analyzer name and dictionary with
+            arguments to the analyzer.
+
+    Returns:
+      Name (str) of the index.
+    """
+    analyzers = []
+    analysis_ids = []
+    for analysis_id, analyzer_name, kwargs in analyses:
+        analyzer_class = manager.AnalysisManager.get_analyzer(analyzer_name)
+        try:
+            analyzers.append(analyzer_class(
+                sketch_id=sketch_id, index_name=index_name, **kwargs))
+        except Exception as e:  # pylint: disable=broad-except
+            # The other analyzers share the scan without this one.
+            set_analysis_error(
+                Analysis.query.get(analysis_id), e, traceback.format_exc())
+            db_session.commit()
+            logging.exception(
+                '[{0:s}] Unable to create analyzer'.format(analyzer_name))
+            continue
+        analysis_ids.append(analysis_id)
+
+    if not analyzers:
+        return index_name
+
+    shared_scan = SharedScan(analyzers)
+    results = shared_scan.run_wrapper(analysis_ids)
+    for analyzer, result in zip(analyzers, results):
+        logging.info('[{0:s}] result: {1:s}'.format(analyzer.name, result))
+    return index_name
+
+
 @celery.task(track_started=True, base=SqlAlchemyTask)
 def run_plaso(source_file_path, timeline_name, index_name, source_type):
     """Create a Celery task for processing Plaso storage file.
@@ -413,8 +791,23 @@ def run_plaso(source_file_path, timeline_name, index_name, source_type):
         timeline_name, '--status_view', 'none', '--index', index_name
     ]
 
-    # Run psort.py
+    # psort doesn't report progress while it runs, only the start and the
+    # end of the import are recorded.
+    bytes_total = os.path.getsize(source_file_path)
+    start_import_progress(index_name, bytes_total)
+
+    # Create the index up front so that psort indexes into an index that is
+    # optimized for ingest, psort leaves existing indices as they are.
+    es = ElasticsearchDataStore(
+        host=current_app.config['ELASTIC_HOST'],
+        port=current_app.config['ELASTIC_PORT'])
+
     try:
+        if current_app.config.get('ELASTIC_INGEST_OPTIMIZE', True):
+            es.create_index(
+                index_name=index_name, doc_type='plaso_event', ingest=True)
+
+        # Run psort.py
         if six.PY3:
             subprocess.check_output(
                 cmd, stderr=subprocess.STDOUT, encoding='utf-8')
@@ -424,6 +817,16 @@ def run_plaso(source_file_path, timeline_name, index_name, source_type):
         # Mark the searchindex and timelines as failed and exit the task
         _set_timeline_status(index_name, status='fail', error_msg=e.output)
         return e.output
+    except RuntimeError as e:
+        _set_timeline_status(index_name, status='fail', error_msg=str(e))
+        raise
+    finally:
+        es.finish_ingest(index_name)
+
+    progress = ImportProgressReporter(index_name)
+    progress.add(bytes_read=bytes_total)
+    progress.report()
+    finish_import_progress(index_name)
 
     # Mark the searchindex and timelines as ready
     _set_timeline_status(index_name, status='ready')
@@ -431,25 +834,161 @@ def run_plaso(source_file_path, timeline_name, index_name, source_type):
     return index_name
 
 
+def _get_import_checkpoint(index_name, source_file_path, source_type,
+                           timeline_name, resume=False):
+    """Get the checkpoint to start an import at.
+
+    Args:
+        index_name: Name of the datastore index.
+        source_file_path: Path to the file that is imported.
+        source_type: Type of file, csv or jsonl.
+        timeline_name: Name of the Timesketch timeline.
+        resume: Boolean indicating if an existing checkpoint should be used.
+
+    Returns:
+        Instance of ImportCheckpoint.
+    """
+    searchindex = SearchIndex.query.filter_by(index_name=index_name).first()
+    checkpoint = searchindex.import_checkpoints.filter_by(
+        end_offset=None).first()
+    if checkpoint and resume:
+        return checkpoint
+
+    if resume:
+        logging.warning(
+            'No checkpoint for index [{0:s}], importing from the '
+            'start.'.format(index_name))
+
+    # The chunks of an earlier import are replaced by this import.
+    for chunk_checkpoint in searchindex.import_checkpoints.filter(
+            ImportCheckpoint.end_offset.isnot(None)):
+        db_session.delete(chunk_checkpoint)
+
+    if not checkpoint:
+        checkpoint = ImportCheckpoint(
+            searchindex=searchindex, source_path=source_file_path,
+            source_type=source_type, timeline_name=timeline_name)
+    checkpoint.offset = 0
+    checkpoint.line_number = 0
+    checkpoint.events_read = 0
+    checkpoint.events_indexed = 0
+    db_session.add(checkpoint)
+    db_session.commit()
+    return checkpoint
+
+
+def _sample_index_schema(source_file_path, source_type):
+    """Infer the field types of a timeline from its first events.
+
+    Args:
+        source_file_path: Path to CSV, JSONL, Parquet or Arrow file.
+        source_type: Type of file, csv, jsonl, parquet or arrow.
+
+    Returns:
+        Instance of FieldSchema or None if schema sampling is disabled.
+
+    Raises:
+        RuntimeError if the file is invalid.
+    """
+    sample_size = current_app.config.get(
+        'ELASTIC_MAPPING_SAMPLE_SIZE', DEFAULT_SAMPLE_SIZE)
+    readers = {
+        'csv': read_and_validate_csv_chunked,
+        'jsonl': read_and_validate_jsonl,
+        'parquet': read_and_validate_parquet,
+        'arrow': read_and_validate_arrow
+    }
+    read_and_validate = readers.get(source_type)
+    if not sample_size or not read_and_validate:
+        return None
+
+    schema = FieldSchema(field_limit=current_app.config.get(
+        'ELASTIC_MAPPING_FIELD_LIMIT', DEFAULT_FIELD_LIMIT))
+    for event in itertools.islice(
+            read_and_validate(source_file_path), sample_size):
+        schema.add(event)
+    return schema
+
+
+def _read_byte_range(read_and_validate, path, byte_range, line_number):
+    """Generator for reading the events in a byte range of a file.
+
+    Args:
+        read_and_validate: Reader function that supports byte ranges.
+        path: Path to the file.
+        byte_range: Tuple with start and end offset.
+        line_number: Number of lines in the file before the range.
+
+    Raises:
+        RuntimeError if the file is invalid, with line numbers relative to
+        the start of the range.
+    """
+    try:
+        for event in read_and_validate(path, byte_range=byte_range):
+            yield event
+    except RuntimeError as e:
+        raise RuntimeError('{0!s} (counted from line {1:d} of the file)'.format(
+            e, line_number + 1))
+
+
 @celery.task(track_started=True, base=SqlAlchemyTask)
-def run_csv_jsonl(source_file_path, timeline_name, index_name, source_type):
-    """Create a Celery task for processing a CSV or JSONL file.
+def run_csv_jsonl(source_file_path, timeline_name, index_name, source_type,
+                  resume=False):
+    """Create a Celery task for processing a CSV, JSONL, Parquet or Arrow
+    file.
+
+    The file is imported in byte ranges of INDEX_CHECKPOINT_SIZE bytes.
+    After every range the queued events are flushed and a checkpoint with
+    the offset in the file, the number of lines and the number of events
+    acknowledged by the datastore is saved, so that a failed import can be
+    resumed. The import fails when the datastore failed to index events of
+    a range, the checkpoint then stays at the start of the range.
+
+    Events get IDs based on their position in the file, which makes a
+    resume overwrite the events of an unfinished range instead of
+    duplicating them.
+
+    Compressed files are decompressed while they are read, they are
+    imported in one range. So are Parquet and Arrow files, which are read
+    a row group or record batch at a time.
+
+    Progress is published every INDEX_PROGRESS_INTERVAL seconds and after
+    every range.
+
+    With INDEX_DEDUPLICATE set, events get IDs derived from their content
+    instead, so that duplicate events within the file, including events
+    that a resume imports again, are indexed once. Every upload has its own
+    index, so events of other uploads are not deduplicated.
+
+    New indices get a mapping inferred from the first
+    ELASTIC_MAPPING_SAMPLE_SIZE events of the file.
 
     Args:
-        source_file_path: Path to CSV or JSONL file.
+        source_file_path: Path to CSV, JSONL, Parquet or Arrow file.
         timeline_name: Name of the Timesketch timeline.
         index_name: Name of the datastore index.
-        source_type: Type of file, csv or jsonl.
+        source_type: Type of file, csv, jsonl, parquet or arrow.
+        resume: Boolean indicating if the import should start at the last
+            checkpoint.
 
     Returns:
         Name (str) of the index.
     """
     event_type = 'generic_event'  # Document type for Elasticsearch
     validators = {
-        'csv': read_and_validate_csv,
-        'jsonl': read_and_validate_jsonl
+        'csv': read_and_validate_csv_chunked,
+        'jsonl': read_and_validate_jsonl_parallel,
+        'parquet': read_and_validate_parquet,
+        'arrow': read_and_validate_arrow
     }
     read_and_validate = validators.get(source_type)
+    quotechar = '"' if source_type == 'csv' else None
+    checkpoint_size = current_app.config.get(
+        'INDEX_CHECKPOINT_SIZE', DEFAULT_CHECKPOINT_SIZE)
+    progress_interval = current_app.config.get(
+        'INDEX_PROGRESS_INTERVAL', DEFAULT_PROGRESS_INTERVAL)
+    deduplicate = current_app.config.get('INDEX_DEDUPLICATE', False)
+    ingest = current_app.config.get('ELASTIC_INGEST_OPTIMIZE', True)
 
     # Log information to Celery
     logging.info(
@@ -463,11 +1002,94 @@ def run_csv_jsonl(source_file_path, timeline_name, index_name, source_type):
     # Reason for the broad exception catch is that we want to capture
     # all possible errors and exit the task.
     try:
-        es.create_index(index_name=index_name, doc_type=event_type)
-        for event in read_and_validate(source_file_path):
-            es.import_event(index_name, event_type, event)
-        # Import the remaining events
-        es.flush_queued_events()
+        # Compressed and columnar files can't be read from an offset, they
+        # are imported in one range and resumed from the start.
+        whole_file = (
+            source_type in COLUMNAR_EXTENSIONS or
+            bool(detect_compression(source_file_path)))
+        checkpoint = _get_import_checkpoint(
+            index_name, source_file_path, source_type, timeline_name,
+            resume=resume and not whole_file)
+        if checkpoint.offset:
+            logging.info(
+                'Resume import to index [{0:s}] at line {1:d}'.format(
+                    index_name, checkpoint.line_number))
+
+        es.create_index(
+            index_name=index_name, doc_type=event_type, ingest=ingest,
+            schema=_sample_index_schema(source_file_path, source_type))
+
+        file_size = os.path.getsize(source_file_path)
+        if whole_file:
+            byte_ranges = [None]
+        elif checkpoint_size:
+            byte_ranges = split_on_newlines(
+                source_file_path, checkpoint_size, start=checkpoint.offset,
+                quotechar=quotechar)
+        else:
+            byte_ranges = [(checkpoint.offset, file_size)]
+
+        # Progress covers this run of the import, a resumed import starts
+        # at the checkpoint.
+        start_import_progress(index_name, file_size - checkpoint.offset)
+        progress = ImportProgressReporter(
+            index_name, datastore=es, interval=progress_interval)
+
+        events_read = checkpoint.events_read
+        events_indexed = checkpoint.events_indexed
+        import_summary = {}
+        for byte_range in byte_ranges:
+            for event in _read_byte_range(
+                    read_and_validate, source_file_path, byte_range,
+                    checkpoint.line_number):
+                if deduplicate:
+                    document_id = get_event_content_id(event)
+                else:
+                    document_id = six.text_type(events_read)
+                es.import_event(
+                    index_name, event_type, event, document_id=document_id)
+                events_read += 1
+                progress.add(events_parsed=1)
+
+            # Only save the checkpoint when the datastore has acknowledged
+            # all events in the range. Failed events keep the checkpoint at
+            # the start of the range, so that a resume imports them again.
+            import_summary = es.flush_queued_events().get(index_name, {})
+            if import_summary.get('failed', 0):
+                raise RuntimeError(
+                    '{0:d} events failed to index (counted from line {1:d} '
+                    'of the file)'.format(
+                        import_summary['failed'], checkpoint.line_number + 1))
+            if byte_range:
+                checkpoint.offset = byte_range[1]
+                checkpoint.line_number += count_lines(
+                    source_file_path, byte_range)
+            else:
+                checkpoint.offset = file_size
+            checkpoint.events_read = events_read
+            checkpoint.events_indexed = (
+                events_indexed + import_summary.get('indexed', 0))
+            db_session.add(checkpoint)
+            db_session.commit()
+
+            if byte_range:
+                progress.add(bytes_read=byte_range[1] - byte_range[0])
+            else:
+                progress.add(bytes_read=file_size)
+            progress.report()
+
+        logging.info(
+            'Index [{0:s}] indexed: {1:d} failed: {2:d} retried: {3:d} '
+            'duplicates: {4:d}'.format(
+                index_name, import_summary.get('indexed', 0),
+                import_summary.get('failed', 0),
+                import_summary.get('retried', 0),
+                import_summary.get('updated', 0)))
+
+        # The import is done, there is nothing left to resume.
+        db_session.delete(checkpoint)
+        db_session.commit()
+        finish_import_progress(index_name)
 
     except (RuntimeError, ImportError, NameError, UnboundLocalError) as e:
         _set_timeline_status(index_name, status='fail', error_msg=str(e))
@@ -480,7 +1102,180 @@ def run_csv_jsonl(source_file_path, timeline_name, index_name, source_type):
         logging.error(error_msg)
         return None
 
+    finally:
+        # Restore the index settings also when the import failed, otherwise
+        # the events that were indexed stay invisible. An interrupted import
+        # might have left the index in ingest mode.
+        es.finish_ingest(index_name, force=resume and ingest)
+
     # Set status to ready when done
     _set_timeline_status(index_name, status='ready')
 
     return index_name
+
+
+@celery.task(track_started=True, base=SqlAlchemyTask)
+def run_index_prepare(index_name, doc_type, bytes_total=0,
+                      source_file_path=None, source_type=None):
+    """Create a Celery task that creates an index before parallel indexing.
+
+    Args:
+        index_name: Name of the datastore index.
+        doc_type: Name of the document type.
+        bytes_total: Number of bytes that will be indexed.
+        source_file_path: Optional path to the file that will be indexed,
+            used to infer the mapping of the index.
+        source_type: Type of file, csv or jsonl.
+
+    Returns:
+        Name (str) of the index.
+    """
+    es = ElasticsearchDataStore(
+        host=current_app.config['ELASTIC_HOST'],
+        port=current_app.config['ELASTIC_PORT'])
+    try:
+        schema = None
+        if source_file_path:
+            schema = _sample_index_schema(source_file_path, source_type)
+        es.create_index(
+            index_name=index_name, doc_type=doc_type,
+            ingest=current_app.config.get('ELASTIC_INGEST_OPTIMIZE', True),
+            schema=schema)
+    except RuntimeError as e:
+        _set_timeline_status(index_name, status='fail', error_msg=str(e))
+        raise
+    start_import_progress(index_name, bytes_total)
+    return index_name
+
+
+@celery.task(track_started=True, base=SqlAlchemyTask)
+def run_csv_jsonl_chunk(source_file_path, timeline_name, index_name,
+                        source_type, start, end):
+    """Create a Celery task for indexing a chunk of a CSV or JSONL file.
+
+    The index must already exist, fields that are not in its inferred
+    schema are moved to the overflow field. Errors are returned instead of
+    raised, otherwise Celery would not run the chord callback and the
+    timeline would never leave the processing state. Events that the
+    datastore failed to index are reported as an error as well.
+
+    The checkpoint of the chunk is deleted when the datastore has
+    acknowledged all its events. Events get IDs based on their position in
+    the chunk, or derived from their content when INDEX_DEDUPLICATE is set,
+    so that a chunk that is indexed again overwrites its events. Content IDs
+    also deduplicate events across the chunks of the file, but not across
+    uploads.
+
+    Args:
+        source_file_path: Path to CSV or JSONL file.
+        timeline_name: Name of the Timesketch timeline.
+        index_name: Name of the datastore index.
+        source_type: Type of file, csv or jsonl.
+        start: Offset of the first byte of the chunk.
+        end: Offset after the last byte of the chunk.
+
+    Returns:
+        Dictionary with the byte range, the number of indexed, failed and
+        duplicate events and an error message or None.
+    """
+    event_type = 'generic_event'  # Document type for Elasticsearch
+    validators = {
+        'csv': read_and_validate_csv_chunked,
+        'jsonl': read_and_validate_jsonl
+    }
+    read_and_validate = validators.get(source_type)
+    progress_interval = current_app.config.get(
+        'INDEX_PROGRESS_INTERVAL', DEFAULT_PROGRESS_INTERVAL)
+    deduplicate = current_app.config.get('INDEX_DEDUPLICATE', False)
+    result = {
+        'start': start, 'end': end, 'indexed': 0, 'failed': 0,
+        'duplicates': 0, 'error': None}
+
+    logging.info(
+        'Index bytes {0:d}-{1:d} of timeline [{2:s}] to index [{3:s}] '
+        '(source: {4:s})'.format(
+            start, end, timeline_name, index_name, source_type))
+
+    es = ElasticsearchDataStore(
+        host=current_app.config['ELASTIC_HOST'],
+        port=current_app.config['ELASTIC_PORT'])
+
+    # Reason for the broad exception catch is that we want to capture
+    # all possible errors and report them to the chord callback.
+    try:
+        es.load_index_schema(index_name)
+        progress = ImportProgressReporter(
+            index_name, datastore=es, interval=progress_interval)
+        for event_number, event in enumerate(read_and_validate(
+                source_file_path, byte_range=(start, end))):
+            if deduplicate:
+                document_id = get_event_content_id(event)
+            else:
+                document_id = '{0:d}:{1:d}'.format(start, event_number)
+            es.import_event(
+                index_name, event_type, event, document_id=document_id)
+            progress.add(events_parsed=1)
+        import_summary = es.flush_queued_events().get(index_name, {})
+        result['indexed'] = import_summary.get('indexed', 0)
+        result['failed'] = import_summary.get('failed', 0)
+        result['duplicates'] = import_summary.get('updated', 0)
+        progress.add(bytes_read=end - start)
+        progress.report()
+        if result['failed']:
+            result['error'] = (
+                'Bytes {0:d}-{1:d}: {2:d} events failed to index'.format(
+                    start, end, result['failed']))
+        else:
+            searchindex = SearchIndex.query.filter_by(
+                index_name=index_name).first()
+            searchindex.import_checkpoints.filter_by(
+                offset=start, end_offset=end).delete()
+            db_session.commit()
+    except Exception as e:  # pylint: disable=broad-except
+        result['error'] = 'Bytes {0:d}-{1:d}: {2!s}'.format(start, end, e)
+        logging.error(traceback.format_exc())
+
+    return result
+
+
+@celery.task(track_started=True, base=SqlAlchemyTask)
+def run_index_chunks_done(results, index_name):
+    """Create a Celery task that finishes indexing a file in chunks.
+
+    Restores the index settings and marks the timeline as failed if any of
+    the chunks failed, otherwise as ready.
+
+    Args:
+        results: List of results from run_csv_jsonl_chunk tasks.
+        index_name: Name of the datastore index.
+
+    Returns:
+        Name (str) of the index or None if a chunk failed.
+    """
+    es = ElasticsearchDataStore(
+        host=current_app.config['ELASTIC_HOST'],
+        port=current_app.config['ELASTIC_PORT'])
+    try:
+        es.finish_ingest(
+            index_name,
+            force=current_app.config.get('ELASTIC_INGEST_OPTIMIZE', True))
+    except RuntimeError as e:
+        _set_timeline_status(index_name, status='fail', error_msg=str(e))
+        raise
+
+    logging.info(
+        'Index [{0:s}] indexed: {1:d} failed: {2:d} duplicates: {3:d}'.format(
+            index_name, sum(result['indexed'] for result in results),
+            sum(result['failed'] for result in results),
+            sum(result.get('duplicates', 0) for result in results)))
+
+    errors = [result['error'] for result in results if result['error']]
+    if errors:
+        error_msg = '\n'.join(errors)
+        _set_timeline_status(index_name, status='fail', error_msg=error_msg)
+        logging.error(error_msg)
+        return None
+
+    finish_import_progress(index_name)
+    _set_timeline_status(index_name, status='ready')
+    return index_name
@@ -0,0 +1,362 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the Celery tasks."""
+
+from __future__ import unicode_literals
+
+import json
+import os
+import shutil
+import tempfile
+
+import mock
+from celery import chord
+from celery import group
+from celery.canvas import _chain
+
+from timesketch import create_app
+from timesketch.lib.testlib import BaseTest
+from timesketch.lib.testlib import TestConfig
+from timesketch.lib.utils import count_lines
+from timesketch.lib.utils import split_on_newlines
+from timesketch.models import db_session
+from timesketch.models.sketch import Analysis
+from timesketch.models.sketch import ImportCheckpoint
+from timesketch.models.sketch import SearchIndex
+
+
+class TaskTestConfig(TestConfig):
+    """Config for the Celery app of the tasks module."""
+    CELERY_BROKER_URL = 'memory://'
+
+
+# The tasks module creates its Celery app from the server config at import
+# time, use the test config instead.
+with mock.patch(
+        'timesketch.create_app', lambda: create_app(TaskTestConfig)):
+    from timesketch.lib import tasks  # pylint: disable=wrong-import-position
+
+
+class BaseTaskTest(BaseTest):
+    """Base class for tests of tasks that read a file."""
+
+    def setUp(self):
+        """Create the directory for the files to import."""
+        super(BaseTaskTest, self).setUp()
+        self.source_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Remove the files to import."""
+        shutil.rmtree(self.source_dir)
+        super(BaseTaskTest, self).tearDown()
+
+    def _write_file(self, name, data):
+        """Write a file to import.
+
+        Args:
+            name: Name of the file.
+            data: Content of the file as bytes.
+
+        Returns:
+            Path to the file.
+        """
+        path = os.path.join(self.source_dir, name)
+        with open(path, 'wb') as fh:
+            fh.write(data)
+        return path
+
+    def _write_jsonl(self, count):
+        """Write a JSONL file with events to import.
+
+        Args:
+            count: Number of events.
+
+        Returns:
+            Path to the file.
+        """
+        lines = [json.dumps({
+            'message': 'Event {0:d}'.format(lineno),
+            'datetime': '2019-01-01T00:00:00+00:00',
+            'timestamp': lineno,
+            'timestamp_desc': 'Test'}) for lineno in range(count)]
+        return self._write_file(
+            'test.jsonl', '\n'.join(lines).encode('utf-8') + b'\n')
+
+
+class RunPlasoTest(BaseTaskTest):
+    """Tests for the run_plaso task."""
+
+    @mock.patch('timesketch.lib.tasks.subprocess.check_output')
+    @mock.patch('timesketch.lib.tasks.ElasticsearchDataStore')
+    def test_create_index_error(self, mock_datastore, mock_check_output):
+        """Test that the timeline fails when the index can't be created."""
+        mock_datastore.return_value.create_index.side_effect = RuntimeError(
+            'Unable to connect to Timesketch backend.')
+
+        source_file_path = self._write_file('test.plaso', b'plaso')
+        with self.assertRaises(RuntimeError):
+            tasks.run_plaso.run(source_file_path, 'test', 'test', 'plaso')
+
+        searchindex = SearchIndex.query.filter_by(index_name='test').first()
+        self.assertEqual(searchindex.get_status.status, 'fail')
+        self.assertEqual(self.timeline.get_status.status, 'fail')
+        mock_check_output.assert_not_called()
+        mock_datastore.return_value.finish_ingest.assert_called_once_with(
+            'test')
+
+
+class BuildSplitIndexTaskTest(BaseTaskTest):
+    """Tests for the _build_split_index_task function."""
+
+    @mock.patch('timesketch.lib.tasks.run_csv_jsonl_chunk')
+    def test_csv_quoted_newlines(self, mock_chunk_task):
+        """Test that CSV files aren't split inside quoted fields."""
+        self.app.config['INDEX_SPLIT_SIZE'] = 50
+        rows = ['message,datetime,timestamp_desc'] + [
+            '"Line {0:d}\nof event",2019-01-01T00:00:00,Test'.format(lineno)
+            for lineno in range(10)]
+        data = '\n'.join(rows).encode('utf-8') + b'\n'
+        source_file_path = self._write_file('test.csv', data)
+
+        # pylint: disable=protected-access
+        self.assertIsNotNone(tasks._build_split_index_task(
+            source_file_path, 'test', 'test', 'csv'))
+        starts = [
+            call[0][4] for call in mock_chunk_task.si.call_args_list]
+        self.assertEqual(starts[0], 0)
+        self.assertGreater(len(starts), 1)
+        for start in starts[1:]:
+            self.assertEqual(data[:start].count(b'"') % 2, 0)
+            self.assertEqual(data[start - 1:start], b'\n')
+
+    @mock.patch('timesketch.lib.tasks.run_csv_jsonl_chunk')
+    def test_resume(self, mock_chunk_task):
+        """Test that a resume only indexes the chunks that aren't done."""
+        self.app.config['INDEX_SPLIT_SIZE'] = 300
+        source_file_path = self._write_jsonl(10)
+
+        # pylint: disable=protected-access
+        tasks._build_split_index_task(
+            source_file_path, 'test', 'test', 'jsonl')
+        byte_ranges = [
+            tuple(call[0][4:]) for call in mock_chunk_task.si.call_args_list]
+        self.assertGreater(len(byte_ranges), 2)
+        checkpoints = self.searchindex.import_checkpoints.order_by(
+            ImportCheckpoint.offset)
+        self.assertEqual([
+            (checkpoint.offset, checkpoint.end_offset)
+            for checkpoint in checkpoints], byte_ranges)
+
+        # The first chunk is done.
+        db_session.delete(checkpoints[0])
+        db_session.commit()
+        mock_chunk_task.reset_mock()
+        tasks._build_split_index_task(
+            source_file_path, 'test', 'test', 'jsonl', resume=True)
+        self.assertEqual([
+            tuple(call[0][4:])
+            for call in mock_chunk_task.si.call_args_list], byte_ranges[1:])
+
+
+class RunCsvJsonlChunkTest(BaseTaskTest):
+    """Tests for the run_csv_jsonl_chunk and run_index_chunks_done tasks."""
+
+    @mock.patch('timesketch.lib.tasks.ImportProgressReporter')
+    @mock.patch('timesketch.lib.tasks.ElasticsearchDataStore')
+    def test_failed_events(self, mock_datastore, _):
+        """Test that events the datastore failed to index fail the import."""
+        mock_datastore.return_value.flush_queued_events.return_value = {
+            'test': {'indexed': 2, 'failed': 1, 'updated': 0}}
+        source_file_path = self._write_jsonl(3)
+        end = os.path.getsize(source_file_path)
+
+        result = tasks.run_csv_jsonl_chunk.run(
+            source_file_path, 'test', 'test', 'jsonl', 0, end)
+        self.assertEqual(result['failed'], 1)
+        self.assertEqual(
+            result['error'],
+            'Bytes 0-{0:d}: 1 events failed to index'.format(end))
+
+        self.assertIsNone(tasks.run_index_chunks_done.run([result], 'test'))
+        self.assertEqual(self.timeline.get_status.status, 'fail')
+
+    @mock.patch('timesketch.lib.tasks.ImportProgressReporter')
+    @mock.patch('timesketch.lib.tasks.ElasticsearchDataStore')
+    def test_checkpoint(self, mock_datastore, _):
+        """Test that a chunk deletes its checkpoint only when it is done."""
+        datastore = mock_datastore.return_value
+        source_file_path = self._write_jsonl(3)
+        end = os.path.getsize(source_file_path)
+        checkpoint = ImportCheckpoint(
+            searchindex=self.searchindex, source_path=source_file_path,
+            source_type='jsonl', timeline_name='test', offset=0,
+            end_offset=end)
+        db_session.add(checkpoint)
+        db_session.commit()
+
+        datastore.flush_queued_events.return_value = {
+            'test': {'indexed': 2, 'failed': 1, 'updated': 0}}
+        tasks.run_csv_jsonl_chunk.run(
+            source_file_path, 'test', 'test', 'jsonl', 0, end)
+        self.assertEqual(self.searchindex.import_checkpoints.count(), 1)
+
+        # Events get the same position based IDs when the chunk is retried.
+        datastore.flush_queued_events.return_value = {
+            'test': {'indexed': 3, 'failed': 0, 'updated': 2}}
+        result = tasks.run_csv_jsonl_chunk.run(
+            source_file_path, 'test', 'test', 'jsonl', 0, end)
+        self.assertIsNone(result['error'])
+        self.assertEqual(self.searchindex.import_checkpoints.count(), 0)
+        document_ids = [
+            call[1]['document_id']
+            for call in datastore.import_event.call_args_list]
+        self.assertEqual(document_ids, ['0:0', '0:1', '0:2'] * 2)
+
+
+class RunCsvJsonlTest(BaseTaskTest):
+    """Tests for the run_csv_jsonl task."""
+
+    @mock.patch('timesketch.lib.tasks.ImportProgressReporter')
+    @mock.patch('timesketch.lib.tasks.ElasticsearchDataStore')
+    def test_failed_events(self, mock_datastore, _):
+        """Test that failed events keep the checkpoint at their range."""
+        self.app.config['INDEX_CHECKPOINT_SIZE'] = 300
+        source_file_path = self._write_jsonl(6)
+        byte_ranges = split_on_newlines(source_file_path, 300)
+        self.assertGreater(len(byte_ranges), 1)
+        first_range_lines = count_lines(source_file_path, byte_ranges[0])
+
+        mock_datastore.return_value.flush_queued_events.side_effect = [
+            {'test': {'indexed': first_range_lines, 'failed': 0}},
+            {'test': {'indexed': 0, 'failed': 1}}]
+
+        with self.assertRaises(RuntimeError) as context:
+            tasks.run_csv_jsonl.run(source_file_path, 'test', 'test', 'jsonl')
+        self.assertIn(
+            '1 events failed to index (counted from line {0:d}'.format(
+                first_range_lines + 1), str(context.exception))
+
+        searchindex = SearchIndex.query.filter_by(index_name='test').first()
+        self.assertEqual(searchindex.get_status.status, 'fail')
+        checkpoint = searchindex.import_checkpoints.one()
+        self.assertEqual(checkpoint.offset, byte_ranges[0][1])
+        self.assertEqual(checkpoint.line_number, first_range_lines)
+        self.assertEqual(checkpoint.events_indexed, first_range_lines)
+
+
+class GetDependencyTasksTest(BaseTest):
+    """Tests for the _get_dependency_tasks function."""
+
+    def _describe(self, task):
+        """Describe a Celery task by the analyzers it runs.
+
+        Args:
+            task: Celery subtask signature, chain, group or chord.
+
+        Returns:
+            Analyzer name, 'init' for run_sketch_init or a tuple with the
+            type and the descriptions of the tasks in a chain, group or
+            chord.
+        """
+        if isinstance(task, chord):
+            return ('chord', [self._describe(t) for t in task.tasks],
+                    self._describe(task.body))
+        if isinstance(task, (group, _chain)):
+            name = 'group' if isinstance(task, group) else 'chain'
+            return (name, [self._describe(t) for t in task.tasks])
+        return task.args[0] if task.args else 'init'
+
+    def test_get_dependency_tasks(self):
+        """Test that analyzers only wait on the analyzers they depend on."""
+        dependencies = [
+            ('a', []), ('d', []), ('e', []), ('f', []), ('b', ['a']),
+            ('c', ['A']), ('g', ['e', 'f'])]
+        analysis_tasks = [
+            (name, mock.Mock(DEPENDENCIES=analyzer_dependencies),
+             tasks.run_index_analyzer.s(name))
+            for name, analyzer_dependencies in dependencies]
+
+        # pylint: disable=protected-access
+        dependency_tasks = tasks._get_dependency_tasks(analysis_tasks)
+        self.assertEqual([self._describe(t) for t in dependency_tasks], [
+            ('group', [
+                ('chain', ['a', ('chord', ['b', 'c'], 'init')]),
+                'd',
+                ('chord', ['e', 'f'], ('chain', ['init', 'g']))]),
+            'init'])
+
+        dependency_tasks = tasks._get_dependency_tasks(analysis_tasks[:1])
+        self.assertEqual(
+            [self._describe(t) for t in dependency_tasks], ['a'])
+
+
+class BuildResumePipelineTest(BaseTest):
+    """Tests for the build_resume_pipeline function."""
+
+    def setUp(self):
+        """Add a checkpoint to the test search index."""
+        super(BuildResumePipelineTest, self).setUp()
+        checkpoint = ImportCheckpoint(
+            searchindex=self.searchindex, source_path='/tmp/test.jsonl',
+            source_type='jsonl', timeline_name='test')
+        db_session.add(checkpoint)
+        db_session.commit()
+
+    @mock.patch('timesketch.lib.tasks.build_index_pipeline')
+    def test_processing(self, mock_build_index_pipeline):
+        """Test that an import that is processing is only resumed with force."""
+        # pylint: disable=protected-access
+        tasks._set_timeline_status('test', status='processing')
+        with self.assertRaises(ValueError):
+            tasks.build_resume_pipeline('test')
+        mock_build_index_pipeline.assert_not_called()
+
+        tasks.build_resume_pipeline('test', force=True)
+        mock_build_index_pipeline.assert_called_once_with(
+            '/tmp/test.jsonl', 'test', 'test', 'jsonl', self.sketch1.id,
+            resume=True)
+
+
+class RunAnalyzerTest(BaseTest):
+    """Tests for the run_index_analyzer and run_sketch_analyzer tasks."""
+
+    @mock.patch('timesketch.lib.tasks.manager.AnalysisManager.get_analyzer')
+    def test_run_index_analyzer(self, mock_get_analyzer):
+        """Test that an index analyzer runs without an analysis."""
+        mock_analyzer = mock_get_analyzer.return_value.return_value
+        mock_analyzer.run_wrapper.return_value = 'result'
+
+        self.assertEqual(
+            tasks.run_index_analyzer.run('test', 'mock_index'), 'test')
+        mock_get_analyzer.return_value.assert_called_once_with(
+            index_name='test')
+        mock_analyzer.run_wrapper.assert_called_once_with()
+
+    @mock.patch('timesketch.lib.tasks.manager.AnalysisManager.get_analyzer')
+    def test_run_sketch_analyzer_error(self, mock_get_analyzer):
+        """Test that an analyzer that can't be created fails its analysis."""
+        mock_get_analyzer.return_value.side_effect = ValueError(
+            'Unable to create analyzer.')
+        analysis = Analysis(
+            name='test', description='test', analyzer_name='mock_sketch',
+            parameters='{}', user=None, sketch=self.sketch1)
+        db_session.add(analysis)
+        db_session.commit()
+
+        self.assertEqual(tasks.run_sketch_analyzer.run(
+            'test', self.sketch1.id, analysis.id, 'mock_sketch'), 'test')
+        analysis = Analysis.query.get(analysis.id)
+        self.assertEqual(analysis.get_status.status, 'ERROR')
+        self.assertEqual(analysis.result, 'Error: Unable to create analyzer.')
+        self.assertIn('ValueError', analysis.log)
@@ -83,7 +83,7 @@ class MockDataStore(object):
     """A mock implementation of a Datastore."""
 
     event_dict = {
-        '_index': [],
+        '_index': 'test_index',
         '_id': 'adc123',
         '_type': 'plaso_event',
         '_source': {
@@ -205,13 +205,25 @@ class MockDataStore(object):
         """Mock adding a label to an event."""
         return
 
+    def set_labels(self, events, sketch_id, user_id, label, toggle=False):
+        """Mock adding a label to many events."""
+        return [{
+            '_index': event['_index'],
+            '_id': event['_id'],
+            'status': 200
+        } for event in events]
+
     # pylint: disable=unused-argument
     def create_index(self, *args, **kwargs):
         """Mock creating an index."""
         return
 
+    def load_index_schema(self, index_name):
+        """Mock loading the inferred schema of an index."""
+        return False
+
     def import_event(self, index_name, event_type, event=None,
-                     event_id=None, flush_interval=None):
+                     event_id=None, flush_interval=None, document_id=None):
         """Mock adding the event to Elasticsearch, instead add the event
         to event_store.
 
@@ -222,22 +234,39 @@ class MockDataStore(object):
             event_type: Type of event (e.g. plaso_event)
             event: Event dictionary
             event_id: Event Elasticsearch ID
+            document_id: ID for a new document, replaces an existing one.
         """
 
         for stored_event in self.event_store:
-            if stored_event['_id'] == event_id:
+            if event_id and stored_event['_id'] == event_id:
                 stored_event['_source'].update(event)
                 return
+            if document_id and stored_event['_id'] == document_id:
+                self.event_store.remove(stored_event)
+                break
 
         new_event = {
             '_index': index_name,
-            '_id': event_id,
+            '_id': event_id or document_id,
             '_type': event_type,
             '_source': event
         }
 
         self.event_store.append(new_event)
 
+    def flush_queued_events(self):
+        """Mock flushing the bulk insert queue."""
+        return {}
+
+    def import_summary(self):
+        """Mock getting a summary of the indexed events."""
+        summary = {}
+        for event in self.event_store:
+            counter = summary.setdefault(event['_index'], {
+                'indexed': 0, 'updated': 0, 'failed': 0, 'retried': 0})
+            counter['indexed'] += 1
+        return summary
+
     @property
     def version(self):
         """Get Elasticsearch version.
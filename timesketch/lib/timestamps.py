@@ -0,0 +1,416 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Normalization of event datetimes and timestamps.
+
+Events have a datetime in ISO 8601 format and a timestamp in microseconds
+since the epoch, in UTC. Datetimes without a time zone are in UTC.
+"""
+
+from __future__ import unicode_literals
+
+import datetime
+import math
+import re
+
+import six
+
+from dateutil import parser
+from dateutil import tz
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+MONTHS = {
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6,
+    'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
+
+# E.g. 2019-01-01T12:00:00.123456+02:00, 2019-01-01 12:00:00,123 or
+# 2019-01-01T12:00:00Z.
+ISO8601_RE = re.compile(
+    r'^(\d{4})-(\d{2})-(\d{2})'
+    r'(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,](\d+))?)?)?'
+    r' ?(Z|[+-]\d{2}(?::?\d{2})?)?$')
+
+# Compact date with optional time, e.g. 20190101, 20190101120000,
+# 20190101T1200 or 20190101 120000. Without a separator only 8 or 14 digits
+# are a compact date, other lengths are a time since the epoch.
+COMPACT_RE = re.compile(
+    r'^(\d{4})(\d{2})(\d{2})(?:([T ]?)(\d{2})(\d{2})(\d{2})?)?$')
+
+# Seconds, milliseconds, microseconds or nanoseconds since the epoch. Less
+# than 9 digits is more likely a date like 20190101, and 14 digits a date
+# and time like 20190101120000, which would be after the year 2286 as time
+# since the epoch.
+EPOCH_RE = re.compile(r'^(?!\d{14}$)(\d{9,19})(?:\.(\d+))?$')
+
+# Apache common log format, e.g. 10/Oct/2000:13:55:36 -0700.
+CLF_RE = re.compile(
+    r'^(\d{2})/([A-Za-z]{3})/(\d{4}):(\d{2}):(\d{2}):(\d{2})'
+    r'(?: ([+-]\d{4}))?$')
+
+# RFC 2822, e.g. Tue, 01 Jan 2019 12:00:00 +0000.
+RFC2822_RE = re.compile(
+    r'^(?:[A-Za-z]{3}, )?(\d{1,2}) ([A-Za-z]{3}) (\d{4}) '
+    r'(\d{2}):(\d{2})(?::(\d{2}))? ([+-]\d{4}|GMT|UTC)$')
+
+# Month first like dateutil, e.g. 01/31/2019 01:00:00 PM.
+US_RE = re.compile(
+    r'^(\d{1,2})/(\d{1,2})/(\d{4})[ T](\d{1,2}):(\d{2})(?::(\d{2}))?'
+    r'(?: ?([AaPp][Mm]))?$')
+
+_TZ_CACHE = {}
+
+
+def _get_tzinfo(offset):
+    """Get a time zone object for a UTC offset.
+
+    Args:
+        offset: UTC offset in seconds.
+
+    Returns:
+        Instance of datetime.tzinfo.
+    """
+    tzinfo = _TZ_CACHE.get(offset)
+    if tzinfo is None:
+        tzinfo = tz.tzutc() if offset == 0 else tz.tzoffset(None, offset)
+        _TZ_CACHE[offset] = tzinfo
+    return tzinfo
+
+
+def _parse_offset(value):
+    """Parse a UTC offset.
+
+    Args:
+        value: Offset like Z, +02, +0200 or -02:00, or None.
+
+    Returns:
+        Offset in seconds or None if there is no offset.
+    """
+    if not value:
+        return None
+    if value in ('Z', 'GMT', 'UTC'):
+        return 0
+    digits = value[1:].replace(':', '')
+    seconds = int(digits[:2]) * 3600 + int(digits[2:4] or 0) * 60
+    return -seconds if value[0] == '-' else seconds
+
+
+def _parse_fraction(value):
+    """Parse the fraction of a second.
+
+    Args:
+        value: Digits after the decimal point or None.
+
+    Returns:
+        Microseconds, extra digits are truncated.
+    """
+    if not value:
+        return 0
+    return int(value[:6].ljust(6, '0'))
+
+
+def _parse_iso8601(value):
+    """Parse an ISO 8601 datetime.
+
+    Args:
+        value: Datetime string.
+
+    Returns:
+        Tuple with a naive datetime and the UTC offset in seconds or None,
+        or None if the value doesn't match.
+    """
+    match = ISO8601_RE.match(value)
+    if not match:
+        return None
+    year, month, day, hour, minute, second, fraction, offset = (
+        match.groups())
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+        int(second or 0), _parse_fraction(fraction)), _parse_offset(offset)
+
+
+def _parse_compact(value):
+    """Parse a compact date with an optional time.
+
+    Args:
+        value: Datetime string.
+
+    Returns:
+        Tuple with a naive datetime and None as UTC offset, or None if the
+        value doesn't match.
+
+    Raises:
+        ValueError if the value matches but isn't a valid date, e.g. a time
+        since the epoch.
+    """
+    match = COMPACT_RE.match(value)
+    if not match:
+        return None
+    year, month, day, separator, hour, minute, second = match.groups()
+    if hour and not separator and not second:
+        # 12 digits, e.g. milliseconds since the epoch.
+        return None
+    return datetime.datetime(
+        int(year), int(month), int(day), int(hour or 0), int(minute or 0),
+        int(second or 0)), None
+
+
+def _parse_epoch(value):
+    """Parse a number of seconds, milli-, micro- or nanoseconds since the
+    epoch.
+
+    Args:
+        value: Datetime string.
+
+    Returns:
+        Tuple with a naive datetime and a UTC offset of 0, or None if the
+        value doesn't match.
+    """
+    match = EPOCH_RE.match(value)
+    if not match:
+        return None
+    return _epoch_to_datetime(int(match.group(1)), match.group(2)), 0
+
+
+def _parse_clf(value):
+    """Parse a datetime in Apache common log format.
+
+    Args:
+        value: Datetime string.
+
+    Returns:
+        Tuple with a naive datetime and the UTC offset in seconds or None,
+        or None if the value doesn't match.
+    """
+    match = CLF_RE.match(value)
+    if not match:
+        return None
+    day, month, year, hour, minute, second, offset = match.groups()
+    month = MONTHS.get(month.lower())
+    if not month:
+        return None
+    return datetime.datetime(
+        int(year), month, int(day), int(hour), int(minute),
+        int(second)), _parse_offset(offset)
+
+
+def _parse_rfc2822(value):
+    """Parse an RFC 2822 datetime.
+
+    Args:
+        value: Datetime string.
+
+    Returns:
+        Tuple with a naive datetime and the UTC offset in seconds, or None
+        if the value doesn't match.
+    """
+    match = RFC2822_RE.match(value)
+    if not match:
+        return None
+    day, month, year, hour, minute, second, offset = match.groups()
+    month = MONTHS.get(month.lower())
+    if not month:
+        return None
+    return datetime.datetime(
+        int(year), month, int(day), int(hour), int(minute),
+        int(second or 0)), _parse_offset(offset)
+
+
+def _parse_us(value):
+    """Parse a month first datetime, like dateutil does by default.
+
+    Args:
+        value: Datetime string.
+
+    Returns:
+        Tuple with a naive datetime and None as UTC offset, or None if the
+        value doesn't match.
+    """
+    match = US_RE.match(value)
+    if not match:
+        return None
+    month, day, year, hour, minute, second, meridiem = match.groups()
+    hour = int(hour)
+    if meridiem:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.lower() == 'pm' else 0)
+    return datetime.datetime(
+        int(year), int(month), int(day), hour, int(minute),
+        int(second or 0)), None
+
+
+def _epoch_to_datetime(number, fraction=None):
+    """Convert a time since the epoch to a datetime.
+
+    The unit is derived from the magnitude of the number, which works for
+    dates between 1973 and 5138.
+
+    Args:
+        number: Integer with the time since the epoch.
+        fraction: Optional digits after the decimal point.
+
+    Returns:
+        Naive datetime in UTC.
+    """
+    if abs(number) < 10**11:
+        microseconds = number * 10**6 + _parse_fraction(fraction)
+    elif abs(number) < 10**14:
+        microseconds = number * 1000
+    elif abs(number) < 10**17:
+        microseconds = number
+    else:
+        microseconds = number // 1000
+    return EPOCH + datetime.timedelta(microseconds=microseconds)
+
+
+def _format(parsed_datetime, offset):
+    """Get the ISO 8601 datetime and the timestamp of a parsed datetime.
+
+    Args:
+        parsed_datetime: Naive datetime.
+        offset: UTC offset in seconds or None if the datetime has no time
+            zone.
+
+    Returns:
+        Tuple with the datetime in ISO 8601 format and the timestamp in
+        microseconds since the epoch in UTC.
+    """
+    delta = parsed_datetime - EPOCH
+    timestamp = (
+        (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds)
+    if offset is None:
+        return parsed_datetime.isoformat(), timestamp
+    iso_datetime = parsed_datetime.replace(
+        tzinfo=_get_tzinfo(offset)).isoformat()
+    return iso_datetime, timestamp - offset * 10**6
+
+
+class DatetimeNormalizer(object):
+    """Normalizes the datetimes of a file.
+
+    A file almost always has a single datetime format. The first parser that
+    matches is remembered and tried first for the next datetime, the other
+    fast parsers are tried when it doesn't match. dateutil, which is a lot
+    slower, is only used for datetimes that none of them match.
+
+    Attributes:
+        fallbacks: Number of datetimes that were parsed with dateutil.
+    """
+
+    FAST_PARSERS = [
+        _parse_iso8601, _parse_compact, _parse_epoch, _parse_clf,
+        _parse_rfc2822, _parse_us]
+
+    def __init__(self):
+        """Initialize the normalizer."""
+        super(DatetimeNormalizer, self).__init__()
+        self.fallbacks = 0
+        self._parser = None
+
+    def normalize(self, value):
+        """Normalize a datetime.
+
+        Args:
+            value: Datetime string, or a number of seconds, milli-, micro- or
+                nanoseconds since the epoch.
+
+        Returns:
+            Tuple with the datetime in ISO 8601 format and the timestamp in
+            microseconds since the epoch in UTC.
+
+        Raises:
+            ValueError if the datetime can't be parsed.
+        """
+        if not isinstance(value, six.string_types):
+            return normalize_timestamp(value)
+        value = value.strip()
+
+        fast_parsers = self.FAST_PARSERS
+        if self._parser:
+            fast_parsers = [self._parser] + [
+                fast_parser for fast_parser in self.FAST_PARSERS
+                if fast_parser is not self._parser]
+
+        for fast_parser in fast_parsers:
+            try:
+                result = fast_parser(value)
+            except (OverflowError, ValueError):
+                # Matched, but e.g. the day is out of range.
+                continue
+            if result:
+                self._parser = fast_parser
+                return _format(*result)
+
+        self.fallbacks += 1
+        try:
+            parsed_datetime = parser.parse(value)
+        except (OverflowError, TypeError) as e:
+            raise ValueError('Unable to parse datetime: {0!s}'.format(e))
+
+        offset = None
+        if parsed_datetime.tzinfo:
+            utc_offset = parsed_datetime.utcoffset()
+            offset = utc_offset.days * 86400 + utc_offset.seconds
+        return _format(parsed_datetime.replace(tzinfo=None), offset)
+
+
+def normalize_datetime(value):
+    """Normalize a single datetime.
+
+    Use a DatetimeNormalizer for the datetimes of a file.
+
+    Args:
+        value: Datetime string.
+
+    Returns:
+        Tuple with the datetime in ISO 8601 format and the timestamp in
+        microseconds since the epoch in UTC.
+
+    Raises:
+        ValueError if the datetime can't be parsed.
+    """
+    return DatetimeNormalizer().normalize(value)
+
+
+def normalize_timestamp(value):
+    """Normalize a time since the epoch.
+
+    Args:
+        value: Number of seconds, milli-, micro- or nanoseconds since the
+            epoch, as number or string.
+
+    Returns:
+        Tuple with the datetime in ISO 8601 format and the timestamp in
+        microseconds since the epoch in UTC.
+
+    Raises:
+        ValueError if the value isn't a number.
+    """
+    if isinstance(value, bool):
+        raise ValueError('Invalid timestamp: {0!s}'.format(value))
+    if isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            raise ValueError('Invalid timestamp: {0!s}'.format(value))
+        number = int(value)
+        fraction = '{0:.6f}'.format(abs(value - number))[2:]
+    else:
+        number_string, _, fraction = six.text_type(value).strip().partition(
+            '.')
+        number = int(number_string)
+        if fraction and not fraction.isdigit():
+            raise ValueError('Invalid timestamp: {0!s}'.format(value))
+    try:
+        return _format(_epoch_to_datetime(number, fraction or None), 0)
+    except OverflowError as e:
+        raise ValueError('Invalid timestamp: {0!s}'.format(e))
@@ -0,0 +1,96 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for datetime and timestamp normalization."""
+
+from __future__ import unicode_literals
+
+from timesketch.lib.testlib import BaseTest
+from timesketch.lib.timestamps import DatetimeNormalizer
+from timesketch.lib.timestamps import normalize_datetime
+from timesketch.lib.timestamps import normalize_timestamp
+
+
+class TestTimestamps(BaseTest):
+    """Tests for datetime and timestamp normalization."""
+
+    def test_normalize_datetime(self):
+        """Test that the fast parsers give the same result as dateutil."""
+        expected = {
+            '2015-07-24T19:01:01+02:00':
+                ('2015-07-24T19:01:01+02:00', 1437757261000000),
+            '2015-07-24 17:01:01.25Z':
+                ('2015-07-24T17:01:01.250000+00:00', 1437757261250000),
+            '2015-07-24 17:01:01,250':
+                ('2015-07-24T17:01:01.250000', 1437757261250000),
+            '1437757261':
+                ('2015-07-24T17:01:01+00:00', 1437757261000000),
+            '1437757261250':
+                ('2015-07-24T17:01:01.250000+00:00', 1437757261250000),
+            '946684800000':
+                ('2000-01-01T00:00:00+00:00', 946684800000000),
+            '20150724170101':
+                ('2015-07-24T17:01:01', 1437757261000000),
+            '20150724 1701':
+                ('2015-07-24T17:01:00', 1437757260000000),
+            '20150724T170101':
+                ('2015-07-24T17:01:01', 1437757261000000),
+            '20150724':
+                ('2015-07-24T00:00:00', 1437696000000000),
+            '24/Jul/2015:19:01:01 +0200':
+                ('2015-07-24T19:01:01+02:00', 1437757261000000),
+            'Fri, 24 Jul 2015 17:01:01 GMT':
+                ('2015-07-24T17:01:01+00:00', 1437757261000000),
+            '07/24/2015 05:01:01 PM':
+                ('2015-07-24T17:01:01', 1437757261000000),
+            'Jul 24 2015 19:01:01 +0200':
+                ('2015-07-24T19:01:01+02:00', 1437757261000000),
+        }
+        for value, result in expected.items():
+            self.assertEqual(normalize_datetime(value), result, value)
+
+        self.assertRaises(ValueError, normalize_datetime, 'not a datetime')
+        self.assertRaises(ValueError, normalize_datetime, '2015-02-30')
+
+    def test_format_cache(self):
+        """Test that dateutil is only used when no fast parser matches."""
+        normalizer = DatetimeNormalizer()
+        for value in ('2015-07-24T19:01:01', '1437757261',
+                      '2015-07-24T19:01:02', 'Jul 24 2015 19:01:01'):
+            normalizer.normalize(value)
+        self.assertEqual(normalizer.fallbacks, 1)
+
+    def test_compact_and_epoch(self):
+        """Test that the last parser doesn't change the result."""
+        for first in ('20150724', '1437757261'):
+            normalizer = DatetimeNormalizer()
+            normalizer.normalize(first)
+            self.assertEqual(
+                normalizer.normalize('946684800000'),
+                ('2000-01-01T00:00:00+00:00', 946684800000000))
+            self.assertEqual(
+                normalizer.normalize('20150724170101'),
+                ('2015-07-24T17:01:01', 1437757261000000))
+            self.assertEqual(
+                normalizer.normalize('1437757261000000'),
+                ('2015-07-24T17:01:01+00:00', 1437757261000000))
+
+    def test_normalize_timestamp(self):
+        """Test that timestamps are converted to microseconds."""
+        for value in (1437757261, 1437757261.0, '1437757261000',
+                      1437757261000000, 1437757261000000000):
+            self.assertEqual(
+                normalize_timestamp(value),
+                ('2015-07-24T17:01:01+00:00', 1437757261000000))
+        self.assertRaises(ValueError, normalize_timestamp, 'abc')
+        self.assertRaises(ValueError, normalize_timestamp, True)
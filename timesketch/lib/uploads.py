@@ -0,0 +1,313 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Chunked uploads of timeline files."""
+
+from __future__ import unicode_literals
+
+import codecs
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+import six
+
+# Size of the chunks clients send, small enough to pass reverse proxies.
+DEFAULT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Largest file that can be uploaded in chunks, the space for the file is
+# allocated when the upload starts.
+DEFAULT_UPLOAD_MAX_FILE_SIZE = 50 * 1024 * 1024 * 1024
+
+# Seconds after the last chunk that an upload is considered abandoned.
+DEFAULT_UPLOAD_MAX_AGE = 24 * 60 * 60
+
+
+class ChunkedUpload(object):
+    """File upload that is received in numbered chunks.
+
+    The file is created with its final size in the upload folder and every
+    chunk is written directly at its offset, so chunks can be sent in any
+    order and concurrently, and the file doesn't need to be assembled when
+    the upload is finished. The upload state is kept next to the file, so
+    that it is shared by all web server processes:
+
+        <upload folder>/<upload ID>         The file.
+        <upload folder>/<upload ID>.json    Metadata about the upload.
+        <upload folder>/<upload ID>.chunks/ One file per received chunk.
+
+    Attributes:
+        upload_id: ID of the upload.
+        path: Path to the uploaded file.
+        metadata_path: Path to the metadata of the upload.
+        chunk_folder: Path to the folder with the received chunks.
+        filename: Original name of the file.
+        file_size: Size of the file in bytes.
+        chunk_size: Size of a chunk in bytes, the last one can be smaller.
+        user_id: ID of the user that uploads the file.
+        sketch_id: ID of the sketch to add the timeline to or None.
+        timeline_name: Name of the timeline or None.
+    """
+
+    # Upload IDs are UUIDs, this also makes sure that an ID from a request
+    # can't point outside the upload folder.
+    _UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+    def __init__(self, upload_folder, upload_id, metadata):
+        """Initialize the upload.
+
+        Args:
+            upload_folder: Folder for uploaded files.
+            upload_id: ID of the upload.
+            metadata: Dictionary with the metadata of the upload.
+        """
+        super(ChunkedUpload, self).__init__()
+        self.upload_id = upload_id
+        self.path = os.path.join(upload_folder, upload_id)
+        self.filename = metadata['filename']
+        self.file_size = metadata['file_size']
+        self.chunk_size = metadata['chunk_size']
+        self.user_id = metadata['user_id']
+        self.sketch_id = metadata.get('sketch_id')
+        self.timeline_name = metadata.get('timeline_name')
+        self.metadata_path = self.path + '.json'
+        self.chunk_folder = self.path + '.chunks'
+
+    @classmethod
+    def create(cls, upload_folder, filename, file_size, chunk_size, user_id,
+               sketch_id=None, timeline_name=None,
+               max_file_size=DEFAULT_UPLOAD_MAX_FILE_SIZE):
+        """Start a new upload.
+
+        Args:
+            upload_folder: Folder for uploaded files.
+            filename: Original name of the file.
+            file_size: Size of the file in bytes.
+            chunk_size: Size of a chunk in bytes.
+            user_id: ID of the user that uploads the file.
+            sketch_id: Optional ID of the sketch to add the timeline to.
+            timeline_name: Optional name of the timeline.
+            max_file_size: Largest file size in bytes that is accepted.
+
+        Returns:
+            Instance of ChunkedUpload.
+
+        Raises:
+            ValueError if the file or chunk size is invalid.
+        """
+        if file_size < 1 or chunk_size < 1:
+            raise ValueError('File and chunk size must be positive')
+        if file_size > max_file_size:
+            raise ValueError(
+                'File is larger than the maximum of {0:d} bytes'.format(
+                    max_file_size))
+
+        upload_id = uuid.uuid4().hex
+        if not isinstance(upload_id, six.text_type):
+            upload_id = codecs.decode(upload_id, 'utf-8')
+
+        metadata = {
+            'filename': filename,
+            'file_size': file_size,
+            'chunk_size': chunk_size,
+            'user_id': user_id,
+            'sketch_id': sketch_id,
+            'timeline_name': timeline_name,
+        }
+        upload = cls(upload_folder, upload_id, metadata)
+
+        os.mkdir(upload.chunk_folder)
+        with open(upload.path, 'wb') as fh:
+            fh.truncate(file_size)
+        with io.open(upload.metadata_path, 'w', encoding='utf-8') as fh:
+            fh.write(six.text_type(json.dumps(metadata)))
+        return upload
+
+    @classmethod
+    def load(cls, upload_folder, upload_id):
+        """Load an upload that is in progress.
+
+        Args:
+            upload_folder: Folder for uploaded files.
+            upload_id: ID of the upload.
+
+        Returns:
+            Instance of ChunkedUpload.
+
+        Raises:
+            KeyError if there is no such upload in progress.
+        """
+        if not cls._UPLOAD_ID_RE.match(upload_id):
+            raise KeyError(upload_id)
+
+        metadata_path = os.path.join(upload_folder, upload_id + '.json')
+        try:
+            with io.open(metadata_path, 'r', encoding='utf-8') as fh:
+                metadata = json.load(fh)
+        except (IOError, OSError):
+            raise KeyError(upload_id)
+        return cls(upload_folder, upload_id, metadata)
+
+    @classmethod
+    def remove_stale(cls, upload_folder, max_age=DEFAULT_UPLOAD_MAX_AGE):
+        """Remove uploads that have not received a chunk for a while.
+
+        Uploads in progress have a chunk folder. Finished uploads only have
+        the file, which is left for the import.
+
+        Args:
+            upload_folder: Folder for uploaded files.
+            max_age: Seconds since the last chunk after which an upload is
+                abandoned.
+
+        Returns:
+            List of IDs of the removed uploads.
+        """
+        removed = []
+        now = time.time()
+        for name in os.listdir(upload_folder):
+            upload_id, extension = os.path.splitext(name)
+            if extension != '.chunks' or not cls._UPLOAD_ID_RE.match(
+                    upload_id):
+                continue
+
+            # The file is written and a file is added to the chunk folder
+            # for every chunk.
+            path = os.path.join(upload_folder, upload_id)
+            chunk_folder = path + '.chunks'
+            last_chunk = 0
+            for activity_path in (path, chunk_folder):
+                try:
+                    last_chunk = max(
+                        last_chunk, os.path.getmtime(activity_path))
+                except OSError:
+                    pass
+            if now - last_chunk < max_age:
+                continue
+
+            for stale_path in (path, path + '.json'):
+                try:
+                    os.remove(stale_path)
+                except OSError:
+                    pass
+            shutil.rmtree(chunk_folder, ignore_errors=True)
+            removed.append(upload_id)
+        return removed
+
+    @property
+    def chunk_count(self):
+        """Number of chunks of the file."""
+        return (self.file_size + self.chunk_size - 1) // self.chunk_size
+
+    def chunk_length(self, index):
+        """Get the size of a chunk.
+
+        Args:
+            index: Index of the chunk, starting at 0.
+
+        Returns:
+            Size of the chunk in bytes.
+        """
+        return min(self.chunk_size, self.file_size - index * self.chunk_size)
+
+    def write_chunk(self, index, data, checksum):
+        """Write a chunk to the file.
+
+        Args:
+            index: Index of the chunk, starting at 0.
+            data: Bytes of the chunk.
+            checksum: Hex encoded SHA-256 digest of the chunk.
+
+        Raises:
+            ValueError if the index, size or checksum is wrong.
+        """
+        if not 0 <= index < self.chunk_count:
+            raise ValueError('Invalid chunk index: {0:d}'.format(index))
+
+        if len(data) != self.chunk_length(index):
+            raise ValueError(
+                'Chunk {0:d} must be {1:d} bytes, got {2:d}'.format(
+                    index, self.chunk_length(index), len(data)))
+
+        if hashlib.sha256(data).hexdigest() != (checksum or '').lower():
+            raise ValueError(
+                'Checksum mismatch for chunk {0:d}'.format(index))
+
+        with open(self.path, 'r+b') as fh:
+            fh.seek(index * self.chunk_size)
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+
+        # Only mark the chunk as received when it is on disk.
+        with open(os.path.join(self.chunk_folder, str(index)), 'w'):
+            pass
+
+    def received_chunks(self):
+        """Get the chunks that have been received.
+
+        Returns:
+            Sorted list of chunk indices.
+        """
+        return sorted(
+            int(name) for name in os.listdir(self.chunk_folder)
+            if name.isdigit())
+
+    def missing_chunks(self):
+        """Get the chunks that still need to be sent.
+
+        Returns:
+            Sorted list of chunk indices.
+        """
+        received = set(self.received_chunks())
+        return [
+            index for index in range(self.chunk_count)
+            if index not in received]
+
+    def finish(self):
+        """Finish the upload when all chunks have been received.
+
+        Returns:
+            Path to the uploaded file.
+
+        Raises:
+            ValueError if chunks are missing.
+        """
+        missing = self.missing_chunks()
+        if missing:
+            raise ValueError('Missing {0:d} chunk(s), first: {1:d}'.format(
+                len(missing), missing[0]))
+
+        os.remove(self.metadata_path)
+        shutil.rmtree(self.chunk_folder)
+        return self.path
+
+    def to_dict(self):
+        """Get the state of the upload.
+
+        Returns:
+            Dictionary with the upload ID, chunk size and count, and the
+            missing chunks.
+        """
+        return {
+            'upload_id': self.upload_id,
+            'file_size': self.file_size,
+            'chunk_size': self.chunk_size,
+            'chunk_count': self.chunk_count,
+            'missing_chunks': self.missing_chunks(),
+        }
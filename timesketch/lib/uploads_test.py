@@ -0,0 +1,107 @@
+# Copyright 2019 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for chunked uploads."""
+
+from __future__ import unicode_literals
+
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
+from timesketch.lib.testlib import BaseTest
+from timesketch.lib.uploads import ChunkedUpload
+
+
+class TestChunkedUpload(BaseTest):
+    """Tests for chunked uploads."""
+
+    def setUp(self):
+        """Create an upload folder."""
+        super(TestChunkedUpload, self).setUp()
+        self.upload_folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_folder)
+
+    def test_upload(self):
+        """Test that chunks can be sent in any order."""
+        data = b'0123456789abcdefghij'
+        upload = ChunkedUpload.create(
+            self.upload_folder, 'timeline.csv', len(data), 8, user_id=1)
+        self.assertEqual(upload.chunk_count, 3)
+        self.assertEqual(upload.missing_chunks(), [0, 1, 2])
+
+        upload = ChunkedUpload.load(self.upload_folder, upload.upload_id)
+        for index in (2, 0):
+            chunk = data[index * 8:index * 8 + 8]
+            upload.write_chunk(
+                index, chunk, hashlib.sha256(chunk).hexdigest())
+        self.assertEqual(upload.missing_chunks(), [1])
+        self.assertRaises(ValueError, upload.finish)
+
+        chunk = data[8:16]
+        upload.write_chunk(1, chunk, hashlib.sha256(chunk).hexdigest())
+        path = upload.finish()
+        with open(path, 'rb') as fh:
+            self.assertEqual(fh.read(), data)
+        self.assertEqual(os.listdir(self.upload_folder), [upload.upload_id])
+        self.assertRaises(
+            KeyError, ChunkedUpload.load, self.upload_folder, upload.upload_id)
+
+    def test_invalid_chunk(self):
+        """Test that invalid chunks are rejected."""
+        upload = ChunkedUpload.create(
+            self.upload_folder, 'timeline.csv', 10, 8, user_id=1)
+        checksum = hashlib.sha256(b'01').hexdigest()
+        self.assertRaises(ValueError, upload.write_chunk, 2, b'01', checksum)
+        self.assertRaises(ValueError, upload.write_chunk, 1, b'012', checksum)
+        self.assertRaises(ValueError, upload.write_chunk, 1, b'10', checksum)
+        upload.write_chunk(1, b'01', checksum.upper())
+        self.assertEqual(upload.received_chunks(), [1])
+
+    def test_max_file_size(self):
+        """Test that files larger than the maximum are rejected."""
+        self.assertRaises(
+            ValueError, ChunkedUpload.create, self.upload_folder,
+            'timeline.csv', 11, 8, user_id=1, max_file_size=10)
+        self.assertEqual(os.listdir(self.upload_folder), [])
+
+    def test_remove_stale(self):
+        """Test that only abandoned uploads are removed."""
+        stale = ChunkedUpload.create(
+            self.upload_folder, 'timeline.csv', 10, 8, user_id=1)
+        active = ChunkedUpload.create(
+            self.upload_folder, 'timeline.csv', 10, 8, user_id=1)
+        finished = ChunkedUpload.create(
+            self.upload_folder, 'timeline.csv', 2, 8, user_id=1)
+        finished.write_chunk(0, b'01', hashlib.sha256(b'01').hexdigest())
+        finished.finish()
+
+        last_chunk = time.time() - 3600
+        for path in (stale.path, stale.chunk_folder, finished.path):
+            os.utime(path, (last_chunk, last_chunk))
+
+        self.assertEqual(
+            ChunkedUpload.remove_stale(self.upload_folder, max_age=60),
+            [stale.upload_id])
+        self.assertEqual(sorted(os.listdir(self.upload_folder)), sorted([
+            active.upload_id, active.upload_id + '.json',
+            active.upload_id + '.chunks', finished.upload_id]))
+
+    def test_load_invalid_id(self):
+        """Test that upload IDs can't point outside the upload folder."""
+        self.assertRaises(
+            KeyError, ChunkedUpload.load, self.upload_folder, '../etc/passwd')
+        self.assertRaises(
+            KeyError, ChunkedUpload.load, self.upload_folder, 'a' * 32)
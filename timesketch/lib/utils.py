@@ -15,23 +15,103 @@
 
 from __future__ import unicode_literals
 
+import base64
+import binascii
+import bz2
+import collections
 import colorsys
 import csv
-import datetime
 import email
+import gzip
+import hashlib
+import io
+import itertools
 import json
+import math
+import mmap
+import os
 import random
 import smtplib
 import sys
-import time
+import warnings
 
-from dateutil import parser
+import billiard
 from flask import current_app
+import numpy
+import pandas
+import six
+
+from timesketch.lib.timestamps import DatetimeNormalizer
+from timesketch.lib.timestamps import normalize_timestamp
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
 
 
 # Set CSV field size limit to systems max value.
 csv.field_size_limit(sys.maxsize)
 
+# Columns that must be present in the CSV file
+CSV_MANDATORY_FIELDS = ['message', 'datetime', 'timestamp_desc']
+
+# Number of CSV rows to parse at a time.
+DEFAULT_CSV_CHUNK_SIZE = 10000
+
+# Number of times to parse the datetimes of a chunk before falling back to
+# parsing them row by row.
+CSV_DATETIME_PASSES = 3
+
+# Timeline file types that can be uploaded and the ones that can also be
+# uploaded compressed.
+TIMELINE_EXTENSIONS = ['plaso', 'csv', 'jsonl', 'parquet', 'arrow']
+COMPRESSIBLE_EXTENSIONS = ['csv', 'jsonl']
+
+# Columnar file types, they are compressed internally and are read as a
+# whole instead of in byte ranges.
+COLUMNAR_EXTENSIONS = ['parquet', 'arrow']
+
+# Columns that must be present in Parquet and Arrow files, in addition to
+# a datetime or timestamp column.
+COLUMNAR_MANDATORY_FIELDS = ['message', 'timestamp_desc']
+
+# Number of rows of a Parquet or Arrow file to convert to events at a time.
+DEFAULT_COLUMNAR_BATCH_SIZE = 10000
+
+# Magic bytes of Arrow IPC files, Arrow IPC streams don't have them.
+ARROW_FILE_MAGIC = b'ARROW1'
+
+# Magic bytes of the supported compression formats by file name extension.
+COMPRESSION_MAGIC = collections.OrderedDict([
+    ('gz', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00'),
+    ('zst', b'\x28\xb5\x2f\xfd'),
+])
+
+# Fields that must be present in each entry of a JSONL file.
+JSONL_MANDATORY_FIELDS = ['message', 'datetime', 'timestamp_desc']
+
+JSONL_PARSE_ERROR = 'Error parsing JSON at line {0:n}: {1!s}'
+JSONL_MISSING_FIELDS_ERROR = 'Missing field(s) at line {0:n}: {1!s}'
+
+# Approximate number of bytes of a JSONL file decoded by one process at a
+# time.
+DEFAULT_JSONL_RANGE_SIZE = 16 * 1024 * 1024
+
 
 def random_color():
     """Generates a random color.
@@ -48,6 +128,40 @@ def random_color():
 
 
 
+def _validate_csv_header(csv_header):
+    """Check that all mandatory fields are in a CSV header.
+
+    Args:
+        csv_header: List of column names.
+
+    Raises:
+        RuntimeError if mandatory fields are missing.
+    """
+    missing_fields = []
+    for field in CSV_MANDATORY_FIELDS:
+        if field not in csv_header:
+            missing_fields.append(field)
+    if missing_fields:
+        raise RuntimeError(
+            'Missing fields in CSV header: {0:s}'.format(
+                ','.join(missing_fields)))
+
+
+def _normalize_csv_row(row, normalizer):
+    """Normalize the datetime of a CSV row and add the timestamp.
+
+    Args:
+        row: Dictionary with the CSV row.
+        normalizer: Instance of DatetimeNormalizer for the file.
+
+    Raises:
+        ValueError if the datetime can't be parsed.
+    """
+    # normalize datetime to ISO 8601 format if it's not the case.
+    row['datetime'], timestamp = normalizer.normalize(row['datetime'])
+    row['timestamp'] = str(timestamp)
+
+
 def read_and_validate_csv(path, delimiter=','):
     """Generator for reading a CSV file.
 
@@ -55,37 +169,356 @@ def read_and_validate_csv(path, delimiter=','):
         path: Path to the CSV file
         delimiter: character used as a field separator, default: ','
     """
-    # Columns that must be present in the CSV file
-    mandatory_fields = ['message', 'datetime', 'timestamp_desc']
-
+    normalizer = DatetimeNormalizer()
     with open(path, 'r') as fh:
         reader = csv.DictReader(fh, delimiter=delimiter)
-        csv_header = reader.fieldnames
-        missing_fields = []
-        # Validate the CSV header
-        for field in mandatory_fields:
-            if field not in csv_header:
-                missing_fields.append(field)
-        if missing_fields:
-            raise RuntimeError(
-                'Missing fields in CSV header: {0:s}'.format(
-                    ','.join(missing_fields)))
+        _validate_csv_header(reader.fieldnames)
         for row in reader:
             try:
-                # normalize datetime to ISO 8601 format if it's not the case.
-                parsed_datetime = parser.parse(row['datetime'])
-                row['datetime'] = parsed_datetime.isoformat()
-
-                normalized_timestamp = int(
-                    time.mktime(parsed_datetime.utctimetuple()) * 1000000)
-                normalized_timestamp += parsed_datetime.microsecond
-                row['timestamp'] = str(normalized_timestamp)
+                _normalize_csv_row(row, normalizer)
             except ValueError:
                 continue
 
             yield row
 
 
+def _format_utc_offset(offset):
+    """Format a UTC offset like datetime.isoformat() does.
+
+    Args:
+        offset: UTC offset as datetime.timedelta.
+
+    Returns:
+        String with the offset, e.g. +02:00.
+    """
+    seconds = int(offset.total_seconds())
+    sign = '-' if seconds < 0 else '+'
+    hours, minutes = divmod(abs(seconds) // 60, 60)
+    return '{0:s}{1:02d}:{2:02d}'.format(sign, hours, minutes)
+
+
+def _parse_csv_datetimes(datetimes):
+    """Parse a column of datetimes at once.
+
+    Args:
+        datetimes: pandas.Series with datetime strings, indexed by row
+            position.
+
+    Returns:
+        Dictionary with row position as key and a tuple of the datetime in
+        ISO 8601 format and the timestamp in microseconds as value. Rows that
+        could not be parsed are left out.
+    """
+    try:
+        with warnings.catch_warnings():
+            # Newer pandas versions warn when they fall back to dateutil.
+            warnings.simplefilter('ignore')
+            parsed = pandas.to_datetime(datetimes, errors='coerce')
+    except (TypeError, ValueError):
+        # E.g. mixed time zones.
+        return {}
+    if not pandas.api.types.is_datetime64_any_dtype(parsed):
+        return {}
+
+    suffix = ''
+    local = utc = parsed
+    tz = getattr(parsed.dt, 'tz', None)
+    if tz is not None:
+        offset = tz.utcoffset(None)
+        if offset is None:
+            # Time zone with daylight saving time.
+            return {}
+        suffix = _format_utc_offset(offset)
+        local = parsed.dt.tz_localize(None)
+        utc = parsed.dt.tz_convert('UTC').dt.tz_localize(None)
+
+    valid = parsed.notna()
+    local = local[valid]
+    timestamps = (utc[valid] - pandas.Timestamp(0)) // pandas.Timedelta(
+        microseconds=1)
+    full = local.dt.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    # isoformat() leaves out the fraction when there are no microseconds.
+    iso_datetimes = full.where(
+        local.dt.microsecond != 0, full.str.slice(0, 19)) + suffix
+
+    return dict(zip(local.index.tolist(), zip(
+        iso_datetimes.tolist(), timestamps.astype(str).tolist())))
+
+
+def _parse_datetime_column(datetimes):
+    """Parse a column of datetimes in several passes.
+
+    Args:
+        datetimes: pandas.Series with datetime strings or datetimes, indexed
+            by row position.
+
+    Returns:
+        Dictionary with row position as key and a tuple of the datetime in
+        ISO 8601 format and the timestamp in microseconds as value. Rows that
+        could not be parsed are left out.
+    """
+    normalized = {}
+    for _ in range(CSV_DATETIME_PASSES):
+        parsed = _parse_csv_datetimes(datetimes)
+        if not parsed:
+            break
+        normalized.update(parsed)
+        datetimes = datetimes.drop(list(parsed))
+        if datetimes.empty:
+            break
+    return normalized
+
+
+def _normalize_csv_chunk(chunk, normalizer):
+    """Normalize datetimes of a chunk of CSV rows.
+
+    Datetimes are parsed for the whole chunk at once. Newer pandas versions
+    guess the format from the first value, so values that did not match are
+    parsed again in another pass. What is left after that is parsed row by
+    row like in read_and_validate_csv().
+
+    Args:
+        chunk: pandas.DataFrame with the CSV rows as strings.
+        normalizer: Instance of DatetimeNormalizer for the file.
+
+    Yields:
+        Dictionary per row, rows with an invalid datetime are skipped.
+    """
+    normalized = _parse_datetime_column(
+        chunk['datetime'].reset_index(drop=True))
+
+    columns = list(chunk.columns)
+    rows = zip(*[chunk[column].tolist() for column in columns])
+    for position, values in enumerate(rows):
+        row = dict(zip(columns, values))
+        if position in normalized:
+            row['datetime'], row['timestamp'] = normalized[position]
+        else:
+            try:
+                _normalize_csv_row(row, normalizer)
+            except ValueError:
+                continue
+        yield row
+
+
+class _ByteRangeFile(io.RawIOBase):
+    """Read only file object for a byte range of a file."""
+
+    def __init__(self, path, start, end):
+        """Initialize the file object.
+
+        Args:
+            path: Path to the file.
+            start: Offset of the first byte to read.
+            end: Offset after the last byte to read.
+        """
+        super(_ByteRangeFile, self).__init__()
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self._remaining = end - start
+
+    def readable(self):
+        """Returns True, the file object is readable."""
+        return True
+
+    def readinto(self, buffer):
+        """Read bytes into a buffer up to the end of the range.
+
+        Args:
+            buffer: Writable buffer.
+
+        Returns:
+            Number of bytes read, 0 at the end of the range.
+        """
+        size = min(len(buffer), self._remaining)
+        if size <= 0:
+            return 0
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        """Close the underlying file."""
+        self._file.close()
+        super(_ByteRangeFile, self).close()
+
+
+class _StreamFile(io.RawIOBase):
+    """Read only file object for a decompression stream."""
+
+    def __init__(self, stream, source_file):
+        """Initialize the file object.
+
+        Args:
+            stream: Object with a read() method that returns decompressed
+                bytes.
+            source_file: File object the stream reads from.
+        """
+        super(_StreamFile, self).__init__()
+        self._stream = stream
+        self._source_file = source_file
+
+    def readable(self):
+        """Returns True, the file object is readable."""
+        return True
+
+    def readinto(self, buffer):
+        """Read decompressed bytes into a buffer.
+
+        Args:
+            buffer: Writable buffer.
+
+        Returns:
+            Number of bytes read, 0 at the end of the stream.
+        """
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        """Close the underlying file."""
+        self._source_file.close()
+        super(_StreamFile, self).close()
+
+
+def split_file_extension(filename):
+    """Split a timeline file name into name, file type and compression.
+
+    Args:
+        filename: Name of the file, e.g. timeline.csv.gz.
+
+    Returns:
+        Tuple with the name without extensions, the lower case file type
+        extension and the compression extension or None, e.g.
+        ('timeline', 'csv', 'gz').
+    """
+    name, extension = os.path.splitext(filename)
+    extension = extension.lstrip('.').lower()
+    compression = None
+    if extension in COMPRESSION_MAGIC:
+        compression = extension
+        name, extension = os.path.splitext(name)
+        extension = extension.lstrip('.').lower()
+    return name, extension, compression
+
+
+def detect_compression(path):
+    """Detect the compression format of a file from its magic bytes.
+
+    Uploaded files are stored without their file name, so the extension
+    can't be used.
+
+    Args:
+        path: Path to the file.
+
+    Returns:
+        Compression extension, e.g. gz, or None if the file isn't
+        compressed.
+    """
+    with open(path, 'rb') as fh:
+        header = fh.read(8)
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def _open_compressed(path, compression):
+    """Open a compressed file for reading decompressed data.
+
+    Args:
+        path: Path to the file.
+        compression: Compression extension, e.g. gz.
+
+    Returns:
+        Binary file object.
+
+    Raises:
+        RuntimeError if the compression format isn't supported.
+    """
+    if compression == 'gz':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(path, 'rb')
+    if compression == 'xz' and lzma:
+        return lzma.open(path, 'rb')
+    if compression == 'zst' and zstandard:
+        source_file = open(path, 'rb')
+        stream = zstandard.ZstdDecompressor().stream_reader(source_file)
+        return io.BufferedReader(_StreamFile(stream, source_file))
+    raise RuntimeError(
+        'Unable to decompress {0:s} files, a Python module is '
+        'missing.'.format(compression))
+
+
+def open_timeline_file(path, byte_range=None):
+    """Open a timeline file, or a byte range of it, for reading.
+
+    Compressed files are decompressed while they are read.
+
+    Args:
+        path: Path to the file.
+        byte_range: Optional tuple with start and end offset, e.g. from
+            split_on_newlines(). Not supported for compressed files.
+
+    Returns:
+        Binary file object.
+
+    Raises:
+        ValueError if a byte range of a compressed file is requested.
+    """
+    compression = detect_compression(path)
+    if compression:
+        if byte_range:
+            raise ValueError(
+                'Unable to read a byte range of a compressed file.')
+        return _open_compressed(path, compression)
+
+    if not byte_range:
+        return open(path, 'rb')
+    start, end = byte_range
+    return io.BufferedReader(_ByteRangeFile(path, start, end))
+
+
+def read_and_validate_csv_chunked(
+        path, delimiter=',', chunk_size=DEFAULT_CSV_CHUNK_SIZE,
+        byte_range=None):
+    """Generator for reading a CSV file in chunks.
+
+    Gives the same result as read_and_validate_csv(), but rows are parsed
+    and datetimes are normalized a chunk at a time, which is a lot faster
+    for large files. Timestamps are always calculated in UTC, the row
+    reader only does so on servers that run in UTC.
+
+    Args:
+        path: Path to the CSV file
+        delimiter: character used as a field separator, default: ','
+        chunk_size: Number of rows to parse at a time.
+        byte_range: Optional tuple with start and end offset of the rows
+            to read. The range must start and end on a row boundary, the
+            header is always read from the start of the file.
+    """
+    read_options = dict(
+        sep=delimiter, dtype=six.text_type, keep_default_na=False,
+        na_filter=False, encoding='utf-8')
+
+    with open_timeline_file(path) as fh:
+        csv_header = pandas.read_csv(fh, nrows=0, **read_options).columns
+    _validate_csv_header(list(csv_header))
+
+    if byte_range and byte_range[0] > 0:
+        # Rows in the middle of the file don't have a header line.
+        read_options.update(header=None, names=list(csv_header))
+
+    normalizer = DatetimeNormalizer()
+    with open_timeline_file(path, byte_range) as fh:
+        reader = pandas.read_csv(fh, chunksize=chunk_size, **read_options)
+        for chunk in reader:
+            for row in _normalize_csv_chunk(chunk, normalizer):
+                yield row
+
+
 def read_and_validate_redline(path):
     """Generator for reading a Redline CSV file.
     Args:
@@ -96,7 +529,7 @@ def read_and_validate_redline(path):
     # check if it is the right redline format
     mandatory_fields = ['Alert', 'Tag', 'Timestamp', 'Field', 'Summary']
 
-    with open(path, 'rb') as fh:
+    with open(path, 'r') as fh:
         csv.register_dialect('myDialect',
                              delimiter=',',
                              quoting=csv.QUOTE_ALL,
@@ -112,11 +545,10 @@ def read_and_validate_redline(path):
         if missing_fields:
             raise RuntimeError(
                 'Missing fields in CSV header: {0:s}'.format(missing_fields))
+        normalizer = DatetimeNormalizer()
         for row in reader:
 
-            dt = parser.parse(row['Timestamp'])
-            timestamp = int(time.mktime(dt.timetuple())) * 1000
-            dt_iso_format = dt.isoformat()
+            dt_iso_format, timestamp = normalizer.normalize(row['Timestamp'])
             timestamp_desc = row['Field']
 
             summary = row['Summary']
@@ -135,43 +567,471 @@ def read_and_validate_redline(path):
             yield row_to_yield
 
 
-def read_and_validate_jsonl(path):
+def _validate_columnar_schema(names):
+    """Check that all mandatory columns are in a Parquet or Arrow schema.
+
+    Args:
+        names: List of column names.
+
+    Raises:
+        RuntimeError if mandatory columns are missing.
+    """
+    missing_fields = [
+        field for field in COLUMNAR_MANDATORY_FIELDS if field not in names]
+    if 'datetime' not in names and 'timestamp' not in names:
+        missing_fields.append('datetime')
+    if missing_fields:
+        raise RuntimeError(
+            'Missing fields in file schema: {0:s}'.format(
+                ','.join(missing_fields)))
+
+
+def _epoch_to_datetimes(values):
+    """Convert a column of times since the epoch to datetimes.
+
+    The unit is derived from the magnitude of each value, like
+    timesketch.lib.timestamps.normalize_timestamp() does.
+
+    Args:
+        values: pandas.Series with seconds, milli-, micro- or nanoseconds
+            since the epoch.
+
+    Returns:
+        pandas.Series with datetimes in UTC, NaT for invalid values.
+    """
+    numbers = pandas.to_numeric(values, errors='coerce')
+    magnitude = numbers.abs()
+    microseconds = numpy.select(
+        [magnitude < 10**11, magnitude < 10**14, magnitude < 10**17],
+        [numbers * 10**6, numbers * 1000, numbers], numbers / 1000)
+    return pandas.Series(pandas.to_datetime(
+        microseconds, unit='us', utc=True, errors='coerce'),
+                         index=values.index)
+
+
+def _get_columnar_datetimes(table):
+    """Get the datetimes of a Parquet or Arrow table as one column.
+
+    Native timestamp columns are converted to UTC and numeric columns from
+    times since the epoch, the datetime column is used when there is one and
+    the timestamp column otherwise.
+
+    Args:
+        table: pyarrow.RecordBatch.
+
+    Returns:
+        pandas.Series with datetime strings or datetimes, indexed by row
+        position.
+    """
+    names = table.schema.names
+    name = 'datetime' if 'datetime' in names else 'timestamp'
+    datetimes = table.column(names.index(name)).to_pandas()
+    datetimes = pandas.Series(datetimes).reset_index(drop=True)
+
+    if pandas.api.types.is_datetime64_any_dtype(datetimes):
+        if getattr(datetimes.dt, 'tz', None) is not None:
+            datetimes = datetimes.dt.tz_convert('UTC')
+        return datetimes
+    if name == 'timestamp' or pandas.api.types.is_numeric_dtype(datetimes):
+        return _epoch_to_datetimes(datetimes)
+    return datetimes
+
+
+def _normalize_columnar_table(table, normalizer):
+    """Convert the rows of a Parquet or Arrow table to events.
+
+    Datetimes are normalized for the whole table at once, other columns are
+    converted to Python values column by column. Empty values are left out.
+
+    Args:
+        table: pyarrow.RecordBatch.
+        normalizer: Instance of DatetimeNormalizer for the file.
+
+    Yields:
+        Dictionary per row, rows with an invalid datetime are skipped.
+    """
+    normalized = _parse_datetime_column(_get_columnar_datetimes(table))
+    columns = table.to_pydict()
+    names = list(columns)
+    source = 'datetime' if 'datetime' in columns else 'timestamp'
+
+    rows = zip(*[columns[name] for name in names])
+    for position, values in enumerate(rows):
+        row = {
+            name: value for name, value in zip(names, values)
+            if value is not None and not (
+                isinstance(value, float) and math.isnan(value))}
+        if position in normalized:
+            row['datetime'], row['timestamp'] = normalized[position]
+        else:
+            try:
+                row['datetime'], timestamp = normalizer.normalize(
+                    row.get(source))
+            except ValueError:
+                continue
+            row['timestamp'] = str(timestamp)
+        yield row
+
+
+def _check_columnar_arguments(byte_range):
+    """Check that Parquet and Arrow files can be read.
+
+    Args:
+        byte_range: Byte range argument of the reader.
+
+    Raises:
+        RuntimeError if pyarrow is not installed.
+        ValueError if a byte range is given.
+    """
+    if not pyarrow:
+        raise RuntimeError(
+            'Unable to read Parquet and Arrow files, the pyarrow module is '
+            'missing.')
+    if byte_range:
+        raise ValueError('Parquet and Arrow files can only be read whole.')
+
+
+def _split_record_batches(batches, batch_size):
+    """Split record batches into batches with at most batch_size rows.
+
+    The batches are sliced column by column, Table.slice() and
+    RecordBatch.slice() are missing in older versions of pyarrow.
+
+    Args:
+        batches: Iterable with pyarrow.RecordBatch.
+        batch_size: Maximum number of rows in a batch.
+
+    Yields:
+        pyarrow.RecordBatch.
+    """
+    for batch in batches:
+        if batch.num_rows <= batch_size:
+            yield batch
+            continue
+        names = batch.schema.names
+        for offset in range(0, batch.num_rows, batch_size):
+            length = min(batch_size, batch.num_rows - offset)
+            yield pyarrow.RecordBatch.from_arrays([
+                batch.column(index).slice(offset, length)
+                for index in range(batch.num_columns)], names)
+
+
+def read_and_validate_parquet(
+        path, batch_size=DEFAULT_COLUMNAR_BATCH_SIZE, byte_range=None):
+    """Generator for reading a Parquet file.
+
+    The file is read a row group at a time and converted to events in
+    batches of rows. Columns are validated once, from the file schema.
+
+    Args:
+        path: Path to the Parquet file.
+        batch_size: Number of rows to convert at a time.
+        byte_range: Not supported, has to be None. For compatibility with
+            the CSV and JSONL readers.
+    """
+    _check_columnar_arguments(byte_range)
+    parquet_file = pyarrow.parquet.ParquetFile(path)
+    _validate_columnar_schema(parquet_file.schema.to_arrow_schema().names)
+
+    normalizer = DatetimeNormalizer()
+    for row_group in range(parquet_file.num_row_groups):
+        table = parquet_file.read_row_group(row_group)
+        for batch in _split_record_batches(table.to_batches(), batch_size):
+            for row in _normalize_columnar_table(batch, normalizer):
+                yield row
+
+
+def read_and_validate_arrow(
+        path, batch_size=DEFAULT_COLUMNAR_BATCH_SIZE, byte_range=None):
+    """Generator for reading an Arrow IPC file or stream.
+
+    The file is memory mapped and read a record batch at a time. Columns
+    are validated once, from the schema.
+
+    Args:
+        path: Path to the Arrow file.
+        batch_size: Number of rows to convert at a time.
+        byte_range: Not supported, has to be None. For compatibility with
+            the CSV and JSONL readers.
+    """
+    _check_columnar_arguments(byte_range)
+    with open(path, 'rb') as fh:
+        is_file = fh.read(len(ARROW_FILE_MAGIC)) == ARROW_FILE_MAGIC
+
+    source = pyarrow.memory_map(path, 'r')
+    try:
+        if is_file:
+            reader = pyarrow.ipc.open_file(source)
+            batches = (
+                reader.get_batch(index)
+                for index in range(reader.num_record_batches))
+        else:
+            reader = pyarrow.ipc.open_stream(source)
+            batches = reader
+        _validate_columnar_schema(reader.schema.names)
+
+        normalizer = DatetimeNormalizer()
+        for batch in _split_record_batches(batches, batch_size):
+            for row in _normalize_columnar_table(batch, normalizer):
+                yield row
+    finally:
+        source.close()
+
+
+def _parse_jsonl_line(line, normalizer):
+    """Decode and normalize one line of a JSONL file.
+
+    Args:
+        line: Line from the JSONL file.
+        normalizer: Instance of DatetimeNormalizer for the file.
+
+    Returns:
+        Tuple with the event dictionary and a list of missing mandatory
+        fields.
+
+    Raises:
+        ValueError if the line can't be decoded or has an invalid datetime.
+    """
+    linedict = json.loads(line)
+    ld_keys = linedict.keys()
+    if 'datetime' not in ld_keys and 'timestamp' in ld_keys:
+        linedict['datetime'], linedict['timestamp'] = normalize_timestamp(
+            linedict['timestamp'])
+    if 'timestamp' not in ld_keys and 'datetime' in ld_keys:
+        linedict['datetime'], linedict['timestamp'] = normalizer.normalize(
+            linedict['datetime'])
+
+    missing_fields = []
+    for field in JSONL_MANDATORY_FIELDS:
+        if field not in linedict.keys():
+            missing_fields.append(field)
+    return linedict, missing_fields
+
+
+def read_and_validate_jsonl(path, byte_range=None):
     """Generator for reading a JSONL (json lines) file.
 
     Args:
         path: Path to the JSONL file
+        byte_range: Optional tuple with start and end offset of the lines
+            to read. Line numbers in errors are relative to the start.
     """
-    # Fields that must be present in each entry of the JSONL file.
-    mandatory_fields = ['message', 'datetime', 'timestamp_desc']
-    with open(path, 'rb') as fh:
+    normalizer = DatetimeNormalizer()
+    with open_timeline_file(path, byte_range) as fh:
         lineno = 0
         for line in fh:
             lineno += 1
             try:
-                linedict = json.loads(line)
-                ld_keys = linedict.keys()
-                if 'datetime' not in ld_keys and 'timestamp' in ld_keys:
-                    epoch = int(str(linedict['timestamp'])[:10])
-                    dt = datetime.datetime.fromtimestamp(epoch)
-                    linedict['datetime'] = dt.isoformat()
-                if 'timestamp' not in ld_keys and 'datetime' in ld_keys:
-                    linedict['timestamp'] = parser.parse(linedict['datetime'])
-
-                missing_fields = []
-                for field in mandatory_fields:
-                    if field not in linedict.keys():
-                        missing_fields.append(field)
-                if missing_fields:
-                    raise RuntimeError(
-                        u"Missing field(s) at line {0:n}: {1:s}"
-                        .format(lineno, missing_fields))
-
-                yield linedict
-
+                linedict, missing_fields = _parse_jsonl_line(line, normalizer)
             except ValueError as e:
+                raise RuntimeError(JSONL_PARSE_ERROR.format(lineno, e))
+            if missing_fields:
+                raise RuntimeError(
+                    JSONL_MISSING_FIELDS_ERROR.format(lineno, missing_fields))
+
+            yield linedict
+
+
+def split_on_newlines(path, range_size, start=0, end=None, quotechar=None):
+    """Split a file into byte ranges that end on a newline.
+
+    Args:
+        path: Path to the file.
+        range_size: Approximate size of a range in bytes.
+        start: Offset to start at, must be at the start of a line.
+        end: Offset to stop at, defaults to the end of the file.
+        quotechar: Optional CSV quote character. Newlines inside quoted
+            fields are skipped, assuming that start isn't inside a quoted
+            field.
+
+    Returns:
+        List of (start, end) byte offsets.
+    """
+    size = os.path.getsize(path)
+    end = size if end is None else min(end, size)
+    if start >= end:
+        return []
+
+    quote = quotechar.encode('utf-8') if quotechar else None
+    quotes = 0
+    scanned = start
+
+    ranges = []
+    with open(path, 'rb') as fh:
+        mapped_file = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            while start < end:
+                range_end = min(start + range_size, end)
+                search_from = range_end - 1
+                while range_end < end:
+                    newline = mapped_file.find(b'\n', search_from, end)
+                    if newline == -1:
+                        range_end = end
+                        break
+                    range_end = search_from = newline + 1
+                    if not quote:
+                        break
+                    # An odd number of quotes means the newline is inside a
+                    # quoted field.
+                    quotes += mapped_file[scanned:range_end].count(quote)
+                    scanned = range_end
+                    if not quotes % 2:
+                        break
+                ranges.append((start, range_end))
+                start = range_end
+        finally:
+            mapped_file.close()
+    return ranges
+
+
+def count_lines(path, byte_range):
+    """Count the newlines in a byte range of a file.
+
+    Args:
+        path: Path to the file.
+        byte_range: Tuple with start and end offset.
+
+    Returns:
+        Number of newlines in the range.
+    """
+    start, end = byte_range
+    if start >= end:
+        return 0
+    with open(path, 'rb') as fh:
+        mapped_file = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return mapped_file[start:end].count(b'\n')
+        finally:
+            mapped_file.close()
+
+
+def _read_jsonl_range(args):
+    """Decode and validate the lines in a byte range of a JSONL file.
+
+    This runs in a worker process. Reading stops at the first invalid
+    line, the line number of the error is relative to the range.
+
+    Args:
+        args: Tuple with path, start and end offset of the range.
+
+    Returns:
+        Tuple with a list of event dictionaries, the number of lines read
+        and None, or a tuple with the error template and details when a
+        line is invalid.
+    """
+    path, start, end = args
+    with open(path, 'rb') as fh:
+        mapped_file = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            data = mapped_file[start:end]
+        finally:
+            mapped_file.close()
+
+    lines = data.split(b'\n')
+    if lines and not lines[-1]:
+        lines.pop()
+
+    events = []
+    normalizer = DatetimeNormalizer()
+    for lineno, line in enumerate(lines, 1):
+        try:
+            linedict, missing_fields = _parse_jsonl_line(line, normalizer)
+        except ValueError as e:
+            return events, lineno, (JSONL_PARSE_ERROR, str(e))
+        if missing_fields:
+            return events, lineno, (JSONL_MISSING_FIELDS_ERROR, missing_fields)
+        events.append(linedict)
+    return events, len(lines), None
+
+
+def read_and_validate_jsonl_parallel(
+        path, processes=None, range_size=DEFAULT_JSONL_RANGE_SIZE,
+        byte_range=None):
+    """Generator for reading a JSONL file with several processes.
+
+    The file is split into byte ranges on newline boundaries that are
+    decoded and validated in a process pool. Events are yielded in file
+    order and errors report the line number in the file, like
+    read_and_validate_jsonl().
+
+    The pool is a billiard pool, which unlike a multiprocessing pool can be
+    started from the daemonic processes of a Celery prefork worker. Small
+    and compressed files are read in the current process instead.
+
+    Args:
+        path: Path to the JSONL file
+        processes: Number of worker processes, defaults to the number of
+            CPUs.
+        range_size: Approximate number of bytes decoded per task.
+        byte_range: Optional tuple with start and end offset of the lines
+            to read. Line numbers in errors are relative to the start.
+    """
+    start, end = byte_range or (0, os.path.getsize(path))
+    processes = processes or billiard.cpu_count()
+    # Compressed files can only be read from the start.
+    if (processes < 2 or end - start <= range_size or
+            detect_compression(path)):
+        for event in read_and_validate_jsonl(path, byte_range=byte_range):
+            yield event
+        return
+
+    ranges = iter(split_on_newlines(path, range_size, start=start, end=end))
+    pool = billiard.Pool(processes)
+    # Keep a bounded number of ranges in flight so that decoded events don't
+    # pile up in memory when indexing is slower than decoding.
+    pending = collections.deque()
+    try:
+        for byte_range in itertools.islice(ranges, processes * 2):
+            pending.append(pool.apply_async(
+                _read_jsonl_range, ((path,) + byte_range,)))
+
+        lines_before = 0
+        while pending:
+            events, line_count, error = pending.popleft().get()
+            for byte_range in itertools.islice(ranges, 1):
+                pending.append(pool.apply_async(
+                    _read_jsonl_range, ((path,) + byte_range,)))
+
+            for event in events:
+                yield event
+
+            if error:
+                template, details = error
                 raise RuntimeError(
-                    u"Error parsing JSON at line {0:n}: {1:s}"
-                    .format(lineno, e))
+                    template.format(lines_before + line_count, details))
+            lines_before += line_count
+    finally:
+        # Wait for the ranges in flight instead of terminating the pool, a
+        # terminated billiard pool can wait forever on the lost results.
+        for result in pending:
+            result.wait()
+        pool.close()
+        pool.join()
+
+
+def get_event_content_id(event):
+    """Get a document ID that is derived from the content of an event.
+
+    The same event gets the same ID when it is in an uploaded file twice or
+    is indexed again by a resumed import, so it replaces the existing
+    document instead of being indexed twice. Every upload has its own
+    index, so this only deduplicates events within one file.
+
+    Args:
+        event: Dictionary with the normalized event.
+
+    Returns:
+        Hex encoded SHA-256 digest of the event fields.
+    """
+    fields = dict(event)
+    # CSV readers give the timestamp as string, JSONL readers as number.
+    try:
+        fields['timestamp'] = int(fields['timestamp'])
+    except (KeyError, TypeError, ValueError):
+        pass
+    serialized = json.dumps(
+        fields, sort_keys=True, separators=(',', ':'), default=six.text_type)
+    return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
 
 
 def get_validated_indices(indices, sketch_indices):
@@ -190,6 +1050,42 @@ def get_validated_indices(indices, sketch_indices):
     return indices
 
 
+def encode_search_cursor(sort_values):
+    """Encode the sort values of an event as a search continuation token.
+
+    Args:
+        sort_values: List of sort values from an Elasticsearch hit.
+
+    Returns:
+        URL safe string that can be handed to clients as a cursor.
+    """
+    cursor = json.dumps(sort_values, separators=(',', ':'))
+    return base64.urlsafe_b64encode(cursor.encode('utf-8')).decode('ascii')
+
+
+def decode_search_cursor(cursor):
+    """Decode a search continuation token.
+
+    Args:
+        cursor: String as returned by encode_search_cursor().
+
+    Returns:
+        List of sort values to continue the search after.
+
+    Raises:
+        ValueError if the cursor is not valid.
+    """
+    try:
+        sort_values = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (binascii.Error, TypeError, UnicodeError) as e:
+        raise ValueError('Invalid cursor: {0!s}'.format(e))
+
+    if not isinstance(sort_values, list) or not sort_values:
+        raise ValueError('Invalid cursor: no sort values')
+    return sort_values
+
+
 def send_email(subject, body, to_username, use_html=False):
     """Send email using configure SMTP server.
 
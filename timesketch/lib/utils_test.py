@@ -15,16 +15,76 @@
 
 from __future__ import unicode_literals
 
+import bz2
+import gzip
+import io
+import json
+import os
 import re
+import tempfile
+import unittest
+
+import billiard
+import mock
 
 from timesketch.lib.testlib import BaseTest
+from timesketch.lib import utils
+from timesketch.lib.utils import count_lines
+from timesketch.lib.utils import detect_compression
+from timesketch.lib.utils import decode_search_cursor
+from timesketch.lib.utils import encode_search_cursor
+from timesketch.lib.utils import get_event_content_id
 from timesketch.lib.utils import get_validated_indices
 from timesketch.lib.utils import random_color
+from timesketch.lib.utils import read_and_validate_arrow
+from timesketch.lib.utils import read_and_validate_csv
+from timesketch.lib.utils import read_and_validate_csv_chunked
+from timesketch.lib.utils import read_and_validate_jsonl
+from timesketch.lib.utils import read_and_validate_jsonl_parallel
+from timesketch.lib.utils import read_and_validate_parquet
+from timesketch.lib.utils import open_timeline_file
+from timesketch.lib.utils import split_file_extension
+from timesketch.lib.utils import split_on_newlines
+
+
+def _count_jsonl_events(path, queue):
+    """Read a JSONL file with a process pool and put the event count on a queue.
+
+    Reading the file in the current process is not allowed, so that the
+    count is only put on the queue when the pool was used.
+
+    Args:
+        path: Path to the JSONL file.
+        queue: Queue for the number of events.
+    """
+    with mock.patch.object(
+            utils, 'read_and_validate_jsonl', side_effect=AssertionError):
+        try:
+            queue.put(len(list(read_and_validate_jsonl_parallel(
+                path, processes=2, range_size=1000))))
+        except AssertionError:
+            queue.put(None)
 
 
 class TestUtils(BaseTest):
     """Tests for the functionality on the utils module."""
 
+    def _write_file(self, content, suffix='.csv'):
+        """Write content to a temporary file.
+
+        Args:
+            content: String with the content of the file.
+            suffix: File name suffix.
+
+        Returns:
+            Path to the file.
+        """
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(content)
+        self.addCleanup(os.remove, path)
+        return path
+
     def test_random_color(self):
         """Test to generate a random color."""
         color = random_color()
@@ -41,3 +101,343 @@ class TestUtils(BaseTest):
                                                    sketch_indices))
         self.assertFalse('fail' in get_validated_indices(
             invalid_indices, sketch_indices))
+
+    def test_search_cursor(self):
+        """Test encoding and decoding of search cursors."""
+        sort_values = [1410593223000, 'plaso_event#test']
+        cursor = encode_search_cursor(sort_values)
+        self.assertTrue(re.match('^[A-Za-z0-9_=-]+$', cursor))
+        self.assertEqual(decode_search_cursor(cursor), sort_values)
+        self.assertRaises(ValueError, decode_search_cursor, 'not a cursor')
+        self.assertRaises(
+            ValueError, decode_search_cursor, encode_search_cursor([]))
+
+    def test_read_and_validate_csv_chunked(self):
+        """Test that the chunked CSV reader normalizes like the row reader."""
+        rows = [
+            'message,datetime,timestamp_desc,extra',
+            'a,2015-07-24T19:01:01+02:00,Write,1',
+            'b,2015-07-24T19:01:01.250000+02:00,Write,2',
+            'c,not a datetime,Write,3',
+            'd,Jul 24 2015 19:01:01 +0200,Write,4',
+        ]
+        path = self._write_file('\n'.join(rows) + '\n')
+        expected = [
+            ('a', '2015-07-24T19:01:01+02:00', '1437757261000000'),
+            ('b', '2015-07-24T19:01:01.250000+02:00', '1437757261250000'),
+            ('d', '2015-07-24T19:01:01+02:00', '1437757261000000'),
+        ]
+        self.assertEqual(
+            [(row['message'], row['datetime'])
+             for row in read_and_validate_csv(path)],
+            [(message, datetime) for message, datetime, _ in expected])
+
+        for chunk_size in (1, 2, 10):
+            rows = list(read_and_validate_csv_chunked(
+                path, chunk_size=chunk_size))
+            self.assertEqual(
+                [(row['message'], row['datetime'], row['timestamp'])
+                 for row in rows], expected)
+            self.assertEqual(rows[0]['extra'], '1')
+
+    def test_read_and_validate_csv_chunked_header(self):
+        """Test that the chunked CSV reader checks mandatory fields."""
+        path = self._write_file('message,datetime\na,2015-07-24\n')
+        with self.assertRaises(RuntimeError):
+            list(read_and_validate_csv_chunked(path))
+
+    def test_read_and_validate_csv_chunked_byte_range(self):
+        """Test that byte ranges of a CSV file are read with the header."""
+        rows = ['message,datetime,timestamp_desc']
+        rows.extend(
+            '{0:d},2015-07-24T19:01:01+00:00,Write'.format(i)
+            for i in range(100))
+        path = self._write_file('\n'.join(rows) + '\n')
+        byte_ranges = split_on_newlines(path, 300)
+        self.assertGreater(len(byte_ranges), 2)
+
+        messages = []
+        for byte_range in byte_ranges:
+            for row in read_and_validate_csv_chunked(
+                    path, chunk_size=7, byte_range=byte_range):
+                messages.append(row['message'])
+                self.assertEqual(row['timestamp_desc'], 'Write')
+        self.assertEqual(messages, [str(i) for i in range(100)])
+
+    def _write_jsonl(self, count, bad_line=None):
+        """Write a JSONL file with numbered events.
+
+        Args:
+            count: Number of lines.
+            bad_line: Optional line number of a line that is not JSON.
+
+        Returns:
+            Path to the file.
+        """
+        lines = []
+        for lineno in range(1, count + 1):
+            if lineno == bad_line:
+                lines.append('{not json')
+                continue
+            lines.append(json.dumps({
+                'message': 'Event {0:d}'.format(lineno),
+                'datetime': '2019-01-01T00:00:00+00:00',
+                'timestamp': lineno,
+                'timestamp_desc': 'Test'}))
+        return self._write_file('\n'.join(lines) + '\n', suffix='.jsonl')
+
+    def test_read_and_validate_jsonl_parallel(self):
+        """Test that the parallel JSONL reader keeps the file order."""
+        path = self._write_jsonl(500)
+        events = list(read_and_validate_jsonl_parallel(
+            path, processes=3, range_size=1000))
+        self.assertEqual(events, list(read_and_validate_jsonl(path)))
+        self.assertEqual(len(events), 500)
+
+    def test_read_and_validate_jsonl_parallel_daemon(self):
+        """Test that the reader uses a pool in a daemonic process."""
+        path = self._write_jsonl(500)
+        queue = billiard.Queue()
+        process = billiard.Process(
+            target=_count_jsonl_events, args=(path, queue), daemon=True)
+        process.start()
+        process.join(60)
+        self.assertEqual(queue.get(timeout=10), 500)
+
+    def test_read_and_validate_jsonl_parallel_error(self):
+        """Test that errors report the line number in the file."""
+        path = self._write_jsonl(500, bad_line=321)
+        events = []
+        with self.assertRaises(RuntimeError) as context:
+            for event in read_and_validate_jsonl_parallel(
+                    path, processes=3, range_size=1000):
+                events.append(event)
+        self.assertIn('line 321', str(context.exception))
+        self.assertEqual(len(events), 320)
+
+    def test_read_and_validate_jsonl_normalize(self):
+        """Test that a missing datetime or timestamp is added in UTC."""
+        lines = [
+            {'message': 'a', 'timestamp': 1437757261, 'timestamp_desc': 'W'},
+            {'message': 'b', 'datetime': '2015-07-24T19:01:01+02:00',
+             'timestamp_desc': 'W'},
+        ]
+        path = self._write_file(
+            '\n'.join(json.dumps(line) for line in lines) + '\n',
+            suffix='.jsonl')
+        self.assertEqual(
+            [(event['datetime'], event['timestamp'])
+             for event in read_and_validate_jsonl(path)],
+            [('2015-07-24T17:01:01+00:00', 1437757261000000),
+             ('2015-07-24T19:01:01+02:00', 1437757261000000)])
+
+    def test_get_event_content_id(self):
+        """Test that event IDs only depend on the event content."""
+        event = {'message': 'a', 'timestamp': '1437757261000000', 'x': 1}
+        event_id = get_event_content_id(event)
+        self.assertTrue(re.match('^[0-9a-f]{64}$', event_id))
+        same_event = {'x': 1, 'timestamp': 1437757261000000, 'message': 'a'}
+        self.assertEqual(get_event_content_id(same_event), event_id)
+        self.assertNotEqual(
+            get_event_content_id(dict(event, message='b')), event_id)
+
+    def test_read_and_validate_jsonl_byte_range(self):
+        """Test that byte ranges of a JSONL file cover every line once."""
+        path = self._write_jsonl(50)
+        events = []
+        for byte_range in split_on_newlines(path, 500):
+            events.extend(read_and_validate_jsonl(path, byte_range=byte_range))
+        self.assertEqual(events, list(read_and_validate_jsonl(path)))
+
+    def _write_columnar(self, columns, suffix, **kwargs):
+        """Write a Parquet or Arrow file.
+
+        Args:
+            columns: Dictionary with column names and lists of values.
+            suffix: File name suffix, .parquet, .arrow or .arrows for an
+                Arrow stream.
+            kwargs: Keyword arguments for pyarrow.parquet.write_table.
+
+        Returns:
+            Path to the file.
+        """
+        pyarrow = utils.pyarrow
+        names = sorted(columns)
+        table = pyarrow.Table.from_arrays(
+            [pyarrow.array(columns[name]) for name in names], names)
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        if suffix == '.parquet':
+            pyarrow.parquet.write_table(table, path, **kwargs)
+            return path
+
+        with pyarrow.OSFile(path, 'wb') as sink:
+            if suffix == '.arrow':
+                writer = pyarrow.ipc.RecordBatchFileWriter(sink, table.schema)
+            else:
+                writer = pyarrow.ipc.RecordBatchStreamWriter(
+                    sink, table.schema)
+            for batch in table.to_batches(max_chunksize=2):
+                writer.write_batch(batch)
+            writer.close()
+        return path
+
+    @unittest.skipIf(utils.pyarrow is None, 'pyarrow is not installed')
+    def test_read_and_validate_columnar(self):
+        """Test that Parquet and Arrow files are read like CSV files."""
+        columns = {
+            'message': ['a', 'b', 'c', 'd'],
+            'datetime': [
+                '2015-07-24T19:01:01+02:00', 'Jul 24 2015 19:01:01 +0200',
+                'not a datetime', '2015-07-24 17:01:01'],
+            'timestamp_desc': ['Write'] * 4,
+            'extra': [1, None, 3, 4],
+        }
+        expected = [
+            ('a', '2015-07-24T19:01:01+02:00', '1437757261000000'),
+            ('b', '2015-07-24T19:01:01+02:00', '1437757261000000'),
+            ('d', '2015-07-24T17:01:01', '1437757261000000'),
+        ]
+        paths = [
+            (read_and_validate_parquet,
+             self._write_columnar(columns, '.parquet', row_group_size=3)),
+            (read_and_validate_arrow, self._write_columnar(columns, '.arrow')),
+            (read_and_validate_arrow,
+             self._write_columnar(columns, '.arrows')),
+        ]
+        for read_and_validate, path in paths:
+            for batch_size in (1, 10):
+                rows = list(read_and_validate(path, batch_size=batch_size))
+                self.assertEqual(
+                    [(row['message'], row['datetime'], row['timestamp'])
+                     for row in rows], expected)
+                self.assertEqual(rows[0]['extra'], 1)
+                self.assertNotIn('extra', rows[1])
+
+            with self.assertRaises(ValueError):
+                list(read_and_validate(path, byte_range=(0, 10)))
+
+    @unittest.skipIf(utils.pyarrow is None, 'pyarrow is not installed')
+    def test_read_and_validate_columnar_timestamps(self):
+        """Test native timestamp columns and times since the epoch."""
+        pyarrow = utils.pyarrow
+        timestamps = pyarrow.array(
+            [1437757261000000, 1437757261250000],
+            type=pyarrow.timestamp('us', tz='Europe/Amsterdam'))
+        table = pyarrow.Table.from_arrays(
+            [timestamps, pyarrow.array(['a', 'b']),
+             pyarrow.array(['Write', 'Write'])],
+            ['datetime', 'message', 'timestamp_desc'])
+        fd, path = tempfile.mkstemp(suffix='.parquet')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        pyarrow.parquet.write_table(table, path)
+        self.assertEqual(
+            [(row['datetime'], row['timestamp'])
+             for row in read_and_validate_parquet(path)],
+            [('2015-07-24T17:01:01+00:00', '1437757261000000'),
+             ('2015-07-24T17:01:01.250000+00:00', '1437757261250000')])
+
+        path = self._write_columnar({
+            'message': ['a', 'b', 'c'],
+            'timestamp': [1437757261, 1437757261250, 1437757261250000123],
+            'timestamp_desc': ['Write'] * 3,
+        }, '.arrow')
+        self.assertEqual(
+            [row['timestamp'] for row in read_and_validate_arrow(path)],
+            ['1437757261000000', '1437757261250000', '1437757261250000'])
+
+    @unittest.skipIf(utils.pyarrow is None, 'pyarrow is not installed')
+    def test_read_and_validate_columnar_schema(self):
+        """Test that the columns are checked before reading."""
+        path = self._write_columnar(
+            {'message': ['a'], 'datetime': ['2015-07-24']}, '.parquet')
+        with self.assertRaises(RuntimeError):
+            list(read_and_validate_parquet(path))
+        path = self._write_columnar(
+            {'message': ['a'], 'timestamp_desc': ['Write']}, '.arrow')
+        with self.assertRaises(RuntimeError):
+            list(read_and_validate_arrow(path))
+
+    def test_split_on_newlines_quoted(self):
+        """Test that CSV files are not split inside quoted fields."""
+        path = self._write_file('a,b\n"1\n2\n3",x\n4,y\n')
+        self.assertEqual(
+            split_on_newlines(path, 5), [(0, 7), (7, 14), (14, 18)])
+        byte_ranges = split_on_newlines(path, 5, quotechar='"')
+        self.assertEqual(byte_ranges, [(0, 14), (14, 18)])
+        self.assertEqual(
+            split_on_newlines(path, 5, start=4, quotechar='"'),
+            [(4, 14), (14, 18)])
+        self.assertEqual(
+            [count_lines(path, byte_range) for byte_range in byte_ranges],
+            [4, 1])
+
+    def test_split_file_extension(self):
+        """Test splitting file names into name, type and compression."""
+        self.assertEqual(
+            split_file_extension('timeline.csv'), ('timeline', 'csv', None))
+        self.assertEqual(
+            split_file_extension('timeline.JSONL.zst'),
+            ('timeline', 'jsonl', 'zst'))
+        self.assertEqual(
+            split_file_extension('timeline.gz'), ('timeline', '', 'gz'))
+
+    def _compress(self, path, compression):
+        """Write a compressed copy of a file.
+
+        Args:
+            path: Path to the file.
+            compression: Compression extension, e.g. gz.
+
+        Returns:
+            Path to the compressed file.
+        """
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        compressed_path = '{0:s}.{1:s}'.format(path, compression)
+        if compression == 'gz':
+            with gzip.GzipFile(compressed_path, 'wb') as fh:
+                fh.write(data)
+        elif compression == 'bz2':
+            with io.open(compressed_path, 'wb') as fh:
+                fh.write(bz2.compress(data))
+        elif compression == 'xz':
+            with io.open(compressed_path, 'wb') as fh:
+                fh.write(utils.lzma.compress(data))
+        elif compression == 'zst':
+            with io.open(compressed_path, 'wb') as fh:
+                fh.write(utils.zstandard.ZstdCompressor().compress(data))
+        self.addCleanup(os.remove, compressed_path)
+        return compressed_path
+
+    def test_read_compressed(self):
+        """Test that compressed files are decompressed while reading."""
+        csv_path = self._write_file(
+            'message,datetime,timestamp_desc\n'
+            'a,2015-07-24T19:01:01+00:00,Write\n')
+        jsonl_path = self._write_jsonl(10)
+        compressions = ['gz', 'bz2']
+        if utils.lzma:
+            compressions.append('xz')
+        if utils.zstandard:
+            compressions.append('zst')
+
+        for compression in compressions:
+            path = self._compress(csv_path, compression)
+            self.assertEqual(detect_compression(path), compression)
+            self.assertEqual(
+                list(read_and_validate_csv_chunked(path)),
+                list(read_and_validate_csv_chunked(csv_path)))
+
+            path = self._compress(jsonl_path, compression)
+            self.assertEqual(
+                list(read_and_validate_jsonl_parallel(
+                    path, processes=2, range_size=100)),
+                list(read_and_validate_jsonl(jsonl_path)))
+            with self.assertRaises(ValueError):
+                open_timeline_file(path, byte_range=(0, 10))
+
+        self.assertIsNone(detect_compression(csv_path))
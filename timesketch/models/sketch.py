@@ -15,9 +15,13 @@
 
 from __future__ import unicode_literals
 
+import datetime
 import json
 
+from sqlalchemy import BigInteger
 from sqlalchemy import Column
+from sqlalchemy import DateTime
+from sqlalchemy import Float
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
 from sqlalchemy import Unicode
@@ -206,6 +210,12 @@ class SearchIndex(AccessControlMixin, LabelMixin, StatusMixin, CommentMixin,
     timelines = relationship(
         'Timeline', backref='searchindex', lazy='dynamic')
     events = relationship('Event', backref='searchindex', lazy='dynamic')
+    import_checkpoints = relationship(
+        'ImportCheckpoint', backref='searchindex', lazy='dynamic',
+        cascade='all, delete-orphan')
+    import_progress = relationship(
+        'ImportProgress', backref='searchindex', uselist=False,
+        cascade='all, delete-orphan')
 
     def __init__(self, name, description, index_name, user):
         """Initialize the SearchIndex object.
@@ -223,6 +233,136 @@ class SearchIndex(AccessControlMixin, LabelMixin, StatusMixin, CommentMixin,
         self.user = user
 
 
+class ImportCheckpoint(BaseModel):
+    """Implements the import checkpoint model.
+
+    Keeps track of how far a file has been imported into a search index, so
+    that a failed or interrupted import can be resumed. A file that is
+    imported by a single task has one checkpoint without an end offset. A
+    file that is imported in parallel chunks has a checkpoint per chunk that
+    is not done yet, from the offset to the end offset of the chunk.
+    """
+    searchindex_id = Column(Integer, ForeignKey('searchindex.id'))
+    source_path = Column(UnicodeText())
+    source_type = Column(Unicode(255))
+    timeline_name = Column(Unicode(255))
+    offset = Column(BigInteger())
+    end_offset = Column(BigInteger())
+    line_number = Column(BigInteger())
+    events_read = Column(BigInteger())
+    events_indexed = Column(BigInteger())
+
+    def __init__(self, searchindex, source_path, source_type, timeline_name,
+                 offset=0, end_offset=None):
+        """Initialize the ImportCheckpoint object.
+
+        Args:
+            searchindex: A searchindex
+                (instance of timesketch.models.sketch.SearchIndex)
+            source_path: Path to the file that is imported
+            source_type: Type of file, csv or jsonl
+            timeline_name: Name of the timeline
+            offset: Offset in the file to import from
+            end_offset: Offset after the last byte of a chunk, or None
+        """
+        super(ImportCheckpoint, self).__init__()
+        self.searchindex = searchindex
+        self.source_path = source_path
+        self.source_type = source_type
+        self.timeline_name = timeline_name
+        self.offset = offset
+        self.end_offset = end_offset
+        self.line_number = 0
+        self.events_read = 0
+        self.events_indexed = 0
+
+
+class ImportProgress(BaseModel):
+    """Implements the import progress model.
+
+    Progress of the current import into a search index. The counters are
+    updated by the indexing tasks while they run, see
+    timesketch.lib.progress. Duplicate events are indexed events that
+    replaced an event with the same ID in the same file. Times are in UTC.
+    """
+    searchindex_id = Column(Integer, ForeignKey('searchindex.id'))
+    bytes_total = Column(BigInteger())
+    bytes_read = Column(BigInteger())
+    events_parsed = Column(BigInteger())
+    events_indexed = Column(BigInteger())
+    events_failed = Column(BigInteger())
+    events_duplicate = Column(BigInteger())
+    started_at = Column(DateTime())
+    reported_at = Column(DateTime())
+    finished_at = Column(DateTime())
+
+    def __init__(self, searchindex, bytes_total=0):
+        """Initialize the ImportProgress object.
+
+        Args:
+            searchindex: A searchindex
+                (instance of timesketch.models.sketch.SearchIndex)
+            bytes_total: Number of bytes to import
+        """
+        super(ImportProgress, self).__init__()
+        self.searchindex = searchindex
+        self.reset(bytes_total)
+
+    def reset(self, bytes_total=0):
+        """Reset the counters for a new import.
+
+        Args:
+            bytes_total: Number of bytes to import
+        """
+        now = datetime.datetime.utcnow()
+        self.bytes_total = bytes_total
+        self.bytes_read = 0
+        self.events_parsed = 0
+        self.events_indexed = 0
+        self.events_failed = 0
+        self.events_duplicate = 0
+        self.started_at = now
+        self.reported_at = now
+        self.finished_at = None
+
+    @property
+    def elapsed_seconds(self):
+        """Seconds between the start and the last report."""
+        end = self.finished_at or self.reported_at
+        if not end or not self.started_at:
+            return 0.0
+        return max((end - self.started_at).total_seconds(), 0.0)
+
+    @property
+    def events_per_second(self):
+        """Average number of events indexed per second."""
+        if not self.elapsed_seconds:
+            return 0.0
+        return self.events_indexed / self.elapsed_seconds
+
+    @property
+    def bytes_per_second(self):
+        """Average number of bytes read per second."""
+        if not self.elapsed_seconds:
+            return 0.0
+        return self.bytes_read / self.elapsed_seconds
+
+    @property
+    def eta_seconds(self):
+        """Estimated seconds until the import is done, based on bytes read.
+
+        Returns:
+            Number of seconds, 0 when the import is done or None if there
+            is no estimate yet.
+        """
+        if self.finished_at:
+            return 0.0
+        if not self.bytes_per_second or not self.bytes_total:
+            return None
+        remaining = max(self.bytes_total - self.bytes_read, 0)
+        return remaining / self.bytes_per_second
+
+
 class View(AccessControlMixin, LabelMixin, StatusMixin, CommentMixin,
            BaseModel):
     """Implements the View model."""
@@ -449,6 +589,19 @@ class Analysis(LabelMixin, StatusMixin, CommentMixin, BaseModel):
     sketch_id = Column(Integer, ForeignKey('sketch.id'))
     timeline_id = Column(Integer, ForeignKey('timeline.id'))
     searchindex_id = Column(Integer, ForeignKey('searchindex.id'))
+    # Ingest time in microseconds since epoch up to which the events were
+    # analyzed, the next incremental run starts from here.
+    watermark = Column(BigInteger())
+    # Execution profile of the run, see timesketch.lib.analyzers.profiling.
+    # Times are in seconds and the peak memory in bytes, as the growth of the
+    # peak memory of the worker during the run.
+    wall_time = Column(Float())
+    search_time = Column(Float())
+    run_time = Column(Float())
+    write_time = Column(Float())
+    events_read = Column(BigInteger())
+    events_written = Column(BigInteger())
+    peak_memory = Column(BigInteger())
 
     def __init__(self, name, description, analyzer_name, parameters, user,
                  sketch, timeline=None, searchindex=None, result=None):
@@ -37,6 +37,10 @@ from werkzeug.exceptions import Forbidden
 
 from timesketch import create_app
 from timesketch.lib.datastores.elastic import ElasticsearchDataStore
+from timesketch.lib.uploads import ChunkedUpload
+from timesketch.lib.utils import COMPRESSIBLE_EXTENSIONS
+from timesketch.lib.utils import TIMELINE_EXTENSIONS
+from timesketch.lib.utils import split_file_extension
 from timesketch.models import db_session
 from timesketch.models import drop_all
 from timesketch.models.user import Group
@@ -318,20 +322,24 @@ class ImportTimeline(Command):
         """This is the run method."""
 
         file_path = os.path.realpath(file_path)
-        file_path_no_extension, extension = os.path.splitext(file_path)
-        extension = extension.lstrip('.')
+        file_path_no_extension, extension, compression = (
+            split_file_extension(file_path))
         filename = os.path.basename(file_path_no_extension)
 
-        supported_extensions = ('plaso', 'csv', 'jsonl')
-
         if not os.path.isfile(file_path):
             sys.exit('No such file: {0:s}'.format(file_path))
 
-        if extension not in supported_extensions:
+        if extension not in TIMELINE_EXTENSIONS:
             sys.exit(
                 'Extension {0:s} is not supported. '
                 '(supported extensions are: {1:s})'.format(
-                    extension, ', '.join(supported_extensions)))
+                    extension, ', '.join(TIMELINE_EXTENSIONS)))
+
+        if compression and extension not in COMPRESSIBLE_EXTENSIONS:
+            sys.exit(
+                'Compressed {0:s} files are not supported. '
+                '(supported compressed files are: {1:s})'.format(
+                    extension, ', '.join(COMPRESSIBLE_EXTENSIONS)))
 
         user = None
         if not username:
@@ -422,6 +430,60 @@ class ImportTimeline(Command):
             file_path, sketch.id, sketch.name))
 
 
+class ResumeImport(Command):
+    """Resume a failed or interrupted CSV or JSONL import."""
+    option_list = (
+        Option('--index_name', '-i', dest='index_name', required=True),
+        Option(
+            '--force',
+            '-f',
+            dest='force',
+            action='store_true',
+            required=False,
+            default=False),
+    )
+
+    # pylint: disable=arguments-differ, method-hidden
+    def run(self, index_name, force):
+        """This is the run method."""
+        if not isinstance(index_name, six.text_type):
+            index_name = codecs.decode(index_name, 'utf-8')
+
+        # Import here to avoid circular imports.
+        from timesketch.lib import tasks
+        try:
+            pipeline = tasks.build_resume_pipeline(index_name, force=force)
+        except ValueError as e:
+            sys.exit(str(e))
+        pipeline.apply_async()
+
+        print('Resumed import to index: {0:s}'.format(index_name))
+
+
+class PurgeUploads(Command):
+    """Remove chunked uploads that were abandoned."""
+    option_list = (
+        Option(
+            '--max_age',
+            '-a',
+            dest='max_age',
+            type=int,
+            required=False,
+            default=24),
+    )
+
+    # pylint: disable=arguments-differ, method-hidden
+    def run(self, max_age):
+        """Remove the uploads that didn't receive a chunk for max_age hours.
+
+        Args:
+            max_age: Number of hours.
+        """
+        for upload_id in ChunkedUpload.remove_stale(
+                current_app.config['UPLOAD_FOLDER'], max_age * 60 * 60):
+            print('Removed upload: {0:s}'.format(upload_id))
+
+
 def main():
     # Setup Flask-script command manager and register commands.
     shell_manager = Manager(create_app)
@@ -434,6 +496,8 @@ def main():
     shell_manager.add_command('purge', PurgeTimeline())
     shell_manager.add_command('search_template', SearchTemplateManager())
     shell_manager.add_command('import', ImportTimeline())
+    shell_manager.add_command('resume_import', ResumeImport())
+    shell_manager.add_command('purge_uploads', PurgeUploads())
     shell_manager.add_command('runserver',
                               Server(host='127.0.0.1', port=5000))
     shell_manager.add_option(